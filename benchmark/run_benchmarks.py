@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Timed benchmark scenarios (loading, analysis, distances and outputs) run on synthetic datasets
+(see synthetic_data.py) at a number of scales. The results, including the per stage records of the
+stage_profiler, are written out as JSON so that the performance of different commits can be compared offline.
+
+e.g. python3 -m benchmark.run_benchmarks --scales 50,500,5000 --scenarios analysis,distances,outputs --num_proc 8
+
+The loading scenario runs the full data loading pipeline (mothur, BLAST, MED) on synthetic fastq files. For the
+other scenarios, if loading is not benchmarked, the synthetic DataSet is created directly in the database.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import subprocess
+from datetime import datetime
+
+SYMPORTAL_ROOT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if SYMPORTAL_ROOT_DIRECTORY not in sys.path:
+    sys.path.insert(0, SYMPORTAL_ROOT_DIRECTORY)
+import main
+import sp_config
+import django_general
+from dbApp.models import DataSet, DataAnalysis
+from stage_profiling import stage_profiler
+from benchmark.synthetic_data import SyntheticDataSetGenerator
+
+
+class SymPortalBenchmarker:
+    scenario_list = ['loading', 'analysis', 'distances', 'outputs']
+
+    def __init__(self, custom_args_list=None):
+        self.args = self._define_and_parse_args(custom_args_list)
+        self.scales = [int(scale) for scale in self.args.scales.split(',')]
+        self.scenarios = self.args.scenarios.split(',')
+        for scenario in self.scenarios:
+            if scenario not in self.scenario_list:
+                raise RuntimeError(f'Unknown scenario {scenario}. Choose from {",".join(self.scenario_list)}')
+        self.date_time_str = str(datetime.utcnow()).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
+        self.work_directory = os.path.join(SYMPORTAL_ROOT_DIRECTORY, 'benchmark', 'work', self.date_time_str)
+        self.git_commit = self._get_git_commit()
+        if self.args.results_path is not None:
+            self.results_path = os.path.abspath(self.args.results_path)
+        else:
+            self.results_path = os.path.join(
+                SYMPORTAL_ROOT_DIRECTORY, 'benchmark', 'results', f'{self.date_time_str}_{self.git_commit[:10]}.json')
+        self.results = []
+        # The DataSets and DataAnalyses made during the run (deleted at the end of the run unless --keep)
+        self.data_set_uids = []
+        self.data_analysis_uids = []
+
+    @staticmethod
+    def _define_and_parse_args(custom_args_list):
+        parser = argparse.ArgumentParser(description='Benchmark SymPortal on synthetic datasets')
+        parser.add_argument('--scales', type=str, default='50,500,5000', help='Comma separated numbers of samples')
+        parser.add_argument(
+            '--scenarios', type=str, default='loading,analysis,distances,outputs',
+            help='Comma separated scenarios to run: loading, analysis, distances, outputs')
+        parser.add_argument('--num_proc', type=int, default=1)
+        parser.add_argument('--seqs_per_sample', type=int, default=2000)
+        parser.add_argument('--num_profiles_per_clade', type=int, default=8)
+        parser.add_argument('--divs_per_profile', type=int, default=4)
+        parser.add_argument(
+            '--clade_mix', type=str, default='{"A": 0.2, "C": 0.6, "D": 0.2}',
+            help='JSON dict of clade to the proportion of samples dominated by that clade')
+        parser.add_argument('--seed', type=int, default=1234)
+        parser.add_argument(
+            '--distance_method', type=str, default='braycurtis',
+            help='The --distance_method used for the distances scenario [braycurtis]')
+        parser.add_argument('--results_path', type=str, help='Where to write the JSON results')
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Keep the synthetic DataSets, DataAnalyses and fastq files made during the benchmark')
+        if custom_args_list is not None:
+            return parser.parse_args(custom_args_list)
+        return parser.parse_args()
+
+    @staticmethod
+    def _get_git_commit():
+        git_cmd = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=SYMPORTAL_ROOT_DIRECTORY)
+        if git_cmd.returncode != 0:
+            return 'unknown'
+        return git_cmd.stdout.decode('utf-8').strip()
+
+    def run_benchmarks(self):
+        try:
+            for scale in self.scales:
+                self._run_scale(scale)
+                self._write_results()
+        finally:
+            if not self.args.keep:
+                self._clean_up()
+        print(f'\nBenchmark results written to {self.results_path}')
+
+    def _run_scale(self, scale):
+        print(f'\n\nBenchmarking {scale} samples')
+        generator = SyntheticDataSetGenerator(
+            num_samples=scale, clade_mix=json.loads(self.args.clade_mix),
+            num_profiles_per_clade=self.args.num_profiles_per_clade, divs_per_profile=self.args.divs_per_profile,
+            seqs_per_sample=self.args.seqs_per_sample, seed=self.args.seed)
+        name = f'benchmark_{self.date_time_str}_{scale}'
+
+        if 'loading' in self.scenarios:
+            fastq_directory = os.path.join(self.work_directory, str(scale))
+            data_sheet_path = generator.write_fastq_data_set(fastq_directory)
+            work_flow_manager = self._run_timed_scenario(
+                scale=scale, scenario='loading', generator=generator, custom_args_list=[
+                    '--load', fastq_directory, '--name', name, '--num_proc', str(self.args.num_proc),
+                    '--data_sheet', data_sheet_path, '--no_output'])
+            data_set_uid = work_flow_manager.data_set_object.id
+            self.data_set_uids.append(data_set_uid)
+        else:
+            fixture_start = time.perf_counter()
+            data_set_uid = generator.create_db_fixture(data_set_name=name).id
+            self.data_set_uids.append(data_set_uid)
+            print(f'Synthetic DataSet {data_set_uid} created in {time.perf_counter() - fixture_start:.2f}s')
+
+        data_analysis_uid = None
+        if 'analysis' in self.scenarios or 'distances' in self.scenarios or 'outputs' in self.scenarios:
+            # The distances and outputs scenarios need an analysis to work from
+            work_flow_manager = self._run_timed_scenario(
+                scale=scale, scenario='analysis', generator=generator, custom_args_list=[
+                    '--analyse', str(data_set_uid), '--name', name, '--num_proc', str(self.args.num_proc),
+                    '--no_output'], record='analysis' in self.scenarios)
+            data_analysis_uid = work_flow_manager.data_analysis_object.id
+            self.data_analysis_uids.append(data_analysis_uid)
+
+        if 'distances' in self.scenarios:
+            self._run_timed_scenario(
+                scale=scale, scenario='distances', generator=generator, custom_args_list=[
+                    '--between_sample_distances', str(data_set_uid), '--num_proc', str(self.args.num_proc),
+                    '--distance_method', self.args.distance_method])
+            self._run_timed_scenario(
+                scale=scale, scenario='distances', generator=generator, custom_args_list=[
+                    '--between_type_distances', str(data_set_uid), '--data_analysis_id', str(data_analysis_uid),
+                    '--num_proc', str(self.args.num_proc), '--distance_method', self.args.distance_method])
+
+        if 'outputs' in self.scenarios:
+            self._run_timed_scenario(
+                scale=scale, scenario='outputs', generator=generator, custom_args_list=[
+                    '--print_output_seqs', str(data_set_uid), '--num_proc', str(self.args.num_proc),
+                    '--no_ordinations'])
+            if sp_config.system_type == 'local':
+                self._run_timed_scenario(
+                    scale=scale, scenario='outputs', generator=generator, custom_args_list=[
+                        '--print_output_types', str(data_set_uid), '--data_analysis_id', str(data_analysis_uid),
+                        '--num_proc', str(self.args.num_proc), '--no_ordinations'])
+
+    def _run_timed_scenario(self, scale, scenario, generator, custom_args_list, record=True):
+        print(f'\nRunning {scenario} scenario: {" ".join(custom_args_list)}')
+        num_stage_records_before = len(stage_profiler.stage_records)
+        work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
+        start = time.perf_counter()
+        work_flow_manager.start_work_flow()
+        wall_time = time.perf_counter() - start
+        if record:
+            self.results.append({
+                'scale': scale, 'scenario': scenario, 'command': ' '.join(custom_args_list),
+                'wall_time_s': round(wall_time, 3), 'synthetic_data_set': generator.get_description(),
+                'stages': stage_profiler.stage_records[num_stage_records_before:]})
+        return work_flow_manager
+
+    def _write_results(self):
+        os.makedirs(os.path.dirname(self.results_path), exist_ok=True)
+        with open(self.results_path, 'w') as f:
+            json.dump({
+                'git_commit': self.git_commit, 'date_time_str': self.date_time_str,
+                'platform': platform.platform(), 'python_version': platform.python_version(),
+                'cpu_count': os.cpu_count(), 'num_proc': self.args.num_proc,
+                'system_type': sp_config.system_type, 'results': self.results}, f, indent=2)
+
+    def _clean_up(self):
+        for data_analysis_uid in self.data_analysis_uids:
+            if DataAnalysis.objects.filter(id=data_analysis_uid).exists():
+                print(f'Deleting benchmark DataAnalysis {data_analysis_uid}')
+                django_general.delete_data_analysis(data_analysis_uid)
+            self._remove_directory(os.path.join(
+                SYMPORTAL_ROOT_DIRECTORY, 'outputs', 'analyses', str(data_analysis_uid)))
+        for data_set_uid in self.data_set_uids:
+            if DataSet.objects.filter(id=data_set_uid).exists():
+                print(f'Deleting benchmark DataSet {data_set_uid}')
+                django_general.delete_data_set(data_set_uid)
+            self._remove_directory(os.path.join(
+                SYMPORTAL_ROOT_DIRECTORY, 'outputs', 'loaded_data_sets', str(data_set_uid)))
+        self._remove_directory(self.work_directory)
+
+    @staticmethod
+    def _remove_directory(directory):
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    benchmarker = SymPortalBenchmarker()
+    benchmarker.run_benchmarks()
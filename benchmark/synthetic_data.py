@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Generation of synthetic Symbiodiniaceae-like datasets for benchmarking.
+
+Each clade is given a pool of DIVs (named ReferenceSequences of symbiodiniaceaeDB/refSeqDB.fa) from which
+a set of ITS2 type profiles (a set of DIVs with characteristic relative abundances) is drawn. Each sample then
+contains one profile (or, for a proportion of the samples, two profiles from different clades) with noise applied
+to the relative abundances of the DIVs and a small number of background sequences.
+
+A synthetic dataset can be written out either as a set of paired fastq files (and a datasheet) to be loaded
+using --load, or directly into the database as a pre-loaded DataSet (as if it had been through data loading)
+so that the analysis, distance and output stages can be benchmarked at scales where loading would be impractical.
+"""
+import os
+import sys
+import gzip
+import json
+import argparse
+import numpy as np
+from datetime import datetime
+
+SYMPORTAL_ROOT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if SYMPORTAL_ROOT_DIRECTORY not in sys.path:
+    sys.path.insert(0, SYMPORTAL_ROOT_DIRECTORY)
+from general import ThreadSafeGeneral
+
+
+class SyntheticDataSetGenerator:
+    clade_list = list('ABCDEFGHI')
+    # The SymVar primers (as used in the initial mothur QC). The degenerate bases of the reverse primer are resolved.
+    pcr_fwd_primer = 'GAATTGCAGAACTCCGTGAACC'
+    pcr_rev_primer = 'CGGGTTCACTTGTCTGACTTCATGC'
+
+    def __init__(
+            self, num_samples, clade_mix=None, num_divs_per_clade=30, num_profiles_per_clade=8,
+            divs_per_profile=4, mixed_clade_proportion=0.2, seqs_per_sample=2000, background_seq_proportion=0.02,
+            read_length=250, seed=1234, ref_seq_fasta_path=None):
+        self.num_samples = num_samples
+        self.clade_mix = clade_mix if clade_mix is not None else {'A': 0.2, 'C': 0.6, 'D': 0.2}
+        self.num_divs_per_clade = num_divs_per_clade
+        self.num_profiles_per_clade = num_profiles_per_clade
+        self.divs_per_profile = divs_per_profile
+        self.mixed_clade_proportion = mixed_clade_proportion
+        self.seqs_per_sample = seqs_per_sample
+        self.background_seq_proportion = background_seq_proportion
+        self.read_length = read_length
+        self.seed = seed
+        self.random_state = np.random.RandomState(seed)
+        self.thread_safe_general = ThreadSafeGeneral()
+        if ref_seq_fasta_path is None:
+            ref_seq_fasta_path = os.path.join(SYMPORTAL_ROOT_DIRECTORY, 'symbiodiniaceaeDB', 'refSeqDB.fa')
+        self.ref_seq_name_to_seq_dict = self.thread_safe_general.create_dict_from_fasta(fasta_path=ref_seq_fasta_path)
+        self.clade_to_div_pool_dict = self._make_clade_to_div_pool_dict()
+        self.clade_to_profiles_dict = self._make_clade_to_profiles_dict()
+        # list of (sample name, {div name: absolute abundance}) tuples
+        self.samples = self._make_samples()
+
+    def _make_clade_to_div_pool_dict(self):
+        clade_to_div_pool_dict = {}
+        for clade in self.clade_mix.keys():
+            if clade not in self.clade_list:
+                raise RuntimeError(f'Unknown clade {clade} in clade_mix')
+            clade_divs = sorted(name for name in self.ref_seq_name_to_seq_dict.keys() if name[0] == clade)
+            if len(clade_divs) < self.divs_per_profile:
+                raise RuntimeError(
+                    f'Only {len(clade_divs)} reference sequences available for clade {clade}. '
+                    f'At least {self.divs_per_profile} are required.')
+            self.random_state.shuffle(clade_divs)
+            clade_to_div_pool_dict[clade] = clade_divs[:max(self.num_divs_per_clade, self.divs_per_profile)]
+        return clade_to_div_pool_dict
+
+    def _make_clade_to_profiles_dict(self):
+        """Each profile is a list of (div name, relative abundance) tuples in order of decreasing abundance.
+        The majority DIVs of the profiles of a clade are drawn from a small subset of the DIV pool so that, as in
+        real datasets, there are groups of profiles that share their majority DIV."""
+        clade_to_profiles_dict = {}
+        for clade, div_pool in self.clade_to_div_pool_dict.items():
+            majority_divs = div_pool[:max(1, self.num_profiles_per_clade // 3)]
+            profiles = []
+            for _ in range(self.num_profiles_per_clade):
+                maj_div = majority_divs[self.random_state.randint(len(majority_divs))]
+                other_divs = [div for div in div_pool if div != maj_div]
+                minor_divs = [
+                    str(div) for div in self.random_state.choice(other_divs, self.divs_per_profile - 1, replace=False)]
+                abundances = np.sort(self.random_state.dirichlet(
+                    np.arange(self.divs_per_profile, 0, -1) * 5))[::-1]
+                profiles.append(list(zip([maj_div] + minor_divs, abundances)))
+            clade_to_profiles_dict[clade] = profiles
+        return clade_to_profiles_dict
+
+    def _make_samples(self):
+        clades = list(self.clade_mix.keys())
+        clade_probabilities = np.array([self.clade_mix[clade] for clade in clades], dtype=float)
+        clade_probabilities /= clade_probabilities.sum()
+        samples = []
+        for sample_index in range(self.num_samples):
+            sample_clades = [clades[self.random_state.choice(len(clades), p=clade_probabilities)]]
+            if len(clades) > 1 and self.random_state.random_sample() < self.mixed_clade_proportion:
+                other_clades = [clade for clade in clades if clade != sample_clades[0]]
+                sample_clades.append(other_clades[self.random_state.randint(len(other_clades))])
+            # The first clade is the dominant clade of the sample
+            clade_proportions = [1.0] if len(sample_clades) == 1 else [0.7, 0.3]
+            div_to_abundance_dict = {}
+            for clade, clade_proportion in zip(sample_clades, clade_proportions):
+                self._add_clade_seqs_to_sample(
+                    clade=clade, num_seqs=int(self.seqs_per_sample * clade_proportion),
+                    div_to_abundance_dict=div_to_abundance_dict)
+            samples.append((f'synth_{sample_index:05d}', div_to_abundance_dict))
+        return samples
+
+    def _add_clade_seqs_to_sample(self, clade, num_seqs, div_to_abundance_dict):
+        profiles = self.clade_to_profiles_dict[clade]
+        profile = profiles[self.random_state.randint(len(profiles))]
+        profile_divs = [div for div, _ in profile]
+        rel_abunds = np.array([rel_abund for _, rel_abund in profile]) * self.random_state.lognormal(
+            0, 0.2, len(profile))
+        rel_abunds = rel_abunds / rel_abunds.sum() * (1 - self.background_seq_proportion)
+        background_divs = [div for div in self.clade_to_div_pool_dict[clade] if div not in profile_divs]
+        if background_divs:
+            background_divs = [str(div) for div in self.random_state.choice(
+                background_divs, min(3, len(background_divs)), replace=False)]
+            rel_abunds = np.append(rel_abunds, [self.background_seq_proportion / len(background_divs)] * len(
+                background_divs))
+        else:
+            rel_abunds = rel_abunds / rel_abunds.sum()
+        counts = self.random_state.multinomial(num_seqs, rel_abunds)
+        for div, count in zip(profile_divs + background_divs, counts):
+            if count:
+                div_to_abundance_dict[div] = div_to_abundance_dict.get(div, 0) + int(count)
+
+    def get_description(self):
+        """The parameters of the dataset (recorded in the benchmark results)"""
+        return {
+            'num_samples': self.num_samples, 'clade_mix': self.clade_mix,
+            'num_divs_per_clade': self.num_divs_per_clade, 'num_profiles_per_clade': self.num_profiles_per_clade,
+            'divs_per_profile': self.divs_per_profile, 'mixed_clade_proportion': self.mixed_clade_proportion,
+            'seqs_per_sample': self.seqs_per_sample, 'background_seq_proportion': self.background_seq_proportion,
+            'seed': self.seed}
+
+    # Fastq output
+    def write_fastq_data_set(self, output_directory):
+        """Write out a pair of gzipped fastq files for each sample and a datasheet for loading with --load.
+        Returns the path to the datasheet."""
+        os.makedirs(output_directory, exist_ok=True)
+        data_sheet_lines = [
+            ',,,,host_info if applicable,,,,,,sampling info if applicable,,,',
+            'sample_name,fastq_fwd_file_name,fastq_rev_file_name,sample_type,host_phylum,host_class,host_order,'
+            'host_family,host_genus,host_species,collection_latitude,collection_longitude,collection_date,'
+            'collection_depth']
+        for sample_name, div_to_abundance_dict in self.samples:
+            fwd_file_name = f'{sample_name}_R1.fastq.gz'
+            rev_file_name = f'{sample_name}_R2.fastq.gz'
+            self._write_sample_fastq_pair(
+                sample_name=sample_name, div_to_abundance_dict=div_to_abundance_dict,
+                fwd_path=os.path.join(output_directory, fwd_file_name),
+                rev_path=os.path.join(output_directory, rev_file_name))
+            data_sheet_lines.append(
+                f'{sample_name},{fwd_file_name},{rev_file_name},coral,cnidaria,anthozoa,scleractinia,poritidae,'
+                f'porites,lobata,24.339216,53.059163,20221008,0-12')
+        data_sheet_path = os.path.join(output_directory, 'synthetic_datasheet.csv')
+        self.thread_safe_general.write_list_to_destination(data_sheet_path, data_sheet_lines)
+        return data_sheet_path
+
+    def _write_sample_fastq_pair(self, sample_name, div_to_abundance_dict, fwd_path, rev_path):
+        read_counter = 0
+        with gzip.open(fwd_path, 'wt', compresslevel=1) as fwd_file, \
+                gzip.open(rev_path, 'wt', compresslevel=1) as rev_file:
+            for div, abundance in div_to_abundance_dict.items():
+                amplicon = self.pcr_fwd_primer + self.ref_seq_name_to_seq_dict[div] + self._rev_comp(
+                    self.pcr_rev_primer)
+                fwd_read = amplicon[:self.read_length]
+                rev_read = self._rev_comp(amplicon)[:self.read_length]
+                fwd_quality = 'I' * len(fwd_read)
+                rev_quality = 'I' * len(rev_read)
+                for _ in range(abundance):
+                    read_name = f'@{sample_name}_{read_counter}'
+                    fwd_file.write(f'{read_name} 1:N:0:1\n{fwd_read}\n+\n{fwd_quality}\n')
+                    rev_file.write(f'{read_name} 2:N:0:1\n{rev_read}\n+\n{rev_quality}\n')
+                    read_counter += 1
+
+    @staticmethod
+    def _rev_comp(sequence):
+        return sequence[::-1].translate(str.maketrans('ACGT', 'TGCA'))
+
+    # DB fixture
+    def create_db_fixture(self, data_set_name):
+        """Create a DataSet (with its DataSetSamples, CladeCollections and DataSetSampleSequences) in the database
+        directly from the synthetic samples as if it had been loaded. The DIVs must already be present in the
+        database as named ReferenceSequences (see populate_db_ref_seqs.py). Returns the DataSet."""
+        from dbApp.models import DataSet, DataSetSample, CladeCollection, DataSetSampleSequence, ReferenceSequence
+        from django.db import transaction
+
+        div_names = {div for _, div_to_abundance_dict in self.samples for div in div_to_abundance_dict.keys()}
+        ref_seq_name_to_obj_dict = {}
+        for name_chunk in self.thread_safe_general.chunks(div_names):
+            ref_seq_name_to_obj_dict.update(
+                {rs.name: rs for rs in ReferenceSequence.objects.filter(name__in=name_chunk, has_name=True)})
+        missing_divs = div_names.difference(ref_seq_name_to_obj_dict.keys())
+        if missing_divs:
+            raise RuntimeError(
+                f'{len(missing_divs)} of the synthetic DIVs are not present in the database as named '
+                f'ReferenceSequences. Please populate the database using populate_db_ref_seqs.py')
+
+        time_stamp = str(datetime.utcnow()).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
+        with transaction.atomic():
+            data_set = DataSet(
+                name=data_set_name, reference_fasta_database_used='symClade.fa', time_stamp=time_stamp,
+                loading_complete_time_stamp=time_stamp, working_directory='synthetic')
+            data_set.save()
+            self._create_fixture_data_set_samples(data_set=data_set, data_set_sample_model=DataSetSample)
+            data_set_sample_name_to_obj_dict = {
+                dss.name: dss for dss in DataSetSample.objects.filter(data_submission_from=data_set)}
+
+            CladeCollection.objects.bulk_create([
+                CladeCollection(clade=clade, data_set_sample_from=data_set_sample_name_to_obj_dict[sample_name])
+                for sample_name, div_to_abundance_dict in self.samples
+                for clade in sorted({div[0] for div in div_to_abundance_dict.keys()})], batch_size=500)
+            cc_key_to_obj_dict = {
+                (cc.data_set_sample_from_id, cc.clade): cc for cc in CladeCollection.objects.filter(
+                    data_set_sample_from__data_submission_from=data_set)}
+
+            dsss_list = []
+            cc_key_to_footprint_list_dict = {cc_key: [] for cc_key in cc_key_to_obj_dict.keys()}
+            for sample_name, div_to_abundance_dict in self.samples:
+                dss = data_set_sample_name_to_obj_dict[sample_name]
+                for div, abundance in div_to_abundance_dict.items():
+                    cc_key = (dss.id, div[0])
+                    cc_key_to_footprint_list_dict[cc_key].append(str(ref_seq_name_to_obj_dict[div].id))
+                    dsss_list.append(DataSetSampleSequence(
+                        clade_collection_found_in=cc_key_to_obj_dict[cc_key],
+                        reference_sequence_of=ref_seq_name_to_obj_dict[div],
+                        abundance=abundance, data_set_sample_from=dss))
+            DataSetSampleSequence.objects.bulk_create(dsss_list, batch_size=500)
+            for cc_key, cc in cc_key_to_obj_dict.items():
+                cc.footprint = ','.join(cc_key_to_footprint_list_dict[cc_key])
+            CladeCollection.objects.bulk_update(list(cc_key_to_obj_dict.values()), ['footprint'], batch_size=500)
+        return data_set
+
+    def _create_fixture_data_set_samples(self, data_set, data_set_sample_model):
+        data_set_samples = []
+        for sample_name, div_to_abundance_dict in self.samples:
+            total = sum(div_to_abundance_dict.values())
+            cladal_seq_totals = [
+                str(sum(abund for div, abund in div_to_abundance_dict.items() if div[0] == clade))
+                for clade in self.clade_list]
+            data_set_samples.append(data_set_sample_model(
+                data_submission_from=data_set, name=sample_name, num_contigs=total,
+                fastq_fwd_file_name=f'{sample_name}_R1.fastq.gz', fastq_rev_file_name=f'{sample_name}_R2.fastq.gz',
+                post_qc_absolute_num_seqs=total, post_qc_unique_num_seqs=len(div_to_abundance_dict),
+                absolute_num_sym_seqs=total, unique_num_sym_seqs=len(div_to_abundance_dict),
+                post_med_absolute=total, post_med_unique=len(div_to_abundance_dict),
+                cladal_seq_totals=json.dumps(cladal_seq_totals)))
+        data_set_sample_model.objects.bulk_create(data_set_samples, batch_size=500)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic paired fastq dataset for benchmarking')
+    parser.add_argument('--output_dir', type=str, required=True)
+    parser.add_argument('--num_samples', type=int, default=50)
+    parser.add_argument('--seqs_per_sample', type=int, default=2000)
+    parser.add_argument('--num_profiles_per_clade', type=int, default=8)
+    parser.add_argument('--divs_per_profile', type=int, default=4)
+    parser.add_argument(
+        '--clade_mix', type=str, default='{"A": 0.2, "C": 0.6, "D": 0.2}',
+        help='JSON dict of clade to the proportion of samples dominated by that clade')
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    generator = SyntheticDataSetGenerator(
+        num_samples=args.num_samples, clade_mix=json.loads(args.clade_mix),
+        num_profiles_per_clade=args.num_profiles_per_clade, divs_per_profile=args.divs_per_profile,
+        seqs_per_sample=args.seqs_per_sample, seed=args.seed)
+    print(f'Datasheet written to {generator.write_fastq_data_set(os.path.abspath(args.output_dir))}')
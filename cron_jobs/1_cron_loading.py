@@ -10,11 +10,14 @@ server. Whether or not result file will be output as part of the loadings will d
 Submission object. If results are being output as part of the loading, the output directory will be stored in the
 framework_results_dir_path attribute of the Submission object.
 
-As with the other cron jobs we will ensure that only one instance of the script is running at any given time.
+Several submissions may be loaded at the same time under a global core budget (--core_budget) with the cores
+allocated to the loadings in proportion to the number of samples of the submissions. See loading_scheduler.py.
+The core budget is that of a single instance so, as with the other cron jobs, we ensure that only one instance of
+the script is running at any given time (a lock is held on cron_loading.lock).
 """
 
-import subprocess
-import platform
+import argparse
+import fcntl
 import os
 import sys
 from pathlib import Path
@@ -27,152 +30,66 @@ sys.path.append(str(Path(__file__).resolve().parent))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
-from dbApp.models import Submission
-from django.db.models import Q
-import main
+from loading_scheduler import LoadingScheduler
 from datetime import datetime
 
 
 class CronLoading:
-    def __init__(self):
-        self._check_no_other_instance_running()
+    def __init__(self, core_budget=None):
+        self.loading_scheduler = LoadingScheduler(core_budget=core_budget)
+        self.submissions_to_load = self.loading_scheduler.get_submissions_to_load()
 
-        self.submissions_to_load = list(
-            Submission.objects.filter(progress_status="transfer_to_framework_server_complete", error_has_occured=False, loading_started_date_time=None)
-        )
-
-        # Also check for the presence of a submission that has started loading but has not completed
+        # Also check for the presence of a submission that has started loading but has not completed.
+        # These are either being loaded by another instance of this script or their loading died.
+        # Either way they are not loaded here.
         time_now = str(datetime.utcnow()).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
-        submissions_in_progress = Submission.objects.filter(progress_status="transfer_to_framework_server_complete").filter(~Q(loading_started_date_time=None))
+        submissions_in_progress = self.loading_scheduler.get_submissions_in_progress()
         if submissions_in_progress:
             print(f"{time_now}: Incomplete loading detected:")
             for sub in submissions_in_progress:
-                print(f"\t{sub.id}: {sub.name}")
-            sys.exit("Incomplete loading detected:")
+                print(f"\t{sub.id}: {sub.name} (loading started {sub.loading_started_date_time})")
 
-        
         if self.submissions_to_load:
             print(f"{time_now}: The following submission have been found to load.")
             for sub in self.submissions_to_load:
-                print(sub.name)
+                print(f"\t{sub.id}: {sub.name} ({sub.number_samples} samples)")
         else:
             print(f"{time_now}: No submission found for loading.")
 
-        # Dynamics
-        self.submission_to_load = None
-        self.work_flow_manager = None
-
     def load(self):
         """
-        Perform a SymPortal loading for each submission in self.submissions_to_transfer.
-        Await a successful exit code before starting the next loading.
-        """
-        # Load each submission
-        for sub_to_load in self.submissions_to_load:
-            self.submission_to_load = sub_to_load
-            self._load_submission()
-
-    def _load_submission(self):
+        Perform a SymPortal loading for each submission in self.submissions_to_load,
+        several at a time within the core budget.
         """
-        Do a loading by creating a custom args list that can be processed by a SymPortalWorkFlowManager
-        """
-        # Get the name of the datasheet
-        datasheet_path = os.path.join(self.submission_to_load.framework_local_dir_path, f"{self.submission_to_load.name}_datasheet.xlsx")
-        if not os.path.exists(datasheet_path):
-            datasheet_path = os.path.join(self.submission_to_load.framework_local_dir_path, f"{self.submission_to_load.name}_datasheet.csv")
-            if not os.path.exists(datasheet_path):
-                raise FileNotFoundError(f"Couldn't find {datasheet_path}")
-        # TODO implement error logic
-        # number of proc will be the minimum between 30 and the number of samples in the submission
-        # However when running this on the mac for debug we will pull this down to 4
-        if platform.system() == 'Linux':
-            num_proc = min(30, int(self.submission_to_load.number_samples))
-        else:
-            num_proc = 4
-        # We will only output results if this loading is not proceeding on to an analysis
-        # We will provide the --study_user_string and --study_name arguments for use in creating the Study object
-        # We will also pass --is_cron_loading to let SP know that this is being initiated by a cron job
-        # Currently we only have a single user associated to each Submission object so we will only be able
-        # to associate a single user to the Study object
-        study_user_string = self.submission_to_load.submitting_user.name
-        if self.submission_to_load.for_analysis:
-            # No outputs
-            custom_args_list = [
-                '--load', self.submission_to_load.framework_local_dir_path,
-                '--data_sheet', datasheet_path, '--num_proc', str(num_proc), '--no_output',
-                '--name', self.submission_to_load.name, '--is_cron_loading',
-                '--study_user_string', study_user_string,
-                '--study_name', self.submission_to_load.name
-            ]
-        else:
-            # With output
-            custom_args_list = [
-                '--load', self.submission_to_load.framework_local_dir_path,
-                '--data_sheet', datasheet_path, '--num_proc', str(num_proc),
-                '--name', self.submission_to_load.name, '--is_cron_loading',
-                '--study_user_string', study_user_string,
-                '--study_name', self.submission_to_load.name
-            ]
-        try:
-            self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
-            self.submission_to_load.loading_started_date_time = self.work_flow_manager.date_time_str
-            self.submission_to_load.save()
-            self.work_flow_manager.start_work_flow()
-        except Exception as e:
-            # TODO handle errors for Submission objects and cron jobs
-            self.submission_to_load.error_has_occured = True
-            self.submission_to_load.save()
-            raise NotImplementedError('An error has occured while trying to load the Submission data.')
-
-        # Once here we will have finished the loading.
-        # Update the status of the Submission object and assign results path if not for_analysis
-        if not self.submission_to_load.for_analysis:
-            self.submission_to_load.framework_results_dir_path = self.work_flow_manager.data_loading_object.output_directory
-
-        # Assign the associated DataSet and Study objects
-        self.submission_to_load.associated_dataset = self.work_flow_manager.data_loading_object.dataset_object
-        self.submission_to_load.associated_study = self.work_flow_manager.data_loading_object.study
-
-        # Log the loading complete time
-        self.submission_to_load.loading_complete_date_time = str(
-                datetime.utcnow()
-            ).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
-        if self.submission_to_load.for_analysis:
-            self.submission_to_load.progress_status = "framework_loading_complete"
-        else:
-            # Then there will not be an analysis for this submission
-            # We have already complted the output
-            self.submission_to_load.progress_status = "framework_output_complete"
-
-        # At this point the loading is complete for a single submission object. Now save and do next.
-        self.submission_to_load.save()
-
-    def _check_no_other_instance_running(self):
-        try:
-            if sys.argv[1] == 'debug':  # For development only
-                pass
-            else:
-                raise RuntimeError('Unknown arg at sys.argv[1]')
-        except IndexError:
-            captured_output = subprocess.run(['pgrep', '-fa', 'cron_loading.py'], capture_output=True)
-            if captured_output.returncode == 0:  # PIDs were returned
-                procs = captured_output.stdout.decode('UTF-8').rstrip().split('\n')
-                if platform.system() == 'Linux':
-                    print("Linux system detected")
-                    # Then we expect there to be one PID for the current process
-                    # And one for the cron job
-                    if len(procs) > 2:
-                        print("The following procs were returned:")
-                        for p in procs:
-                            print(p)
-                        time_now = str(datetime.utcnow()).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
-                        raise RuntimeError(f"\n{time_now}:More than one instance of cron_loading detected. Killing process.")
-                else:
-                    # Then we are likely on mac and we expect no PIDs
-                    sys.exit()
-            else:
-                # No PIDs returned
-                pass
-
-cron_loading = CronLoading()
-cron_loading.load()
\ No newline at end of file
+        loaded_submission_uids, failed_submission_uids = self.loading_scheduler.run(
+            submissions_to_load=self.submissions_to_load)
+        if failed_submission_uids:
+            raise RuntimeError(
+                f'An error has occured while trying to load the data of the Submissions: '
+                f'{",".join([str(uid) for uid in failed_submission_uids])}')
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Load the Submissions transferred to the framework server')
+    parser.add_argument(
+        '--core_budget', type=int,
+        help='The total number of cores to be shared by the concurrent loadings [30 on Linux, otherwise 4]')
+    # Kept for backwards compatibility with the previous 'debug' argument. It no longer has an effect.
+    parser.add_argument('debug', nargs='?', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def _acquire_instance_lock():
+    lock_file = open(os.path.join(str(Path(__file__).resolve().parent), 'cron_loading.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        sys.exit('Another instance of 1_cron_loading.py is running. Quiting.')
+    # Keep a reference to the open file so that the lock is held for the life of the process
+    return lock_file
+
+
+args = _parse_args()
+instance_lock = _acquire_instance_lock()
+cron_loading = CronLoading(core_budget=args.core_budget)
+cron_loading.load()
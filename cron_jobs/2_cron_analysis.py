@@ -16,6 +16,9 @@ using the framework --output_study_from_analysis flag.
 One the output is complete the status of the Submission object will be set to framework_output_complete.
 The framework_results_dir_path attribute of the submission object will be set. This, combined with a True for_analysis
 will be the keys for the next cron job to transfer these files over to the symportal.org server.
+
+The analysis and output themselves are done by submission_analysis.py, which is shared with the submission pipeline
+daemon (submission_pipeline.py).
 """
 
 import sys
@@ -32,8 +35,8 @@ sys.path.append(str(Path(__file__).resolve().parent))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
-from dbApp.models import Submission, DataAnalysis
-import main
+from dbApp.models import Submission
+from submission_analysis import SubmissionAnalysis
 
 
 class CronAnalysis:
@@ -73,19 +76,7 @@ class CronAnalysis:
             print(f"{date} As there are still submissions to be transfered or submissions to be loaded we will not run an analysis now.")
             sys.exit("Postponing analysis. Quiting.")
 
-        self.dataset_objects = [
-            s.associated_dataset for s in self.submission_objects]
-        self.dataset_string = ','.join([str(d.id) for d in self.dataset_objects])
-        self.dt_str = self._get_date_time()
-        self.analysis_name = f'{self.dt_str}_DBV'
-        # number of proc will be 30
-        # However when running this on the mac for debug we will pull this down to 4
-        if platform.system() == 'Linux':
-            self.num_proc = 30
-        else:
-            self.num_proc = 4
-        # Dynamics
-        self.work_flow_manager = None
+        self.submission_analysis = SubmissionAnalysis()
 
     def output(self):
         """
@@ -98,69 +89,14 @@ class CronAnalysis:
             error_has_occured=False,
             for_analysis=True
         ).all()
-
-
-        for sub_obj in self.submission_objects:
-            # Because we don't want to rely on the fact that an anaysis was conduced above, we will grab the latest
-            # DataAnalysis that contains the Study/DataSet objects associated with it.
-            latest_dataanalysis = list(DataAnalysis.objects.filter(
-                list_of_data_set_uids__contains=str(sub_obj.associated_dataset.id)).order_by('-id'))[0]
-            study_id_str = str(sub_obj.associated_study.id)
-            custom_args_list = [
-                '--output_study_from_analysis', study_id_str, '--num_proc', str(self.num_proc),
-                '--data_analysis_id', str(latest_dataanalysis.id),
-            ]
-            try:
-                self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
-                sub_obj.study_output_started_date_time = self.work_flow_manager.date_time_str
-                sub_obj.save()
-                self.work_flow_manager.start_work_flow()
-            except Exception as e:
-                # TODO handle errors for Submission objects and cron jobs
-                print(e)
-                raise NotImplementedError(
-                    f'{self.dt_str}: An error has occured while trying to output results for {sub_obj.name}.'
-                )
-
-            # Here the output is complete
-            # Log the complete time and the output directory on the framework server
-            sub_obj.study_output_complete_date_time = self._get_date_time()
-            sub_obj.framework_results_dir_path = self.work_flow_manager.output_dir
-            sub_obj.progress_status = "framework_output_complete"
-            sub_obj.save()
+        self.submission_analysis.output(self.submission_objects)
 
     def analyse(self):
         """
         Run a SymPortal analysis that includes all of the DataSets of the preivous analysis plus the
         DataSet/Study objects associated with the self.submission_objects
         """
-
-        custom_args_list = [
-            '--analyse_next', self.dataset_string, '--num_proc', str(self.num_proc), '--no_output',
-            '--name', self.analysis_name
-        ]
-
-        try:
-            # Run the analysis
-            self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
-            # Log the start time of the analysis
-            for sub_obj in self.submission_objects:
-                sub_obj.analysis_started_date_time = self.work_flow_manager.date_time_str
-                sub_obj.save()
-            self.work_flow_manager.start_work_flow()
-        except Exception as e:
-            # TODO handle errors for Submission objects and cron jobs
-            print(e)
-            raise NotImplementedError(
-                f'{self.dt_str} An error has occured while trying to analyse the current batch of Study objects.'
-            )
-
-        # At this point the analysis is complete
-        # Update the status and analysis complete attribute then move on to outputting each submission
-        for sub_obj in self.submission_objects:
-            sub_obj.progress_status = 'framework_analysis_complete'
-            sub_obj.analysis_complete_date_time = self._get_date_time()
-            sub_obj.save()
+        self.submission_analysis.analyse(self.submission_objects)
 
     @staticmethod
     def _check_no_other_instance_running():
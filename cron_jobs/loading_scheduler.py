@@ -0,0 +1,269 @@
+"""
+Scheduler for the loading of the Submission objects that have been transferred to the framework server
+(progress_status of transfer_to_framework_server_complete).
+
+Several Submissions are loaded concurrently under a core budget. Each Submission is claimed atomically
+before it is loaded (see LoadingScheduler._claim_submission) so that several instances of the scheduler can run
+at the same time without loading a Submission twice. However, the core budget is that of a single instance, so the
+callers make sure that only one instance is run at a time (1_cron_loading.py and the submission pipeline daemon
+each hold a lock). The cores of the budget are allocated to the loadings in
+proportion to the number of samples of the Submissions (see LoadingScheduler.get_num_proc_allocation) so that
+small Submissions are not held up behind a large one.
+
+Django must be set up before this module is imported (see 1_cron_loading.py).
+"""
+import os
+import queue
+import platform
+from datetime import datetime
+from multiprocessing import Queue as mp_Queue, Process
+from queue import Queue as mt_Queue
+from threading import Thread
+from django import db
+from dbApp.models import Submission
+import main
+
+
+def run_symportal_work_flow(custom_args_list):
+    """The default work_flow_runner of the LoadingScheduler. Run a SymPortal workflow and return its
+    SymPortalWorkFlowManager."""
+    work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
+    work_flow_manager.start_work_flow()
+    return work_flow_manager
+
+
+class LoadingScheduler:
+    def __init__(
+            self, core_budget=None, max_cores_per_loading=30, work_flow_runner=run_symportal_work_flow,
+            multiprocess=True, poll_interval=10):
+        """
+        :param core_budget: The total number of cores that may be used by the concurrent loadings.
+        Defaults to 30 on Linux and 4 otherwise (e.g. when debugging on a mac).
+        :param max_cores_per_loading: The maximum number of cores allocated to a single loading.
+        :param work_flow_runner: Called with the custom args list of a loading. Should run the loading and
+        return the SymPortalWorkFlowManager (or an object with the same date_time_str and data_loading_object
+        attributes, e.g. when testing).
+        :param multiprocess: Whether the loadings are run in separate processes (the default) or threads.
+        NB the SymPortal workflows themselves are not thread safe so threads should only be used for testing.
+        """
+        if core_budget is None:
+            core_budget = 30 if platform.system() == 'Linux' else 4
+        if core_budget < 1:
+            raise RuntimeError(f'The core budget must be at least 1 (got {core_budget})')
+        self.core_budget = core_budget
+        self.max_cores_per_loading = max_cores_per_loading
+        self.work_flow_runner = work_flow_runner
+        self.multiprocess = multiprocess
+        self.poll_interval = poll_interval
+        if self.multiprocess:
+            self.done_queue = mp_Queue()
+        else:
+            self.done_queue = mt_Queue()
+        # Dynamics
+        # The Submissions waiting to be loaded
+        self.waiting_submissions = []
+        # submission uid: (worker (Process or Thread), Submission, num_proc) for the loadings in progress
+        self.running_loading_dict = {}
+        self.loaded_submission_uids = []
+        self.failed_submission_uids = []
+
+    @staticmethod
+    def get_submissions_to_load():
+        return list(Submission.objects.filter(
+            progress_status="transfer_to_framework_server_complete", error_has_occured=False,
+            loading_started_date_time=None).order_by('id'))
+
+    @staticmethod
+    def get_submissions_in_progress():
+        """The Submissions that have been claimed but whose loading has not completed. These are either being
+        loaded by another instance of the scheduler or their loading died without being able to record an error."""
+        return list(Submission.objects.filter(
+            progress_status="transfer_to_framework_server_complete", error_has_occured=False,
+            loading_started_date_time__isnull=False).order_by('id'))
+
+    def run(self, submissions_to_load=None):
+        """Load the Submissions (by default all of the Submissions waiting to be loaded), running as many of the
+        loadings concurrently as the core budget allows, and return once all of the loadings have finished."""
+        if submissions_to_load is None:
+            submissions_to_load = self.get_submissions_to_load()
+        self.waiting_submissions = list(submissions_to_load)
+        while self.waiting_submissions or self.running_loading_dict:
+            self._start_loadings_that_fit_in_core_budget()
+            if self.running_loading_dict:
+                self._wait_for_a_loading_to_finish()
+        return self.loaded_submission_uids, self.failed_submission_uids
+
+    def get_num_proc_allocation(self, submission, total_num_samples, num_submissions):
+        """The share of the core budget for a Submission. Each of the num_submissions Submissions (waiting or
+        being loaded, up to the core budget) is given 1 core and the remaining cores are shared in proportion to
+        the number of samples of the Submission out of total_num_samples. The shares therefore never add up to
+        more than the core budget, so a large Submission never takes all of the cores
+        while smaller Submissions wait. At most the number of samples or max_cores_per_loading."""
+        num_samples = int(submission.number_samples)
+        num_reserved_cores = min(num_submissions, self.core_budget)
+        share = 1 + int((self.core_budget - num_reserved_cores) * num_samples / max(total_num_samples, 1))
+        return max(1, min(share, num_samples, self.max_cores_per_loading))
+
+    def _get_num_free_cores(self):
+        return self.core_budget - sum(num_proc for _, _, num_proc in self.running_loading_dict.values())
+
+    def _start_loadings_that_fit_in_core_budget(self):
+        """Start the loading of each of the waiting Submissions (in order) whose allocation fits in the
+        free cores. Smaller Submissions may therefore start before a larger Submission that is waiting for cores.
+        Nothing is held back when there are no loadings running, as the allocation is never more
+        than the core budget."""
+        total_num_samples = sum(int(sub.number_samples) for sub in self.waiting_submissions) + sum(
+            int(sub.number_samples) for _, sub, _ in self.running_loading_dict.values())
+        num_submissions = len(self.waiting_submissions) + len(self.running_loading_dict)
+        for submission in list(self.waiting_submissions):
+            num_proc = self.get_num_proc_allocation(submission, total_num_samples, num_submissions)
+            if num_proc > self._get_num_free_cores():
+                continue
+            self.waiting_submissions.remove(submission)
+            if not self._claim_submission(submission):
+                print(f'{self._get_date_time()}: Submission {submission.id} {submission.name} '
+                      f'has already been claimed for loading. Skipping.')
+                continue
+            self._start_loading(submission, num_proc)
+
+    def _claim_submission(self, submission):
+        """Atomically transition the Submission from waiting to be loaded to loading started. The conditional
+        UPDATE only matches the Submission if it has not already been claimed, so only one of any number of
+        concurrent claims (from this or any other scheduler instance) can succeed."""
+        num_claimed = Submission.objects.filter(
+            id=submission.id, progress_status="transfer_to_framework_server_complete", error_has_occured=False,
+            loading_started_date_time=None).update(loading_started_date_time=self._get_date_time())
+        return num_claimed == 1
+
+    def _start_loading(self, submission, num_proc):
+        print(f'{self._get_date_time()}: Starting loading of Submission {submission.id} {submission.name} '
+              f'({submission.number_samples} samples) with {num_proc} processors')
+        if self.multiprocess:
+            # The DB connections must not be shared with the child processes
+            db.connections.close_all()
+            worker = Process(target=self._load_submission_worker, args=(submission.id, num_proc))
+        else:
+            worker = Thread(target=self._load_submission_worker, args=(submission.id, num_proc))
+        self.running_loading_dict[submission.id] = (worker, submission, num_proc)
+        worker.start()
+
+    def _wait_for_a_loading_to_finish(self):
+        while True:
+            try:
+                submission_uid, status = self.done_queue.get(timeout=self.poll_interval)
+                self._finish_loading(submission_uid, status)
+                return
+            except queue.Empty:
+                # Check for workers that died without reporting (e.g. killed by the OS)
+                dead_submission_uids = [
+                    sub_uid for sub_uid, (worker, _, _) in self.running_loading_dict.items()
+                    if not worker.is_alive()]
+                if dead_submission_uids:
+                    # Give any report that was put just before the worker exited the chance to be read
+                    try:
+                        submission_uid, status = self.done_queue.get(timeout=1)
+                        self._finish_loading(submission_uid, status)
+                        return
+                    except queue.Empty:
+                        for sub_uid in dead_submission_uids:
+                            self._finish_loading(sub_uid, 'ERROR')
+                        return
+
+    def _finish_loading(self, submission_uid, status):
+        worker, submission, num_proc = self.running_loading_dict.pop(submission_uid)
+        worker.join()
+        if status == 'DONE':
+            print(f'{self._get_date_time()}: Loading of Submission {submission.id} {submission.name} complete')
+            self.loaded_submission_uids.append(submission_uid)
+        else:
+            print(f'{self._get_date_time()}: Loading of Submission {submission.id} {submission.name} failed')
+            # Make sure that the error is recorded even if the worker was not able to record it itself
+            Submission.objects.filter(id=submission_uid).update(error_has_occured=True)
+            self.failed_submission_uids.append(submission_uid)
+
+    def _load_submission_worker(self, submission_uid, num_proc):
+        status = 'ERROR'
+        try:
+            submission = Submission.objects.get(id=submission_uid)
+            SubmissionLoader(
+                submission=submission, num_proc=num_proc, work_flow_runner=self.work_flow_runner).load()
+            status = 'DONE'
+        except Exception as e:
+            print(f'{self._get_date_time()}: An error has occured while trying to load the data of '
+                  f'Submission {submission_uid}: {e}')
+            Submission.objects.filter(id=submission_uid).update(error_has_occured=True)
+        finally:
+            self.done_queue.put((submission_uid, status))
+            if not self.multiprocess:
+                db.connection.close()
+
+    @staticmethod
+    def _get_date_time():
+        return str(datetime.utcnow()).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
+
+
+class SubmissionLoader:
+    """Load the seq files and datasheet of a single (claimed) Submission into the SymPortal database and
+    update the Submission accordingly."""
+    def __init__(self, submission, num_proc, work_flow_runner=run_symportal_work_flow):
+        self.submission_to_load = submission
+        self.num_proc = num_proc
+        self.work_flow_runner = work_flow_runner
+        self.work_flow_manager = None
+
+    def load(self):
+        """
+        Do a loading by creating a custom args list that can be processed by a SymPortalWorkFlowManager
+        """
+        datasheet_path = self._get_datasheet_path()
+        # We will only output results if this loading is not proceeding on to an analysis
+        # We will provide the --study_user_string and --study_name arguments for use in creating the Study object
+        # We will also pass --is_cron_loading to let SP know that this is being initiated by a cron job
+        # Currently we only have a single user associated to each Submission object so we will only be able
+        # to associate a single user to the Study object
+        study_user_string = self.submission_to_load.submitting_user.name
+        custom_args_list = [
+            '--load', self.submission_to_load.framework_local_dir_path,
+            '--data_sheet', datasheet_path, '--num_proc', str(self.num_proc),
+            '--name', self.submission_to_load.name, '--is_cron_loading',
+            '--study_user_string', study_user_string,
+            '--study_name', self.submission_to_load.name
+        ]
+        if self.submission_to_load.for_analysis:
+            # No outputs
+            custom_args_list.append('--no_output')
+        self.work_flow_manager = self.work_flow_runner(custom_args_list)
+
+        # Once here we will have finished the loading.
+        # Update the status of the Submission object and assign results path if not for_analysis
+        if not self.submission_to_load.for_analysis:
+            self.submission_to_load.framework_results_dir_path = \
+                self.work_flow_manager.data_loading_object.output_directory
+
+        # Assign the associated DataSet and Study objects
+        self.submission_to_load.associated_dataset = self.work_flow_manager.data_loading_object.dataset_object
+        self.submission_to_load.associated_study = self.work_flow_manager.data_loading_object.study
+
+        # Log the loading complete time
+        self.submission_to_load.loading_complete_date_time = str(
+                datetime.utcnow()
+            ).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
+        if self.submission_to_load.for_analysis:
+            self.submission_to_load.progress_status = "framework_loading_complete"
+        else:
+            # Then there will not be an analysis for this submission
+            # We have already complted the output
+            self.submission_to_load.progress_status = "framework_output_complete"
+
+        # At this point the loading is complete for a single submission object.
+        self.submission_to_load.save()
+
+    def _get_datasheet_path(self):
+        datasheet_path = os.path.join(
+            self.submission_to_load.framework_local_dir_path, f"{self.submission_to_load.name}_datasheet.xlsx")
+        if not os.path.exists(datasheet_path):
+            datasheet_path = os.path.join(
+                self.submission_to_load.framework_local_dir_path, f"{self.submission_to_load.name}_datasheet.csv")
+            if not os.path.exists(datasheet_path):
+                raise FileNotFoundError(f"Couldn't find {datasheet_path}")
+        return datasheet_path
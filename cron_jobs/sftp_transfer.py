@@ -0,0 +1,207 @@
+"""
+Parallel, resumable download of the files of a directory on a remote server over SFTP. Used for the transfer of the
+Submission files from the web server to the framework server (see web_to_framework_transfer.py).
+
+The files are downloaded by a pool of worker threads, each with its own SFTP channel on the SSH connection
+so that several files are in flight at once (a single SFTP channel is limited by its window on a high latency link).
+A file is appended to from the size of any partial local copy rather than being downloaded again from
+the start. Its md5sum is computed as it is written (including over the partial local copy) and checked against
+the expected md5sum so that the file does not have to be read again to be verified. The verified files are
+recorded in a manifest in the local directory so that they are skipped if the transfer is run again
+after an interruption.
+
+This module does not use Django so that it can be tested on its own.
+"""
+import hashlib
+import json
+import os
+import stat
+from queue import Queue as mt_Queue
+from threading import Thread, Lock
+import paramiko
+
+
+class SFTPTransferEngine:
+    manifest_file_name = '.sftp_transfer_manifest.json'
+
+    def __init__(self, ssh_client, num_channels=4, block_size=1048576, max_attempts=4, max_concurrent_requests=64):
+        """
+        :param ssh_client: A connected paramiko.SSHClient.
+        :param num_channels: The number of SFTP channels (and worker threads) used for the downloads.
+        :param block_size: The size (in bytes) of the blocks that are read from the remote files.
+        :param max_attempts: The number of times the download of a file is attempted before giving up.
+        A network error resumes the download from the local size. A checksum mismatch starts the download again
+        from the start.
+        :param max_concurrent_requests: The maximum number of read requests that are in flight at once on each
+        channel. Without a limit, the read requests for the whole of a file are sent at once and the responses are
+        buffered in memory faster than they are written out.
+        """
+        if num_channels < 1:
+            raise RuntimeError(f'The number of SFTP channels must be at least 1 (got {num_channels})')
+        self.ssh_client = ssh_client
+        self.num_channels = num_channels
+        self.block_size = block_size
+        self.max_attempts = max_attempts
+        self.max_concurrent_requests = max_concurrent_requests
+        # Dynamics that are updated with each call to transfer_files
+        self.manifest_lock = Lock()
+        self.manifest_dict = None
+        self.manifest_path = None
+        self.transferred_md5_dict = None
+        self.failed_file_dict = None
+
+    def get_remote_file_size_dict(self, remote_dir):
+        """file name: size in bytes for each of the regular files in remote_dir.
+        As before, only files with a '.' in their name are transferred."""
+        sftp_client = self.ssh_client.open_sftp()
+        try:
+            return {
+                attr.filename: attr.st_size for attr in sftp_client.listdir_attr(remote_dir)
+                if stat.S_ISREG(attr.st_mode) and '.' in attr.filename}
+        finally:
+            sftp_client.close()
+
+    def transfer_files(self, remote_dir, local_dir, file_size_dict, expected_md5_dict=None):
+        """
+        Download the files of file_size_dict (file name: remote size) from remote_dir to local_dir.
+        :param expected_md5_dict: file name: md5sum. The files with an md5sum are verified against it.
+        The other files are only checked for their size.
+        :return: file name: md5sum of each of the files.
+        An error is raised if any of the files could not be transferred once all of the other files have been
+        transferred. The transferred files are kept so that they are skipped when the transfer is run again.
+        The error is a ConnectionError if all of the failures were network errors (i.e. running the transfer again
+        later may succeed) and a RuntimeError if the md5sum of any of the files did not match.
+        """
+        if expected_md5_dict is None:
+            expected_md5_dict = {}
+        os.makedirs(local_dir, exist_ok=True)
+        self.manifest_path = os.path.join(local_dir, self.manifest_file_name)
+        self.manifest_dict = self._read_manifest()
+        self.transferred_md5_dict = {}
+        self.failed_file_dict = {}
+
+        file_queue = mt_Queue()
+        # Largest files first so that a large file is not left to download on its own at the end
+        for file_name, file_size in sorted(file_size_dict.items(), key=lambda x: x[1], reverse=True):
+            if self._file_is_in_manifest(local_dir, file_name, file_size, expected_md5_dict.get(file_name)):
+                print(f'{os.path.join(local_dir, file_name)} already transferred')
+                self.transferred_md5_dict[file_name] = self.manifest_dict[file_name]['md5']
+                continue
+            file_queue.put((file_name, file_size))
+
+        num_workers = min(self.num_channels, file_queue.qsize())
+        for n in range(num_workers):
+            file_queue.put('STOP')
+
+        all_threads = []
+        for n in range(num_workers):
+            t = Thread(target=self._transfer_worker, args=(file_queue, remote_dir, local_dir, expected_md5_dict))
+            all_threads.append(t)
+            t.start()
+
+        for t in all_threads:
+            t.join()
+
+        if self.failed_file_dict:
+            error_message = f'Could not transfer {len(self.failed_file_dict)} files from {remote_dir}: ' + '; '.join(
+                [f'{file_name}: {error}' for file_name, error in self.failed_file_dict.items()])
+            if any(isinstance(error, RuntimeError) for error in self.failed_file_dict.values()):
+                raise RuntimeError(error_message)
+            raise ConnectionError(error_message)
+        return self.transferred_md5_dict
+
+    def remove_manifest(self, local_dir):
+        """Remove the manifest once the transfer of the directory is complete."""
+        manifest_path = os.path.join(local_dir, self.manifest_file_name)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+    def _transfer_worker(self, file_queue, remote_dir, local_dir, expected_md5_dict):
+        sftp_client = None
+        for file_name, file_size in iter(file_queue.get, 'STOP'):
+            remote_path = f'{remote_dir.rstrip("/")}/{file_name}'
+            local_path = os.path.join(local_dir, file_name)
+            expected_md5 = expected_md5_dict.get(file_name)
+            last_error = None
+            for attempt in range(self.max_attempts):
+                try:
+                    if sftp_client is None:
+                        sftp_client = self.ssh_client.open_sftp()
+                    print(f'getting: {remote_path}')
+                    md5 = self._download_file(sftp_client, remote_path, local_path, file_size)
+                except (OSError, EOFError, paramiko.SSHException) as e:
+                    # The channel may be broken so a new one is opened for the next attempt,
+                    # which will resume from the size of the partial local copy.
+                    last_error = e
+                    if sftp_client is not None:
+                        sftp_client.close()
+                        sftp_client = None
+                    continue
+                if expected_md5 is not None and md5 != expected_md5:
+                    last_error = RuntimeError(f'md5sum {md5} does not match the expected {expected_md5}')
+                    os.remove(local_path)
+                    continue
+                self._add_to_manifest(file_name, file_size, md5)
+                last_error = None
+                break
+            if last_error is not None:
+                with self.manifest_lock:
+                    self.failed_file_dict[file_name] = last_error
+        if sftp_client is not None:
+            sftp_client.close()
+
+    def _download_file(self, sftp_client, remote_path, local_path, remote_size):
+        """Download the remote file, appending to any partial local copy, and return its md5sum."""
+        md5 = hashlib.md5()
+        offset = 0
+        if os.path.exists(local_path):
+            offset = os.path.getsize(local_path)
+            if offset > remote_size:
+                os.remove(local_path)
+                offset = 0
+            else:
+                with open(local_path, 'rb') as local_file:
+                    for block in iter(lambda: local_file.read(self.block_size), b''):
+                        md5.update(block)
+        with sftp_client.open(remote_path, 'rb') as remote_file, open(local_path, 'ab') as local_file:
+            if offset < remote_size:
+                remote_file.seek(offset)
+                # Pipeline the read requests rather than waiting for each block in turn
+                remote_file.prefetch(remote_size, max_concurrent_requests=self.max_concurrent_requests)
+                for block in iter(lambda: remote_file.read(self.block_size), b''):
+                    local_file.write(block)
+                    md5.update(block)
+        local_size = os.path.getsize(local_path)
+        if local_size != remote_size:
+            raise EOFError(f'{local_path} is {local_size} bytes but {remote_path} is {remote_size} bytes')
+        return md5.hexdigest()
+
+    def _file_is_in_manifest(self, local_dir, file_name, file_size, expected_md5):
+        if file_name not in self.manifest_dict:
+            return False
+        manifest_entry = self.manifest_dict[file_name]
+        local_path = os.path.join(local_dir, file_name)
+        if manifest_entry['size'] != file_size or not os.path.exists(local_path) or \
+                os.path.getsize(local_path) != file_size:
+            return False
+        return expected_md5 is None or manifest_entry['md5'] == expected_md5
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            # E.g. a manifest that was not fully written. The files will be checked again.
+            return {}
+
+    def _add_to_manifest(self, file_name, file_size, md5):
+        with self.manifest_lock:
+            self.transferred_md5_dict[file_name] = md5
+            self.manifest_dict[file_name] = {'size': file_size, 'md5': md5}
+            # Write to a temporary file and then replace the manifest so that it is never left half written
+            temp_manifest_path = f'{self.manifest_path}.tmp'
+            with open(temp_manifest_path, 'w') as f:
+                json.dump(self.manifest_dict, f)
+            os.replace(temp_manifest_path, self.manifest_path)
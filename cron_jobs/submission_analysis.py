@@ -0,0 +1,118 @@
+"""
+The analysis and output of the loaded Submission objects. Used by 2_cron_analysis.py and the submission pipeline
+daemon (submission_pipeline.py).
+
+The DataSet objects associated with the Submissions (progress_status of framework_loading_complete and
+for_analysis of True) are added to a data base version analysis (DBV) using the SymPortal framework
+--analyse_next flag. This analysis is run without outputs. Once the analysis is complete the status of the
+Submission objects is set to framework_analysis_complete.
+
+Each of the analysed Submissions is then output via its associated Study object using the framework
+--output_study_from_analysis flag. Once the output is complete the status of the Submission object is set to
+framework_output_complete and its framework_results_dir_path is set.
+
+Django must be set up before this module is imported.
+"""
+import platform
+from datetime import datetime
+from dbApp.models import DataAnalysis, Submission
+import main
+
+
+def analyse_submissions(submissions):
+    """The analysis stage of the submission pipeline."""
+    SubmissionAnalysis().analyse(submissions)
+
+
+def output_submissions(submissions):
+    """The output stage of the submission pipeline."""
+    SubmissionAnalysis().output(submissions)
+
+
+class SubmissionAnalysis:
+    def __init__(self, num_proc=None):
+        # number of proc will be 30
+        # However when running this on the mac for debug we will pull this down to 4
+        if num_proc is None:
+            num_proc = 30 if platform.system() == 'Linux' else 4
+        self.num_proc = num_proc
+        self.dt_str = self._get_date_time()
+        # Dynamics
+        self.work_flow_manager = None
+
+    def analyse(self, submission_objects):
+        """
+        Run a SymPortal analysis that includes all of the DataSets of the preivous analysis plus the
+        DataSet/Study objects associated with the submission_objects
+        """
+        dataset_string = ','.join([str(s.associated_dataset.id) for s in submission_objects])
+        analysis_name = f'{self.dt_str}_DBV'
+        custom_args_list = [
+            '--analyse_next', dataset_string, '--num_proc', str(self.num_proc), '--no_output',
+            '--name', analysis_name
+        ]
+
+        try:
+            # Run the analysis
+            self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
+            # Log the start time of the analysis
+            for sub_obj in submission_objects:
+                sub_obj.analysis_started_date_time = self.work_flow_manager.date_time_str
+                sub_obj.save()
+            self.work_flow_manager.start_work_flow()
+        except Exception as e:
+            # The analysis is of the whole batch so the error is recorded against each of its Submissions
+            print(f'{self._get_date_time()}: An error has occured while trying to analyse the Submissions '
+                  f'{",".join([str(sub_obj.id) for sub_obj in submission_objects])}: {e}')
+            Submission.objects.filter(
+                id__in=[sub_obj.id for sub_obj in submission_objects]).update(error_has_occured=True)
+            raise RuntimeError(
+                f'{self.dt_str} An error has occured while trying to analyse the current batch of Study objects.'
+            ) from e
+
+        # At this point the analysis is complete
+        # Update the status and analysis complete attribute then move on to outputting each submission
+        for sub_obj in submission_objects:
+            sub_obj.progress_status = 'framework_analysis_complete'
+            sub_obj.analysis_complete_date_time = self._get_date_time()
+            sub_obj.save()
+
+    def output(self, submission_objects):
+        """
+        For each of the submission objects, output the results from the analysis that was just completed
+        """
+        for sub_obj in submission_objects:
+            # Because we don't want to rely on the fact that an anaysis was conduced above, we will grab the latest
+            # DataAnalysis that contains the Study/DataSet objects associated with it.
+            latest_dataanalysis = list(DataAnalysis.objects.filter(
+                list_of_data_set_uids__contains=str(sub_obj.associated_dataset.id)).order_by('-id'))[0]
+            study_id_str = str(sub_obj.associated_study.id)
+            custom_args_list = [
+                '--output_study_from_analysis', study_id_str, '--num_proc', str(self.num_proc),
+                '--data_analysis_id', str(latest_dataanalysis.id),
+            ]
+            try:
+                self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
+                sub_obj.study_output_started_date_time = self.work_flow_manager.date_time_str
+                sub_obj.save()
+                self.work_flow_manager.start_work_flow()
+            except Exception as e:
+                print(f'{self._get_date_time()}: An error has occured while trying to output the results of '
+                      f'Submission {sub_obj.id} {sub_obj.name}: {e}')
+                Submission.objects.filter(id=sub_obj.id).update(error_has_occured=True)
+                raise RuntimeError(
+                    f'{self.dt_str}: An error has occured while trying to output results for {sub_obj.name}.'
+                ) from e
+
+            # Here the output is complete
+            # Log the complete time and the output directory on the framework server
+            sub_obj.study_output_complete_date_time = self._get_date_time()
+            sub_obj.framework_results_dir_path = self.work_flow_manager.output_dir
+            sub_obj.progress_status = "framework_output_complete"
+            sub_obj.save()
+
+    @staticmethod
+    def _get_date_time():
+        return str(
+            datetime.utcnow()
+        ).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
@@ -0,0 +1,284 @@
+"""
+An in-process state machine over Submission.progress_status that moves each Submission through the stages of the
+framework server as soon as the previous stage completes, rather than waiting for the next run of the
+cron job of the next stage (see submission_pipeline_daemon.py for the long-running daemon):
+
+    submitted
+        --transfer--> transfer_to_framework_server_complete
+        --load--> framework_loading_complete (for_analysis) or framework_output_complete
+        --analyse--> framework_analysis_complete
+        --output--> framework_output_complete
+
+The Submission objects in the database are the only record of the state of the pipeline. Each stage only
+updates the progress_status of a Submission once its work for the Submission is complete, and the pipeline
+works out which stages have work to do from the database whenever a stage finishes. The pipeline can therefore be
+killed at any point and will carry on from the last completed transitions when it is restarted. The stages are
+the same as those of the cron jobs so they may be re-run for a Submission whose stage was interrupted
+(e.g. a transfer will not re-download files that are already present). The exception is a loading that was
+interrupted, which is reported but not re-run (see LoadingScheduler.get_submissions_in_progress).
+
+Each stage runs a batch of the Submissions that are ready for it in its own worker (a process, or a thread when
+testing), and a worker reports back on the local event queue of the pipeline when it finishes.
+The stages record an error against the Submissions whose failure is down to the Submission (e.g. bad data or a
+failed loading or analysis). A stage that fails for a transient reason (e.g. the web server could not be reached)
+raises a TransientStageError and its Submissions are left as they are to be tried again at the next poll.
+The Submissions of a stage that fails in any other way (or that does not move them on) are tried again at the next
+poll up to max_stage_attempts times before they are marked with error_has_occured. Only one batch
+per stage is run at a time. As in 2_cron_analysis.py, an analysis is not started while there are still
+Submissions to be transferred or loaded, and an analysis and an output are never run at the same time (the
+output uses the latest DataAnalysis of a DataSet).
+
+New Submissions are created on the web server so the database is still checked for them every poll_interval
+seconds, but this is the only polling that is done.
+
+Django must be set up before this module is imported.
+"""
+import queue
+import time
+import multiprocessing
+from datetime import datetime
+from queue import Queue as mt_Queue
+from threading import Thread
+from django import db
+from dbApp.models import Submission
+from exceptions import TransientStageError
+from loading_scheduler import LoadingScheduler
+from web_to_framework_transfer import transfer_submissions
+from submission_analysis import analyse_submissions, output_submissions
+
+
+class SubmissionPipeline:
+    # The stages in the order that a Submission passes through them
+    stages = ['transfer', 'load', 'analyse', 'output']
+    # The progress_status of the Submissions that are ready for each stage
+    stage_input_status_dict = {
+        'transfer': 'submitted',
+        'load': 'transfer_to_framework_server_complete',
+        'analyse': 'framework_loading_complete',
+        'output': 'framework_analysis_complete'
+    }
+
+    def __init__(
+            self, core_budget=None, poll_interval=60, stage_runner_dict=None, multiprocess=True, max_stage_attempts=3):
+        """
+        :param core_budget: The core budget of the loadings (see LoadingScheduler).
+        :param poll_interval: How often (in seconds) the database is checked for new Submissions
+        when no stage has finished.
+        :param stage_runner_dict: stage: callable. Each callable is passed the list of the Submissions
+        that are ready for the stage and should move them on to their next progress_status (or set their
+        error_has_occured). Defaults to the transfer, loading, analysis and output of the cron jobs.
+        A callable should raise a TransientStageError if the Submissions should simply be tried again later.
+        :param multiprocess: Whether the stages are run in separate processes (the default) or threads.
+        :param max_stage_attempts: The number of times that a stage is run for a Submission before the Submission is
+        marked with error_has_occured when the stage fails (other than with a TransientStageError)
+        or does not move the Submission on.
+        """
+        self.core_budget = core_budget
+        self.poll_interval = poll_interval
+        if stage_runner_dict is None:
+            stage_runner_dict = {
+                'transfer': transfer_submissions,
+                'load': self._load_submissions,
+                'analyse': analyse_submissions,
+                'output': output_submissions
+            }
+        if set(stage_runner_dict.keys()) != set(self.stages):
+            raise RuntimeError(f'A stage runner must be given for each of the stages: {",".join(self.stages)}')
+        self.stage_runner_dict = stage_runner_dict
+        self.multiprocess = multiprocess
+        self.max_stage_attempts = max_stage_attempts
+        # The stage workers run a bound method of the pipeline (whose stage runners may be bound methods or closures)
+        # so they are always forked. The spawn and forkserver start methods (the default on macOS and, from
+        # python 3.14, on linux) would need the pipeline to be pickled.
+        self.mp_context = multiprocessing.get_context('fork')
+        if self.multiprocess:
+            self.event_queue = self.mp_context.Queue()
+        else:
+            self.event_queue = mt_Queue()
+        # Dynamics
+        # stage: (worker (Process or Thread), list of submission uids) for the stages that are running
+        self.running_stage_dict = {}
+        self.stop_requested = False
+        # (stage, submission uid): the number of failed attempts of the stage for the Submission
+        self.failed_attempt_count_dict = {}
+        # (stage, submission uid): the time before which the stage is not tried again for the Submission
+        self.retry_time_dict = {}
+
+    def run(self, stop_when_idle=False):
+        """Run the pipeline until stop is called (e.g. from a signal handler) or, if stop_when_idle,
+        until there is no work left for any of the stages (including Submissions that are waiting to be tried
+        again). The stages that are running when the pipeline is
+        stopped are allowed to finish."""
+        self._report_incomplete_loadings()
+        while True:
+            if not self.stop_requested:
+                self._start_stages_with_work()
+            if not self.running_stage_dict and (
+                    self.stop_requested or (stop_when_idle and not self.retry_time_dict)):
+                return
+            self._wait_for_an_event()
+
+    def stop(self):
+        self.stop_requested = True
+
+    def get_submissions_ready_for_stage(self, stage):
+        if stage == 'load':
+            # Exclude the Submissions whose loading has already been claimed
+            return LoadingScheduler.get_submissions_to_load()
+        submissions = Submission.objects.filter(
+            progress_status=self.stage_input_status_dict[stage], error_has_occured=False)
+        if stage in ['analyse', 'output']:
+            submissions = submissions.filter(for_analysis=True)
+        return list(submissions.order_by('id'))
+
+    def _start_stages_with_work(self):
+        for stage in self.stages:
+            if stage in self.running_stage_dict or not self._stage_can_start(stage):
+                continue
+            submissions = self._get_submissions_to_start(stage)
+            if submissions:
+                self._start_stage(stage, submissions)
+
+    def _get_submissions_to_start(self, stage):
+        """The Submissions that are ready for the stage other than those that are waiting to be tried again"""
+        submissions = self.get_submissions_ready_for_stage(stage)
+        ready_submission_uids = set(sub.id for sub in submissions)
+        # Forget the Submissions that have been moved on (e.g. by hand) while they were waiting to be tried again
+        for stage_of_retry, uid in list(self.retry_time_dict.keys()):
+            if stage_of_retry == stage and uid not in ready_submission_uids:
+                self._forget_failed_attempts(stage, uid)
+        return [sub for sub in submissions if self.retry_time_dict.get((stage, sub.id), 0) <= time.time()]
+
+    def _stage_can_start(self, stage):
+        if stage == 'analyse':
+            # Hold the analysis until the Submissions that are on their way (transfers and loadings) have
+            # arrived, so that Submissions that are uploaded at roughly the same time go into the same analysis.
+            for upstream_stage in ['transfer', 'load']:
+                if upstream_stage in self.running_stage_dict or \
+                        self.get_submissions_ready_for_stage(upstream_stage):
+                    return False
+            return 'output' not in self.running_stage_dict
+        if stage == 'output':
+            return 'analyse' not in self.running_stage_dict
+        return True
+
+    def _start_stage(self, stage, submissions):
+        submission_uids = [sub.id for sub in submissions]
+        print(f'{self._get_date_time()}: Starting {stage} of the Submissions: '
+              f'{",".join([f"{sub.id} {sub.name}" for sub in submissions])}')
+        if self.multiprocess:
+            # The DB connections must not be shared with the child processes
+            db.connections.close_all()
+            worker = self.mp_context.Process(target=self._stage_worker, args=(stage, submission_uids))
+        else:
+            worker = Thread(target=self._stage_worker, args=(stage, submission_uids))
+        self.running_stage_dict[stage] = (worker, submission_uids)
+        worker.start()
+
+    def _wait_for_an_event(self):
+        """Wait for a stage to finish. Return after poll_interval seconds if none has so that the database
+        can be checked for new Submissions."""
+        try:
+            stage, status = self.event_queue.get(timeout=self.poll_interval)
+            self._finish_stage(stage, status)
+        except queue.Empty:
+            # Check for workers that died without reporting (e.g. killed by the OS)
+            for stage, (worker, _) in list(self.running_stage_dict.items()):
+                if not worker.is_alive():
+                    try:
+                        # Give any report that was put just before the worker exited the chance to be read
+                        reported_stage, status = self.event_queue.get(timeout=1)
+                        self._finish_stage(reported_stage, status)
+                    except queue.Empty:
+                        self._finish_stage(stage, 'ERROR')
+                    return
+
+    def _finish_stage(self, stage, status):
+        worker, submission_uids = self.running_stage_dict.pop(stage)
+        worker.join()
+        # The Submissions that the stage did not move on (and that were not marked as errored by the stage)
+        waiting_submission_uids = [
+            sub.id for sub in self.get_submissions_ready_for_stage(stage) if sub.id in submission_uids]
+        for uid in submission_uids:
+            if uid not in waiting_submission_uids:
+                self._forget_failed_attempts(stage, uid)
+        if status == 'RETRY':
+            # A transient failure is not counted against the Submissions
+            retry_submission_uids = waiting_submission_uids
+        else:
+            if status == 'DONE' and waiting_submission_uids:
+                print(f'{self._get_date_time()}: The {stage} did not move on the Submissions: '
+                      f'{",".join([str(uid) for uid in waiting_submission_uids])}')
+            retry_submission_uids = self._record_failed_attempts(stage, waiting_submission_uids)
+        if retry_submission_uids:
+            print(f'{self._get_date_time()}: The {stage} of the Submissions '
+                  f'{",".join([str(uid) for uid in retry_submission_uids])} will be tried again')
+        for uid in retry_submission_uids:
+            # Wait for the next poll rather than starting the stage again straight away
+            self.retry_time_dict[(stage, uid)] = time.time() + self.poll_interval
+        print(f'{self._get_date_time()}: Finished {stage} of the Submissions: '
+              f'{",".join([str(uid) for uid in submission_uids])}')
+
+    def _record_failed_attempts(self, stage, submission_uids):
+        """Count a failed attempt of the stage for each of the Submissions. A Submission that has used up its
+        max_stage_attempts is marked with error_has_occured so that it is not tried again.
+        Return the uids of the Submissions that are to be tried again."""
+        errored_submission_uids = []
+        retry_submission_uids = []
+        for uid in submission_uids:
+            failed_attempt_count = self.failed_attempt_count_dict.get((stage, uid), 0) + 1
+            if failed_attempt_count >= self.max_stage_attempts:
+                errored_submission_uids.append(uid)
+                self._forget_failed_attempts(stage, uid)
+            else:
+                self.failed_attempt_count_dict[(stage, uid)] = failed_attempt_count
+                retry_submission_uids.append(uid)
+        if errored_submission_uids:
+            print(f'{self._get_date_time()}: The {stage} of the Submissions '
+                  f'{",".join([str(uid) for uid in errored_submission_uids])} failed {self.max_stage_attempts} '
+                  f'times. They will not be tried again.')
+            self._mark_waiting_submissions_as_errored(stage, errored_submission_uids)
+        return retry_submission_uids
+
+    def _forget_failed_attempts(self, stage, submission_uid):
+        self.failed_attempt_count_dict.pop((stage, submission_uid), None)
+        self.retry_time_dict.pop((stage, submission_uid), None)
+
+    def _stage_worker(self, stage, submission_uids):
+        status = 'ERROR'
+        try:
+            submissions = list(Submission.objects.filter(id__in=submission_uids).order_by('id'))
+            self.stage_runner_dict[stage](submissions)
+            status = 'DONE'
+        except TransientStageError as e:
+            print(f'{self._get_date_time()}: {e}')
+            status = 'RETRY'
+        except Exception as e:
+            print(f'{self._get_date_time()}: An error has occured during the {stage} of the Submissions '
+                  f'{",".join([str(uid) for uid in submission_uids])}: {e}')
+        finally:
+            self.event_queue.put((stage, status))
+            if not self.multiprocess:
+                db.connection.close()
+
+    def _mark_waiting_submissions_as_errored(self, stage, submission_uids):
+        """Set error_has_occured for those of the Submissions that did not get through the stage."""
+        Submission.objects.filter(
+            id__in=submission_uids, progress_status=self.stage_input_status_dict[stage]
+        ).update(error_has_occured=True)
+
+    def _load_submissions(self, submissions):
+        """The loading stage. Failed loadings are recorded against their Submissions by the LoadingScheduler."""
+        LoadingScheduler(core_budget=self.core_budget).run(submissions_to_load=submissions)
+
+    def _report_incomplete_loadings(self):
+        submissions_in_progress = LoadingScheduler.get_submissions_in_progress()
+        if submissions_in_progress:
+            print(f'{self._get_date_time()}: Incomplete loading detected. '
+                  f'These Submissions will not be loaded by the pipeline:')
+            for sub in submissions_in_progress:
+                print(f'\t{sub.id}: {sub.name} (loading started {sub.loading_started_date_time})')
+
+    @staticmethod
+    def _get_date_time():
+        return str(datetime.utcnow()).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
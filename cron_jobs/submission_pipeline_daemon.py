@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Long-running alternative to the three cron jobs of the framework server (0_cron_transfer_web_to_framework.py,
+1_cron_loading.py and 2_cron_analysis.py). Each Submission is transferred, loaded, analysed and output as soon
+as the previous stage is complete rather than waiting for the next run of the cron job of the next stage.
+See submission_pipeline.py.
+
+Only one instance of the daemon can run at a time (a lock is held on submission_pipeline.lock). The cron jobs
+should not be run alongside the daemon. The daemon stops on SIGTERM or SIGINT once the stages that are running
+have finished. It can be killed and restarted at any point as its state is kept in the Submission objects.
+"""
+
+import argparse
+import fcntl
+import os
+import signal
+import sys
+from pathlib import Path
+# We have to add the Symportal_framework path so that the settings.py module
+# can be found.
+os.chdir(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+sys.path.append(str(Path(__file__).resolve().parent))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from submission_pipeline import SubmissionPipeline
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Transfer, load, analyse and output the Submissions as soon as they are ready')
+    parser.add_argument(
+        '--core_budget', type=int,
+        help='The total number of cores to be shared by the concurrent loadings [30 on Linux, otherwise 4]')
+    parser.add_argument(
+        '--poll_interval', type=int, default=60,
+        help='How often (in seconds) to check the database for new Submissions [60]')
+    return parser.parse_args()
+
+
+def _acquire_instance_lock():
+    lock_file = open(os.path.join(str(Path(__file__).resolve().parent), 'submission_pipeline.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        sys.exit('Another instance of the submission pipeline daemon is running. Quiting.')
+    # Keep a reference to the open file so that the lock is held for the life of the process
+    return lock_file
+
+
+args = _parse_args()
+instance_lock = _acquire_instance_lock()
+submission_pipeline = SubmissionPipeline(core_budget=args.core_budget, poll_interval=args.poll_interval)
+
+
+def _stop_submission_pipeline(signum, frame):
+    print(f'Signal {signum} received. Stopping once the running stages have finished.')
+    submission_pipeline.stop()
+
+
+signal.signal(signal.SIGTERM, _stop_submission_pipeline)
+signal.signal(signal.SIGINT, _stop_submission_pipeline)
+submission_pipeline.run()
@@ -0,0 +1,197 @@
+"""
+The transfer of the user files of the submitted Submission objects (progress_status of submitted) from the web
+server to the framework server. Used by 0_cron_transfer_web_to_framework.py and the submission pipeline daemon
+(submission_pipeline.py).
+
+The files are downloaded in parallel and an interrupted transfer is resumed rather than restarted
+(see sftp_transfer.py). The md5sum that is generated at the time of user upload is used to verify the integrity of
+the transfer.
+After the transfer is complete the status of the Submission object is updated to
+transfer_to_framework_server_complete and the transfer_to_framework_server_date_time is logged.
+
+Django must be set up before this module is imported.
+"""
+import os
+import shutil
+from pathlib import Path
+from datetime import datetime
+from dbApp.models import Submission
+import sp_config
+import paramiko
+from sftp_transfer import SFTPTransferEngine
+from exceptions import TransientStageError
+
+# The errors of a transfer that are down to the connection to the web server rather than to the Submission
+# being transferred. The transfer of a Submission that fails with one of these is tried again later.
+transient_transfer_errors = (OSError, EOFError, paramiko.SSHException)
+
+
+def transfer_submissions(submissions):
+    """The transfer stage of the submission pipeline. Transfer each of the submissions so that the other
+    submissions are still transferred if the transfer of one of them fails.
+    A Submission whose transfer fails because of its files (e.g. a file that does not match its md5sum) has an
+    error recorded against it. A Submission whose transfer fails because of the connection to the web server
+    (including a failure to connect) is left as it is and a TransientStageError is raised once the other
+    Submissions have been transferred so that the pipeline tries it again at its next poll (resuming any
+    partially transferred files)."""
+    try:
+        twtf = TransferWebToFramework(submissions_to_transfer=submissions)
+    except transient_transfer_errors as e:
+        raise TransientStageError(f'Could not connect to the web server: {e}') from e
+    transient_error_sub_list = []
+    try:
+        for sub_to_trans in submissions:
+            try:
+                twtf.transfer_submission(sub_to_trans)
+            except transient_transfer_errors as e:
+                print(f'A connection error has occured while trying to transfer Submission {sub_to_trans.name} '
+                      f'{sub_to_trans.id}. The transfer will be tried again: {e}')
+                transient_error_sub_list.append(sub_to_trans)
+            except Exception as e:
+                print(f'An error has occured while trying to transfer Submission {sub_to_trans.name} '
+                      f'{sub_to_trans.id}: {e}')
+                Submission.objects.filter(id=sub_to_trans.id).update(error_has_occured=True)
+    finally:
+        twtf.close()
+    if transient_error_sub_list:
+        raise TransientStageError(
+            f'The transfer of the Submissions '
+            f'{",".join([f"{sub.id} {sub.name}" for sub in transient_error_sub_list])} will be tried again')
+
+
+class TransferWebToFramework:
+    def __init__(self, submissions_to_transfer=None):
+        # Get a list of the Submissions that need to be transferred
+        if submissions_to_transfer is None:
+            submissions_to_transfer = Submission.objects.filter(progress_status="submitted", error_has_occured=False)
+        self.submissions_to_transfer = list(submissions_to_transfer)
+        self.symportal_data_dir = sp_config.symportal_data_dir
+
+        # User paramiko to set up an sftp that we can use to transfer
+        self.ssh_client = paramiko.SSHClient()
+        self.ssh_client.load_system_host_keys()
+        if sp_config.authentication_type == 'pass':
+            self.ssh_client.connect(hostname=sp_config.web_ip, username=sp_config.web_user,
+                                    password=sp_config.web_pass)
+        elif sp_config.authentication_type == 'key':
+            self.ssh_client.connect(
+                hostname=sp_config.web_ip, username=sp_config.web_user, key_filename=sp_config.key_file
+                )
+        else:
+            raise RuntimeError('Unknown authentication_type from sp_config.')
+
+        # Open sftp client
+        self.sftp_client = self.ssh_client.open_sftp()
+
+        # The files are downloaded over several SFTP channels of the ssh connection
+        self.transfer_engine = SFTPTransferEngine(
+            ssh_client=self.ssh_client, num_channels=getattr(sp_config, 'sftp_transfer_channels', 4))
+
+        # Dynamics for convenience that will be updated with each Submission object
+        self.submission_to_transfer = None
+        self.web_source_dir = None
+        self.framework_dest_dir = None
+
+    def transfer(self):
+        """
+        Transfer over the files in the Submissions web_local_dir_path from the web server
+        Validate the md5sum
+        Delete the files from the web server
+        Update the status and time log of each Submission object
+        """
+
+        # Transfer each submission
+        for sub_to_trans in self.submissions_to_transfer:
+            self.transfer_submission(sub_to_trans)
+
+    def transfer_submission(self, sub_to_trans):
+        self.submission_to_transfer = sub_to_trans
+        self._process_submission()
+
+    def close(self):
+        self.sftp_client.close()
+        self.ssh_client.close()
+
+    def _process_submission(self, ):
+        self.web_source_dir = self.submission_to_transfer.web_local_dir_path
+        self.framework_dest_dir = os.path.join(self.symportal_data_dir, os.path.basename(self.web_source_dir))
+        self.submission_to_transfer.framework_local_dir_path = self.framework_dest_dir
+        self.submission_to_transfer.save()
+        if not os.path.exists(self.framework_dest_dir):
+            os.makedirs(self.framework_dest_dir)
+        try:
+            self._get_files_from_web_dir()
+
+            # If we get here then the md5sum has been validated and the transfer is complete
+            self.transfer_engine.remove_manifest(self.framework_dest_dir)
+
+            # Delete the remote files and the remote directory
+            for get_file in self.sftp_client.listdir(self.web_source_dir):
+                self.sftp_client.remove(os.path.join(self.web_source_dir, get_file))
+            self.sftp_client.rmdir(self.web_source_dir)
+            
+            # we want to delete the parent directory if it is empty
+            if len(list(self.sftp_client.listdir(str(Path(self.web_source_dir).parent.absolute())))) == 0:
+                self.sftp_client.rmdir(str(Path(self.web_source_dir).parent.absolute()))
+
+            # Update the time of the Submission object transfer_to_framework_server_date_time
+            self.submission_to_transfer.transfer_to_framework_server_date_time = str(
+                datetime.utcnow()
+            ).split('.')[0].replace('-', '').replace(' ', 'T').replace(':', '')
+
+            # Update the status of the Submission object
+            self.submission_to_transfer.progress_status = "transfer_to_framework_server_complete"
+
+            self.submission_to_transfer.save()
+        except FileNotFoundError as e:
+            # It happens that for some reason a submission has been created
+            # But the files ae not available on the linode server
+            # In this case, we will delte the framework_dest_dir we just created
+            # and delete the submission object from the database
+            # and then move on to processing the next submission.
+            print(f"A FileNotFoundError was caught for submission:")
+            print(f"\tSubmission name: {self.submission_to_transfer.name}")
+            print(f"\tSubmission name: {self.submission_to_transfer.id}")
+            print(f"This submission will now be deleted from the database and we will move on to the next submission.")
+            shutil.rmtree(self.framework_dest_dir)
+            self.submission_to_transfer.delete()
+
+    def _make_md5sum_web_server_dict(self):
+        # There should be one md5sum in the pulled down files.
+        md5sum_source_path = [
+            os.path.join(self.framework_dest_dir, fn) for
+            fn in os.listdir(self.framework_dest_dir) if fn.endswith('.md5sum')
+        ]
+        assert (len(md5sum_source_path) == 1)
+        md5sum_source_path = md5sum_source_path[0]
+        # Make a dict of the file name to its hash
+        with open(md5sum_source_path, 'r') as f:
+            md5sum_source_dict = {
+                os.path.basename(line.split()[1]): line.split()[0] for line in f if line.strip()}
+        return md5sum_source_dict
+
+    def _get_files_from_web_dir(self):
+        """
+        Get every file that is in the web directory. The md5sum file is got first so that
+        each of the other files can be verified against its md5sum as it is downloaded.
+        Files that were already transferred (e.g. before an interruption) are skipped and partially transferred
+        files are resumed.
+        """
+        web_file_size_dict = self.transfer_engine.get_remote_file_size_dict(self.web_source_dir)
+        md5sum_file_size_dict = {
+            file_name: file_size for file_name, file_size in web_file_size_dict.items()
+            if file_name.endswith('.md5sum')}
+        self.transfer_engine.transfer_files(
+            remote_dir=self.web_source_dir, local_dir=self.framework_dest_dir, file_size_dict=md5sum_file_size_dict)
+        expected_md5_dict = self._make_md5sum_web_server_dict()
+        missing_file_names = [
+            file_name for file_name in expected_md5_dict.keys() if file_name not in web_file_size_dict]
+        if missing_file_names:
+            raise RuntimeError(
+                f'The files {",".join(missing_file_names)} of the md5sum file are missing from {self.web_source_dir}')
+        self.transfer_engine.transfer_files(
+            remote_dir=self.web_source_dir, local_dir=self.framework_dest_dir,
+            file_size_dict={
+                file_name: file_size for file_name, file_size in web_file_size_dict.items()
+                if file_name not in md5sum_file_size_dict},
+            expected_md5_dict=expected_md5_dict)
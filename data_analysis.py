@@ -4,20 +4,27 @@ import sys
 from typing import FrozenSet
 from dbApp.models import AnalysisType, ReferenceSequence, CladeCollectionType, CladeCollection
 import itertools
+import heapq
 from collections import defaultdict
 import virtual_objects
 import numpy as np
-from scipy.stats import gaussian_kde
 import symportal_utils
 from general import ThreadSafeGeneral
+from stage_profiling import profile_stage, stage_profiler
 import string
 import re
 import sp_config
 import json
+import gzip
+import pickle
 from django import db
+from multiprocessing import Queue as mp_Queue, Process
+from queue import Queue as mt_Queue
+from threading import Thread
 
 class SPDataAnalysis:
-    def __init__(self, workflow_manager_parent, data_analysis_obj, force_basal_lineage_separation):
+    def __init__(self, workflow_manager_parent, data_analysis_obj, force_basal_lineage_separation,
+                 resume_analysis=False, seed_data_analysis_obj=None):
         self.workflow_manager = workflow_manager_parent
         self.force_basal_lineage_separation = force_basal_lineage_separation
         self.temp_wkd = os.path.join(self.workflow_manager.symportal_root_directory, 'temp')
@@ -37,15 +44,65 @@ class SPDataAnalysis:
         self.current_clade = None
         self.list_of_data_set_uids = [
                 int(ds_id_str) for ds_id_str in self.data_analysis_obj.list_of_data_set_uids.split(',')]
-        self.virtual_object_manager = virtual_objects.VirtualObjectManager(
-            within_clade_cutoff=self.workflow_manager.within_clade_cutoff,
-            num_proc=self.workflow_manager.args.num_proc,
-            list_of_data_set_uids=self.list_of_data_set_uids,
-            force_basal_lineage_separation=self.force_basal_lineage_separation)
+        # When doing an incremental analysis, the previous DataAnalysis whose AnalysisTypes the
+        # VirtualAnalysisTypeManager is seeded from (see _seed_vats_from_previous_analysis)
+        self.seed_data_analysis_obj = seed_data_analysis_obj
+        # key = frozenset of the ref seq uids of a seeded VirtualAnalysisType, value = the VirtualAnalysisType
+        self.seeded_footprint_to_vat_dict = {}
+        # The uids of the seeded VirtualAnalysisTypes that no new CladeCollections have been added to
+        self.unchanged_seeded_vat_uid_set = set()
+        # The uids of the VirtualCladeCollections associated to a seeded VirtualAnalysisType.
+        # These are not put through footprint discovery.
+        self.seeded_vcc_uid_set = set()
+        # The VirtualObjectManager is snapshotted after each of the stages of analyse_data
+        self.analysis_checkpoint = AnalysisCheckpoint(
+            checkpoint_directory=os.path.join(
+                self.workflow_manager.symportal_root_directory, 'analysis_checkpoints',
+                str(self.data_analysis_obj.id)),
+            data_analysis_uid=self.data_analysis_obj.id, list_of_data_set_uids=self.list_of_data_set_uids)
+        # The last stage of analyse_data that has been completed
+        self.last_completed_stage = None
+        self.virtual_object_manager = None
+        if resume_analysis:
+            self.last_completed_stage, self.virtual_object_manager = self.analysis_checkpoint.load_last_checkpoint()
+        if self.virtual_object_manager is None:
+            self.virtual_object_manager = virtual_objects.VirtualObjectManager(
+                within_clade_cutoff=self.workflow_manager.within_clade_cutoff,
+                num_proc=self.workflow_manager.args.num_proc,
+                list_of_data_set_uids=self.list_of_data_set_uids,
+                force_basal_lineage_separation=self.force_basal_lineage_separation)
         self.thread_safe_general = ThreadSafeGeneral()
 
     def analyse_data(self):
+        """Run each of the stages of the analysis in turn, taking a checkpoint after each (but the last).
+        When resuming an analysis, the stages up to and including the last completed stage are skipped.
+        The checkpoints are deleted once the last stage has completed."""
+        stage_to_method_dict = {
+            'profile_discovery': self._profile_discovery,
+            'profile_assignment': self._profile_assignment_and_update_vats,
+            'div_naming': self._name_divs,
+            'species_association': self._associate_species_designations_and_clean_up,
+            'analysis_type_creation': self._make_analysis_type_objects_from_vats
+        }
+        for stage in AnalysisCheckpoint.stages:
+            if self.analysis_checkpoint.stage_already_completed(
+                    stage=stage, last_completed_stage=self.last_completed_stage):
+                print(f'\nSkipping {stage}: already completed')
+                continue
+            with stage_profiler.stage(f'SPDataAnalysis.{stage}'):
+                stage_to_method_dict[stage]()
+            self.last_completed_stage = stage
+            if stage != AnalysisCheckpoint.stages[-1]:
+                # There is no need for a checkpoint of the last stage as the checkpoints are then deleted
+                self.analysis_checkpoint.save_checkpoint(
+                    stage=stage, virtual_object_manager=self.virtual_object_manager)
+        self.analysis_checkpoint.delete_checkpoints()
+
+    def _profile_discovery(self):
         print('\n\nBeginning profile discovery')
+        if self.seed_data_analysis_obj is not None:
+            self._seed_vats_from_previous_analysis()
+
         self._populate_clade_fp_dicts_list()
 
         self._collapse_footprints_and_make_analysis_types()
@@ -55,20 +112,59 @@ class SPDataAnalysis:
         self._check_for_artefacts()
         print('TYPE DISCOVERY COMPLETE')
 
+    def _seed_vats_from_previous_analysis(self):
+        """Incremental analysis. Make a VirtualAnalysisType for each of the AnalysisTypes of the
+        seed_data_analysis_obj from the CladeCollections (of this analysis) that the AnalysisType was found in.
+        The CladeCollections of these types are then excluded from footprint discovery so that discovery is only
+        run for the CladeCollections of the newly added DataSets (or those that had no AnalysisType). New
+        InitialTypes with the same profile as a seeded type are added to the seeded type
+        (see AnalysisTypeCreator) and pairs of seeded types that have not gained CladeCollections are not
+        reassessed for artefacts (see ArtefactAssessor)."""
+        print(f'\nSeeding VirtualAnalysisTypes from the AnalysisTypes of DataAnalysis '
+              f'{self.seed_data_analysis_obj.name} (UID: {self.seed_data_analysis_obj.id})')
+        vcc_dict = self.virtual_object_manager.vcc_manager.vcc_dict
+        seed_analysis_types = list(AnalysisType.objects.filter(data_analysis_from=self.seed_data_analysis_obj))
+        ref_seq_uids_of_seed_types = set()
+        for at in seed_analysis_types:
+            ref_seq_uids_of_seed_types.update(int(rs_uid) for rs_uid in at.ordered_footprint_list.split(','))
+        ref_seq_uid_to_ref_seq_obj_dict = {}
+        for uid_list in self.thread_safe_general.chunks(list(ref_seq_uids_of_seed_types)):
+            ref_seq_uid_to_ref_seq_obj_dict.update(
+                {rs.id: rs for rs in ReferenceSequence.objects.filter(id__in=uid_list)})
+
+        for at in seed_analysis_types:
+            vccs_of_at = [
+                vcc_dict[int(cc_uid)] for cc_uid in at.list_of_clade_collections.split(',') if
+                int(cc_uid) in vcc_dict]
+            if not vccs_of_at:
+                # None of the CladeCollections of the AnalysisType are part of this analysis
+                continue
+            seeded_vat = self.virtual_object_manager.vat_manager.make_vat_pre_profile_assignment(
+                clade_collection_obj_list=vccs_of_at,
+                ref_seq_obj_list=frozenset([
+                    ref_seq_uid_to_ref_seq_obj_dict[int(rs_uid)] for
+                    rs_uid in at.ordered_footprint_list.split(',')]))
+            sys.stdout.write(f'\rSeeded {seeded_vat.name} from AnalysisType {at.id}')
+            self.seeded_footprint_to_vat_dict[frozenset(seeded_vat.ref_seq_uids_set)] = seeded_vat
+            self.unchanged_seeded_vat_uid_set.add(seeded_vat.id)
+            self.seeded_vcc_uid_set.update([vcc.id for vcc in vccs_of_at])
+        print(f'\n{len(self.seeded_footprint_to_vat_dict)} VirtualAnalysisTypes seeded. '
+              f'{len(vcc_dict) - len(self.seeded_vcc_uid_set)} CladeCollections will go through '
+              f'footprint discovery.')
+
+    def _profile_assignment_and_update_vats(self):
         self._reset_vcc_vat_rep_abund_dicts()
 
         self._profile_assignment()
 
         self._update_grand_tot_attribute_for_vats()
 
-        self._name_divs()
-
+    def _associate_species_designations_and_clean_up(self):
         self._associate_species_designations()
 
         self._del_and_remake_temp_wkd()
 
         print('DATA ANALYSIS COMPLETE')
-        self._make_analysis_type_objects_from_vats()
 
     def _update_grand_tot_attribute_for_vats(self):
         """We need to populate the grand_tot_num_instances_of_vat_in_analysis attribute of the vats after
@@ -381,9 +477,21 @@ class SPDataAnalysis:
             self.thread_safe_general.write_list_to_destination(
                 destination=self.query_fasta_path, list_to_write=self.query_fasta_as_list)
 
+    def find_profiles_of_clade(self, clade):
+        """Search each of the VirtualCladeCollections of the given clade for VirtualAnalysisTypes.
+        Returns a dict of key = vcc uid, value = list of (vat uid, rel abund of vat in vcc) for the matched VATs
+        so that the result can be passed back from a worker process."""
+        vcc_uid_to_vat_matches_dict = {}
+        for virtual_clade_collection in self.virtual_object_manager.vcc_manager.vcc_dict.values():
+            if virtual_clade_collection.clade == clade:
+                profile_assigner = self.ProfileAssigner(
+                    virtual_clade_collection=virtual_clade_collection, parent_sp_data_analysis=self)
+                vcc_uid_to_vat_matches_dict[virtual_clade_collection.id] = profile_assigner.find_profiles()
+        return vcc_uid_to_vat_matches_dict
+
     class ProfileAssigner:
-        """Responsible for searching a given VirtualCladeCollection for VirtualAnalysisTypes and associating
-        the found VirtualAnalysisTypes to the VirtualCladeCollection"""
+        """Responsible for searching a given VirtualCladeCollection for VirtualAnalysisTypes.
+        The found VirtualAnalysisTypes are associated to the VirtualCladeCollection in _profile_assignment"""
         def __init__(self, virtual_clade_collection, parent_sp_data_analysis):
             self.sp_data_analysis = parent_sp_data_analysis
             self.vcc = virtual_clade_collection
@@ -392,8 +500,9 @@ class SPDataAnalysis:
             # transient objects updated during vat checks
             self.potential_match_object = None
 
-        def assign_profiles(self):
-            print(f'\nAssigning ITS2 type profiles to {self.vcc}:')
+        def find_profiles(self):
+            """Return a list of (vat uid, rel abund of vat in vcc) for each of the VATs found in the vcc"""
+            print(f'\nSearching for ITS2 type profiles in {self.vcc}')
             list_of_vats_to_search = self._get_list_of_vats_to_search()
 
             self._find_vats_in_vcc(list_of_vats_to_search)
@@ -406,16 +515,7 @@ class SPDataAnalysis:
             #     self._create_vat_of_maj_seq()
             #     self._add_maj_seq_vat_to_matched_list()
 
-            self._associate_vcc_to_vats()
-
-
-
-        def _associate_vcc_to_vats(self):
-            for vat_match in self.vat_match_object_list:
-                print(f'Assigning {vat_match.at.name}')
-                vat_match.at.clade_collection_obj_set_profile_assignment.add(vat_match.cc)
-                vat_match.cc.analysis_type_obj_to_representative_rel_abund_in_cc_dict[
-                    vat_match.at] = vat_match.rel_abund_of_at_in_cc
+            return [(vat_match.at.id, vat_match.rel_abund_of_at_in_cc) for vat_match in self.vat_match_object_list]
 
         def _find_vats_in_vcc(self, list_of_vats_to_search):
             for vat in list_of_vats_to_search:
@@ -505,13 +605,25 @@ class SPDataAnalysis:
                     return False
 
     def _profile_assignment(self):
+        """The VirtualAnalysisTypes found in the VirtualCladeCollections are searched for in parallel for each
+        clade (see CladeStageHandler). The matches are then associated in the order of the vcc_dict."""
         print('\n\nBeginning profile assignment')
-        for virtual_clade_collection in self.virtual_object_manager.vcc_manager.vcc_dict.values():
-            if virtual_clade_collection.id == 111118:
-                foo = "bar"
-            profile_assigner = self.ProfileAssigner(virtual_clade_collection = virtual_clade_collection,
-                parent_sp_data_analysis = self)
-            profile_assigner.assign_profiles()
+        vcc_dict = self.virtual_object_manager.vcc_manager.vcc_dict
+        vat_dict = self.virtual_object_manager.vat_manager.vat_dict
+        clades_of_vccs = [clade for clade in self.clade_list if clade in set(vcc.clade for vcc in vcc_dict.values())]
+        clade_stage_handler = CladeStageHandler(
+            parent_sp_data_analysis=self, clades=clades_of_vccs,
+            clade_worker_function=self.find_profiles_of_clade)
+        clade_to_vcc_uid_to_vat_matches_dict = clade_stage_handler.execute_clade_stage()
+        for virtual_clade_collection in vcc_dict.values():
+            vat_match_list = clade_to_vcc_uid_to_vat_matches_dict[
+                virtual_clade_collection.clade][virtual_clade_collection.id]
+            for vat_uid, rel_abund_of_at_in_cc in vat_match_list:
+                vat = vat_dict[vat_uid]
+                print(f'Assigning {vat.name}')
+                vat.clade_collection_obj_set_profile_assignment.add(virtual_clade_collection)
+                virtual_clade_collection.analysis_type_obj_to_representative_rel_abund_in_cc_dict[
+                    vat] = rel_abund_of_at_in_cc
 
         # Reinit the VirtualAnalysisTypes to populate the post-profile assignment objects
         self.reinit_vats_post_profile_assignment()
@@ -524,11 +636,17 @@ class SPDataAnalysis:
         mmd.run_multimodal_detection()
 
     class MultiModalDetection:
+        """Splits VirtualAnalysisTypes that have a DIV whose relative abundances (across the
+        VirtualCladeCollections that the type was assigned to) are bimodally distributed.
+        The VirtualAnalysisTypes are independent of each other and so are assessed in parallel. Once a round of
+        splitting is complete, only the VirtualAnalysisTypes created by the splits need to be assessed.
+        """
         def __init__(self, parent_sp_data_analysis):
             self.sp_data_analysis = parent_sp_data_analysis
-            self.vat_uids_checked_set = set()
-            self.restart = True
-            # attributes that will be updated with each vat checked
+            self.vat_dict = self.sp_data_analysis.virtual_object_manager.vat_manager.vat_dict
+            self.num_proc = self.sp_data_analysis.workflow_manager.args.num_proc
+            self.multiprocess = self.sp_data_analysis.workflow_manager.args.multiprocess
+            # attributes that will be updated with each vat split
             self.current_vat = None
             # The two lists that will hold the VirtualCladeCollection objects belonging to each of the potential
             # new VATs resulting from a splitting occurrence.
@@ -537,67 +655,83 @@ class SPDataAnalysis:
 
         def run_multimodal_detection(self):
             print('\nStarting MultiModalDetection')
-            while self.restart:
-                self.restart = False
-                for vat_uid in self.sp_data_analysis.virtual_object_manager.vat_manager.vat_dict.keys():
-                    self.current_vat = self.sp_data_analysis.virtual_object_manager.vat_manager.vat_dict[vat_uid]
-                    sys.stdout.write(f'\rChecking {self.current_vat.name}')
-                    if self.current_vat.id in self.vat_uids_checked_set:
-                        continue
-                    if len(self.current_vat.ref_seq_uids_set) == 1:
-                        self.vat_uids_checked_set.add(self.current_vat.id)
-                        continue
-                    if len(self.current_vat.clade_collection_obj_set_profile_assignment) < 8:
-                        self.vat_uids_checked_set.add(self.current_vat.id)
-                        continue
-                    for ref_seq_uid_col in list(self.current_vat.multi_modal_detection_rel_abund_df):
-                        if not self.restart:
-                            self._assess_if_div_multimodal(ref_seq_uid_col)
-                            if not self.restart:
-                                self.vat_uids_checked_set.add(self.current_vat.id)
-                    if self.restart:
-                        break
+            vat_uids_to_check = list(self.vat_dict.keys())
+            while vat_uids_to_check:
+                vat_uids_to_check = self._check_vats_and_split(vat_uids_to_check)
+
+        def _check_vats_and_split(self, vat_uids_to_check):
+            """Assess the VirtualAnalysisTypes of vat_uids_to_check and split those found to be multimodal.
+            Splits are made in the order of vat_uids_to_check. Return the uids of the newly created types."""
+            vats_to_assess = [
+                self.vat_dict[vat_uid] for vat_uid in vat_uids_to_check if
+                len(self.vat_dict[vat_uid].ref_seq_uids_set) > 1 and
+                len(self.vat_dict[vat_uid].clade_collection_obj_set_profile_assignment) >= 8]
+            if not vats_to_assess:
+                return []
+
+            vat_uid_to_split_vcc_uid_lists_dict = self._assess_vats(vats_to_assess)
+
+            new_vat_uids = []
+            for vat in vats_to_assess:
+                if vat.id in vat_uid_to_split_vcc_uid_lists_dict:
+                    self.current_vat = vat
+                    self.list_of_vcc_uids_one, self.list_of_vcc_uids_two = vat_uid_to_split_vcc_uid_lists_dict[vat.id]
+                    new_vat_uids.extend(self._split_vat_into_two_new_vats())
+            return new_vat_uids
+
+        @profile_stage()
+        def _assess_vats(self, vats_to_assess):
+            """Return a dict of key = vat uid, value = (list_of_vcc_uids_one, list_of_vcc_uids_two) for each of the
+            VirtualAnalysisTypes that should be split."""
+            if self.multiprocess:
+                vat_input_queue = mp_Queue()
+                split_output_queue = mp_Queue()
+            else:
+                vat_input_queue = mt_Queue()
+                split_output_queue = mt_Queue()
 
-        def _assess_if_div_multimodal(self, ref_seq_uid_col):
-            c, modes, pdf, x_grid = self._find_modes_of_abundances(ref_seq_uid_col)
-            if modes == 2:
-                x_diff_valid = self._assess_if_modes_sufficiently_separated(c, pdf, x_grid)
-                if x_diff_valid:
-                    self._assign_vccs_to_modes(pdf, ref_seq_uid_col, x_grid)
+            for vat in vats_to_assess:
+                vat_input_queue.put((vat.id, vat.name, vat.multi_modal_detection_rel_abund_df))
+            for n in range(self.num_proc):
+                vat_input_queue.put('STOP')
 
-                    if self._sufficient_support_of_each_mode():
-                        self._split_vat_into_two_new_vats()
+            all_processes = []
+            # close all connections to the db so that they are automatically recreated for each process
+            # http://stackoverflow.com/questions/8242837/django-multiprocessing-and-database-connections
+            db.connections.close_all()
+            for n in range(self.num_proc):
+                if self.multiprocess:
+                    p = Process(target=self._multimodal_detection_worker, args=(vat_input_queue, split_output_queue))
+                else:
+                    p = Thread(target=self._multimodal_detection_worker, args=(vat_input_queue, split_output_queue))
+                all_processes.append(p)
+                p.start()
+
+            # Process the output queue as we go so that it doesn't grow large enough to cause p.join() to hang.
+            vat_uid_to_split_vcc_uid_lists_dict = {}
+            done_count = 0
+            while done_count < self.num_proc:
+                worker_output = split_output_queue.get()
+                if isinstance(worker_output, str) and worker_output == 'DONE':
+                    done_count += 1
+                else:
+                    vat_uid, split_vcc_uid_lists = worker_output
+                    if split_vcc_uid_lists is not None:
+                        vat_uid_to_split_vcc_uid_lists_dict[vat_uid] = split_vcc_uid_lists
 
-        def _assess_if_modes_sufficiently_separated(self, c, pdf, x_grid):
-            # Must be sufficient separation between the peaks in x axis
-            x_diff_valid = False
-            if x_grid[c[1]] - x_grid[c[0]] > 0.7:
-                x_diff_valid = True
-            # plotHists(pdf, x_grid, listOfRatios, listOfTypesToAnalyse[k].name)
-            # Must also be sufficient diff between minima y and small peak y
-            # This represents the x spread and overlap of the two peaks
-            d = list((np.diff(np.sign(np.diff(pdf))) != 0).nonzero()[0] + 1)  # max and min indices
-            if min([pdf[d[0]], pdf[d[2]]]) == 0:
-                x_diff_valid = False
-            else:
-                if pdf[d[1]] / min([pdf[d[0]], pdf[d[2]]]) > 0.85:  # Insufficient separation of peaks
-                    x_diff_valid = False
-            return x_diff_valid
+            for p in all_processes:
+                p.join()
 
-        def _assign_vccs_to_modes(self, pdf, ref_seq_uid_col, x_grid):
-            # Then we have found modes that are sufficiently separated.
-            self.list_of_vcc_uids_one = []
-            self.list_of_vcc_uids_two = []
-            min_x = x_grid[list(((np.diff(np.sign(np.diff(pdf))) != 0).nonzero()[0] + 1))[1]]
-            for vcc_uid in self.current_vat.multi_modal_detection_rel_abund_df.index.tolist():
-                if self.current_vat.multi_modal_detection_rel_abund_df.at[
-                    vcc_uid, ref_seq_uid_col] < min_x:
-                    self.list_of_vcc_uids_one.append(vcc_uid)
-                else:
-                    self.list_of_vcc_uids_two.append(vcc_uid)
+            return vat_uid_to_split_vcc_uid_lists_dict
 
-        def _sufficient_support_of_each_mode(self):
-            return len(self.list_of_vcc_uids_one) >= 4 and len(self.list_of_vcc_uids_two) >= 4
+        @staticmethod
+        def _multimodal_detection_worker(in_q, out_q):
+            for vat_uid, vat_name, multi_modal_detection_rel_abund_df in iter(in_q.get, 'STOP'):
+                sys.stdout.write(f'\rChecking {vat_name}')
+                mmd_worker = SPDataAnalysis.MultiModalDetectionWorker(
+                    multi_modal_detection_rel_abund_df=multi_modal_detection_rel_abund_df)
+                out_q.put((vat_uid, mmd_worker.get_split_vcc_uid_lists()))
+            out_q.put('DONE')
 
         def _update_vccs_rep_abund_dict_for_split_type(self, list_of_vcc_objs, resultant_vat):
             for vcc in list_of_vcc_objs:
@@ -633,18 +767,122 @@ class SPDataAnalysis:
             print(f'Destroyed {self.current_vat.name}\n')
             self.sp_data_analysis.virtual_object_manager.vat_manager. \
                 delete_virtual_analysis_type(self.current_vat)
-            self.restart = True
+            return [resultant_type_one.id, resultant_type_two.id]
+
+    class MultiModalDetectionWorker:
+        """Assesses whether the relative abundances of any of the DIVs of a single VirtualAnalysisType
+        are bimodally distributed. Only the multi_modal_detection_rel_abund_df of the type is required so that
+        the worker can be run in a separate process."""
+        def __init__(self, multi_modal_detection_rel_abund_df):
+            self.rel_abund_df = multi_modal_detection_rel_abund_df
+            self.list_of_vcc_uids_one = []
+            self.list_of_vcc_uids_two = []
+
+        def get_split_vcc_uid_lists(self):
+            """Return the two lists of VirtualCladeCollection uids that the type should be split into
+            according to the first multimodal DIV found, or None if the type should not be split."""
+            for ref_seq_uid_col in list(self.rel_abund_df):
+                if self._assess_if_div_multimodal(ref_seq_uid_col):
+                    return self.list_of_vcc_uids_one, self.list_of_vcc_uids_two
+            return None
+
+        def _assess_if_div_multimodal(self, ref_seq_uid_col):
+            c, modes, pdf, x_grid = self._find_modes_of_abundances(ref_seq_uid_col)
+            if modes == 2:
+                x_diff_valid = self._assess_if_modes_sufficiently_separated(c, pdf, x_grid)
+                if x_diff_valid:
+                    self._assign_vccs_to_modes(pdf, ref_seq_uid_col, x_grid)
+
+                    if self._sufficient_support_of_each_mode():
+                        return True
+            return False
+
+        def _assess_if_modes_sufficiently_separated(self, c, pdf, x_grid):
+            # Must be sufficient separation between the peaks in x axis
+            x_diff_valid = False
+            if x_grid[c[1]] - x_grid[c[0]] > 0.7:
+                x_diff_valid = True
+            # plotHists(pdf, x_grid, listOfRatios, listOfTypesToAnalyse[k].name)
+            # Must also be sufficient diff between minima y and small peak y
+            # This represents the x spread and overlap of the two peaks
+            d = self._get_extrema_indices(pdf)  # max and min indices
+            if min([pdf[d[0]], pdf[d[2]]]) == 0:
+                x_diff_valid = False
+            else:
+                if pdf[d[1]] / min([pdf[d[0]], pdf[d[2]]]) > 0.85:  # Insufficient separation of peaks
+                    x_diff_valid = False
+            return x_diff_valid
+
+        def _assign_vccs_to_modes(self, pdf, ref_seq_uid_col, x_grid):
+            # Then we have found modes that are sufficiently separated.
+            self.list_of_vcc_uids_one = []
+            self.list_of_vcc_uids_two = []
+            min_x = x_grid[self._get_extrema_indices(pdf)[1]]
+            for vcc_uid in self.rel_abund_df.index.tolist():
+                if self.rel_abund_df.at[vcc_uid, ref_seq_uid_col] < min_x:
+                    self.list_of_vcc_uids_one.append(vcc_uid)
+                else:
+                    self.list_of_vcc_uids_two.append(vcc_uid)
+
+        def _sufficient_support_of_each_mode(self):
+            return len(self.list_of_vcc_uids_one) >= 4 and len(self.list_of_vcc_uids_two) >= 4
 
         def _find_modes_of_abundances(self, ref_seq_uid_col):
-            rel_abunds_of_ref_seq = self.current_vat.multi_modal_detection_rel_abund_df.loc[
-                                    :, ref_seq_uid_col].values.tolist()
-            x_grid = np.linspace(min(rel_abunds_of_ref_seq) - 1, max(rel_abunds_of_ref_seq) + 1, 2000)
-            kde = gaussian_kde(rel_abunds_of_ref_seq)
-            pdf = kde.evaluate(x_grid)
-            c = list((np.diff(np.sign(np.diff(pdf))) < 0).nonzero()[0] + 1)
+            rel_abunds_of_ref_seq = self.rel_abund_df.loc[:, ref_seq_uid_col].values.astype(float)
+            x_grid = np.linspace(rel_abunds_of_ref_seq.min() - 1, rel_abunds_of_ref_seq.max() + 1, 2000)
+            pdf = self._binned_gaussian_kde(rel_abunds_of_ref_seq, x_grid)
+            c = list((np.diff(self._get_slope_signs(pdf)) < 0).nonzero()[0] + 1)
             modes = len(c)
             return c, modes, pdf, x_grid
 
+        @staticmethod
+        def _binned_gaussian_kde(values, x_grid):
+            """Evaluate a gaussian KDE of values on the evenly spaced x_grid.
+            The bandwidth is that of scipy.stats.gaussian_kde (Scott's rule). Rather than summing a kernel for every
+            value at every grid point, the values are linearly binned onto the grid and the bin counts are convolved
+            with the kernel using an FFT. Values below the numerical noise of the FFT are set to 0.
+            If all values are identical there is no bandwidth and a single spike is returned.
+            """
+            num_values = len(values)
+            num_grid_points = len(x_grid)
+            pdf = np.zeros(num_grid_points)
+            bandwidth = np.std(values, ddof=1) * num_values ** (-1 / 5)
+            delta = x_grid[1] - x_grid[0]
+            grid_position = (values - x_grid[0]) / delta
+            left_index = np.clip(np.floor(grid_position).astype(int), 0, num_grid_points - 2)
+            right_weight = grid_position - left_index
+            if bandwidth == 0:
+                pdf[left_index[0]] = 1
+                return pdf
+            bin_counts = np.bincount(
+                left_index, weights=1 - right_weight, minlength=num_grid_points
+            ) + np.bincount(left_index + 1, weights=right_weight, minlength=num_grid_points)
+
+            # The kernel at every possible grid offset so that the convolution is not truncated
+            kernel_offsets = np.arange(-(num_grid_points - 1), num_grid_points) * delta
+            kernel = np.exp(-0.5 * (kernel_offsets / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+            fft_size = 1 << int(np.ceil(np.log2(len(bin_counts) + len(kernel) - 1)))
+            convolved = np.fft.irfft(np.fft.rfft(bin_counts, fft_size) * np.fft.rfft(kernel, fft_size), fft_size)
+            pdf = convolved[num_grid_points - 1:2 * num_grid_points - 1] / num_values
+            pdf[pdf < pdf.max() * 1e-10] = 0
+            return pdf
+
+        @staticmethod
+        def _get_slope_signs(pdf):
+            """The sign of the slope between each of the grid points of the pdf.
+            Flat sections (e.g. where the density is 0) take the sign of the slope before them (or after them if
+            at the start of the pdf) so that they are not counted as maxima or minima."""
+            slope_signs = np.sign(np.diff(pdf))
+            non_zero_indices = np.nonzero(slope_signs)[0]
+            if not len(non_zero_indices):
+                return slope_signs
+            fill_indices = np.maximum.accumulate(
+                np.where(slope_signs != 0, np.arange(len(slope_signs)), non_zero_indices[0]))
+            return slope_signs[fill_indices]
+
+        def _get_extrema_indices(self, pdf):
+            return list((np.diff(self._get_slope_signs(pdf)) != 0).nonzero()[0] + 1)
+
     def reinit_vats_post_profile_assignment(self):
         print('\nReinstantiating VirtualAnalysisTypes')
         for vat in self.virtual_object_manager.vat_manager.vat_dict.values():
@@ -682,15 +920,54 @@ class SPDataAnalysis:
         artefact_assessor.reassess_support_of_artefact_div_containing_types()
 
     def _collapse_footprints_and_make_analysis_types(self):
-        for i, clade_fp_dict in enumerate(self.clade_footp_dicts_list):
-            self.current_clade = self.clade_list[i]
-            if self._there_are_footprints_of_this_clade(clade_fp_dict):
-                sfi = SupportedFootPrintIdentifier(clade_footprint_dict=clade_fp_dict, parent_sp_data_analysis=self)
-                self.list_of_initial_types_after_collapse = sfi.identify_supported_footprints()
-                analysis_type_creator = AnalysisTypeCreator(parent_sp_data_analysis=self)
-                analysis_type_creator.create_analysis_types()
+        """The footprints of each clade are collapsed in parallel (see CladeStageHandler).
+        The VirtualAnalysisTypes are then created from the resultant InitialTypes in clade order."""
+        clades_with_footprints = [
+            clade for clade, clade_fp_dict in zip(self.clade_list, self.clade_footp_dicts_list) if
+            self._there_are_footprints_of_this_clade(clade_fp_dict)]
+        clade_stage_handler = CladeStageHandler(
+            parent_sp_data_analysis=self, clades=clades_with_footprints,
+            clade_worker_function=self.identify_supported_footprints_of_clade)
+        clade_to_initial_type_uids_list_dict = clade_stage_handler.execute_clade_stage()
+        for clade in clades_with_footprints:
+            self.current_clade = clade
+            self.list_of_initial_types_after_collapse = self._get_initial_types_from_uids(
+                clade=clade, initial_type_uids_list=clade_to_initial_type_uids_list_dict[clade])
+            analysis_type_creator = AnalysisTypeCreator(parent_sp_data_analysis=self)
+            analysis_type_creator.create_analysis_types()
         self._verify_all_ccs_associated_to_analysis_type()
 
+    def identify_supported_footprints_of_clade(self, clade):
+        """Run the SupportedFootPrintIdentifier for the given clade. Returns a list with a tuple for each of the
+        resultant InitialTypes of the uids of its profile ReferenceSequences and the uids of its
+        VirtualCladeCollections so that the result can be passed back from a worker process."""
+        sfi = SupportedFootPrintIdentifier(
+            clade_footprint_dict=self.clade_footp_dicts_list[self.clade_list.index(clade)],
+            parent_sp_data_analysis=self, clade=clade)
+        return [
+            ([ref_seq.id for ref_seq in initial_type.profile], [vcc.id for vcc in initial_type.clade_collection_list])
+            for initial_type in sfi.identify_supported_footprints()]
+
+    def _get_initial_types_from_uids(self, clade, initial_type_uids_list):
+        """Return a list of InitialTypeProfile (the profile and VirtualCladeCollections of an InitialType)
+        from the uids returned by identify_supported_footprints_of_clade"""
+        # The profiles are made up of ReferenceSequences from the footprints or the ordered DataSetSampleSequences
+        # of the VirtualCladeCollections of the clade
+        ref_seq_uid_to_ref_seq_obj_dict = {}
+        vcc_dict = self.virtual_object_manager.vcc_manager.vcc_dict
+        for vcc in vcc_dict.values():
+            if vcc.clade == clade:
+                for dsss in vcc.ordered_dsss_objs:
+                    ref_seq_uid_to_ref_seq_obj_dict[dsss.reference_sequence_of.id] = dsss.reference_sequence_of
+        for footprint in self.clade_footp_dicts_list[self.clade_list.index(clade)].keys():
+            for ref_seq in footprint:
+                ref_seq_uid_to_ref_seq_obj_dict[ref_seq.id] = ref_seq
+        return [
+            InitialTypeProfile(
+                profile=frozenset([ref_seq_uid_to_ref_seq_obj_dict[rs_uid] for rs_uid in profile_ref_seq_uids]),
+                clade_collection_list=[vcc_dict[vcc_uid] for vcc_uid in vcc_uids])
+            for profile_ref_seq_uids, vcc_uids in initial_type_uids_list]
+
 
     def _verify_all_ccs_associated_to_analysis_type(self):
         print('\nVerifying all CladeCollections have been associated to an AnalysisType...')
@@ -715,6 +992,8 @@ class SPDataAnalysis:
 
     def _populate_clade_fp_dicts_list(self):
         for cc_id, vcc in self.virtual_object_manager.vcc_manager.vcc_dict.items():
+            if cc_id in self.seeded_vcc_uid_set:
+                continue
             clade_index = self.clade_list.index(vcc.clade)
             if vcc.above_cutoff_ref_seqs_obj_set in self.clade_footp_dicts_list[clade_index]:
                 self.clade_footp_dicts_list[clade_index][vcc.above_cutoff_ref_seqs_obj_set].cc_list.append(vcc)
@@ -724,6 +1003,147 @@ class SPDataAnalysis:
                 cc=vcc, maj_dss_seq_list=vcc.ordered_dsss_objs[0])
 
 
+class AnalysisCheckpoint:
+    """Snapshots of the VirtualObjectManager of an SPDataAnalysis taken after each of the stages of the analysis.
+    There is one snapshot per stage (a gzipped pickle) so that an interrupted analysis can be resumed
+    from its last completed stage. Each snapshot records the DataAnalysis uid and the DataSet uids that it was made
+    for. It is only loaded if these match the analysis being resumed. The snapshots are deleted once all of the
+    stages have completed as the results of the analysis are then in the database."""
+    stages = [
+        'profile_discovery', 'profile_assignment', 'div_naming', 'species_association', 'analysis_type_creation']
+
+    def __init__(self, checkpoint_directory, data_analysis_uid, list_of_data_set_uids):
+        self.checkpoint_directory = checkpoint_directory
+        self.data_analysis_uid = data_analysis_uid
+        self.list_of_data_set_uids = sorted(list_of_data_set_uids)
+
+    def get_checkpoint_path(self, stage):
+        return os.path.join(self.checkpoint_directory, f'{stage}.p.gz')
+
+    def stage_already_completed(self, stage, last_completed_stage):
+        if last_completed_stage is None:
+            return False
+        return self.stages.index(stage) <= self.stages.index(last_completed_stage)
+
+    def save_checkpoint(self, stage, virtual_object_manager):
+        os.makedirs(self.checkpoint_directory, exist_ok=True)
+        checkpoint_path = self.get_checkpoint_path(stage)
+        print(f'\nWriting {stage} checkpoint to {checkpoint_path}')
+        # Write to a temporary file first so that an interrupted write never leaves a truncated checkpoint
+        with gzip.open(f'{checkpoint_path}.tmp', 'wb', compresslevel=1) as f:
+            pickle.dump({
+                'data_analysis_uid': self.data_analysis_uid,
+                'list_of_data_set_uids': self.list_of_data_set_uids,
+                'stage': stage,
+                'virtual_object_manager': virtual_object_manager
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(f'{checkpoint_path}.tmp', checkpoint_path)
+
+    def load_last_checkpoint(self):
+        """Return the last completed stage and its VirtualObjectManager.
+        If there are no checkpoints return None, None so that the analysis is started from the beginning."""
+        for stage in reversed(self.stages):
+            checkpoint_path = self.get_checkpoint_path(stage)
+            if os.path.exists(checkpoint_path):
+                print(f'\nResuming analysis from the {stage} checkpoint {checkpoint_path}')
+                return stage, self.load_checkpoint(stage)
+        print(f'\nNo checkpoints found in {self.checkpoint_directory}. Starting analysis from the beginning.')
+        return None, None
+
+    def load_checkpoint(self, stage):
+        checkpoint_path = self.get_checkpoint_path(stage)
+        with gzip.open(checkpoint_path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        if checkpoint['data_analysis_uid'] != self.data_analysis_uid:
+            raise RuntimeError(
+                f'The checkpoint {checkpoint_path} was made for DataAnalysis {checkpoint["data_analysis_uid"]} '
+                f'not DataAnalysis {self.data_analysis_uid}')
+        if checkpoint['list_of_data_set_uids'] != self.list_of_data_set_uids:
+            raise RuntimeError(
+                f'The checkpoint {checkpoint_path} was made for DataSets '
+                f'{",".join([str(_) for _ in checkpoint["list_of_data_set_uids"]])} '
+                f'not DataSets {",".join([str(_) for _ in self.list_of_data_set_uids])}')
+        if checkpoint['stage'] != stage:
+            raise RuntimeError(f'The checkpoint {checkpoint_path} is for the {checkpoint["stage"]} stage')
+        return checkpoint['virtual_object_manager']
+
+    def delete_checkpoints(self):
+        if os.path.exists(self.checkpoint_directory):
+            print(f'\nDeleting the analysis checkpoints in {self.checkpoint_directory}')
+            shutil.rmtree(self.checkpoint_directory)
+
+
+class CladeStageHandler:
+    """Runs a per clade stage of the analysis (clade_worker_function) for each of the clades in a separate worker.
+    The clades share no VirtualAnalysisType or VirtualCladeCollection state during these stages so that each
+    worker process works on its own copy of the VirtualObjectManager.
+    The clade_worker_function must only read the VirtualObjectManager and return a uid based result
+    that the parent then merges back into the VirtualObjectManager.
+    The clade stages are CPU bound so, unlike the other handlers, the workers are processes whether or not
+    --multiprocess was passed. Threads (multiprocess=False) give no speed up and are for debugging only
+    (e.g. to step into the clade_worker_function)."""
+    def __init__(self, parent_sp_data_analysis, clades, clade_worker_function, multiprocess=True):
+        self.sp_data_analysis = parent_sp_data_analysis
+        self.clades = clades
+        self.clade_worker_function = clade_worker_function
+        self.multiprocess = multiprocess
+        # One worker per clade up to num_proc
+        self.num_proc = max(1, min(self.sp_data_analysis.workflow_manager.args.num_proc, len(self.clades)))
+        if self.multiprocess:
+            self.clade_input_queue = mp_Queue()
+            self.clade_output_queue = mp_Queue()
+        else:
+            self.clade_input_queue = mt_Queue()
+            self.clade_output_queue = mt_Queue()
+        for clade in self.clades:
+            self.clade_input_queue.put(clade)
+        for n in range(self.num_proc):
+            self.clade_input_queue.put('STOP')
+        # key = clade, value = the result of the clade_worker_function for that clade
+        self.clade_to_result_dict = {}
+
+    @profile_stage()
+    def execute_clade_stage(self):
+        all_processes = []
+        # close all connections to the db so that they are automatically recreated for each process
+        # http://stackoverflow.com/questions/8242837/django-multiprocessing-and-database-connections
+        db.connections.close_all()
+        for n in range(self.num_proc):
+            if self.multiprocess:
+                p = Process(target=self._clade_stage_worker, args=(
+                    self.clade_input_queue, self.clade_output_queue, self.clade_worker_function))
+            else:
+                p = Thread(target=self._clade_stage_worker, args=(
+                    self.clade_input_queue, self.clade_output_queue, self.clade_worker_function))
+            all_processes.append(p)
+            p.start()
+
+        # Process the output queue as we go so that it doesn't grow large enough to cause p.join() to hang.
+        done_count = 0
+        while done_count < self.num_proc:
+            worker_output = self.clade_output_queue.get()
+            if isinstance(worker_output, str) and worker_output == 'DONE':
+                done_count += 1
+            else:
+                clade, clade_result = worker_output
+                self.clade_to_result_dict[clade] = clade_result
+
+        for p in all_processes:
+            p.join()
+
+        if set(self.clade_to_result_dict.keys()) != set(self.clades):
+            raise RuntimeError(
+                f'No result was returned for clade(s) '
+                f'{",".join(set(self.clades).difference(self.clade_to_result_dict.keys()))}')
+        return self.clade_to_result_dict
+
+    @staticmethod
+    def _clade_stage_worker(in_q, out_q, clade_worker_function):
+        for clade in iter(in_q.get, 'STOP'):
+            out_q.put((clade, clade_worker_function(clade)))
+        out_q.put('DONE')
+
+
 class ArtefactAssessor:
     def __init__(self, parent_sp_data_analysis):
         self.sp_data_analysis = parent_sp_data_analysis
@@ -738,21 +1158,31 @@ class ArtefactAssessor:
         self.ref_seq_fp_set_to_analysis_type_obj_dict = self._init_fp_to_at_dict()
         # Attributes updated on an iterative basis
         self.current_clade = None
-        # NB we have the two lists below as we only want to check combinations of the original AnalysiTypes and
+        # NB we only want to check combinations of the original AnalysiTypes and
         # not the new AnalysisTypes that will be created as part of this process. This is to prevent any infinite
         # loops occuring.
-        # A query that will be coninually updated
-        self.vat_uids_of_clade_dynamic = None
         # A fixed list of the original types that we stated with
         self.vat_uids_of_clade_static = None
-        # A list that holds a tuple of ids that have already been compared.
+        # The position of each of the original types in the above list. Pairs are checked in order of these positions.
+        self.vat_uid_to_static_position_dict = None
+        # A set that holds frozensets of the ids of the pairs that have already been compared (and rejected).
         self.already_compared_analysis_type_uid_set = set()
-        # Bool whether the pair comparisons need to be restarted.
+        # key = vat uid, value = set of the uids of the vats it has been compared with
+        self.vat_uid_to_compared_vat_uids_dict = defaultdict(set)
+        # The pair index. Only types with the same basal seq and non-artefact DIV set can be checked as a pair
+        # (see _types_should_be_checked) so the original types are indexed by this key.
+        # key = vat uid, value = the pair index key of the vat (None if it has no non-artefact DIVs)
+        self.vat_uid_to_pair_index_key_dict = None
+        # key = pair index key, value = set of the vat uids with that key
+        self.pair_index_key_to_vat_uids_dict = None
+        # heap of (position of vat a, position of vat b) of the candidate pairs still to be checked
+        self.candidate_pair_heap = None
+        # Bool whether the checks need to be restarted.
         # This will be true when we have modified a type in anyway
         self.restart_pair_comparisons = True
 
         # reassess support of artefact DIV containing analysis types attributes
-        self.already_checked_vat_uid_list = []
+        self.already_checked_vat_uid_set = set()
 
     def _init_fp_to_at_dict(self):
         ref_seq_fp_set_to_analysis_type_obj_dict = {}
@@ -780,30 +1210,109 @@ class ArtefactAssessor:
         withincladecutoff. Please see:
         https://github.com/didillysquat/SymPortal_framework/wiki/
         The-SymPortal-logic#artefacts-during-the-its2-type-profile-discovery-phase
-        For further details"""
+        For further details
+
+        Rather than walking all pairwise combinations of the types (and restarting every time a new type is created)
+        the candidate pairs are taken from the pair index in the order that the pairwise combinations would
+        be walked. When a new type is created, only the types whose pair index key has changed
+        (i.e. they were reinitiated with a different non-artefact DIV set, or deleted) are re-indexed.
+        Rejected pairs are cached until the key of either of their types changes."""
         for clade in self.set_of_clades_from_analysis:
             self.current_clade = clade
-            self._set_static_and_dynamic_vat_lists()
-            self.restart_pair_comparisons = True
-            while self.restart_pair_comparisons:
-                self.restart_pair_comparisons = False
-                self._set_vat_to_compare_pairwise()
-                for analysis_type_a_uid, analysis_type_b_uid in itertools.combinations(self.vat_uids_to_check_of_clade, 2):
-                    if {analysis_type_a_uid, analysis_type_b_uid} not in self.already_compared_analysis_type_uid_set:
-                        vat_a = self.virtual_analysis_type_dict[analysis_type_a_uid]
-                        vat_b = self.virtual_analysis_type_dict[analysis_type_b_uid]
-                        if self._types_should_be_checked(vat_a, vat_b):
-                            print(f'\n\nChecking {vat_a.name} and {vat_b.name} for additional artefactual profiles')
-
-                            ctph = CheckTypePairingHandler(parent_artefact_assessor=self, vat_a=vat_a, vat_b=vat_b)
-                            if ctph.check_type_pairing():
-                                self.restart_pair_comparisons = True
-                                self._reset_dynamic_vat_list()
-                                break
-                            else:
-                                self._log_completed_comparison(analysis_type_a_uid, analysis_type_b_uid)
-                        else:
-                            self._log_completed_comparison(analysis_type_a_uid, analysis_type_b_uid)
+            self._set_static_vat_list()
+            self._init_pair_index()
+            while self.candidate_pair_heap:
+                position_a, position_b = heapq.heappop(self.candidate_pair_heap)
+                analysis_type_a_uid = self.vat_uids_of_clade_static[position_a]
+                analysis_type_b_uid = self.vat_uids_of_clade_static[position_b]
+                if self._pair_no_longer_needs_checking(analysis_type_a_uid, analysis_type_b_uid):
+                    continue
+                vat_a = self.virtual_analysis_type_dict[analysis_type_a_uid]
+                vat_b = self.virtual_analysis_type_dict[analysis_type_b_uid]
+                if self._types_should_be_checked(vat_a, vat_b):
+                    print(f'\n\nChecking {vat_a.name} and {vat_b.name} for additional artefactual profiles')
+
+                    ctph = CheckTypePairingHandler(parent_artefact_assessor=self, vat_a=vat_a, vat_b=vat_b)
+                    if ctph.check_type_pairing():
+                        # Types will have been reinitiated or deleted. Update the index for these and
+                        # check this pairing again (as the first pairing of the restarted comparisons would be).
+                        self._update_pair_index()
+                        heapq.heappush(self.candidate_pair_heap, (position_a, position_b))
+                    else:
+                        self._log_completed_comparison(analysis_type_a_uid, analysis_type_b_uid)
+                else:
+                    self._log_completed_comparison(analysis_type_a_uid, analysis_type_b_uid)
+
+    def _pair_no_longer_needs_checking(self, analysis_type_a_uid, analysis_type_b_uid):
+        if analysis_type_a_uid not in self.virtual_analysis_type_dict:
+            return True
+        if analysis_type_b_uid not in self.virtual_analysis_type_dict:
+            return True
+        return frozenset({analysis_type_a_uid, analysis_type_b_uid}) in self.already_compared_analysis_type_uid_set
+
+    @staticmethod
+    def _get_pair_index_key(vat):
+        if not vat.non_artefact_ref_seq_uid_set:
+            return None
+        return vat.basal_seq, frozenset(vat.non_artefact_ref_seq_uid_set)
+
+    def _log_unchanged_seeded_vat_pairs(self):
+        """Incremental analysis. Pairs of seeded VirtualAnalysisTypes that have not gained any CladeCollections
+        were already assessed in the previous analysis and so are logged as compared. They are reassessed
+        if the pair index key of either of the types changes."""
+        pair_index_key_to_unchanged_vat_uids_dict = defaultdict(list)
+        for vat_uid in self.vat_uids_of_clade_static:
+            if vat_uid in self.sp_data_analysis.unchanged_seeded_vat_uid_set:
+                pair_index_key = self._get_pair_index_key(self.virtual_analysis_type_dict[vat_uid])
+                if pair_index_key is not None:
+                    pair_index_key_to_unchanged_vat_uids_dict[pair_index_key].append(vat_uid)
+        for unchanged_vat_uids in pair_index_key_to_unchanged_vat_uids_dict.values():
+            for vat_uid_a, vat_uid_b in itertools.combinations(unchanged_vat_uids, 2):
+                self._log_completed_comparison(vat_uid_a, vat_uid_b)
+
+    def _init_pair_index(self):
+        if self.sp_data_analysis.unchanged_seeded_vat_uid_set:
+            self._log_unchanged_seeded_vat_pairs()
+        self.vat_uid_to_static_position_dict = {
+            vat_uid: i for i, vat_uid in enumerate(self.vat_uids_of_clade_static)}
+        self.vat_uid_to_pair_index_key_dict = {}
+        self.pair_index_key_to_vat_uids_dict = defaultdict(set)
+        self.candidate_pair_heap = []
+        for vat_uid in self.vat_uids_of_clade_static:
+            self._add_vat_to_pair_index(vat_uid)
+
+    def _add_vat_to_pair_index(self, vat_uid):
+        """Index the vat by its key and queue a candidate pair with each of the other vats of the same key"""
+        pair_index_key = self._get_pair_index_key(self.virtual_analysis_type_dict[vat_uid])
+        self.vat_uid_to_pair_index_key_dict[vat_uid] = pair_index_key
+        if pair_index_key is None:
+            return
+        vat_uids_of_key = self.pair_index_key_to_vat_uids_dict[pair_index_key]
+        position = self.vat_uid_to_static_position_dict[vat_uid]
+        for other_vat_uid in vat_uids_of_key:
+            if frozenset({vat_uid, other_vat_uid}) not in self.already_compared_analysis_type_uid_set:
+                other_position = self.vat_uid_to_static_position_dict[other_vat_uid]
+                heapq.heappush(
+                    self.candidate_pair_heap, (min(position, other_position), max(position, other_position)))
+        vat_uids_of_key.add(vat_uid)
+
+    def _remove_vat_from_pair_index(self, vat_uid):
+        """Remove the vat from the index and forget the pairs it was rejected in"""
+        pair_index_key = self.vat_uid_to_pair_index_key_dict.pop(vat_uid)
+        if pair_index_key is not None:
+            self.pair_index_key_to_vat_uids_dict[pair_index_key].discard(vat_uid)
+        for other_vat_uid in self.vat_uid_to_compared_vat_uids_dict.pop(vat_uid, set()):
+            self.already_compared_analysis_type_uid_set.discard(frozenset({vat_uid, other_vat_uid}))
+            self.vat_uid_to_compared_vat_uids_dict[other_vat_uid].discard(vat_uid)
+
+    def _update_pair_index(self):
+        """Re-index the original types that have been deleted or whose pair index key has changed"""
+        for vat_uid, pair_index_key in list(self.vat_uid_to_pair_index_key_dict.items()):
+            if vat_uid not in self.virtual_analysis_type_dict:
+                self._remove_vat_from_pair_index(vat_uid)
+            elif self._get_pair_index_key(self.virtual_analysis_type_dict[vat_uid]) != pair_index_key:
+                self._remove_vat_from_pair_index(vat_uid)
+                self._add_vat_to_pair_index(vat_uid)
 
     def reassess_support_of_artefact_div_containing_types(self):
         """Check to see how the association of VirtualCladeCollections to VirtualAnalysisTypes changes when taking into
@@ -813,7 +1322,7 @@ class ArtefactAssessor:
         for further details."""
         for clade in self.set_of_clades_from_analysis:
             self.current_clade = clade
-            self.already_checked_vat_uid_list = []
+            self.already_checked_vat_uid_set = set()
             self.restart_pair_comparisons = True
 
             while self.restart_pair_comparisons:
@@ -821,17 +1330,17 @@ class ArtefactAssessor:
                 self.restart_pair_comparisons = False
 
                 for vat_uid in self.vat_uids_to_check_of_clade:
-                    if vat_uid not in self.already_checked_vat_uid_list:
+                    if vat_uid not in self.already_checked_vat_uid_set:
 
                         vat_to_check = self.virtual_analysis_type_dict[vat_uid]
                         print(f'\n\nChecking associations of VirtualCladeCollections to {vat_to_check.name}')
                         cadivvata = CheckArtefactDIVVATAssociations(parent_artefact_assessor=self, vat_to_check=vat_to_check)
                         if cadivvata.check_artefact_div_vat_associations():
                             self.restart_pair_comparisons = True
-                            self.already_checked_vat_uid_list.append(vat_to_check.id)
+                            self.already_checked_vat_uid_set.add(vat_to_check.id)
                             break
                         else:
-                            self.already_checked_vat_uid_list.append(vat_to_check.id)
+                            self.already_checked_vat_uid_set.add(vat_to_check.id)
 
     def _set_artefact_div_vat_to_check(self):
         self.vat_uids_to_check_of_clade = [
@@ -839,24 +1348,13 @@ class ArtefactAssessor:
             vat.clade == self.current_clade if
             vat.artefact_ref_seq_uid_set]
 
-    def _reset_dynamic_vat_list(self):
-        self.vat_uids_of_clade_dynamic = [
-            at_id for at_id in self.virtual_analysis_type_dict.keys() if
-            self.virtual_analysis_type_dict[at_id].clade == self.current_clade]
-
     def _log_completed_comparison(self, analysis_type_a_uid, analysis_type_b_uid):
         self.already_compared_analysis_type_uid_set.add(
             frozenset({analysis_type_a_uid, analysis_type_b_uid}))
+        self.vat_uid_to_compared_vat_uids_dict[analysis_type_a_uid].add(analysis_type_b_uid)
+        self.vat_uid_to_compared_vat_uids_dict[analysis_type_b_uid].add(analysis_type_a_uid)
 
-    def _set_vat_to_compare_pairwise(self):
-        self.vat_uids_to_check_of_clade = [at_id for at_id in self.vat_uids_of_clade_dynamic if at_id in
-                                     self.vat_uids_of_clade_static]
-
-
-    def _set_static_and_dynamic_vat_lists(self):
-        self.vat_uids_of_clade_dynamic = [
-            vat_id for vat_id in self.virtual_analysis_type_dict.keys() if
-            self.virtual_analysis_type_dict[vat_id].clade == self.current_clade]
+    def _set_static_vat_list(self):
         self.vat_uids_of_clade_static = [
             at_id for at_id in self.virtual_analysis_type_dict.keys() if
             self.virtual_analysis_type_dict[at_id].clade == self.current_clade]
@@ -1500,6 +1998,20 @@ class AnalysisTypeCreator:
             self._create_new_virtual_analysis_type_from_initial_type(initial_type)
 
     def _create_new_virtual_analysis_type_from_initial_type(self, initial_type):
+        seeded_vat = self.sp_data_analysis.seeded_footprint_to_vat_dict.get(
+            frozenset([rs.id for rs in initial_type.profile]))
+        if seeded_vat is not None and seeded_vat.id in self.sp_data_analysis.virtual_object_manager.vat_manager.vat_dict:
+            # Incremental analysis: the profile is already represented by a type seeded from the previous analysis
+            new_cc_list = [
+                cc for cc in initial_type.clade_collection_list if
+                cc not in seeded_vat.clade_collection_obj_set_profile_discovery]
+            if new_cc_list:
+                # Only a type that has gained CladeCollections needs to be reassessed for artefacts
+                self.sp_data_analysis.virtual_object_manager.vat_manager.add_ccs_and_reinit_virtual_analysis_type(
+                    vat_to_add_ccs_to=seeded_vat, list_of_clade_collection_objs_to_add=new_cc_list)
+                self.sp_data_analysis.unchanged_seeded_vat_uid_set.discard(seeded_vat.id)
+                print(f'Adding CladeCollections to seeded virtual analysis type: {seeded_vat.name}')
+            return
         new_virtual_analysis_type = self.sp_data_analysis.virtual_object_manager.vat_manager.make_vat_pre_profile_assignment(
             clade_collection_obj_list=initial_type.clade_collection_list,
             ref_seq_obj_list=initial_type.profile)
@@ -1529,9 +2041,10 @@ class SupportedFootPrintIdentifier:
     footprints, one for with C3 and one with C15.
     as """
 
-    def __init__(self, clade_footprint_dict, parent_sp_data_analysis):
+    def __init__(self, clade_footprint_dict, parent_sp_data_analysis, clade):
         self.sp_data_analysis = parent_sp_data_analysis
         self.clade_fp_dict = clade_footprint_dict
+        self.clade = clade
         self.supported_list = []
         self.unsupported_list = []
         self.initial_types_list = []
@@ -1560,6 +2073,8 @@ class SupportedFootPrintIdentifier:
         # Attributes used in the synthetic footprint generation
         self.list_of_initial_types_of_len_n = None
         self.synthetic_fp_dict = None
+        # key = ReferenceSequence, value = set of indices of the unsupported initial types containing it
+        self.unsupported_ref_seq_to_unsup_index_dict = None
 
         # Attributes used in synthetic footprint collapse
         self.ordered_sig_synth_fps = None
@@ -1574,7 +2089,7 @@ class SupportedFootPrintIdentifier:
                     maj_dsss_list=footprint_representative.maj_dss_seq_list))
 
     def _verify_that_all_cc_associated_to_an_initial_type(self):
-        set_of_ccs_of_clade = set([cc.id for cc in self.sp_data_analysis.ccs_of_analysis if cc.clade == self.sp_data_analysis.current_clade])
+        set_of_ccs_of_clade = set([cc.id for cc in self.sp_data_analysis.ccs_of_analysis if cc.clade == self.clade])
         set_of_ccs_found_in_init_types = set()
         for init_type in self.initial_types_list:
             set_of_ccs_found_in_init_types.update([cc.id for cc in init_type.clade_collection_list])
@@ -1650,7 +2165,7 @@ class SupportedFootPrintIdentifier:
         # Because we can't modify the initial_types_list at the same time as parsing through it
         # we will use a default dict to store the references sequence to the list of clade collections that should be associated to it
         rs_to_vcc_maj_seq_dict = defaultdict(list)
-        for vcc in [_ for _ in self.sp_data_analysis.virtual_object_manager.vcc_manager.vcc_dict.values() if _.clade == self.sp_data_analysis.current_clade]:
+        for vcc in [_ for _ in self.sp_data_analysis.virtual_object_manager.vcc_manager.vcc_dict.values() if _.clade == self.clade]:
             vcc_maj_rs = vcc.ordered_dsss_objs[0].reference_sequence_of
             rs_to_vcc_maj_seq_dict[vcc_maj_rs].append(vcc)
         
@@ -1705,31 +2220,73 @@ class SupportedFootPrintIdentifier:
         return False
 
     def _generate_synth_footprints(self):
+        """Generate the n-1 length synthetic footprints from the footprints of the length n initial types.
+        Support (the unsupported initial types a synthetic footprint is a subset of) is computed by intersecting
+        the per ReferenceSequence posting lists of the unsupported initial types. Synthetic footprints with
+        zero support are not kept and footprints that cannot produce a supported combination are pruned before
+        their combinations are enumerated.
+        """
+        self._make_unsupported_ref_seq_posting_dict()
         temp_dict = {}
+        zero_support_synth_fps = set()
         for footprint_set in [_.profile for _ in self.list_of_initial_types_of_len_n]:
-            temp_dict.update({
-                frozenset(tup): [] for tup in itertools.combinations(footprint_set, self.current_n-1)})
+            if not self._footprint_has_synth_fp_support(footprint_set):
+                continue
+            for tup in itertools.combinations(footprint_set, self.current_n-1):
+                synth_fp = frozenset(tup)
+                if synth_fp in temp_dict or synth_fp in zero_support_synth_fps:
+                    continue
+                unsup_index_list = self._get_unsup_index_list_supporting_synth_fp(synth_fp)
+                if unsup_index_list:
+                    temp_dict[synth_fp] = unsup_index_list
+                else:
+                    zero_support_synth_fps.add(synth_fp)
         sys.stdout.write(f'\rGenerated {len(temp_dict.items())} synthetic footprints')
         self.synthetic_fp_dict = temp_dict
 
+    def _make_unsupported_ref_seq_posting_dict(self):
+        """key = ReferenceSequence, value = set of the indices of the unsupported initial types
+        (in self.unsupported_list) whose profile contains the ReferenceSequence."""
+        self.unsupported_ref_seq_to_unsup_index_dict = defaultdict(set)
+        for unsup_index, un_sup_initial_type in enumerate(self.unsupported_list):
+            for ref_seq in un_sup_initial_type.profile:
+                self.unsupported_ref_seq_to_unsup_index_dict[ref_seq].add(unsup_index)
+
+    def _footprint_has_synth_fp_support(self, footprint_set):
+        """An unsupported initial type can only contain one of the n-1 combinations of footprint_set if it contains
+        at least n-1 of the ReferenceSequences of footprint_set."""
+        unsup_index_counter = defaultdict(int)
+        for ref_seq in footprint_set:
+            for unsup_index in self.unsupported_ref_seq_to_unsup_index_dict.get(ref_seq, ()):
+                unsup_index_counter[unsup_index] += 1
+        return any(count >= self.current_n - 1 for count in unsup_index_counter.values())
+
+    def _get_unsup_index_list_supporting_synth_fp(self, synth_fp):
+        """The sorted indices of the unsupported initial types that synth_fp is a subset of"""
+        posting_list = sorted(
+            (self.unsupported_ref_seq_to_unsup_index_dict.get(ref_seq, set()) for ref_seq in synth_fp), key=len)
+        if not posting_list or not posting_list[0]:
+            return []
+        return sorted(posting_list[0].intersection(*posting_list[1:]))
+
     def _associate_un_sup_init_types_to_synth_footprints(self):
-        # Now go through each of the (n-1) footprints and see if they
-        # fit into a footprint in the unsuported list
+        # Now go through each of the (n-1) footprints and associate the unsuported types that they
+        # fit into (as identified in _generate_synth_footprints)
         sys.stdout.write('\rChecking new set of synthetic types')
-        for synth_fp in self.synthetic_fp_dict.keys():
+        for synth_fp, unsup_index_list in self.synthetic_fp_dict.items():
+            self.synthetic_fp_dict[synth_fp] = []
             if self.sp_data_analysis.force_basal_lineage_separation:
                 if self._does_synth_fp_have_multi_basal_seqs(synth_fp):
                     continue
 
-            for un_sup_initial_type in self.unsupported_list:
-                # For each of the synth footprints see if they fit within the unsupported types.
+            for unsup_index in unsup_index_list:
+                un_sup_initial_type = self.unsupported_list[unsup_index]
                 # If so then add the initial type into the list associated with that synth footprint
                 # in the synthetic_fp_dict.
                 # For a match, at least one maj ref seqs need to be in common between the two footprints
-                if synth_fp.issubset(un_sup_initial_type.profile):
-                    if len(un_sup_initial_type.set_of_maj_ref_seqs & synth_fp) >= 1:
-                        # Then associate un_sup_initial_type to the synth fp
-                        self.synthetic_fp_dict[synth_fp].append(un_sup_initial_type)
+                if len(un_sup_initial_type.set_of_maj_ref_seqs & synth_fp) >= 1:
+                    # Then associate un_sup_initial_type to the synth fp
+                    self.synthetic_fp_dict[synth_fp].append(un_sup_initial_type)
 
     def _does_synth_fp_have_multi_basal_seqs(self, frozen_set_of_ref_seqs):
         basal_count = 0
@@ -2497,6 +3054,14 @@ class InitialType:
         return str(self.profile)
 
 
+class InitialTypeProfile:
+    """The profile and VirtualCladeCollections of an InitialType once the footprints of a clade have been collapsed.
+    Used by the AnalysisTypeCreator to create the VirtualAnalysisTypes."""
+    def __init__(self, profile, clade_collection_list):
+        self.profile = profile
+        self.clade_collection_list = clade_collection_list
+
+
 class FootprintRepresentative:
     def __init__(self, cc, maj_dss_seq_list):
         self.cc_list = [cc]
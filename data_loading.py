@@ -13,11 +13,13 @@ from multiprocessing import Queue as mp_Queue, Manager, Process, Lock as mp_Lock
 from threading import Lock as mt_Lock, Thread, get_ident
 from queue import Queue as mt_Queue
 from general import ThreadSafeGeneral, file_as_blockiter, hash_bytestr_iter
+from stage_profiling import profile_stage
 from datetime import datetime
 import distance
 from plotting import DistScatterPlotterSamples, SeqStackedBarPlotter
-from symportal_utils import BlastnAnalysis, MothurAnalysis, NucleotideSequence
+from symportal_utils import BlastnAnalysis, MothurAnalysis, NativeQCAnalysis, NucleotideSequence
 from output import SequenceCountTableCreator
+from sequence_store import UniqueSequenceStore
 import ntpath
 import math
 from numpy import NaN
@@ -45,7 +47,7 @@ class DataLoading:
             screen_sub_evalue, num_proc,no_fig, no_ord, no_output,
             distance_method, no_pre_med_seqs, multiprocess, start_time, date_time_str, is_cron_loading,
             study_name=None, study_user_string=None,
-            debug=False):
+            debug=False, native_qc=False):
         self.parent = parent_work_flow_obj
         self.is_cron_loading = is_cron_loading
         self.thread_safe_general = ThreadSafeGeneral()
@@ -53,7 +55,10 @@ class DataLoading:
         self.sample_meta_info_df = None
         self.user_input_path = user_input_path
         self.datasheet_path = datasheet_path
-        self._check_mothur_version()
+        # If True, the initial QC will be performed in process by the NativeQCAnalysis rather than by mothur
+        self.native_qc = native_qc
+        if not self.native_qc:
+            self._check_mothur_version()
         if self.datasheet_path:
             self._create_and_check_datasheet()
         self.symportal_root_directory = os.path.abspath(os.path.dirname(__file__))
@@ -106,12 +111,11 @@ class DataLoading:
         self.seq_dump_file_path = self._setup_sequence_dump_file_path()
         self.dataset_object.working_directory = self.temp_working_directory
         self.dataset_object.save()
-        # This is the directory that sequences that have undergone QC for each sample will be written out as
-        # .names and .fasta pairs BEFORE MED decomposition
-        # We will delete the directory if it already exists
+        # The directory of the UniqueSequenceStore that holds the unique sequences (and their abundances)
+        # of each sample once taxonomic screening is complete. It is used in place of the per-sample .fasta and .names
+        # pairs by the MED and pre-MED stages.
+        self.unique_sequence_store_directory_path = os.path.join(self.temp_working_directory, 'unique_sequence_store')
 
-        self.pre_med_sequence_output_directory_path = self._create_pre_med_write_out_directory_path()
-        
         # directory that will contain sub directories for each sample. Each sub directory will contain a pair of
         # .names and .fasta files of the non_symbiodiniaceae_sequences that were thrown out for that sample
         self.non_symb_and_size_violation_base_dir_path = os.path.join(
@@ -206,7 +210,7 @@ class DataLoading:
 
         self._perform_sequence_drop()
 
-        self._delete_temp_dir__log_files_and_pre_med_dir()
+        self._delete_temp_dir_and_log_files()
 
         self._write_data_set_info_to_stdout()
 
@@ -259,12 +263,16 @@ class DataLoading:
         self.parent.data_set_object = self.dataset_object
 
     def _write_sym_non_sym_and_size_violation_dirs_to_stdout(self):
-        if not self.no_pre_med_seqs:
-            print(f'\nPre-MED Symbiodiniaceae sequences written out to:\n'
-                  f'{self.pre_med_sequence_output_directory_path}')
+        # The pre-MED sequences are no longer written out as .fasta and .names pairs during the loading. They are held
+        # in the unique sequence store (in the temp working directory) and from there stored in the database as
+        # DataSetSampleSequencePM objects that are output as the pre-MED count tables.
+        if not self.no_pre_med_seqs and self.sequence_count_table_creator.pre_med_fasta_out_path is not None:
+            print(f'\nPre-MED Symbiodiniaceae sequences (from the unique sequence store) written out to:\n'
+                  f'{os.path.dirname(self.sequence_count_table_creator.pre_med_fasta_out_path)}')
         print(f'\nNon-Symbiodiniaceae and size violation sequences written out to:\n'
               f'{self.non_symb_and_size_violation_base_dir_path}')
 
+    @profile_stage()
     def _do_sample_ordination(self):
         if not self.no_ord:
             self._do_sample_dist_and_pcoa()
@@ -334,25 +342,25 @@ class DataLoading:
         unifrac_dict_pcoa_creator.compute_unifrac_dists_and_pcoa_coords()
         self.output_path_list.extend(unifrac_dict_pcoa_creator.output_path_list)
 
+    @profile_stage()
     def _output_seqs_stacked_bar_plots(self):
-        """Plot up the post- and pre-MED seqs as both .png and .svg"""
+        """Plot up the post- and pre-MED seqs in each of the configured figure formats"""
         if not self.no_fig:
-            if len(self.list_of_samples_names) > 1000:
-                print(f'Too many samples ({len(self.list_of_samples_names)}) to generate plots')
-            else:
-                sys.stdout.write('\nGenerating sequence count table figures\n')
-
-                self.seq_stacked_bar_plotter = SeqStackedBarPlotter(
-                    output_directory=self.output_directory,
-                    seq_relative_abund_count_table_path_post_med=self.seq_abundance_relative_output_path_post_med,
-                    no_pre_med_seqs=self.no_pre_med_seqs,
-                    ordered_seq_list=self.sequence_count_table_creator.clade_abundance_ordered_ref_seq_list,
-                    date_time_str=self.date_time_str,
-                    seq_relative_abund_df_pre_med=self.seq_abund_relative_df_pre_med
-                    )
-                self.seq_stacked_bar_plotter.plot_stacked_bar_seqs()
-                self.output_path_list.extend(self.seq_stacked_bar_plotter.output_path_list)
+            sys.stdout.write('\nGenerating sequence count table figures\n')
+
+            self.seq_stacked_bar_plotter = SeqStackedBarPlotter(
+                output_directory=self.output_directory,
+                seq_relative_abund_count_table_path_post_med=self.seq_abundance_relative_output_path_post_med,
+                no_pre_med_seqs=self.no_pre_med_seqs,
+                ordered_seq_list=self.sequence_count_table_creator.clade_abundance_ordered_ref_seq_list,
+                date_time_str=self.date_time_str,
+                seq_relative_abund_df_pre_med=self.seq_abund_relative_df_pre_med,
+                num_proc=self.num_proc
+                )
+            self.seq_stacked_bar_plotter.plot_stacked_bar_seqs()
+            self.output_path_list.extend(self.seq_stacked_bar_plotter.output_path_list)
 
+    @profile_stage()
     def _output_seqs_count_table(self):
         sys.stdout.write('\nGenerating count tables for post- and pre-MED sequence abundances\n')
         self.sequence_count_table_creator = SequenceCountTableCreator(
@@ -373,17 +381,13 @@ class DataLoading:
             if 'relative.abund_and_meta' in path:
                 self.seq_abundance_relative_output_path_post_med = path
 
-    def _delete_temp_dir__log_files_and_pre_med_dir(self):
+    def _delete_temp_dir_and_log_files(self):
         if os.path.exists(self.temp_working_directory):
             shutil.rmtree(self.temp_working_directory)
         # Delete any log files that are found anywhere in the SymPortal directory
         subprocess.run(f'find {self.symportal_root_directory} -name "*.logfile" -delete', shell=True, check=True)
-        # Delete the pre_med_seq directories holding the .fasta and .names pairs
-        # as this information is now stored in the database and output in a count table.
-        # This directory will be remade if outputs are being made
-        if os.path.exists(self.pre_med_sequence_output_directory_path):
-            shutil.rmtree(self.pre_med_sequence_output_directory_path)
 
+    @profile_stage()
     def _perform_sequence_drop(self):
         sequence_drop_file = self._generate_sequence_drop_file()
         sys.stdout.write(f'\n\nBackup of named reference_sequences output to {self.seq_dump_file_path}\n')
@@ -413,6 +417,7 @@ class DataLoading:
                      f'samples successfully passed QC.\n'
                      f'{failed_count} samples produced errors\n')
 
+    @profile_stage()
     def _create_data_set_sample_sequences_from_med_nodes(self):
         self.data_set_sample_creator_handler_instance = DataSetSampleCreatorHandler()
         self.data_set_sample_creator_handler_instance.execute_data_set_sample_creation(
@@ -421,12 +426,13 @@ class DataLoading:
         self.dataset_object.currently_being_processed = False
         self.dataset_object.save()
 
+    @profile_stage()
     def _create_data_set_sample_sequence_pre_med_objs(self):
         print('\n\nCreating DataSetSampleSequencePM objects')
         self.pre_med_seq_start_time = time.time()
         data_set_sample_pre_med_obj_creator = FastDataSetSampleSequencePMCreator(
             dataset_object=self.dataset_object,
-            pre_med_sequence_output_directory_path=self.pre_med_sequence_output_directory_path,
+            unique_sequence_store_directory_path=self.unique_sequence_store_directory_path,
             num_proc=self.num_proc, path_to_seq_match_executable=self.path_to_seq_match_executable,
             temp_working_directory=self.temp_working_directory)
         data_set_sample_pre_med_obj_creator.make_data_set_sample_pm_objects()
@@ -434,9 +440,11 @@ class DataLoading:
         print(f'\n\nCreation of DataSetSampleSequencePM objects took '
               f'{self.pre_med_seq_stop_time-self.pre_med_seq_start_time}s')
 
+    @profile_stage()
     def _do_med_decomposition(self):
         self.perform_med_handler_instance = PerformMEDHandler(
             data_loading_temp_working_directory=self.temp_working_directory,
+            data_loading_unique_sequence_store_directory_path=self.unique_sequence_store_directory_path,
             data_loading_num_proc=self.num_proc,
             multiprocess=self.multiprocess)
 
@@ -452,6 +460,7 @@ class DataLoading:
             for med_output_directory in self.list_of_med_output_directories:
                 print(med_output_directory)
 
+    @profile_stage()
     def _do_initial_mothur_qc(self):
 
         if not self.sample_fastq_pairs:
@@ -462,6 +471,7 @@ class DataLoading:
         self.samples_that_caused_errors_in_qc_list = list(
             self.initial_mothur_handler.samples_that_caused_errors_in_qc_mp_list)
 
+    @profile_stage()
     def _taxonomic_screening(self):
         """
         There are only two things to achieve as part of this taxonomy screening.
@@ -527,14 +537,15 @@ class DataLoading:
         )
         self.sym_non_sym_tax_screening_handler.execute_sym_non_sym_tax_screening(
             data_loading_temp_working_directory=self.temp_working_directory,
-            data_loading_pre_med_sequence_output_directory_path=self.pre_med_sequence_output_directory_path,
-
+            data_loading_unique_sequence_store_directory_path=self.unique_sequence_store_directory_path,
             non_symb_and_size_violation_base_dir_path=self.non_symb_and_size_violation_base_dir_path,
             data_loading_debug=self.debug
         )
         self.samples_that_caused_errors_in_qc_list = list(
             self.sym_non_sym_tax_screening_handler.samples_that_caused_errors_in_qc_mp_list
         )
+        # Intern the sequences written out by each of the workers into the DataSet's sequence table
+        UniqueSequenceStore(self.unique_sequence_store_directory_path).consolidate_shards()
 
     def _screen_sub_e_seqs(self):
         """This function screens a fasta file to see if the sequences are Symbiodinium in origin.
@@ -1371,6 +1382,7 @@ class DataLoading:
             print('Please rectify this in your datasheet and reattempt loading')
             sys.exit()
 
+    @profile_stage()
     def _copy_and_decompress_input_files_to_temp_wkd(self):
         if not self.is_single_file_or_paired_input:
             self._copy_fastq_files_from_input_dir_to_temp_wkd()
@@ -1423,13 +1435,6 @@ class DataLoading:
                 # rather the pairs of files themselves.
                 return False
 
-    def _create_pre_med_write_out_directory_path(self):
-        pre_med_write_out_directory_path = os.path.join(self.output_directory, 'pre_med_seqs')
-        if os.path.exists(pre_med_write_out_directory_path):
-            shutil.rmtree(pre_med_write_out_directory_path)
-        os.makedirs(pre_med_write_out_directory_path)
-        return pre_med_write_out_directory_path
-
     def _setup_output_directory(self):
         output_directory = os.path.join(self.symportal_root_directory,
                                         'outputs', 'loaded_data_sets', f'{self.dataset_object.id}', self.date_time_str)
@@ -1471,11 +1476,11 @@ class DataLoading:
 
 class FastDataSetSampleSequencePMCreator:
     def __init__(
-            self, pre_med_sequence_output_directory_path, dataset_object, num_proc,
+            self, unique_sequence_store_directory_path, dataset_object, num_proc,
             path_to_seq_match_executable, temp_working_directory):
         # dictionaries to save us having to do lots of database look ups
         self.path_to_seq_match_executable = path_to_seq_match_executable
-        self.pre_med_sequence_output_directory_path = pre_med_sequence_output_directory_path
+        self.unique_sequence_store = UniqueSequenceStore(unique_sequence_store_directory_path)
         self.thread_safe_general = ThreadSafeGeneral()
         self.num_proc = num_proc
         self.dataset_object = dataset_object
@@ -1484,7 +1489,6 @@ class FastDataSetSampleSequencePMCreator:
         for clade in clades:
             self.ref_seq_sequence_to_ref_seq_obj_dict[clade] = {
                 ref_seq.sequence: ref_seq for ref_seq in ReferenceSequence.objects.filter(clade=clade)}
-        self.list_of_pre_med_sample_dirs = self._populate_list_of_pre_med_sample_dirs()
         # This is a dict that will have three levels.
         # The first set of keys will be the clades.
         # The second set of keys will be nucleotide sequences
@@ -1504,46 +1508,29 @@ class FastDataSetSampleSequencePMCreator:
         self.no_match_consolidated_seq_to_sample_and_abund_dict = defaultdict(dict)
         self.temp_working_directory = temp_working_directory
 
-    def _populate_list_of_pre_med_sample_dirs(self):
-        return self.thread_safe_general.return_list_of_directory_paths_in_directory(
-            self.pre_med_sequence_output_directory_path)
-
     def _populated_consolidated_seq_to_sample_and_abund_dict(self):
-        """Go through the list_of_pre_med_sample_dirs. There will be one per sample.
-        Get the list of sequences and their abundances using the fasta and name file pairs.
-        Get the sample from the fasta name. Get the current dictionary represented by the sequence key
-        and add the sample in question-abunance k, v pairing to it. Then move on to next sample."""
-        count = 0
-        num_samples_to_process = len(self.list_of_pre_med_sample_dirs)
+        """Go through the sample keys of the UniqueSequenceStore. There will be one per sample per clade.
+        Get the sample's sequences and their abundances from the store. Get the current dictionary
+        represented by the sequence key and add the sample in question-abunance k, v pairing to it.
+        Then move on to next sample."""
+        sample_keys = self.unique_sequence_store.get_sample_keys()
+        num_samples_to_process = len(sample_keys)
+        dss_name_to_dss_obj_dict = {
+            dss.name: dss for dss in DataSetSample.objects.filter(data_submission_from=self.dataset_object)}
         print('Populating the consolidated sequence to sample and abundance dictionary'
               'for pre-MED sequence processing')
-        for sample_pm_dir in self.list_of_pre_med_sample_dirs:
-            count += 1
-            print(f'Processing pre-MED seqs for sample {count} of {num_samples_to_process}')
-            current_dss_obj = None
-            # get list of the fasta files (one per clade) that we will need to process
-            # we can deduce the .names file from the fasta file simply by changing the extension
-            sample_list_of_fasta_file_paths = [
-                f_path for f_path in self.thread_safe_general.return_list_of_file_paths_in_directory(sample_pm_dir) if
-                '.fasta' in f_path]
-            for f_path in sample_list_of_fasta_file_paths:
-                fasta_dict = self.thread_safe_general.create_dict_from_fasta(fasta_path=f_path)
-                names_dict = self.thread_safe_general.create_seq_name_to_abundance_dict_from_name_file(
-                    name_file_path=f_path.replace('.fasta', '.names'))
-                clade = f_path.split('/')[-1].split('_')[3]
-                # we only need to get the datasetsample object if we haven't already
-                if current_dss_obj is None:
-                    sample_name = '_'.join(f_path.split('/')[-1].split('_')[4:]).replace('.fasta', '')
-                    current_dss_obj = DataSetSample.objects.get(
-                        data_submission_from=self.dataset_object, name=sample_name)
-                # Check to see whether a dictionary entry already exists for this clade
-                # and if not create a default dict to use
-                if clade not in self.consolidated_sequence_to_sample_and_abund_dict.keys():
-                    self.consolidated_sequence_to_sample_and_abund_dict[clade] = defaultdict(dict)
-                # for each sequence of the fasta log it in the consolidated dictionary
-                clade_dict_to_add_to = self.consolidated_sequence_to_sample_and_abund_dict[clade]
-                for seq_name, seq_seq in fasta_dict.items():
-                    clade_dict_to_add_to[seq_seq][current_dss_obj] = names_dict[seq_name]
+        for count, sample_key in enumerate(sample_keys, 1):
+            print(f'Processing pre-MED seqs for sample clade {count} of {num_samples_to_process}')
+            sample_name, clade = self.unique_sequence_store.split_sample_key(sample_key)
+            current_dss_obj = dss_name_to_dss_obj_dict[sample_name]
+            # Check to see whether a dictionary entry already exists for this clade
+            # and if not create a default dict to use
+            if clade not in self.consolidated_sequence_to_sample_and_abund_dict.keys():
+                self.consolidated_sequence_to_sample_and_abund_dict[clade] = defaultdict(dict)
+            # for each sequence of the sample log it in the consolidated dictionary
+            clade_dict_to_add_to = self.consolidated_sequence_to_sample_and_abund_dict[clade]
+            for seq_seq, abundance in self.unique_sequence_store.iter_sample_sequences(sample_key):
+                clade_dict_to_add_to[seq_seq][current_dss_obj] = abundance
 
     def make_data_set_sample_pm_objects(self):
         print('\nProcessing pre-MED seqs for each clade')
@@ -1853,17 +1840,22 @@ class FastDataSetSampleSequencePMCreator:
                             raise RuntimeError(
                                 'Consolidated sequence is already found in the ReferenceSequence object collection')
                 # Create the new reference sequence.
-                new_rs_list.append(ReferenceSequence(clade=self.clade, sequence=c_seq))
+                new_rs_list.append(ReferenceSequence(
+                    clade=self.clade, sequence=c_seq, sequence_hash=ReferenceSequence.make_sequence_hash(c_seq)))
 
             print(f'\ncreating {len(new_rs_list)} new ReferenceSequence objects in bulk for clade {self.clade}')
+            # A concurrent loading may already have created some of these sequences,
+            # in which case the existing ReferenceSequence objects are used (fetched back below).
             for rs_chunk in self.thread_safe_general.chunks(new_rs_list):
-                ReferenceSequence.objects.bulk_create(rs_chunk)
+                ReferenceSequence.objects.bulk_create(rs_chunk, ignore_conflicts=True)
 
-            # Now get the newly create ref seq objects back and create a dict form them
-            # with rs sequence as key and the rs object itself as the value
-            new_rs_seq_to_obj_dict = {
-                rs.sequence: rs for rs in ReferenceSequence.objects.filter(
-                    sequence__in=list(self.non_match_dict.keys()))}
+            # Now get the newly create ref seq objects back (using the indexed sequence hash)
+            # and create a dict form them with rs sequence as key and the rs object itself as the value
+            new_rs_seq_to_obj_dict = {}
+            for rs_chunk in self.thread_safe_general.chunks(new_rs_list):
+                new_rs_seq_to_obj_dict.update({
+                    rs.sequence: rs for rs in ReferenceSequence.objects.filter(
+                        sequence_hash__in=[new_rs.sequence_hash for new_rs in rs_chunk])})
             # Now go back through the no match dict and use this dictionary to poulate the match dictionary
             for c_seq in self.non_match_dict.keys():
                 self.match_dict[new_rs_seq_to_obj_dict[c_seq]] = self.non_match_dict[c_seq]
@@ -1950,7 +1942,7 @@ class InitialMothurHandler:
                             self.samples_that_caused_errors_in_qc_mp_list, 
                             self.output_queue_for_attribute_data, 
                             self.parent.temp_working_directory, 
-                            self.parent.debug)
+                            self.parent.debug, self.parent.native_qc)
                             )
             else:
                 p = Thread(target=self._worker_initial_mothur,
@@ -1958,7 +1950,7 @@ class InitialMothurHandler:
                         self.samples_that_caused_errors_in_qc_mp_list, 
                         self.output_queue_for_attribute_data, 
                         self.parent.temp_working_directory, 
-                        self.parent.debug)
+                        self.parent.debug, self.parent.native_qc)
                         )
 
             all_processes.append(p)
@@ -2009,13 +2001,16 @@ class InitialMothurHandler:
 
     # We will attempt to fix the weakref pickling issue we are having by maing this a static method.
     @staticmethod
-    def _worker_initial_mothur(in_q_paths, out_list_error_samples, out_q_attr_data, temp_working_directory, debug):
+    def _worker_initial_mothur(
+            in_q_paths, out_list_error_samples, out_q_attr_data, temp_working_directory, debug, native_qc):
         """
         This worker performs the pre-MED processing that is primarily mothur-based.
         This QC includes making contigs, screening for ambigous calls (0 allowed), screening for a min 30bp overlap,
         discarding singletons and doublets, in silico PCR. It also checks whether sequences are rev compliment.
         This is all done through the use of an InitialMothurWorker class which in turn makes use of the MothurAnalysis
         class that does the heavy lifting of running the mothur commands in sequence.
+        If native_qc is True, the NativeQCAnalysis class is used in place of the MothurAnalysis class and
+        the same QC is performed in process without calling mothur.
         """
         for contigpair, dss_att_holder in iter(in_q_paths.get, 'STOP'):
 
@@ -2023,7 +2018,7 @@ class InitialMothurHandler:
                 dss_att_holder=dss_att_holder, 
                 contig_pair=contigpair, 
                 temp_working_directory=temp_working_directory,
-                debug=debug, out_q_attr_data=out_q_attr_data
+                debug=debug, out_q_attr_data=out_q_attr_data, native_qc=native_qc
                 )
 
             try:
@@ -2036,13 +2031,15 @@ class InitialMothurHandler:
 
 
 class InitialMothurWorker:
-    def __init__(self, dss_att_holder, contig_pair, temp_working_directory, debug, out_q_attr_data):
+    def __init__(self, dss_att_holder, contig_pair, temp_working_directory, debug, out_q_attr_data, native_qc=False):
         self.sample_name = dss_att_holder.name
         self.dss_att_holder = dss_att_holder
         self.cwd = os.path.join(temp_working_directory, self.sample_name)
         self.debug = debug
         os.makedirs(self.cwd, exist_ok=True)
-        self.mothur_analysis_object = MothurAnalysis(
+        # The NativeQCAnalysis has the same interface as the MothurAnalysis
+        qc_analysis_class = NativeQCAnalysis if native_qc else MothurAnalysis
+        self.mothur_analysis_object = qc_analysis_class(
             name=self.sample_name,
             output_dir=self.cwd, input_dir=self.cwd,
             fastq_gz_fwd_path=contig_pair.split('\t')[1], fastq_gz_rev_path=contig_pair.split('\t')[2],
@@ -2099,13 +2096,12 @@ class InitialMothurWorker:
                 raise RuntimeError({'sample_name': self.sample_name})
 
     def _write_out_final_name_and_fasta_for_tax_screening(self):
-        name_file_as_list = self.thread_safe_general.read_defined_file_to_list(
-            self.mothur_analysis_object.name_file_path)
+        # The final QC outputs are no longer needed under their own names so we simply rename them
+        # rather than reading them in and writing them back out.
         taxonomic_screening_name_file_path = os.path.join(self.cwd, 'name_file_for_tax_screening.names')
-        self.thread_safe_general.write_list_to_destination(taxonomic_screening_name_file_path, name_file_as_list)
-        fasta_file_as_list = self.thread_safe_general.read_defined_file_to_list(self.mothur_analysis_object.fasta_path)
+        os.replace(self.mothur_analysis_object.name_file_path, taxonomic_screening_name_file_path)
         taxonomic_screening_fasta_file_path = os.path.join(self.cwd, 'fasta_file_for_tax_screening.fasta')
-        self.thread_safe_general.write_list_to_destination(taxonomic_screening_fasta_file_path, fasta_file_as_list)
+        os.replace(self.mothur_analysis_object.fasta_path, taxonomic_screening_fasta_file_path)
 
     def _do_fwd_and_rev_pcr(self):
         try:
@@ -2151,18 +2147,18 @@ class InitialMothurWorker:
                 self.check_for_error_and_raise_runtime_error(stage_of_qc='screen seqs ambig', error_summary=str(e))
 
     def _set_unique_and_abs_num_seqs_after_initial_qc(self):
-        name_file = self.thread_safe_general.read_defined_file_to_list(self.mothur_analysis_object.name_file_path)
+        number_of_contig_seqs_unique = 0
+        abs_count = 0
+        for _, abundance in self.thread_safe_general.iter_name_file_records(
+                self.mothur_analysis_object.name_file_path):
+            number_of_contig_seqs_unique += 1
+            abs_count += abundance
 
-        number_of_contig_seqs_unique = len(name_file)
         self.dss_att_holder.post_qc_unique_num_seqs = number_of_contig_seqs_unique
         sys.stdout.write(
             f'{self.sample_name}: '
             f'data_set_sample_instance_in_q.post_qc_unique_num_seqs = {number_of_contig_seqs_unique}\n')
 
-        abs_count = 0
-        for line in name_file:
-            abs_count += len(line.split('\t')[1].split(','))
-
         self.dss_att_holder.post_qc_absolute_num_seqs = abs_count
 
         sys.stdout.write(
@@ -2175,6 +2171,10 @@ class InitialMothurWorker:
                 errorreason=f'No seqs remaining after screen.seqs for minoverlap'
                 )
                 raise RuntimeError({'sample_name': self.sample_name})
+        if self.mothur_analysis_object.latest_completed_process_command is None:
+            # The NativeQCAnalysis has no mothur stdout to check
+            self.log_qc_error_and_continue(errorreason=f'error in inital QC during {stage_of_qc}')
+            raise RuntimeError({'sample_name': self.sample_name})
         for stdout_line in self.thread_safe_general.decode_utf8_binary_to_list(
                 self.mothur_analysis_object.latest_completed_process_command.stdout
         ):
@@ -2336,7 +2336,7 @@ class PotentialSymTaxScreeningWorker:
         self.fasta_dict = self.thread_safe_general.create_dict_from_fasta(fasta_path=self.fasta_file_path)
         self.name_file_path = os.path.join(self.cwd, 'name_file_for_tax_screening.names')
         self.name_dict = {
-            a.split('\t')[0]: a for a in self.thread_safe_general.read_defined_file_to_list(self.name_file_path)}
+            a.split('\t')[0]: a for a in self.thread_safe_general.read_defined_file_to_generator(self.name_file_path)}
         self.path_to_symclade_db = path_to_symclade_db
         self.debug = debug
         # This is a managed dictionary where key is a nucleotide sequence that has:
@@ -2500,7 +2500,7 @@ class SymNonSymTaxScreeningHandler:
 
     def execute_sym_non_sym_tax_screening(
             self, data_loading_temp_working_directory,
-            non_symb_and_size_violation_base_dir_path, data_loading_pre_med_sequence_output_directory_path,
+            non_symb_and_size_violation_base_dir_path, data_loading_unique_sequence_store_directory_path,
             data_loading_debug):
         all_processes = []
         # http://stackoverflow.com/questions/8242837/django-multiprocessing-and-database-connections
@@ -2515,7 +2515,7 @@ class SymNonSymTaxScreeningHandler:
                     self.sample_attributes_mp_output_queue,
                     data_loading_temp_working_directory,
                     non_symb_and_size_violation_base_dir_path, 
-                    data_loading_pre_med_sequence_output_directory_path,
+                    data_loading_unique_sequence_store_directory_path,
                     data_loading_debug))
             else:
                 p = Thread(target=self._sym_non_sym_tax_screening_worker, args=(
@@ -2524,7 +2524,7 @@ class SymNonSymTaxScreeningHandler:
                 self.sample_attributes_mp_output_queue,
                 data_loading_temp_working_directory, 
                 non_symb_and_size_violation_base_dir_path,
-                data_loading_pre_med_sequence_output_directory_path,
+                data_loading_unique_sequence_store_directory_path,
                 data_loading_debug))
             all_processes.append(p)
             p.start()
@@ -2541,7 +2541,7 @@ class SymNonSymTaxScreeningHandler:
         sample_attributes_mp_output_queue, 
         data_loading_temp_working_directory, 
         data_loading_non_symbiodiniaceae_and_size_violation_base_directory_path,
-        data_loading_pre_med_sequence_output_directory_path,
+        data_loading_unique_sequence_store_directory_path,
         data_loading_debug):
 
         for dss in iter(in_q.get, 'STOP'):
@@ -2554,7 +2554,7 @@ class SymNonSymTaxScreeningHandler:
                 dss=dss,
                 data_loading_non_symbiodiniaceae_and_size_violation_base_directory_path=
                 data_loading_non_symbiodiniaceae_and_size_violation_base_directory_path,
-                data_loading_pre_med_sequence_output_directory_path=data_loading_pre_med_sequence_output_directory_path,
+                data_loading_unique_sequence_store_directory_path=data_loading_unique_sequence_store_directory_path,
                 data_loading_debug=data_loading_debug,
                 sample_attributes_mp_output_queue=sample_attributes_mp_output_queue
             )
@@ -2584,7 +2584,7 @@ class SymNonSymTaxScreeningWorker:
     def __init__(
             self, data_loading_temp_working_directory, dss,
             data_loading_non_symbiodiniaceae_and_size_violation_base_directory_path,
-            data_loading_pre_med_sequence_output_directory_path, data_loading_debug,
+            data_loading_unique_sequence_store_directory_path, data_loading_debug,
             sample_attributes_mp_output_queue
     ):
         # init core objects
@@ -2597,7 +2597,7 @@ class SymNonSymTaxScreeningWorker:
         self._init_fasta_name_blast_and_clade_dict_attributes()
         self._init_non_sym_and_size_violation_output_paths(
             data_loading_non_symbiodiniaceae_and_size_violation_base_directory_path)
-        self._init_sym_non_size_violation_output_paths(data_loading_pre_med_sequence_output_directory_path)
+        self.unique_sequence_store = UniqueSequenceStore(data_loading_unique_sequence_store_directory_path)
         self._init_sets_for_categorizing_sequences()
         self._init_qc_meta_info_counters()
 
@@ -2611,17 +2611,6 @@ class SymNonSymTaxScreeningWorker:
         self.sym_size_violation_sequence_name_set_for_sample = set()
         self.sym_no_size_violation_sequence_name_set_for_sample = set()
 
-    def _init_sym_non_size_violation_output_paths(self, data_loading_pre_med_sequence_output_directory_path):
-        pre_med_sequence_output_directory_for_sample_path = os.path.join(
-            data_loading_pre_med_sequence_output_directory_path, f'{self.dss.id}_{self.dss.name}')
-        os.makedirs(pre_med_sequence_output_directory_for_sample_path, exist_ok=True)
-        self.pre_med_fasta_path = os.path.join(
-            pre_med_sequence_output_directory_for_sample_path, f'pre_med_seqs_{self.dss.name}.fasta'
-        )
-        self.pre_med_names_file_path = os.path.join(
-            pre_med_sequence_output_directory_for_sample_path, f'pre_med_seqs_{self.dss.name}.names'
-        )
-
     def _init_non_sym_and_size_violation_output_paths(
             self, data_loading_non_symbiodiniaceae_and_size_violation_base_directory_path):
         non_symbiodiniaceae_and_size_violation_directory_for_sample_path = os.path.join(
@@ -2646,10 +2635,10 @@ class SymNonSymTaxScreeningWorker:
         self.fasta_dict = self.thread_safe_general.create_dict_from_fasta(fasta_path=fasta_file_path)
         name_file_path = os.path.join(self.cwd, 'name_file_for_tax_screening.names')
         self.name_dict = {
-            a.split('\t')[0]: a for a in self.thread_safe_general.read_defined_file_to_list(name_file_path)}
+            a.split('\t')[0]: a for a in self.thread_safe_general.read_defined_file_to_generator(name_file_path)}
         blast_output_path = os.path.join(self.cwd, 'blast.out')
         self.blast_dict = {blast_line.split('\t')[0]: blast_line for blast_line in
-                           self.thread_safe_general.read_defined_file_to_list(blast_output_path)}
+                           self.thread_safe_general.read_defined_file_to_generator(blast_output_path)}
         self.sequence_name_to_clade_dict = {
             blast_out_line.split('\t')[0]: blast_out_line.split('\t')[1][-1] for
             blast_out_line in self.blast_dict.values()
@@ -2664,10 +2653,8 @@ class SymNonSymTaxScreeningWorker:
         2 - identifies the symbiodiniaceae sequences that violate our size range thresholds and writes them out
         also to the output dir
         3 - and finally the symbiodiniaceae sequences that do not violate our size range thresholds (sequences that
-        will be carried through into med decomposition). These are also written out both as clade seperated
-        (one redundant fasta for each clade) in the temp working directory (for med processing),
-        and as a non clade separated .name
-        .file set (pre-med-seqs) in the output directory.
+        will be carried through into med decomposition). These are written to the UniqueSequenceStore
+        (one shard for each clade) from which both the MED and the pre-MED stages read.
         This method also populates all of the dataset qc metadata attributes accordingly.
         """
         self._identify_and_write_non_sym_seqs_in_sample()
@@ -2684,44 +2671,20 @@ class SymNonSymTaxScreeningWorker:
         self._associate_qc_meta_info_to_dss_objs()
 
     def _write_out_no_size_violation_seqs(self):
-        self._write_out_no_size_violation_seqs_to_pre_med_dirs()
+        """Write the sequences of each clade to the UniqueSequenceStore as a shard for this sample.
+        The redundant fasta files required for MED are materialised from the store by the PerformMEDWorker."""
         clades_of_non_violation_seqs = self._get_set_of_clades_represented_by_no_size_violation_seqs()
-        self._write_out_no_size_violation_seqs_redundant_fasta_clade_separated(clades_of_non_violation_seqs)
-
-    def _write_out_no_size_violation_seqs_redundant_fasta_clade_separated(self, clades_of_non_violation_seqs):
         for clade_of_sequences_to_write_out in clades_of_non_violation_seqs:
-            sequence_names_of_clade = self._get_sequence_names_of_clade_for_no_size_violation_sequences(
-                clade_of_sequences_to_write_out
-            )
-
-            sample_clade_fasta_path = os.path.join(
-                self.cwd,
-                clade_of_sequences_to_write_out,
-                f'seqs_for_med_{self.dss.name}_clade_{clade_of_sequences_to_write_out}.redundant.fasta'
-            )
-            os.makedirs(os.path.dirname(sample_clade_fasta_path), exist_ok=True)
-            with open(sample_clade_fasta_path, 'w') as f:
-                sequence_counter = 0
-                for sequence_name in sequence_names_of_clade:
-                    # NB that MED will use the last '_' character as the separator for infering what the sample
-                    # name is. As such we either need to make sure that '_' are not found after the '_' that
-                    # separates the sample name from the rest of the sequence name, or we need to use another character
-                    # for doing the sample name inference. This can be provided to med using the -t argument.
-                    for i in range(len(self.name_dict[sequence_name].split('\t')[1].split(','))):
-                        f.write(f'>{self.dss.name}_{sequence_counter}\n')
-                        f.write(f'{self.fasta_dict[sequence_name]}\n')
-                        sequence_counter += 1
-
-            self._if_debug_check_length_of_deuniqued_fasta(sample_clade_fasta_path)
-
-    def _if_debug_check_length_of_deuniqued_fasta(self, sample_clade_fasta_path):
-        if self.debug:
-            deuniqued_fasta = self.thread_safe_general.read_defined_file_to_list(sample_clade_fasta_path)
-            if deuniqued_fasta:
-                if len(deuniqued_fasta) < 100:
-                    print(f'{self.dss.name}: WARNING the dequniqed fasta is < {len(deuniqued_fasta)} lines')
-            else:
-                print(f'{self.dss.name}: ERROR deuniqued fasta is empty')
+            sequence_to_abundance_dict = defaultdict(int)
+            for sequence_name in self._get_sequence_names_of_clade_for_no_size_violation_sequences(
+                    clade_of_sequences_to_write_out):
+                abundance = len(self.name_dict[sequence_name].split('\t')[1].split(','))
+                sequence_to_abundance_dict[self.fasta_dict[sequence_name]] += abundance
+                self.absolute_number_of_sym_no_size_violation_sequences += abundance
+            self.unique_sequence_store.write_sample_shard(
+                sample_key=self.unique_sequence_store.make_sample_key(
+                    sample_name=self.dss.name, clade=clade_of_sequences_to_write_out),
+                sequence_to_count_dict=sequence_to_abundance_dict)
 
     def _get_sequence_names_of_clade_for_no_size_violation_sequences(self, clade_of_sequences_to_write_out):
         sequence_names_of_clade = [
@@ -2740,39 +2703,6 @@ class SymNonSymTaxScreeningWorker:
         )
         return clades_of_non_violation_seqs
 
-    def _write_out_no_size_violation_seqs_to_pre_med_dirs(self):
-        self._write_out_no_size_violation_fasta_to_pre_med_dir()
-        self._write_out_no_size_violation_names_file_to_pre_med_dir()
-
-    def _write_out_no_size_violation_names_file_to_pre_med_dir(self):
-        for clade_value in set(self.sequence_name_to_clade_dict.values()):
-            pre_med_names_path_clade_specific = self.pre_med_names_file_path.replace(
-                f'pre_med_seqs_{self.dss.name}', f'pre_med_seqs_{clade_value}_{self.dss.name}')
-
-            with open(pre_med_names_path_clade_specific, 'w') as f:
-                for sequence_name in [
-                        seq_name for seq_name, clade_val in self.sequence_name_to_clade_dict.items() if
-                        clade_val == clade_value and seq_name in
-                        self.sym_no_size_violation_sequence_name_set_for_sample]:
-                    f.write(f'{self.name_dict[sequence_name]}\n')
-                    self.absolute_number_of_sym_no_size_violation_sequences += len(
-                        self.name_dict[sequence_name].split('\t')[1].split(','))
-
-    def _write_out_no_size_violation_fasta_to_pre_med_dir(self):
-        """ Write out the pre-med seqs into clade separated .fasta and .name pairs"""
-        for clade_value in set(self.sequence_name_to_clade_dict.values()):
-            pre_med_fasta_path_clade_specific = self.pre_med_fasta_path.replace(
-                f'pre_med_seqs_{self.dss.name}', f'pre_med_seqs_{clade_value}_{self.dss.name}')
-
-            with open(pre_med_fasta_path_clade_specific, 'w') as f:
-                for sequence_name in [
-                    seq_name for seq_name, clade_val in self.sequence_name_to_clade_dict.items() if
-                        clade_val == clade_value and seq_name in
-                        self.sym_no_size_violation_sequence_name_set_for_sample]:
-
-                    f.write(f'>{sequence_name}\n')
-                    f.write(f'{self.fasta_dict[sequence_name]}\n')
-
     def _write_out_size_violation_seqs(self):
         if self.sym_size_violation_sequence_name_set_for_sample:
             self._write_out_size_violation_fasta()
@@ -2913,11 +2843,14 @@ class SymNonSymTaxScreeningWorker:
 
 
 class PerformMEDHandler:
-    def __init__(self, data_loading_temp_working_directory, data_loading_num_proc, multiprocess):
+    def __init__(
+            self, data_loading_temp_working_directory, data_loading_unique_sequence_store_directory_path,
+            data_loading_num_proc, multiprocess):
         # need to get list of the directories in which to perform the MED
-        # we want to get a list of the .
+        # There will be one for each sample clade in the UniqueSequenceStore
         self.multiprocess = multiprocess
         self.temp_working_directory = data_loading_temp_working_directory
+        self.unique_sequence_store_directory_path = data_loading_unique_sequence_store_directory_path
         self.num_proc = data_loading_num_proc
         self.list_of_redundant_fasta_paths = []
         self._populate_list_of_redundant_fasta_paths()
@@ -2940,12 +2873,12 @@ class PerformMEDHandler:
                 p = Process(target=self._perform_med_worker, args=(
                     self.input_queue_of_redundant_fasta_paths, data_loading_debug,
                     data_loading_path_to_med_padding_executable,
-                    data_loading_path_to_med_decompose_executable))
+                    data_loading_path_to_med_decompose_executable, self.unique_sequence_store_directory_path))
             else:
                 p = Thread(target=self._perform_med_worker, args=(
                 self.input_queue_of_redundant_fasta_paths, data_loading_debug,
                 data_loading_path_to_med_padding_executable,
-                data_loading_path_to_med_decompose_executable))
+                data_loading_path_to_med_decompose_executable, self.unique_sequence_store_directory_path))
             all_processes.append(p)
             p.start()
 
@@ -2953,10 +2886,14 @@ class PerformMEDHandler:
             p.join()
 
     def _populate_list_of_redundant_fasta_paths(self):
-        for dirpath, dirnames, files in os.walk(self.temp_working_directory):
-            for file_name in files:
-                if file_name.endswith('redundant.fasta'):
-                    self.list_of_redundant_fasta_paths.append(os.path.join(dirpath, file_name))
+        """The redundant fasta files are materialised from the UniqueSequenceStore by the workers.
+        Here we only work out where they will be written."""
+        unique_sequence_store = UniqueSequenceStore(self.unique_sequence_store_directory_path)
+        for sample_key in unique_sequence_store.get_sample_keys():
+            sample_name, clade = unique_sequence_store.split_sample_key(sample_key)
+            self.list_of_redundant_fasta_paths.append(os.path.join(
+                self.temp_working_directory, sample_name, clade,
+                f'seqs_for_med_{sample_name}_clade_{clade}.redundant.fasta'))
 
     def _populate_input_queue_of_redundant_fasta_paths(self):
         for redundant_fasta_path in self.list_of_redundant_fasta_paths:
@@ -2967,12 +2904,13 @@ class PerformMEDHandler:
     @staticmethod
     def _perform_med_worker(
             in_q, data_loading_debug, data_loading_path_to_med_padding_executable,
-            data_loading_path_to_med_decompose_executable):
+            data_loading_path_to_med_decompose_executable, data_loading_unique_sequence_store_directory_path):
         for redundant_fata_path in iter(in_q.get, 'STOP'):
             perform_med_worker_instance = PerformMEDWorker(
                 redundant_fasta_path=redundant_fata_path, data_loading_debug=data_loading_debug,
                 data_loading_path_to_med_padding_executable=data_loading_path_to_med_padding_executable,
-                data_loading_path_to_med_decompose_executable=data_loading_path_to_med_decompose_executable)
+                data_loading_path_to_med_decompose_executable=data_loading_path_to_med_decompose_executable,
+                data_loading_unique_sequence_store_directory_path=data_loading_unique_sequence_store_directory_path)
 
             perform_med_worker_instance.do_decomposition()
 
@@ -2980,12 +2918,15 @@ class PerformMEDHandler:
 class PerformMEDWorker:
     def __init__(
             self, redundant_fasta_path, data_loading_path_to_med_padding_executable, data_loading_debug,
-            data_loading_path_to_med_decompose_executable):
+            data_loading_path_to_med_decompose_executable, data_loading_unique_sequence_store_directory_path):
         self.thread_safe_general = ThreadSafeGeneral()
         self.redundant_fasta_path_unpadded = redundant_fasta_path
         self.redundant_fasta_path_padded = self.redundant_fasta_path_unpadded.replace('.fasta', '.padded.fasta')
         self.cwd = os.path.dirname(self.redundant_fasta_path_unpadded)
         self.sample_name = self.cwd.split('/')[-2]
+        self.clade = self.cwd.split('/')[-1]
+        self.unique_sequence_store = UniqueSequenceStore(data_loading_unique_sequence_store_directory_path)
+        self.sample_key = self.unique_sequence_store.make_sample_key(sample_name=self.sample_name, clade=self.clade)
         self.debug = data_loading_debug
         self.path_to_med_padding_executable = data_loading_path_to_med_padding_executable
         self.path_to_med_decompose_executable = data_loading_path_to_med_decompose_executable
@@ -2995,6 +2936,7 @@ class PerformMEDWorker:
 
     def do_decomposition(self):
         sys.stdout.write(f'{self.sample_name}: starting MED analysis\n')
+        self._write_out_redundant_fasta()
         sys.stdout.write(f'{self.sample_name}: padding sequences\n')
         subprocess.run([
             self.path_to_med_padding_executable,
@@ -3029,10 +2971,24 @@ class PerformMEDWorker:
         # calculated when working with a modelling project where I was subsampling to 1000 sequences. In this
         # scenario the M was set to 4.
         # We should also take care that M doesn't go below 4, so we should use a max choice for the M
-        num_of_seqs_to_decompose = len(
-            self.thread_safe_general.read_defined_file_to_list(self.redundant_fasta_path_unpadded)) / 2
+        num_of_seqs_to_decompose = self.unique_sequence_store.get_sample_absolute_abundance(self.sample_key)
         return max(4, int(0.004 * num_of_seqs_to_decompose))
 
+    def _write_out_redundant_fasta(self):
+        # NB that MED will use the last '_' character as the separator for infering what the sample
+        # name is. As such we either need to make sure that '_' are not found after the '_' that
+        # separates the sample name from the rest of the sequence name, or we need to use another character
+        # for doing the sample name inference. This can be provided to med using the -t argument.
+        self.unique_sequence_store.write_redundant_fasta(
+            sample_key=self.sample_key, fasta_path=self.redundant_fasta_path_unpadded,
+            sequence_name_prefix=self.sample_name)
+        if self.debug:
+            num_redundant_seqs = self.unique_sequence_store.get_sample_absolute_abundance(self.sample_key)
+            if num_redundant_seqs == 0:
+                print(f'{self.sample_name}: ERROR deuniqued fasta is empty')
+            elif num_redundant_seqs < 50:
+                print(f'{self.sample_name}: WARNING the dequniqed fasta is < {num_redundant_seqs * 2} lines')
+
 
 class DataSetSampleSequenceCreatorWorker:
     """This class will be responsible for handling a set of med outputs. Objects will be things like the directory,
@@ -3059,15 +3015,13 @@ class DataSetSampleSequenceCreatorWorker:
 
     def _populate_nodes_list_of_nucleotide_sequences(self):
         node_file_path = os.path.join(self.output_directory, 'NODE-REPRESENTATIVES.fasta')
-        try:
-            node_file_as_list = self.thread_safe_general.read_defined_file_to_list(node_file_path)
-        except FileNotFoundError:
+        if not os.path.exists(node_file_path):
             raise RuntimeError({'med_output_directory': self.output_directory})
 
-        for i in range(0, len(node_file_as_list), 2):
-            node_seq_name = node_file_as_list[i].split('|')[0][1:]
-            node_seq_abundance = int(node_file_as_list[i].split('|')[1].split(':')[1])
-            node_seq_sequence = node_file_as_list[i+1].replace('-', '')
+        for node_header, node_aligned_sequence in self.thread_safe_general.iter_fasta_records(node_file_path):
+            node_seq_name = node_header.split('|')[0]
+            node_seq_abundance = int(node_header.split('|')[1].split(':')[1])
+            node_seq_sequence = node_aligned_sequence.replace('-', '')
             self.nodes_list_of_nucleotide_sequences.append(
                 NucleotideSequence(name=node_seq_name, abundance=node_seq_abundance, sequence=node_seq_sequence))
 
@@ -3273,8 +3227,11 @@ class DataSetSampleSequenceCreatorWorker:
                          f'to existing reference sequence {name_of_reference_sequence}')
 
     def _assign_node_sequence_to_new_ref_seq(self, node_nucleotide_sequence_object):
-        new_ref_seq = ReferenceSequence(clade=self.clade, sequence=node_nucleotide_sequence_object.sequence)
-        new_ref_seq.save()
+        # get_or_create in case a concurrent loading has created the same sequence since the
+        # ReferenceSequences were read in.
+        new_ref_seq, created = ReferenceSequence.objects.get_or_create(
+            sequence_hash=ReferenceSequence.make_sequence_hash(node_nucleotide_sequence_object.sequence),
+            defaults={'clade': self.clade, 'sequence': node_nucleotide_sequence_object.sequence})
         self.ref_seq_sequence_to_ref_seq_id_dict[new_ref_seq.sequence] = new_ref_seq.id
         self.node_sequence_name_to_ref_seq_id[node_nucleotide_sequence_object.name] = new_ref_seq.id
         self.ref_seq_uid_to_ref_seq_name_dict[new_ref_seq.id] = str(new_ref_seq)
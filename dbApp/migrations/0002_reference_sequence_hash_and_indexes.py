@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:21
+
+import hashlib
+from django.db import migrations, models
+
+
+def populate_reference_sequence_hashes(apps, schema_editor):
+    """Set the sequence_hash of all existing ReferenceSequences in bulk.
+    Should there be ReferenceSequences with duplicate sequences, only the first (lowest id) is given the hash
+    so that the unique index can be created. The hash of the others is left as null and ReferenceSequence.save
+    keeps it null. The duplicates are not merged as they may be referenced by DataSetSampleSequences and
+    the footprints of AnalysisTypes. Look ups by sequence_hash will find the first of the duplicates."""
+    ReferenceSequence = apps.get_model('dbApp', 'ReferenceSequence')
+    seen_hashes = set()
+    duplicate_uids = []
+    batch = []
+    for ref_seq in ReferenceSequence.objects.only('id', 'sequence').order_by('id').iterator(chunk_size=5000):
+        sequence_hash = hashlib.sha1(ref_seq.sequence.encode('ascii')).hexdigest()
+        if sequence_hash in seen_hashes:
+            duplicate_uids.append(ref_seq.id)
+            continue
+        seen_hashes.add(sequence_hash)
+        ref_seq.sequence_hash = sequence_hash
+        batch.append(ref_seq)
+        if len(batch) == 5000:
+            ReferenceSequence.objects.bulk_update(batch, ['sequence_hash'])
+            batch = []
+    if batch:
+        ReferenceSequence.objects.bulk_update(batch, ['sequence_hash'])
+    if duplicate_uids:
+        print(f'\nWARNING: {len(duplicate_uids)} ReferenceSequences have the same sequence as a ReferenceSequence '
+              f'with a lower id. Their sequence_hash has been left null: {",".join(str(_) for _ in duplicate_uids)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='referencesequence',
+            name='sequence_hash',
+            field=models.CharField(max_length=40, null=True),
+        ),
+        migrations.RunPython(populate_reference_sequence_hashes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='referencesequence',
+            name='sequence_hash',
+            field=models.CharField(max_length=40, null=True, unique=True),
+        ),
+        migrations.AddIndex(
+            model_name='cladecollection',
+            index=models.Index(fields=['data_set_sample_from', 'clade'], name='dbApp_clade_data_se_d8d170_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cladecollectiontype',
+            index=models.Index(fields=['analysis_type_of', 'clade_collection_found_in'], name='dbApp_clade_analysi_66e652_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datasetsample',
+            index=models.Index(fields=['data_submission_from', 'name'], name='dbApp_datas_data_su_5d230a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datasetsamplesequence',
+            index=models.Index(fields=['data_set_sample_from', 'reference_sequence_of'], name='dbApp_datas_data_se_a19d33_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datasetsamplesequence',
+            index=models.Index(fields=['clade_collection_found_in', 'reference_sequence_of'], name='dbApp_datas_clade_c_6ed276_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datasetsamplesequencepm',
+            index=models.Index(fields=['data_set_sample_from', 'reference_sequence_of'], name='dbApp_datas_data_se_195847_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='referencesequence',
+            index=models.Index(fields=['clade', 'has_name'], name='dbApp_refer_clade_4b5a07_idx'),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.db import models
 import json
+import hashlib
 import general
 from datetime import datetime
 import sp_config
@@ -83,6 +84,9 @@ class DataSetSample(models.Model):
     # store a string rather than a number as this may be given as a range e.g. 6 - 12
     collection_depth = models.CharField(max_length=40, default='NoData')
 
+    class Meta:
+        indexes = [models.Index(fields=['data_submission_from', 'name'])]
+
     def __str__(self):
         return self.name
 
@@ -243,6 +247,9 @@ class CladeCollection(models.Model):
     # I will therefore store the reference uids in the field below
     footprint = models.CharField(max_length=100000, default=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['data_set_sample_from', 'clade'])]
+
     # This will return the foot print of the analysedSampleSequences that are found above the given percentage cutoff
     def cutoff_footprint(self, cutoff):
         # get total seqs in cladeCollection
@@ -319,6 +326,9 @@ class CladeCollectionType(models.Model):
     clade_collection_found_in = models.ForeignKey(CladeCollection, on_delete=models.CASCADE, null=True)
     # clade_collection_found_in = models.IntegerField(null=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['analysis_type_of', 'clade_collection_found_in'])]
+
     def __str__(self):
         # return ','.join([str(refseq.id) for refseq in self.analysis_type_of.get_ordered_footprint_list()])
         return self.analysis_type_of.name
@@ -330,8 +340,31 @@ class ReferenceSequence(models.Model):
     has_name = models.BooleanField(default=False)
     clade = models.CharField(max_length=30)
     sequence = models.CharField(max_length=500)
+    # The SHA-1 hex digest of the sequence. Used for the sequence identity look ups as the sequence itself
+    # is too long to be usefully indexed. Set on save(). NB bulk_create does not call save() so the hash
+    # must be set explicitly (see make_sequence_hash) when creating ReferenceSequences in bulk.
+    # Should a database have held ReferenceSequences with duplicate sequences before the hash was added,
+    # only the first of these (lowest id) has the hash and the hash of the others is left null
+    # (see migration 0002), including when they are saved again.
+    sequence_hash = models.CharField(max_length=40, unique=True, null=True)
     accession = models.CharField(max_length=50, null=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['clade', 'has_name'])]
+
+    @staticmethod
+    def make_sequence_hash(sequence):
+        return hashlib.sha1(sequence.encode('ascii')).hexdigest()
+
+    def save(self, *args, **kwargs):
+        sequence_hash = self.make_sequence_hash(self.sequence)
+        if self.pk is not None and self.sequence_hash is None and ReferenceSequence.objects.filter(
+                sequence_hash=sequence_hash).exclude(pk=self.pk).exists():
+            # A duplicate that was left without a hash by the migration. Setting the hash would break the unique index.
+            sequence_hash = None
+        self.sequence_hash = sequence_hash
+        super().save(*args, **kwargs)
+
     def __str__(self):
         if self.has_name:
             return self.name
@@ -347,6 +380,11 @@ class DataSetSampleSequence(models.Model):
     abundance = models.IntegerField(default=0)
     data_set_sample_from = models.ForeignKey(DataSetSample, on_delete=models.CASCADE, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['data_set_sample_from', 'reference_sequence_of']),
+            models.Index(fields=['clade_collection_found_in', 'reference_sequence_of'])]
+
     def __str__(self):
         if self.reference_sequence_of.has_name:
             return self.reference_sequence_of.name
@@ -362,6 +400,8 @@ class DataSetSampleSequencePM(models.Model):
     # reference_sequence_of = models.IntegerField(null=True)
     abundance = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [models.Index(fields=['data_set_sample_from', 'reference_sequence_of'])]
 
     def __str__(self):
         if self.reference_sequence_of.has_name:
@@ -12,6 +12,7 @@ from skbio.stats.ordination import pcoa
 from skbio.tree import TreeNode
 import django_general
 from general import ThreadSafeGeneral
+from stage_profiling import profile_stage
 from dbApp.models import (
     ReferenceSequence, DataSetSampleSequence, AnalysisType, DataSetSample,
     CladeCollection, CladeCollectionType)
@@ -237,6 +238,7 @@ class TypeUnifracDistPCoACreator(BaseUnifracDistPCoACreator):
             temp_clade_col_type_objs_list.extend(list(CladeCollectionType.objects.filter(id__in=uid_list)))
         return temp_clade_col_type_objs_list
 
+    @profile_stage()
     def compute_unifrac_dists_and_pcoa_coords(self):
         for clade_in_question in self.clades_for_dist_calcs:
 
@@ -647,6 +649,7 @@ class SampleUnifracDistPCoACreator(BaseUnifracDistPCoACreator):
             temp_clade_col_objs.extend(list(CladeCollection.objects.filter(data_set_sample_from__in=uid_list)))
         return temp_clade_col_objs
 
+    @profile_stage()
     def compute_unifrac_dists_and_pcoa_coords(self):
         for clade_in_question in self.clades_for_dist_calcs:
 
@@ -1338,6 +1341,7 @@ class SampleBrayCurtisDistPCoACreator(BaseBrayCurtisDistPCoACreator):
             temp_cc_list_for_output.extend(list(CladeCollection.objects.filter(data_set_sample_from__in=uid_list)))
         return temp_cc_list_for_output
 
+    @profile_stage()
     def compute_braycurtis_dists_and_pcoa_coords(self):
         print('\n\nComputing sample pairwise distances and PCoA coordinates using the BrayCurtis method\n')
         for clade_in_question in self.clades_of_ccs:
@@ -1526,6 +1530,7 @@ class TypeBrayCurtisDistPCoACreator(BaseBrayCurtisDistPCoACreator):
                 cladecollectiontype__clade_collection_found_in__data_set_sample_from__in=uid_list)))
         return list(temp_at_set)
 
+    @profile_stage()
     def compute_braycurtis_dists_and_pcoa_coords(self):
         print('\n\nComputing ITS2 type profile pairwise distances and PCoA coordinates using the BrayCurtis method\n')
         for clade_in_question in self.clades_of_ats:
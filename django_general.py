@@ -4,22 +4,94 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
 from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
-from dbApp.models import DataSet, DataAnalysis, DataSetSample, Study, User
+from dbApp.models import (
+    DataSet, DataAnalysis, DataSetSample, Study, User, Submission, CladeCollection, CladeCollectionType,
+    AnalysisType, DataSetSampleSequence, DataSetSampleSequencePM, ReferenceSequence)
+from django.db import transaction
 import pandas as pd
 import sys
 from collections import Counter
 from numpy import NaN
 from django.core.exceptions import ObjectDoesNotExist
 from datetime import datetime
-from general import check_lat_lon
+from general import check_lat_lon, chunks
 
 
-def delete_data_set(uid):
-    DataSet.objects.get(id=uid).delete()
+def delete_data_set(uid, remove_orphaned_reference_sequences=False):
+    """
+    Delete the DataSet and all of the objects that depend on it (the same objects that the ORM cascade deletes).
+    Rather than letting the ORM collect every dependent object into memory, the dependent objects are deleted
+    bottom-up with one DELETE statement per model, each selecting its rows with a subquery on the DataSet.
+    This is done in a single transaction so that either all or none of the objects are deleted.
+    SymPortal does not use delete signals so nothing is lost by bypassing them.
+
+    :param remove_orphaned_reference_sequences: If True, also delete the unnamed ReferenceSequences
+    that were only used by this DataSet (see _delete_orphaned_reference_sequences).
+    """
+    data_set = DataSet.objects.get(id=uid)
+    with transaction.atomic():
+        if remove_orphaned_reference_sequences:
+            # Collected before the DataSetSampleSequences that reference them are deleted
+            reference_sequence_uids = set(DataSetSampleSequence.objects.filter(
+                data_set_sample_from__data_submission_from=data_set
+            ).values_list('reference_sequence_of', flat=True).distinct())
+            reference_sequence_uids.update(DataSetSampleSequencePM.objects.filter(
+                data_set_sample_from__data_submission_from=data_set
+            ).values_list('reference_sequence_of', flat=True).distinct())
+            reference_sequence_uids.discard(None)
+        _raw_delete(CladeCollectionType.objects.filter(
+            clade_collection_found_in__data_set_sample_from__data_submission_from=data_set))
+        _raw_delete(DataSetSampleSequence.objects.filter(data_set_sample_from__data_submission_from=data_set))
+        _raw_delete(DataSetSampleSequencePM.objects.filter(data_set_sample_from__data_submission_from=data_set))
+        _raw_delete(CladeCollection.objects.filter(data_set_sample_from__data_submission_from=data_set))
+        _raw_delete(Study.data_set_samples.through.objects.filter(datasetsample__data_submission_from=data_set))
+        _raw_delete(Submission.objects.filter(associated_dataset=data_set))
+        _raw_delete(DataSetSample.objects.filter(data_submission_from=data_set))
+        _raw_delete(DataSet.objects.filter(id=data_set.id))
+        if remove_orphaned_reference_sequences:
+            _delete_orphaned_reference_sequences(reference_sequence_uids)
 
 
 def delete_data_analysis(uid):
-    DataAnalysis.objects.get(id=uid).delete()
+    """
+    Delete the DataAnalysis with its AnalysisTypes and CladeCollectionTypes in the same way as delete_data_set.
+    The Studies that reference the DataAnalysis are kept (their data_analysis is set to null as with the ORM).
+    """
+    data_analysis = DataAnalysis.objects.get(id=uid)
+    with transaction.atomic():
+        Study.objects.filter(data_analysis=data_analysis).update(data_analysis=None)
+        _raw_delete(CladeCollectionType.objects.filter(analysis_type_of__data_analysis_from=data_analysis))
+        _raw_delete(AnalysisType.objects.filter(data_analysis_from=data_analysis))
+        _raw_delete(DataAnalysis.objects.filter(id=data_analysis.id))
+
+
+def _raw_delete(query_set):
+    """Delete the rows of the query set with a single DELETE statement, without collecting the objects,
+    following their relations or sending signals. The objects that reference the rows must already have been
+    deleted."""
+    query_set._raw_delete(query_set.db)
+
+
+def _delete_orphaned_reference_sequences(reference_sequence_uids):
+    """
+    Delete those of the given ReferenceSequences that are no longer referenced.
+    Named ReferenceSequences are kept as they are part of the reference database, as are those that are part
+    of the footprint of an AnalysisType (which references them by uid in a string rather than a foreign key).
+    """
+    analysis_type_reference_sequence_uids = set()
+    for ordered_footprint_list in AnalysisType.objects.exclude(
+            ordered_footprint_list=None).values_list('ordered_footprint_list', flat=True).iterator():
+        analysis_type_reference_sequence_uids.update(
+            int(rs_uid) for rs_uid in ordered_footprint_list.split(',') if rs_uid)
+    candidate_uids = [
+        rs_uid for rs_uid in reference_sequence_uids if rs_uid not in analysis_type_reference_sequence_uids]
+    for uid_chunk in chunks(candidate_uids):
+        _raw_delete(ReferenceSequence.objects.filter(id__in=uid_chunk, has_name=False).exclude(
+            id__in=DataSetSampleSequence.objects.filter(
+                reference_sequence_of__in=uid_chunk).values('reference_sequence_of')
+        ).exclude(
+            id__in=DataSetSampleSequencePM.objects.filter(
+                reference_sequence_of__in=uid_chunk).values('reference_sequence_of')))
 
 def write_ref_seq_objects_to_fasta(path, list_of_ref_seq_objs, identifier='name'):
     with open(path, 'w') as f:
@@ -40,7 +112,11 @@ class ApplyDatasheetToDataSetSamples:
         self.datasheet_path = data_sheet_path
         self.sample_meta_info_df = None
         self._make_data_sheet_df()
-        self.dss_objects = [dss for dss in DataSetSample.objects.filter(data_submission_from=self.ds_obj) if dss.name in self.sample_meta_info_df.index.values.tolist()]
+        # Only the DataSetSamples named in the datasheet are fetched (chunked to stay below the SQLite variable limit)
+        self.dss_objects = []
+        for sample_name_chunk in chunks(self.sample_meta_info_df.index.values.tolist()):
+            self.dss_objects.extend(
+                DataSetSample.objects.filter(data_submission_from=self.ds_obj, name__in=sample_name_chunk))
         self.dss_object_names_list = [dss.name for dss in self.dss_objects]
         self._check_all_samples_found_exit_if_not()
         self.meta_category_titles = ['sample_type', 'host_phylum', 'host_class', 'host_order', 'host_family',
@@ -57,12 +133,14 @@ class ApplyDatasheetToDataSetSamples:
             raise RuntimeError('ABORTING application of datasheet to samples. No database objects have been changed')
 
     def apply_datasheet(self):
-        # get a list of the parameters we will be working with
-        sample_count = 0
+        """The changes are worked out for all of the samples before any of them are written. They are then written
+        with a single bulk update of the changed fields in one transaction, so either all or none
+        of the changes are made."""
+        changed_dss_objects = []
+        changed_meta_cats = set()
         meta_cat_count = 0
-        for i in range(len(self.dss_objects)):
+        for dss_obj in self.dss_objects:
             changed = False
-            dss_obj = self.dss_objects[i]
             print(f'Processing {dss_obj.name}')
             ser = self.sample_meta_info_df.loc[dss_obj.name]
             for meta_cat in self.meta_category_titles:
@@ -77,6 +155,7 @@ class ApplyDatasheetToDataSetSamples:
                                 print(f'\tChanging {meta_cat} from '
                                       f'{float(getattr(dss_obj, meta_cat))} to {float(ser.at[meta_cat])}')
                                 setattr(dss_obj, meta_cat, float(ser.at[meta_cat]))
+                                changed_meta_cats.add(meta_cat)
                                 meta_cat_count += 1
                             else:
                                 print(f'\t{meta_cat} is already {float(ser.at[meta_cat])}; No change')
@@ -88,6 +167,7 @@ class ApplyDatasheetToDataSetSamples:
                                 changed = True
                                 print(f'\tChanging {meta_cat} from {getattr(dss_obj, meta_cat)} to {ser.at[meta_cat]}')
                                 setattr(dss_obj, meta_cat, ser.at[meta_cat])
+                                changed_meta_cats.add(meta_cat)
                                 meta_cat_count += 1
                             else:
                                 print(f'\t{meta_cat} is already {ser.at[meta_cat]}; No change')
@@ -96,11 +176,16 @@ class ApplyDatasheetToDataSetSamples:
                 else:
                     print(f'\t{meta_cat} is null')
             if changed:
-                print(f'\tSaving changes to {dss_obj.name}')
-                dss_obj.save()
-                sample_count += 1
+                changed_dss_objects.append(dss_obj)
+        if changed_dss_objects:
+            print(f'Saving changes to {len(changed_dss_objects)} samples')
+            with transaction.atomic():
+                DataSetSample.objects.bulk_update(
+                    changed_dss_objects,
+                    fields=[meta_cat for meta_cat in self.meta_category_titles if meta_cat in changed_meta_cats],
+                    batch_size=500)
         print('Application complete')
-        print(f'Changed {meta_cat_count} meta information category instances across {sample_count} samples')
+        print(f'Changed {meta_cat_count} meta information category instances across {len(changed_dss_objects)} samples')
 
     def _make_data_sheet_df(self):
         """This will create a curate the df that will hold the information that is to be applied to the
@@ -22,4 +22,10 @@ class EigenValsTooSmallError(Error):
     """Raised when the eigen values of a PCoA sum to 0. This happens because
     the scipy code converts very small eigen values to 0. As such if all eigen values are small
     we end up with TrueDivide errors when trying to calculate variance."""
-    pass
\ No newline at end of file
+    pass
+
+class TransientStageError(Error):
+    """Raised by a stage of the submission pipeline (e.g. the transfer) when it failed for a reason that is not
+    down to its Submissions, e.g. the web server could not be reached. The Submissions are left as they are so that
+    the stage is tried again at the next poll rather than being marked with error_has_occured."""
+    pass
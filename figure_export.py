@@ -0,0 +1,99 @@
+import sys
+from multiprocessing import Process
+# https://stackoverflow.com/questions/21784641/installation-issue-with-matplotlib-python
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.image
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+
+class FigureExporter:
+    """
+    Writes out the figures of SymPortal (the stacked bar plots and the distance scatter plots) in each of the
+    output formats at the output DPI set with the --figure_formats and --figure_dpi arguments
+    (defaults ['svg', 'png'] at 600 DPI, as before).
+
+    The figure is only rendered once for all of the raster formats: the Agg canvas is drawn at the output DPI
+    and its RGBA buffer is written out to each of the raster formats. Each vector format (e.g. svg) needs its own
+    render of the figure. With --background_figure_export these are written by background processes
+    so that the pipeline can continue. wait_for_background_exports must be called before
+    the vector outputs are used.
+    """
+    raster_formats = ['png', 'jpg', 'jpeg', 'tif', 'tiff', 'webp']
+    vector_formats = ['svg', 'pdf', 'eps', 'ps']
+    # The raster formats (as used for the file extensions) that PIL only knows by another name
+    # e.g. imsave(format='tif') raises a KeyError
+    raster_format_alias_dict = {'jpg': 'jpeg', 'tif': 'tiff'}
+
+    def __init__(self, formats=None, dpi=600, background_vector_export=False):
+        self.formats = None
+        self.dpi = None
+        self.background_vector_export = None
+        self.configure(formats=formats, dpi=dpi, background_vector_export=background_vector_export)
+        self.background_processes = []
+
+    def configure(self, formats=None, dpi=600, background_vector_export=False):
+        if formats is None:
+            formats = ['svg', 'png']
+        for figure_format in formats:
+            if figure_format not in self.raster_formats + self.vector_formats:
+                raise RuntimeError(
+                    f'Unknown figure format {figure_format}. '
+                    f'Choose from {",".join(self.vector_formats + self.raster_formats)}')
+        if not dpi > 0:
+            raise RuntimeError(f'The figure DPI must be greater than 0 (got {dpi})')
+        self.formats = list(formats)
+        self.dpi = dpi
+        self.background_vector_export = background_vector_export
+
+    def export_figure(self, figure, fig_output_path_base):
+        """Write figure out to <fig_output_path_base>.<format> for each of the formats and return the paths
+        in the order of the formats. The figure should be complete (e.g. tight_layout already applied)."""
+        output_path_list = self.get_output_path_list(fig_output_path_base)
+        raster_path_format_tups = []
+        for output_path, figure_format in zip(output_path_list, self.formats):
+            if figure_format in self.raster_formats:
+                raster_path_format_tups.append((output_path, figure_format))
+            elif self.background_vector_export:
+                p = Process(target=figure.savefig, args=(output_path,))
+                self.background_processes.append(p)
+                p.start()
+            else:
+                figure.savefig(output_path)
+        if raster_path_format_tups:
+            self._write_raster_outputs(figure, raster_path_format_tups)
+        return output_path_list
+
+    def get_output_path_list(self, fig_output_path_base):
+        return [f'{fig_output_path_base}.{figure_format}' for figure_format in self.formats]
+
+    def _write_raster_outputs(self, figure, raster_path_format_tups):
+        if isinstance(figure.canvas, FigureCanvasAgg):
+            canvas = figure.canvas
+        else:
+            canvas = FigureCanvasAgg(figure)
+        original_dpi = figure.dpi
+        figure.dpi = self.dpi
+        try:
+            canvas.draw()
+            rgba_buffer = canvas.buffer_rgba()
+            for output_path, figure_format in raster_path_format_tups:
+                matplotlib.image.imsave(
+                    output_path, rgba_buffer, format=self.raster_format_alias_dict.get(figure_format, figure_format),
+                    origin='upper', dpi=self.dpi)
+        finally:
+            figure.dpi = original_dpi
+
+    def wait_for_background_exports(self):
+        if not self.background_processes:
+            return
+        sys.stdout.write('\nWaiting for the background figure exports to complete\n')
+        for p in self.background_processes:
+            p.join()
+        failed_process_count = len([p for p in self.background_processes if p.exitcode != 0])
+        self.background_processes = []
+        if failed_process_count:
+            raise RuntimeError(f'{failed_process_count} background figure exports failed')
+
+
+figure_exporter = FigureExporter()
@@ -8,6 +8,7 @@ import json
 import numpy as np
 import random
 import re
+import itertools
 
 class ThreadSafeGeneral:
     def __init__(self):
@@ -24,6 +25,56 @@ class ThreadSafeGeneral:
         with open(filename, mode='r') as reader:
             return [line.rstrip() for line in reader]
 
+    @staticmethod
+    def iter_fasta_records_from_lines(fasta_lines):
+        """
+        Yield (name, sequence) tuples from an iterable of fasta lines.
+        The name is the full header line without the '>'.
+        Sequences may be split over multiple lines (i.e. interleaved) and blank lines are ignored.
+        """
+        name = None
+        sequence_parts = []
+        for line in fasta_lines:
+            line = line.rstrip()
+            if not line:
+                continue
+            if line.startswith('>'):
+                if name is not None:
+                    yield name, ''.join(sequence_parts)
+                name = line[1:]
+                sequence_parts = []
+            else:
+                sequence_parts.append(line)
+        if name is not None:
+            yield name, ''.join(sequence_parts)
+
+    def iter_fasta_records(self, fasta_path):
+        """Yield (name, sequence) tuples from a fasta file without reading the whole file into memory"""
+        with open(fasta_path, mode='r', buffering=1048576) as reader:
+            yield from self.iter_fasta_records_from_lines(reader)
+
+    @staticmethod
+    def iter_name_file_records(name_file_path):
+        """Yield (name, abundance) tuples from a mothur .names file without reading the whole file into memory.
+        The abundance is the number of sequence names in the second column."""
+        with open(name_file_path, mode='r', buffering=1048576) as reader:
+            for line in reader:
+                line = line.rstrip()
+                if not line:
+                    continue
+                name, member_names = line.split('\t', 1)
+                yield name, member_names.count(',') + 1
+
+    @staticmethod
+    def write_fasta_records(destination, records):
+        """Write (name, sequence) tuples out as a sequential (two line) fasta.
+        records may be any iterable (e.g. a generator) so that the fasta never needs to be held in memory."""
+        with open(destination, mode='w', buffering=1048576) as writer:
+            writer.writelines(f'>{name}\n{sequence}\n' for name, sequence in records)
+
+    def count_fasta_records(self, fasta_path):
+        return sum(1 for _ in self.iter_fasta_records(fasta_path))
+
     def create_dict_from_fasta(self, fasta_list=None, fasta_path=None):
         if fasta_list is None and fasta_path is None:
             sys.exit('Please provide either a fasta_as_list OR a fasta_path as arguments to create_dict_from_fasta')
@@ -31,32 +82,17 @@ class ThreadSafeGeneral:
             sys.exit('Please provide either a fasta_as_list OR a fasta_path as arguments to create_dict_from_fasta')
         else:
             if fasta_list:
-                temporary_dictionary = {}
-                i = 0
-                while i < len(fasta_list):
-                    sequence = fasta_list[i][1:]
-                    temporary_dictionary[sequence] = fasta_list[i + 1]
-                    i += 2
-                return temporary_dictionary
+                return dict(self.iter_fasta_records_from_lines(fasta_list))
             if fasta_path:
-                fasta_file_as_list = self.read_defined_file_to_list(fasta_path)
-                temporary_dictionary = {}
-                i = 0
-                while i < len(fasta_file_as_list):
-                    sequence = fasta_file_as_list[i][1:]
-                    temporary_dictionary[sequence] = fasta_file_as_list[i + 1]
-                    i += 2
-                return temporary_dictionary
+                return dict(self.iter_fasta_records(fasta_path))
 
     @staticmethod
     def decode_utf8_binary_to_list(bin_to_decode):
         return bin_to_decode.decode('ISO-8859-1').split('\n')
 
     def combine_two_fasta_files(self, path_one, path_two, path_for_combined):
-        one_file_one = self.read_defined_file_to_list(path_one)
-        one_file_two = self.read_defined_file_to_list(path_two)
-        one_file_one.extend(one_file_two)
-        self.write_list_to_destination(path_for_combined, one_file_one)
+        self.write_fasta_records(
+            path_for_combined, itertools.chain(self.iter_fasta_records(path_one), self.iter_fasta_records(path_two)))
 
     def create_seq_name_to_abundance_dict_from_name_file(self, name_file_list = None, name_file_path = None):
         if name_file_list is None and name_file_path is None:
@@ -75,12 +111,7 @@ class ThreadSafeGeneral:
                         name_file_list[i].split('\t')[1].split(','))
                 return temporary_dictionary
             if name_file_path:
-                name_file_as_list = self.read_defined_file_to_list(name_file_path)
-                temporary_dictionary = {}
-                for i in range(len(name_file_as_list)):
-                    temporary_dictionary[name_file_as_list[i].split('\t')[0]] = len(
-                        name_file_as_list[i].split('\t')[1].split(','))
-                return temporary_dictionary
+                return dict(self.iter_name_file_records(name_file_path))
 
     @staticmethod
     def return_list_of_file_names_in_directory(directory_to_list):
@@ -114,7 +145,8 @@ class ThreadSafeGeneral:
     @staticmethod
     def read_defined_file_to_generator(filename):
         with open(filename, mode='r') as reader:
-            return (line.rstrip() for line in reader)
+            for line in reader:
+                yield line.rstrip()
 
     @staticmethod
     def read_byte_object_from_defined_directory(directory):
@@ -147,21 +179,10 @@ class ThreadSafeGeneral:
 
         return out_fasta
 
-    @staticmethod
-    def convert_interleaved_to_sequencial_fasta(fasta_as_list):
+    def convert_interleaved_to_sequencial_fasta(self, fasta_as_list):
         new_fasta = []
-        temp_seq_string_list = []
-        for i, fasta_line in enumerate(fasta_as_list):
-            if fasta_line.startswith('>'):
-                if temp_seq_string_list:
-                    new_fasta.append(''.join(temp_seq_string_list))
-                    temp_seq_string_list = []
-                    new_fasta.append(fasta_line)
-                else:
-                    new_fasta.append(fasta_line)
-            else:
-                temp_seq_string_list.append(fasta_line)
-        new_fasta.append(''.join(temp_seq_string_list))
+        for name, sequence in self.iter_fasta_records_from_lines(fasta_as_list):
+            new_fasta.extend([f'>{name}', sequence])
         return new_fasta
 
     @staticmethod
@@ -267,6 +288,76 @@ class ThreadSafeGeneral:
         new_df = new_df.iloc[:, :-1].div(new_df['sum'], axis=0)
         return new_df
 
+    @staticmethod
+    def order_samples_by_most_abundant_seq(abund_df, group_seqs_by_clade=False, descending_tie_break=False):
+        """Return the index labels (samples) of abund_df (samples as rows, sequences as columns) ordered
+        according to their most abundant sequence. Sequences are ordered by the number of samples in which they
+        are the most abundant sequence and the samples of each sequence are ordered by the abundance of that
+        sequence in the sample. Samples without a most abundant sequence (i.e. all 0) are added at the end.
+
+        If group_seqs_by_clade, the sequences are first grouped by clade (clade taken from the sequence name,
+        i.e. 'C3' or '12345_C') in the order ABCDEFGHI.
+        If descending_tie_break, ties (in sequence counts, in sample abundances and in the order of the samples
+        without a most abundant sequence) are broken by descending sequence name or sample label. Otherwise
+        ties keep the order in which the sequences and samples first appear in abund_df.
+
+        The most abundant sequence of every sample is found with a single row-wise argmax/max
+        over the numeric matrix and the samples are then ordered with a single lexsort.
+        """
+        sample_labels = abund_df.index.to_numpy()
+        num_samples, num_seqs = abund_df.shape
+        if num_samples == 0:
+            return []
+        if num_seqs == 0:
+            no_maj_samples = sample_labels.tolist()
+            return sorted(no_maj_samples, reverse=True) if descending_tie_break else no_maj_samples
+        abund_array = np.nan_to_num(abund_df.to_numpy(dtype=float), nan=0.0)
+        max_abund_array = abund_array.max(axis=1)
+        max_abund_seq_array = abund_array.argmax(axis=1)
+        has_maj_seq = max_abund_array > 0
+        sample_positions = np.arange(num_samples)
+
+        # The number of samples in which each sequence was the most abundant sequence
+        seq_counts = np.bincount(max_abund_seq_array[has_maj_seq], minlength=num_seqs)
+        if descending_tie_break:
+            # The rank of each sequence name when sorted
+            seq_tie_break = np.empty(num_seqs, dtype=int)
+            seq_tie_break[sorted(range(num_seqs), key=lambda i: abund_df.columns[i])] = np.arange(num_seqs)
+            seq_tie_break = -seq_tie_break
+        else:
+            # The position of the first sample in which each sequence was the most abundant sequence
+            seq_tie_break = np.full(num_seqs, num_samples)
+            np.minimum.at(seq_tie_break, max_abund_seq_array[has_maj_seq], sample_positions[has_maj_seq])
+        if group_seqs_by_clade:
+            seq_clade_index = np.array([
+                ThreadSafeGeneral._get_clade_index_from_seq_name(seq_name) for seq_name in abund_df.columns])
+        else:
+            seq_clade_index = np.zeros(num_seqs, dtype=int)
+        seq_order = np.lexsort((seq_tie_break, -seq_counts, seq_clade_index))
+        seq_rank = np.empty(num_seqs, dtype=int)
+        seq_rank[seq_order] = np.arange(num_seqs)
+
+        if descending_tie_break:
+            sample_tie_break = np.empty(num_samples, dtype=int)
+            sample_tie_break[sorted(range(num_samples), key=lambda i: sample_labels[i])] = np.arange(num_samples)
+            sample_tie_break = -sample_tie_break
+        else:
+            sample_tie_break = sample_positions
+        maj_positions = sample_positions[has_maj_seq]
+        maj_order = np.lexsort((
+            sample_tie_break[maj_positions], -max_abund_array[maj_positions],
+            seq_rank[max_abund_seq_array[maj_positions]]))
+        no_maj_positions = sample_positions[~has_maj_seq]
+        no_maj_order = np.argsort(sample_tie_break[no_maj_positions], kind='stable')
+        return sample_labels[maj_positions[maj_order]].tolist() + sample_labels[no_maj_positions[no_maj_order]].tolist()
+
+    @staticmethod
+    def _get_clade_index_from_seq_name(seq_name):
+        for clade_index, clade in enumerate('ABCDEFGHI'):
+            if seq_name.startswith(clade) or seq_name[-2:] == f'_{clade}':
+                return clade_index
+        return len('ABCDEFGHI')
+
     @staticmethod
     def chunks(l, n=500):
         """Yield successive n-sized chunks from l.
@@ -373,6 +464,23 @@ class ThreadSafeGeneral:
                 for line in temp_js_file_as_list:
                     f.write(f'{line}\n')
 
+    @staticmethod
+    def write_out_js_function_to_return_streamed_js_obj(function_name, key_value_iterable, js_outpath):
+        '''The streaming counterpart of write_out_js_file_to_return_python_objs_as_js_objs for large objects.
+        The javascript object returned by the function is written out one key value pair at a time
+        (e.g. one sample's rectangle array at a time) so that the full python object never needs to be held
+        in memory. The output is identical to that of json.dumps on the equivalent dictionary.
+        As with write_out_js_file_to_return_python_objs_as_js_objs, the function is appended to js_outpath
+        if it already exists.'''
+        with open(js_outpath, 'a') as f:
+            f.write('function ' + function_name + '(){\n')
+            f.write('\treturn {')
+            for i, (key, value) in enumerate(key_value_iterable):
+                if i:
+                    f.write(', ')
+                f.write(f'{json.dumps(str(key))}: {json.dumps(value)}')
+            f.write('};\n}\n')
+
     @staticmethod
     def make_json_object_array_from_python_dictionary(p_dict):
         json_str = ''
@@ -50,6 +50,8 @@ if sp_config.system_type == 'remote':
     import re
 import data_analysis
 from general import ThreadSafeGeneral
+from stage_profiling import stage_profiler
+from figure_export import figure_exporter
 from django_general import CreateStudyAndAssociateUsers
 import django_general
 from shutil import which
@@ -63,6 +65,7 @@ class SymPortalWorkFlowManager:
     def __init__(self, custom_args_list=None):
         self.start_time = time.time()
         self.args = self._define_args(custom_args_list)
+        self._configure_figure_exporter()
         # general attributes
         self.thread_safe_general = ThreadSafeGeneral()
         self.symportal_root_directory = os.path.abspath(os.path.dirname(__file__))
@@ -86,6 +89,8 @@ class SymPortalWorkFlowManager:
         # for data analysis
         self.within_clade_cutoff = 0.03
         self.data_analysis_object = None
+        # The DataAnalysis an incremental analysis is seeded from (--incremental_from)
+        self.seed_data_analysis_object = None
         self.sp_data_analysis = None
         self.output_type_count_table_obj = None
         self.type_stacked_bar_plotter = None
@@ -150,6 +155,21 @@ class SymPortalWorkFlowManager:
             '--data_sheet',
             help='An absolute path to the .xlsx file containing the meta-data information for the data_set\'s samples')
         parser.add_argument('--no_figures', action='store_true', help='Skip figure production')
+        parser.add_argument(
+            '--no_svg_figures', action='store_true',
+            help='Do not output the figures as .svg (i.e. remove svg from the --figure_formats)')
+        parser.add_argument(
+            '--figure_formats', default=getattr(sp_config, 'figure_formats', 'svg,png'),
+            help='Comma separated formats to output the figures in. '
+                 'Any of svg, pdf, eps, ps, png, jpg, jpeg, tif, tiff, webp. '
+                 'The raster formats are all written from a single render of the figure [svg,png]')
+        parser.add_argument(
+            '--figure_dpi', type=int, default=getattr(sp_config, 'figure_dpi', 600),
+            help='The DPI of the raster figure formats [600]')
+        parser.add_argument(
+            '--background_figure_export', action='store_true', default=False,
+            help='When passed, the vector figure formats (e.g. svg) are written by background processes '
+                 'while the rest of the outputs are generated [False]')
         parser.add_argument('--no_ordinations', action='store_true', help='Skip ordination analysis')
         parser.add_argument('--debug', action='store_true', help='Present additional stdout output', default=False)
 
@@ -179,6 +199,20 @@ class SymPortalWorkFlowManager:
         parser.add_argument('--multiprocess', help="When passed, concurrency will be acheived using "
                                                    "multiprocessing rather than multithreading.",
                             action='store_true', default=False)
+        parser.add_argument('--native_qc',
+                            help="When passed, the initial sequence QC (make.contigs, screen.seqs, pcr.seqs, "
+                                 "unique.seqs and split.abund) will be performed in process rather than by mothur. "
+                                 "[False]", action='store_true', default=False)
+        parser.add_argument('--resume_analysis', type=int, metavar='DataAnalysis UID',
+                            help="Resume the DataAnalysis with the given UID from the checkpoint of its last "
+                                 "completed stage. To be passed together with --analyse and the same DataSet UIDs "
+                                 "that the DataAnalysis was started with.")
+        parser.add_argument('--incremental_from', type=int, metavar='DataAnalysis UID',
+                            help="Run an incremental analysis. To be passed with --analyse or --analyse_next. "
+                                 "The ITS2 type profiles of the DataAnalysis with the given UID are used as the "
+                                 "starting profiles of the new analysis so that profile discovery is only run for "
+                                 "the samples that were not part of it. NB the results may differ slightly from "
+                                 "those of a full analysis.")
         parser.add_argument('--force_basal_lineage_separation',
                             help="When passed, cladocopium profiles sequences from the C3, C15 and C1 radiations "
                                  "will not be allowed to occur together in profiles.",
@@ -325,6 +359,37 @@ class SymPortalWorkFlowManager:
             help='Output version')
 
     def start_work_flow(self):
+        # The profiler is shared by the module so drop the stages of any previous run in this process
+        stage_profiler.reset()
+        with stage_profiler.stage('SymPortalWorkFlowManager.start_work_flow'):
+            try:
+                self._run_work_flow()
+            finally:
+                # Don't leave background figure exports running (or orphaned) if the work flow fails
+                figure_exporter.wait_for_background_exports()
+        self._write_stage_profile_report()
+
+    def _configure_figure_exporter(self):
+        figure_formats = [
+            figure_format.strip().lower() for figure_format in self.args.figure_formats.split(',')
+            if figure_format.strip()]
+        if self.args.no_svg_figures:
+            figure_formats = [figure_format for figure_format in figure_formats if figure_format != 'svg']
+        if not figure_formats:
+            raise RuntimeError('Please provide at least one figure format to --figure_formats')
+        figure_exporter.configure(
+            formats=figure_formats, dpi=self.args.figure_dpi,
+            background_vector_export=self.args.background_figure_export)
+
+    def _write_stage_profile_report(self):
+        """Write out the timings, CPU time, peak RSS and DB query counts of each of the stages of this run.
+        Only written for those workflows that produce an output directory."""
+        if self.output_dir is None or not os.path.isdir(self.output_dir):
+            return
+        stage_profiler.write_report(
+            report_path=os.path.join(self.output_dir, f'{self.date_time_str}_stage_profile.json'))
+
+    def _run_work_flow(self):
         if self.args.load:
             self.perform_data_loading()
         elif self.args.analyse:
@@ -412,6 +477,8 @@ class SymPortalWorkFlowManager:
 
     # GENERAL
     def _plot_if_not_too_many_samples(self, plotting_function):
+        """The stacked bar plots are plotted whatever the number of samples (see plotting.StackedBarPlotter)
+        but the distance plots are only plotted for fewer than 1000 samples."""
         if self.number_of_samples < 1000:
             plotting_function()
         else:
@@ -437,14 +504,16 @@ class SymPortalWorkFlowManager:
             no_pre_med_seqs=self.args.no_pre_med_seqs,
             ordered_seq_list=self.output_seq_count_table_obj.clade_abundance_ordered_ref_seq_list,
             date_time_str=self.output_seq_count_table_obj.date_time_str,
-            seq_relative_abund_df_pre_med=self.output_seq_count_table_obj.output_df_relative_pre_med)
+            seq_relative_abund_df_pre_med=self.output_seq_count_table_obj.output_df_relative_pre_med,
+            num_proc=self.args.num_proc)
         self.seq_stacked_bar_plotter.plot_stacked_bar_seqs()
 
     def _plot_type_stacked_bar_from_type_output_table(self):
         self.type_stacked_bar_plotter = plotting.TypeStackedBarPlotter(
             output_directory=self.output_type_count_table_obj.output_dir,
             type_relative_abund_count_table_path=self.output_type_count_table_obj.path_to_relative_count_table_profiles_abund_and_meta,
-            date_time_str=self.output_type_count_table_obj.date_time_str)
+            date_time_str=self.output_type_count_table_obj.date_time_str,
+            num_proc=self.args.num_proc)
         self.type_stacked_bar_plotter.plot_stacked_bar_profiles()
 
     @staticmethod
@@ -475,8 +544,12 @@ class SymPortalWorkFlowManager:
 
     # DATA ANALYSIS
     def _perform_data_analysis(self):
-        self._verify_name_arg_given_analysis()
-        self.create_new_data_analysis_obj()
+        self.seed_data_analysis_object = self._get_seed_data_analysis_obj()
+        if self.args.resume_analysis:
+            self._set_data_analysis_obj_to_resume()
+        else:
+            self._verify_name_arg_given_analysis()
+            self.create_new_data_analysis_obj()
         self.output_dir = os.path.join(
             self.symportal_root_directory, 'outputs', 'analyses', str(self.data_analysis_object.id), self.date_time_str)
         self._set_html_dir_and_js_out_path_from_output_dir()
@@ -536,7 +609,9 @@ class SymPortalWorkFlowManager:
         self.sp_data_analysis = data_analysis.SPDataAnalysis(
             workflow_manager_parent=self,
             data_analysis_obj=self.data_analysis_object,
-            force_basal_lineage_separation=self.args.force_basal_lineage_separation)
+            force_basal_lineage_separation=self.args.force_basal_lineage_separation,
+            resume_analysis=bool(self.args.resume_analysis),
+            seed_data_analysis_obj=self.seed_data_analysis_object)
         self.sp_data_analysis.analyse_data()
 
     def _do_data_analysis_output(self):
@@ -545,9 +620,9 @@ class SymPortalWorkFlowManager:
         self.number_of_samples = len(self.output_type_count_table_obj.sorted_list_of_vdss_uids_to_output)
 
         if not self.args.no_figures:
-            self._plot_if_not_too_many_samples(self._plot_type_stacked_bar_from_type_output_table)
+            self._plot_type_stacked_bar_from_type_output_table()
 
-            self._plot_if_not_too_many_samples(self._plot_sequence_stacked_bar_with_ordered_dss_uids_from_type_output)
+            self._plot_sequence_stacked_bar_with_ordered_dss_uids_from_type_output()
         else:
             print('\nFigure plotting skipped at user\'s request')
 
@@ -561,7 +636,8 @@ class SymPortalWorkFlowManager:
             no_pre_med_seqs=self.args.no_pre_med_seqs,
             ordered_seq_list=self.output_seq_count_table_obj.clade_abundance_ordered_ref_seq_list,
             date_time_str=self.output_seq_count_table_obj.date_time_str,
-            seq_relative_abund_df_pre_med=self.output_seq_count_table_obj.output_df_relative_pre_med)
+            seq_relative_abund_df_pre_med=self.output_seq_count_table_obj.output_df_relative_pre_med,
+            num_proc=self.args.num_proc)
         self.seq_stacked_bar_plotter.plot_stacked_bar_seqs()
 
     def _do_data_analysis_ordinations(self):
@@ -681,6 +757,28 @@ class SymPortalWorkFlowManager:
             date_time_str=self.date_time_str, force_basal_lineage_separation=self.args.force_basal_lineage_separation)
         self.output_type_count_table_obj.output_types()
 
+    def _get_seed_data_analysis_obj(self):
+        """The DataAnalysis that an incremental analysis is seeded from"""
+        if not self.args.incremental_from:
+            return None
+        try:
+            return DataAnalysis.objects.get(id=self.args.incremental_from)
+        except ObjectDoesNotExist:
+            sys.exit(f'DataAnalysis {self.args.incremental_from} does not exist. Unable to run incremental analysis.')
+
+    def _set_data_analysis_obj_to_resume(self):
+        try:
+            self.data_analysis_object = DataAnalysis.objects.get(id=self.args.resume_analysis)
+        except ObjectDoesNotExist:
+            sys.exit(f'DataAnalysis {self.args.resume_analysis} does not exist. Unable to resume.')
+        data_set_uids_of_analysis = set(
+            int(uid_str) for uid_str in self.data_analysis_object.list_of_data_set_uids.split(','))
+        data_set_uids_to_analyse = set(int(uid_str) for uid_str in self.args.analyse.split(','))
+        if data_set_uids_of_analysis != data_set_uids_to_analyse:
+            sys.exit(f'DataAnalysis {self.data_analysis_object.id} was started with DataSets '
+                     f'{self.data_analysis_object.list_of_data_set_uids} not {self.args.analyse}. Unable to resume.')
+        print(f'\nResuming DataAnalysis {self.data_analysis_object.name} (UID: {self.data_analysis_object.id})')
+
     def create_new_data_analysis_obj(self):
         self.data_analysis_object = DataAnalysis(
             list_of_data_set_uids=self.args.analyse, within_clade_cutoff=self.within_clade_cutoff,
@@ -707,7 +805,7 @@ class SymPortalWorkFlowManager:
                     distance_method=self.args.distance_method,
                     no_pre_med_seqs=self.args.no_pre_med_seqs, debug=self.args.debug, multiprocess=self.args.multiprocess,
                     start_time=self.start_time, date_time_str=self.date_time_str,
-                    is_cron_loading=True,
+                    is_cron_loading=True, native_qc=self.args.native_qc,
                     study_name=self.args.study_name, study_user_string=self.args.study_user_string)
         else:
             self.data_loading_object = data_loading.DataLoading(
@@ -717,7 +815,7 @@ class SymPortalWorkFlowManager:
                 distance_method=self.args.distance_method,
                 no_pre_med_seqs=self.args.no_pre_med_seqs, debug=self.args.debug, multiprocess=self.args.multiprocess,
                 start_time=self.start_time, date_time_str=self.date_time_str,
-                is_cron_loading=False)
+                is_cron_loading=False, native_qc=self.args.native_qc)
         
         self.data_loading_object.load_data()
 
@@ -742,7 +840,7 @@ class SymPortalWorkFlowManager:
         else:
             self._stand_alone_sequence_output_data_set()
         self.number_of_samples = len(self.output_seq_count_table_obj.sorted_sample_uid_list)
-        self._plot_if_not_too_many_samples(self._plot_sequence_stacked_bar_from_seq_output_table)
+        self._plot_sequence_stacked_bar_from_seq_output_table()
         self._do_sample_ordination()
         self._output_js_output_path_dict()
         self._print_all_outputs_complete()
@@ -898,8 +996,8 @@ class SymPortalWorkFlowManager:
             self._stand_alone_seq_output_from_type_output_data_set()
         if not self.args.no_figures:
             self.number_of_samples = len(self.output_seq_count_table_obj.sorted_sample_uid_list)
-            self._plot_if_not_too_many_samples(self._plot_sequence_stacked_bar_with_ordered_dss_uids_from_type_output)
-            self._plot_if_not_too_many_samples(self._plot_type_stacked_bar_from_type_output_table)
+            self._plot_sequence_stacked_bar_with_ordered_dss_uids_from_type_output()
+            self._plot_type_stacked_bar_from_type_output_table()
         else:
             print('\nFigure plotting skipped at user\'s request')
         if not self.args.no_ordinations:
@@ -918,7 +1016,8 @@ class SymPortalWorkFlowManager:
         Produce the study_output_info.json file in the output directory
         and produce a .bak in the dbBackup directory
         """
-        
+        # The outputs must all be in place before the study is marked as ready
+        figure_exporter.wait_for_background_exports()
         bak_path = os.path.join(self.dbbackup_dir, f'symportal_database_backup_{self.date_time_str}.bak')
         study_output_info_path = os.path.join(self.output_dir, 'study_output_info.json')
         # Now output the .json file
@@ -1,18 +1,19 @@
 from dbApp.models import (DataSet, ReferenceSequence, DataSetSampleSequence, AnalysisType, DataSetSample,
                           DataAnalysis, DataSetSampleSequencePM, CladeCollectionType)
-from multiprocessing import Queue as mp_Queue, Process, Manager, Lock as mp_Lock
+from multiprocessing import Queue as mp_Queue, Process
 from queue import Queue as mt_Queue
-from threading import Thread, Lock as mt_Lock
+from threading import Thread
 import sys
 from django import db
 import os
 import json
-from collections import defaultdict
+from collections import defaultdict, Counter
 import pandas as pd
 import numpy as np
 import sp_config
 import virtual_objects
 from general import ThreadSafeGeneral
+from stage_profiling import profile_stage
 from exceptions import NoDataSetSampleSequencePMObjects
 
 
@@ -45,16 +46,21 @@ class OutputProfileCountTable:
         self.sorted_list_of_vdss_uids_to_output = self._set_sorted_list_of_vdss_to_output()
         self.number_of_samples = None
         self.call_type = call_type
-        self.pre_headers = None
-        # the number of meta rows that have been added to the dataframe.
-        # This number will be used to remove the meta rows when making the abundance only dataframes
-        self.number_of_meta_rows_added = 0
-        # the number of header rows that have been added to the dataframe.
-        # This number will be used to remove the header rows when making the abundance only dataframes
-        # set of all of the species found in the vats
-        self.number_of_header_rows_added = 0
-        self.rel_abund_output_df, self.abs_abund_output_df = self._init_dfs()
+        # The meta information rows that are written above (pre_headers) and below (post_headers)
+        # the abundances of the samples in the abund_and_meta output tables
+        self.pre_headers = [
+            'ITS2 type profile UID', 'Clade', 'Majority ITS2 sequence', 'Associated species',
+            'ITS2 profile abundance local', 'ITS2 profile abundance DB', 'ITS2 type profile']
+        self.post_headers = ['Sequence accession / SymPortal UID', 'Average defining sequence proportions and [stdev]']
+        # The sample (index; sorted_list_of_vdss_uids_to_output) by profile (columns; clade_sorted_list_of_vats_to_output)
+        # relative and absolute abundance dataframes. These are purely numeric. The meta information of the profiles
+        # is held separately in profile_meta_df (index; profile uid, columns; pre_headers and post_headers)
+        # and the two are only joined when writing out the abund_and_meta tables.
+        self.rel_abund_df = None
+        self.abs_abund_df = None
+        self.profile_meta_df = None
         self.additional_info_file_as_list = []
+        # set of all of the species found in the vats
         self.species_set = set()
         self.species_ref_dict = self._set_species_ref_dict()
         self.output_path_list = []
@@ -118,39 +124,15 @@ class OutputProfileCountTable:
         vcc_uids_to_output = list_of_sets_of_vcc_uids_in_vdss[0].union(*list_of_sets_of_vcc_uids_in_vdss[1:])
         return vcc_uids_to_output
 
+    @profile_stage()
     def output_types(self):
         print('\n\nOutputting ITS2 type profile abundance count tables\n')
         self._populate_main_body_of_dfs()
 
-        self._populate_sample_name_series()
-
         self._populate_meta_info_of_dfs()
 
         self._write_out_dfs()
 
-    def _populate_sample_name_series(self):
-        dss_name_ordered_list = [self.virtual_object_manager.vdss_manager.vdss_dict[vdss_uid].name for vdss_uid in self.sorted_list_of_vdss_uids_to_output]
-
-        sample_name_series_data = []
-
-        for _ in range(len(self.pre_headers)):
-            sample_name_series_data.append(np.nan)
-
-        for name in dss_name_ordered_list:
-            sample_name_series_data.append(name)
-
-        # add two nan for the remainder
-        for _ in range(len(self.abs_abund_output_df.index.tolist()) - (len(self.pre_headers) + len(dss_name_ordered_list))):
-            sample_name_series_data.append(np.nan)
-
-        sample_name_series = pd.Series(
-            name='sample_name',
-            data=sample_name_series_data,
-            index=self.abs_abund_output_df.index.tolist())
-
-        self.abs_abund_output_df.insert(loc=0, column='sample_name', value=sample_name_series)
-        self.rel_abund_output_df.insert(loc=0, column='sample_name', value=sample_name_series)
-
     def _populate_meta_info_of_dfs(self):
         self._add_species_info_to_addition_info_file()
 
@@ -163,9 +145,9 @@ class OutputProfileCountTable:
     def _write_out_dfs(self):
         self._write_out_abund_and_meta_dfs_profiles()
 
-        abund_row_indices = self._write_out_abund_only_dfs_profiles()
+        self._write_out_abund_only_dfs_profiles()
 
-        prof_meta_only = self._write_out_meta_only_dfs_profiles(abund_row_indices)
+        prof_meta_only = self._write_out_meta_only_dfs_profiles()
 
         self._write_out_js_profiles_data_file(prof_meta_only)
 
@@ -285,25 +267,19 @@ class OutputProfileCountTable:
         return  colour_dict
 
     def _make_profile_rect_array(self, prof_colour_dict, prof_meta_only, sorted_profile_uids_by_local_abund):
-        # get rid of the meta information at the top of the df
-        rows_to_keep_by_index = []
-        abundance_row_indices = list(range(self.number_of_header_rows_added, (
-                len(self.abs_abund_output_df.index.values.tolist()) - self.number_of_meta_rows_added)))
-        rows_to_keep_by_index += abundance_row_indices
-        absolute_df_abund_only = self.abs_abund_output_df.iloc[rows_to_keep_by_index, :]
-        relative_df_abund_only = self.rel_abund_output_df.iloc[rows_to_keep_by_index, :]
         # now we need to create the rect array for the profiles
-        profile_rect_dict = {sample_uid: [] for sample_uid in absolute_df_abund_only.index.values.tolist()}
+        profile_rect_dict = {sample_uid: [] for sample_uid in self.abs_abund_df.index.values.tolist()}
         max_cumulative_abs = 0
-        for sample_uid in absolute_df_abund_only.index:
+        # Work with the abundance arrays with the profiles in order of local abundance
+        abs_abund_array = self.abs_abund_df[sorted_profile_uids_by_local_abund].to_numpy()
+        rel_abund_array = self.rel_abund_df[sorted_profile_uids_by_local_abund].to_numpy()
+        for sample_uid, abs_abunds, rel_abunds in zip(
+                self.abs_abund_df.index.values.tolist(), abs_abund_array, rel_abund_array):
             new_rect_list = []
-            abs_series = absolute_df_abund_only.loc[sample_uid]
-            rel_series = relative_df_abund_only.loc[sample_uid]
             cumulative_count_abs = 0
             cumulative_count_rel = 0
-            for profile_uid in sorted_profile_uids_by_local_abund:
-                prof_abund_abs = abs_series.at[profile_uid]
-                prof_abund_rel = rel_series.at[profile_uid]
+            for profile_uid, prof_abund_abs, prof_abund_rel in zip(
+                    sorted_profile_uids_by_local_abund, abs_abunds, rel_abunds):
                 if prof_abund_abs:
                     cumulative_count_abs += int(prof_abund_abs)
                     cumulative_count_rel += float(prof_abund_rel)
@@ -329,17 +305,10 @@ class OutputProfileCountTable:
              {'function_name': 'getProfColor', 'python_obj': prof_colour_dict}],
             js_outpath=js_file_path)
 
-    def _write_out_meta_only_dfs_profiles(self, abundance_row_indices):
+    def _write_out_meta_only_dfs_profiles(self):
         # now output the meta_only dfs
-        # delete the abundance info rows and drop the sample_name column
-        # then output the transposed matrix so that this is essentially the meta info for each of the
-        # ITS2 type profiles
-        rows_to_keep_by_index = list(range(self.number_of_header_rows_added))
-        rows_to_keep_by_index += list(range(self.number_of_header_rows_added + len(abundance_row_indices),
-                                            len(self.abs_abund_output_df.index.values.tolist())))
-        profile_meta_only = self.abs_abund_output_df.iloc[rows_to_keep_by_index, :]
-        profile_meta_only.drop(columns='sample_name', inplace=True)
-        profile_meta_only = profile_meta_only.T
+        # this is essentially the meta info for each of the ITS2 type profiles
+        profile_meta_only = self.profile_meta_df.copy()
         profile_meta_only.to_csv(self.path_to_absolute_count_table_profiles_meta_only, sep="\t", header=True,
                                  index=False)
         print(self.path_to_absolute_count_table_profiles_meta_only)
@@ -352,38 +321,38 @@ class OutputProfileCountTable:
 
     def _write_out_abund_only_dfs_profiles(self):
         # write out the abund_only dfs
-        # get rid of the header rows other than the profile uid that is the first row
-        # also get rid of all meta rows at the end
-        # also get rid of the sample_name column
-        rows_to_keep_by_index = [0]
-        abundance_row_indices = list(range(self.number_of_header_rows_added, (
-                    len(self.abs_abund_output_df.index.values.tolist()) - self.number_of_meta_rows_added)))
-        rows_to_keep_by_index += abundance_row_indices
-        absolute_df_abund_only = self.abs_abund_output_df.iloc[rows_to_keep_by_index, :]
-        relative_df_abund_only = self.rel_abund_output_df.iloc[rows_to_keep_by_index, :]
-        absolute_df_abund_only.drop(columns='sample_name', inplace=True)
-        relative_df_abund_only.drop(columns='sample_name', inplace=True)
-        # replace the top item of the index with sample_uid rather than 'ITS2 type profile UID'
-        new_index = absolute_df_abund_only.index.values.tolist()
-        new_index[0] = 'sample_uid'
-        absolute_df_abund_only.index = new_index
-        relative_df_abund_only.index = new_index
-        absolute_df_abund_only.to_csv(self.path_to_absolute_count_table_profiles_abund_only, sep="\t", header=False)
-        relative_df_abund_only.to_csv(self.path_to_relative_count_table_profiles_abund_only, sep="\t", header=False)
+        # The first row is the profile uids with 'sample_uid' as the index header
+        self.abs_abund_df.to_csv(
+            self.path_to_absolute_count_table_profiles_abund_only, sep="\t", header=True, index_label='sample_uid')
+        self.rel_abund_df.to_csv(
+            self.path_to_relative_count_table_profiles_abund_only, sep="\t", header=True, index_label='sample_uid')
         print(self.path_to_absolute_count_table_profiles_abund_only)
         print(self.path_to_relative_count_table_profiles_abund_only)
-        return abundance_row_indices
 
     def _write_out_abund_and_meta_dfs_profiles(self):
         # write out the abund_and_meta dfs
         print('\n\nITS2 type profile count tables output to:')
-        self.abs_abund_output_df.to_csv(
+        self._make_abund_and_meta_df(self.abs_abund_df).to_csv(
             self.path_to_absolute_count_table_profiles_abund_and_meta, sep="\t", header=False)
         print(f'{self.path_to_absolute_count_table_profiles_abund_and_meta}\n\n')
-        self.rel_abund_output_df.to_csv(
+        self._make_abund_and_meta_df(self.rel_abund_df).to_csv(
             self.path_to_relative_count_table_profiles_abund_and_meta, sep="\t", header=False)
         print(self.path_to_relative_count_table_profiles_abund_and_meta)
 
+    def _make_abund_and_meta_df(self, abund_df):
+        """Join the meta information rows of the profiles (pre_headers above and post_headers below)
+        to the sample abundances and add the sample_name column."""
+        meta_df = self.profile_meta_df.T
+        abund_and_meta_df = pd.concat(
+            [meta_df.loc[self.pre_headers], abund_df.astype(object), meta_df.loc[self.post_headers]])
+        vdss_dict = self.virtual_object_manager.vdss_manager.vdss_dict
+        abund_and_meta_df.insert(
+            loc=0, column='sample_name',
+            value=[np.nan for _ in self.pre_headers] +
+                  [vdss_dict[vdss_uid].name for vdss_uid in self.sorted_list_of_vdss_uids_to_output] +
+                  [np.nan for _ in self.post_headers])
+        return abund_and_meta_df
+
     def _append_meta_info_for_stand_alone_call_type(self):
         data_sets_of_analysis = len(self.data_analysis_obj.list_of_data_set_uids.split(','))
         if self.call_type == 'stand_alone_data_sets':
@@ -452,27 +421,57 @@ class OutputProfileCountTable:
         return meta_info_string
 
     def _populate_main_body_of_dfs(self):
+        """Populate the sample by profile abundance arrays in a single pass over the VirtualCladeCollection to
+        VirtualAnalysisType assignments of the output and make the meta information for each of the profiles."""
         print('\nPopulating output dfs:')
-        for vat in self.clade_sorted_list_of_vats_to_output:
+        vdss_uid_to_row_index_dict = {
+            vdss_uid: row_index for row_index, vdss_uid in enumerate(self.sorted_list_of_vdss_uids_to_output)}
+        vcc_dict = self.virtual_object_manager.vcc_manager.vcc_dict
+        rel_abund_array = np.zeros(
+            (len(self.sorted_list_of_vdss_uids_to_output), len(self.clade_sorted_list_of_vats_to_output)), dtype=float)
+        abs_abund_array = np.zeros(
+            (len(self.sorted_list_of_vdss_uids_to_output), len(self.clade_sorted_list_of_vats_to_output)), dtype=int)
+        profile_meta_info_list = []
+        for col_index, vat in enumerate(self.clade_sorted_list_of_vats_to_output):
             sys.stdout.write(f'\r{vat.name}')
-            tosp = self.TypeOutputSeriesPopulation(parent_output_type_count_table=self, vat=vat)
-            data_relative_list, data_absolute_list = tosp.make_output_series()
-            self.rel_abund_output_df[vat.id] = data_relative_list
-            self.abs_abund_output_df[vat.id] = data_absolute_list
+            vdss_row_indices_of_vat = set()
+            for vcc_uid, rel_abund, abs_abund in zip(
+                    vat.type_output_rel_abund_series.index.values.tolist(),
+                    vat.type_output_rel_abund_series.values.tolist(),
+                    vat.type_output_abs_abund_series.values.tolist()):
+                row_index = vdss_uid_to_row_index_dict.get(vcc_dict[vcc_uid].vdss_uid)
+                if row_index is None:
+                    # vcc is not part of the output
+                    continue
+                if row_index in vdss_row_indices_of_vat:
+                    raise RuntimeError('More than one vcc of vdss matched vat in output')
+                vdss_row_indices_of_vat.add(row_index)
+                rel_abund_array[row_index, col_index] = rel_abund
+                abs_abund_array[row_index, col_index] = abs_abund
+            tomip = self.TypeOutputMetaInfoPopulation(vat=vat, local_abundance=len(vdss_row_indices_of_vat))
+            profile_meta_info_list.append(tomip.make_meta_info())
             if vat.species != 'None':
                 self.species_set.update(vat.species.split(','))
 
-    class TypeOutputSeriesPopulation:
-        """will create a relative abundance and absolute abundance
-        output pandas series for a given VirtualAnalysisType
+        vat_uids = [vat.id for vat in self.clade_sorted_list_of_vats_to_output]
+        self.rel_abund_df = pd.DataFrame(
+            rel_abund_array, index=self.sorted_list_of_vdss_uids_to_output, columns=vat_uids)
+        self.abs_abund_df = pd.DataFrame(
+            abs_abund_array, index=self.sorted_list_of_vdss_uids_to_output, columns=vat_uids)
+        self.profile_meta_df = pd.DataFrame(
+            profile_meta_info_list, index=vat_uids, columns=self.pre_headers + self.post_headers, dtype=object)
+
+    class TypeOutputMetaInfoPopulation:
+        """will create the meta information (in the order of the pre_headers and then the post_headers
+        of the OutputProfileCountTable) for a given VirtualAnalysisType
         """
-        def __init__(self, parent_output_type_count_table, vat):
-            self.output_type_count_table = parent_output_type_count_table
+        def __init__(self, vat, local_abundance):
             self.vat = vat
-            self.data_relative_list = []
-            self.data_absolute_list = []
+            # The number of samples of the output that the vat was found in
+            self.local_abundance = local_abundance
+            self.meta_info_list = []
 
-        def make_output_series(self):
+        def make_meta_info(self):
             """type_uid"""
             self._pop_type_uid()
 
@@ -486,14 +485,11 @@ class OutputProfileCountTable:
 
             self._pop_type_name()
 
-            self._pop_type_abundances()
-
             self._pop_vat_accession_name()
 
             self._pop_av_and_stdev_abund()
 
-            return self.data_relative_list, self.data_absolute_list
-
+            return self.meta_info_list
 
         def _pop_av_and_stdev_abund(self):
             average_abund_and_sd_string = ''
@@ -506,8 +502,7 @@ class OutputProfileCountTable:
                                                                                         rs_id)
                     average_abund_and_sd_string = self._append_rel_abund_and_sd_str_for_rs(
                         average_abund_and_sd_string, rs_id)
-            self.data_relative_list.append(average_abund_and_sd_string)
-            self.data_absolute_list.append(average_abund_and_sd_string)
+            self.meta_info_list.append(average_abund_and_sd_string)
 
         def _append_dash_or_slash_if_maj_seq(self, average_abund_and_sd_string, rs_id):
             if rs_id in self.vat.majority_reference_sequence_uid_set:
@@ -526,49 +521,21 @@ class OutputProfileCountTable:
             vat_accession_name = self.vat.generate_name(
                 at_df=self.vat.multi_modal_detection_rel_abund_df,
                 use_rs_ids_rather_than_names=True)
-            self.data_relative_list.append(vat_accession_name)
-            self.data_absolute_list.append(vat_accession_name)
-
-        def _pop_type_abundances(self):
-            # type abundances
-            temp_rel_abund_holder_list = []
-            temp_abs_abund_holder_list = []
-            for vdss_uid in self.output_type_count_table.sorted_list_of_vdss_uids_to_output:
-                count = 0
-                vdss_obj = self.output_type_count_table.virtual_object_manager.vdss_manager.vdss_dict[vdss_uid]
-                for vcc_uid in vdss_obj.set_of_cc_uids:
-                    if vcc_uid in self.vat.type_output_rel_abund_series:
-                        count += 1
-                        temp_rel_abund_holder_list.append(self.vat.type_output_rel_abund_series[vcc_uid])
-                        temp_abs_abund_holder_list.append(self.vat.type_output_abs_abund_series[vcc_uid])
-
-                if count == 0:  # type not found in vdss
-                    temp_rel_abund_holder_list.append(0)
-                    temp_abs_abund_holder_list.append(0)
-                if count > 1:  # more than one vcc from vdss associated with type
-                    raise RuntimeError('More than one vcc of vdss matched vat in output')
-            self.data_relative_list.extend(temp_rel_abund_holder_list)
-            self.data_absolute_list.extend(temp_abs_abund_holder_list)
+            self.meta_info_list.append(vat_accession_name)
 
         def _pop_type_name(self):
             # name
-            self.data_absolute_list.append(self.vat.name)
-            self.data_relative_list.append(self.vat.name)
+            self.meta_info_list.append(self.vat.name)
 
         def _pop_type_local_and_global_abundances(self):
             # local_output_type_abundance
             # all analysis_type_abundance
-            vccs_of_type = self.vat.clade_collection_obj_set_profile_assignment
-            vccs_of_type_from_output = [vcc for vcc in vccs_of_type if
-                                        vcc.vdss_uid in self.output_type_count_table.sorted_list_of_vdss_uids_to_output]
             abund_db = self.vat.grand_tot_num_instances_of_vat_in_analysis
-            self.data_absolute_list.extend([str(len(vccs_of_type_from_output)), str(abund_db)])
-            self.data_relative_list.extend([str(len(vccs_of_type_from_output)), str(abund_db)])
+            self.meta_info_list.extend([str(self.local_abundance), str(abund_db)])
 
         def _pop_species(self):
             # species
-            self.data_absolute_list.append(self.vat.species)
-            self.data_relative_list.append(self.vat.species)
+            self.meta_info_list.append(self.vat.species)
 
         def _pop_maj_seq_str(self):
             # majority sequences string e.g. C3/C3b
@@ -578,18 +545,15 @@ class OutputProfileCountTable:
                     if rs.id == rs_id and rs in self.vat.majority_reference_sequence_obj_set:
                         ordered_maj_seq_names.append(rs.name)
             maj_seq_str = '/'.join(ordered_maj_seq_names)
-            self.data_absolute_list.append(maj_seq_str)
-            self.data_relative_list.append(maj_seq_str)
+            self.meta_info_list.append(maj_seq_str)
 
         def _pop_type_clade(self):
             # clade
-            self.data_absolute_list.append(self.vat.clade)
-            self.data_relative_list.append(self.vat.clade)
+            self.meta_info_list.append(self.vat.clade)
 
         def _pop_type_uid(self):
             # Type uid
-            self.data_absolute_list.append(self.vat.id)
-            self.data_relative_list.append(self.vat.id)
+            self.meta_info_list.append(self.vat.id)
 
 
     def _init_da_object(self, data_analysis_obj, data_analysis_uid):
@@ -599,15 +563,6 @@ class OutputProfileCountTable:
             self.data_analysis_obj = data_analysis_obj
         return self.data_analysis_obj
 
-    def _init_dfs(self):
-        self.pre_headers = ['ITS2 type profile UID', 'Clade', 'Majority ITS2 sequence',
-                       'Associated species', 'ITS2 profile abundance local', 'ITS2 profile abundance DB', 'ITS2 type profile']
-        self.number_of_header_rows_added += len(self.pre_headers)
-        post_headers = ['Sequence accession / SymPortal UID', 'Average defining sequence proportions and [stdev]']
-        self.number_of_meta_rows_added += len(post_headers)
-        self.df_index = self.pre_headers + self.sorted_list_of_vdss_uids_to_output + post_headers
-        return pd.DataFrame(index=self.df_index), pd.DataFrame(index=self.df_index)
-
     def _init_dss_and_ds_uids(self, data_set_sample_uid_set_to_output, data_set_uids_to_output):
         if data_set_sample_uid_set_to_output:
             self.data_set_sample_uid_set_to_output = data_set_sample_uid_set_to_output
@@ -697,48 +652,51 @@ class OutputProfileCountTable:
         of the output dataframes. The samples will be ordered by the most abundant type profiles first, and for
         each type profile the samples that had this profile as their most abundant type profile should be listed,
         within this, they should additionally be sorted by the relative abundance at which the profiles were found
-        within the samples."""
-        sorted_vdss_uid_list = []
+        within the samples.
+        The most abundant clade of each sample and the most abundant vat of each vcc are computed once and the
+        ordering is then produced with a single keyed sort."""
+        vdss_dict = self.virtual_object_manager.vdss_manager.vdss_dict
+        output_vdss_uid_set = set(self.data_set_sample_uid_set_to_output)
+        # vdss uid to the (most abundant clade, relative abundance of the clade) of the vdss
+        vdss_uid_to_most_abund_clade_tup_dict = {
+            vdss_uid: max(vdss_dict[vdss_uid].cladal_abundances_dict.items(), key=lambda x: x[1])
+            for vdss_uid in output_vdss_uid_set}
+        # vdss uid to the (index of the vat in overall_sorted_list_of_vats, rel abund in sample) of the vdss's
+        # most abundant vat
+        vdss_uid_to_sort_key_dict = {}
         # a sanity checking set just to make sure we are not finding more vccs with more than one most abundant type
         set_of_vcc_uids_already_added = set()
-        for vat in self.overall_sorted_list_of_vats:
-            temp_set_vcc_rel_abund_tups = set()
+        for vat_index, vat in enumerate(self.overall_sorted_list_of_vats):
             # For each vcc that had this profile found in it
             for vcc in vat.clade_collection_obj_set_profile_assignment:
                 vdss_uid_of_vcc = vcc.vdss_uid
-                vdss_obj = self.virtual_object_manager.vdss_manager.vdss_dict[vdss_uid_of_vcc]
+                # this vcc is not part of the output
+                if vdss_uid_of_vcc not in output_vdss_uid_set:
+                    continue
                 # if the clade of the vat is the most abundant clade in the vdss
-                sorted_clade_abundances_tups = [tup for tup in sorted(vdss_obj.cladal_abundances_dict.items(), key=lambda x:x[1], reverse=True)]
-                most_abund_clade, rel_abund_of_clade = sorted_clade_abundances_tups[0]
+                most_abund_clade, rel_abund_of_clade = vdss_uid_to_most_abund_clade_tup_dict[vdss_uid_of_vcc]
                 if not vat.clade == most_abund_clade:
                     continue
-                # this vcc is not part of the output
-                if not vdss_uid_of_vcc in self.data_set_sample_uid_set_to_output:
-                    continue
                 # see if this vat was the most abundant vat of the vcc
-                # get sorted list of the vats
-                most_abundant_vat, within_clade_rel_abund = sorted(vcc.analysis_type_obj_to_representative_rel_abund_in_cc_dict.items(), key=lambda x: x[1], reverse=True)[0]
-                rel_abund_in_sample = within_clade_rel_abund * rel_abund_of_clade
+                most_abundant_vat, within_clade_rel_abund = max(
+                    vcc.analysis_type_obj_to_representative_rel_abund_in_cc_dict.items(), key=lambda x: x[1])
                 # if this type was most abundant type of the vcc, add it to the profile
                 if most_abundant_vat == vat:
                     if vcc.id not in set_of_vcc_uids_already_added:
                         set_of_vcc_uids_already_added.add(vcc.id)
                     else:
                         raise RuntimeError('The vcc was already added to the list_of_vcc_uids_already_added')
-
-                    if vdss_uid_of_vcc in self.data_set_sample_uid_set_to_output:
-                        if vdss_uid_of_vcc not in sorted_vdss_uid_list:
-                            temp_set_vcc_rel_abund_tups.add((vdss_uid_of_vcc, rel_abund_in_sample))
-                        else:
-                            pass
-                    else:
-                        raise RuntimeError('vdss associated with vcc seems to not be part of the output')
-            temp_set_vcc_rel_abund_tups = list(temp_set_vcc_rel_abund_tups)
-            temp_set_vcc_rel_abund_tups.sort(key=lambda x: x[0], reverse=True)
-            temp_set_vcc_rel_abund_tups.sort(key=lambda x: x[1], reverse=True)
-            sorted_vdss_uid_list.extend([tup[0] for tup in temp_set_vcc_rel_abund_tups])
+                    if vdss_uid_of_vcc not in vdss_uid_to_sort_key_dict:
+                        vdss_uid_to_sort_key_dict[vdss_uid_of_vcc] = (
+                            vat_index, within_clade_rel_abund * rel_abund_of_clade)
+        # Order by the vats, then by decreasing relative abundance of the vat in the sample, then by decreasing uid
+        sorted_vdss_uid_list = sorted(
+            vdss_uid_to_sort_key_dict.keys(),
+            key=lambda vdss_uid: (
+                vdss_uid_to_sort_key_dict[vdss_uid][0], -vdss_uid_to_sort_key_dict[vdss_uid][1], -vdss_uid))
         # add the samples that didn't have a type associated to them in a specific order
-        samples_to_add = [dss_uid for dss_uid in self.data_set_sample_uid_set_to_output if dss_uid not in sorted_vdss_uid_list]
+        samples_to_add = [
+            dss_uid for dss_uid in self.data_set_sample_uid_set_to_output if dss_uid not in vdss_uid_to_sort_key_dict]
         samples_to_add.sort(reverse=True)
         sorted_vdss_uid_list.extend(samples_to_add)
         return sorted_vdss_uid_list
@@ -747,22 +705,22 @@ class OutputProfileCountTable:
         """Get list of analysis type sorted by clade, and then by
         len of the cladecollections associated to them from the output
         """
+        output_vdss_uid_set = set(self.data_set_sample_uid_set_to_output)
         list_of_tup_vat_to_vccs_of_output = []
         for vat in self.virtual_object_manager.vat_manager.vat_dict.values():
             self.clades_of_output.add(vat.clade)
-            vccs_of_output_of_vat = []
-            for vcc in vat.clade_collection_obj_set_profile_assignment:
-                if vcc.vdss_uid in self.data_set_sample_uid_set_to_output:
-                    vccs_of_output_of_vat.append(vcc)
-            list_of_tup_vat_to_vccs_of_output.append((vat, len(vccs_of_output_of_vat)))
+            num_vccs_of_output_of_vat = sum(
+                1 for vcc in vat.clade_collection_obj_set_profile_assignment if vcc.vdss_uid in output_vdss_uid_set)
+            list_of_tup_vat_to_vccs_of_output.append((vat, num_vccs_of_output_of_vat))
 
         self.overall_sorted_list_of_vats = [vat for vat, num_vcc_of_output in
                               sorted(list_of_tup_vat_to_vccs_of_output, key=lambda x: x[1], reverse=True) if num_vcc_of_output != 0]
 
-        clade_ordered_type_order = []
-        for clade in list('ABCDEFGHI'):
-            clade_ordered_type_order.extend([vat for vat in self.overall_sorted_list_of_vats if vat.clade == clade])
-        return clade_ordered_type_order
+        # The sort is stable so that the vats of each clade stay in the order of overall_sorted_list_of_vats
+        clade_to_index_dict = {clade: i for i, clade in enumerate('ABCDEFGHI')}
+        return sorted(
+            [vat for vat in self.overall_sorted_list_of_vats if vat.clade in clade_to_index_dict],
+            key=lambda vat: clade_to_index_dict[vat.clade])
 
     def _set_species_ref_dict(self):
         return {
@@ -894,7 +852,10 @@ class SequenceCountTableCreator:
 
             self.list_of_dss_objects = self._chunk_query_set_dss_objs_from_ds_objs()
 
-        self.ref_seqs_in_datasets = self._chunk_query_set_rs_objs_from_dss_objs()
+        # The DataSetSample uid, ReferenceSequence uid and abundance of every DataSetSampleSequence of the output
+        self.dsss_dss_uid_array, self.dsss_ref_seq_uid_array, self.dsss_abundance_array = \
+            self._chunk_query_seq_abundance_columns(seq_model=DataSetSampleSequence)
+        self.ref_seqs_in_datasets = self._chunk_query_rs_objs_from_rs_uids(np.unique(self.dsss_ref_seq_uid_array))
 
         self.num_proc = num_proc
 
@@ -908,12 +869,47 @@ class SequenceCountTableCreator:
         set_of_clades_found = {ref_seq.clade for ref_seq in self.ref_seqs_in_datasets}
         self.ordered_list_of_clades_found = [clade for clade in self.clade_list if clade in set_of_clades_found]
 
-    def _chunk_query_set_rs_objs_from_dss_objs(self):
-        temp_ref_seqs_in_datasets_set = set()
-        for uid_list in self.thread_safe_general.chunks(self.list_of_dss_objects):
-            temp_ref_seqs_in_datasets_set.update(
-                list(ReferenceSequence.objects.filter(datasetsamplesequence__data_set_sample_from__in=uid_list)))
-        return list(temp_ref_seqs_in_datasets_set)
+    def _chunk_query_seq_abundance_columns(self, seq_model):
+        """Return three integer arrays: the DataSetSample uid, the ReferenceSequence uid and the abundance
+        of every seq_model (DataSetSampleSequence or DataSetSampleSequencePM) object of the samples of the output.
+        The columns are pulled with chunked values_list queries so that no model instances are created.
+        The rows are grouped by sample (in the order of list_of_dss_objects), keeping the db order within a sample.
+        """
+        dss_uids = [dss.id for dss in self.list_of_dss_objects]
+        chunk_arrays = []
+        for uid_list in self.thread_safe_general.chunks(dss_uids):
+            chunk_arrays.append(np.array(list(seq_model.objects.filter(
+                data_set_sample_from_id__in=uid_list, reference_sequence_of__isnull=False).values_list(
+                'data_set_sample_from_id', 'reference_sequence_of_id', 'abundance')), dtype=np.int64).reshape(-1, 3))
+        columns = np.concatenate(chunk_arrays) if chunk_arrays else np.zeros((0, 3), dtype=np.int64)
+        dss_uid_to_sample_position_dict = {dss_uid: i for i, dss_uid in enumerate(dss_uids)}
+        sample_positions = np.fromiter(
+            (dss_uid_to_sample_position_dict[dss_uid] for dss_uid in columns[:, 0].tolist()),
+            dtype=np.int64, count=len(columns))
+        columns = columns[np.argsort(sample_positions, kind='stable')]
+        return columns[:, 0].copy(), columns[:, 1].copy(), columns[:, 2].copy()
+
+    def _split_seq_abundance_columns_by_sample(self, dss_uid_array, *arrays):
+        """Split the arrays returned by _chunk_query_seq_abundance_columns into a dict of
+        dss uid to the tuple of the arrays for that sample. Every sample of the output is given an entry."""
+        dss_uid_to_arrays_dict = {}
+        boundaries = np.flatnonzero(np.diff(dss_uid_array)) + 1
+        starts = np.concatenate(([0], boundaries)) if len(dss_uid_array) else np.zeros(0, dtype=np.int64)
+        ends = np.concatenate((boundaries, [len(dss_uid_array)])) if len(dss_uid_array) else np.zeros(0, dtype=np.int64)
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            dss_uid_to_arrays_dict[int(dss_uid_array[start])] = tuple(array[start:end] for array in arrays)
+        for dss in self.list_of_dss_objects:
+            if dss.id not in dss_uid_to_arrays_dict:
+                dss_uid_to_arrays_dict[dss.id] = tuple(array[0:0] for array in arrays)
+        return dss_uid_to_arrays_dict
+
+    def _chunk_query_rs_objs_from_rs_uids(self, ref_seq_uids):
+        """The ReferenceSequence objects of the given uids ordered by uid"""
+        temp_ref_seqs = []
+        for uid_list in self.thread_safe_general.chunks(np.asarray(ref_seq_uids).tolist()):
+            temp_ref_seqs.extend(list(ReferenceSequence.objects.filter(id__in=uid_list)))
+        temp_ref_seqs.sort(key=lambda ref_seq: ref_seq.id)
+        return temp_ref_seqs
 
     def _chunk_query_set_dss_objs_from_ds_objs(self):
         temp_list_of_dss_objects = []
@@ -961,10 +957,13 @@ class SequenceCountTableCreator:
 
     def _init_seq_abundance_collection_objects(self):
         """Output objects from first worker to be used by second worker"""
-        self.dss_id_to_list_of_dsss_objects_dict_mp_dict = None
-        self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict = None
-        self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict = None
-        # this is the list that we will use the self.annotated_dss_name_to_cummulative_rel_abund_mp_dict to create
+        # The output names of the ReferenceSequences. The seq indices below are indices into this list.
+        self.ref_seq_names_clade_annotated = None
+        # dss.id : (array of the seq indices found in the sample, array of their absolute abundances)
+        self.dss_id_to_seq_index_and_abs_abund_arrays_dict = None
+        # dss.id : array of the total absolute abundance of the no name seqs of each clade (in order ABCDEFGHI)
+        self.dss_id_to_noname_clade_summary_abs_abund_array_dict = None
+        # this is the list that we will use the cumulative relative abundances of the sequences to create
         # it is a list of the ref_seqs_ordered first by clade then by abundance.
         self.clade_abundance_ordered_ref_seq_list = []
 
@@ -1092,6 +1091,7 @@ class SequenceCountTableCreator:
         db.connections.close_all()
         
 
+    @profile_stage()
     def make_seq_output_tables(self):
         self._make_output_tables_post_med()
         if not self.no_pre_med_seqs:
@@ -1288,17 +1288,16 @@ class SequenceCountTableCreator:
 
     def _make_post_med_rect_array(self, index_of_first_seq):
         # now we need to create the rectangle array
-        post_med_rect_dict = {sample_uid: [] for sample_uid in self.df_abs_no_meta_rows.index.values.tolist()}
         # The sequences in the output df are ordered by clade and then abundance. We need to provide the
         # y_abs and y_rel properties of the rect objects in order of the most abundant sequences first.
         # We want this order to be independent of clade so we need to do a sorting.
-        abundance_dict = {}
-        for col in list(self.df_abs_no_meta_rows)[index_of_first_seq:]:
-            abundance_dict[col] = sum(self.df_abs_no_meta_rows[col])
+        seq_names = list(self.df_abs_no_meta_rows)[index_of_first_seq:]
+        seq_abundances = np.asarray(
+            self.df_abs_no_meta_rows.iloc[:, index_of_first_seq:].to_numpy(), dtype=np.int64).sum(axis=0)
         # get the names of the sequences sorted according to their totalled abundance
-        sorted_sorted_seq_names = list(abundance_dict.items())
-        sorted_sorted_seq_names.sort(key=lambda x: x[0], reverse=True)
-        sorted_sorted_seq_names.sort(key=lambda x: x[1], reverse=True)
+        # (ties are broken by the sequence name, both in descending order)
+        sorted_sorted_seq_names = sorted(
+            zip(seq_names, seq_abundances.tolist()), key=lambda x: (x[1], x[0]), reverse=True)
         sorted_seq_names = [x[0] for x in sorted_sorted_seq_names]
         # The col_dict output happens before the plotting where the col dict is
         # created so we will have to create the col
@@ -1308,44 +1307,49 @@ class SequenceCountTableCreator:
         with open(os.path.join(self.html_dir, 'color_dict_post_med.json'), 'w') as f:
             json.dump(fp=f, obj=seq_colour_dict)
 
-        max_cumulative_abs = self._populate_post_med_rect_dict(post_med_rect_dict, sorted_seq_names)
-        # now we have the dictionary that holds the rectangle arrays populated
-        # and we have the maximum abundance
+        abs_matrix, rel_matrix, cumulative_abs_matrix, cumulative_rel_matrix = self._make_cumulative_rect_matrices(
+            abs_df=self.df_abs_no_meta_rows, rel_df=self.df_rel_no_meta_rows, sorted_seq_names=sorted_seq_names)
+        max_cumulative_abs = int(cumulative_abs_matrix[:, -1].max()) if cumulative_abs_matrix.size else 0
         # now write these out as js file and functions to return.
+        # The rectangle arrays are streamed out sample by sample rather than held in memory as a single dict.
         js_file_path = os.path.join(self.html_dir, 'study_data.js')
+        self.thread_safe_general.write_out_js_function_to_return_streamed_js_obj(
+            function_name='getRectDataPostMEDBySample',
+            key_value_iterable=self._iter_sample_rect_arrays(
+                sample_uids=self.df_abs_no_meta_rows.index.values.tolist(), sorted_seq_names=sorted_seq_names,
+                abs_matrix=abs_matrix, rel_matrix=rel_matrix, cumulative_abs_matrix=cumulative_abs_matrix,
+                cumulative_rel_matrix=cumulative_rel_matrix),
+            js_outpath=js_file_path)
         self.thread_safe_general.write_out_js_file_to_return_python_objs_as_js_objs(
-            [{'function_name': 'getRectDataPostMEDBySample', 'python_obj': post_med_rect_dict},
-             {'function_name': 'getRectDataPostMEDBySampleMaxSeq', 'python_obj': max_cumulative_abs},
+            [{'function_name': 'getRectDataPostMEDBySampleMaxSeq', 'python_obj': max_cumulative_abs},
              {'function_name': 'getSeqColorPostMED', 'python_obj': seq_colour_dict}],
             js_outpath=js_file_path)
 
-    def _populate_post_med_rect_dict(self, post_med_rect_dict, sorted_seq_names):
-        max_cumulative_abs = 0
-        for sample_uid in self.df_abs_no_meta_rows.index:
-            new_rect_list = []
-            abs_series = self.df_abs_no_meta_rows.loc[sample_uid]
-            rel_series = self.df_rel_no_meta_rows.loc[sample_uid]
-            cumulative_count_abs = 0
-            cumulative_count_rel = 0
-
-            for seq in sorted_seq_names:
-                seq_abund_abs = abs_series.at[seq]
-                seq_abund_rel = rel_series.at[seq]
-                if seq_abund_abs:
-                    cumulative_count_abs += int(seq_abund_abs)
-                    cumulative_count_rel += float(seq_abund_rel)
-                    new_rect_list.append({
-                        "seq_name": seq,
-                        "y_abs": cumulative_count_abs,
-                        "y_rel": f'{cumulative_count_rel:.3f}',
-                        "height_rel": f'{float(seq_abund_rel):.3f}',
-                        "height_abs": int(seq_abund_abs),
-                    })
+    @staticmethod
+    def _make_cumulative_rect_matrices(abs_df, rel_df, sorted_seq_names):
+        """Return the absolute and relative abundance matrices (samples x sequences) with the sequence columns
+        in sorted_seq_names order, along with their row-wise cumulative sums. The cumulative sums
+        are the y_abs and y_rel values of the stacked rectangles of each of the samples.
+        Relative abundances are only counted where the absolute abundance is non-zero."""
+        abs_matrix = np.asarray(abs_df.loc[:, sorted_seq_names].to_numpy(), dtype=np.int64)
+        rel_matrix = np.asarray(rel_df.loc[:, sorted_seq_names].to_numpy(), dtype=np.float64)
+        rel_matrix = np.where(abs_matrix != 0, rel_matrix, 0.0)
+        return abs_matrix, rel_matrix, np.cumsum(abs_matrix, axis=1), np.cumsum(rel_matrix, axis=1)
 
-            post_med_rect_dict[sample_uid] = new_rect_list
-            if cumulative_count_abs > max_cumulative_abs:
-                max_cumulative_abs = cumulative_count_abs
-        return max_cumulative_abs
+    @staticmethod
+    def _iter_sample_rect_arrays(
+            sample_uids, sorted_seq_names, abs_matrix, rel_matrix, cumulative_abs_matrix, cumulative_rel_matrix):
+        """Yield the sample uid and rectangle array of each sample in turn. Only the sequences that
+        are found in a sample have a rectangle."""
+        for i, sample_uid in enumerate(sample_uids):
+            non_zero_indices = np.flatnonzero(abs_matrix[i]).tolist()
+            yield sample_uid, [{
+                "seq_name": sorted_seq_names[j],
+                "y_abs": int(cumulative_abs_matrix[i, j]),
+                "y_rel": f'{cumulative_rel_matrix[i, j]:.3f}',
+                "height_rel": f'{rel_matrix[i, j]:.3f}',
+                "height_abs": int(abs_matrix[i, j]),
+            } for j in non_zero_indices]
 
     def _populate_sample_meta_info_dict(self):
         # first lets produce the meta information.
@@ -1476,11 +1480,8 @@ class SequenceCountTableCreator:
     def _add_uids_for_seqs_to_dfs(self):
         """Now add the UID for each of the sequences"""
         sys.stdout.write('\nGenerating accession and fasta\n')
-        reference_sequences_in_data_sets_no_name = self._chunk_query_rs_objs_no_name_from_dss_objs()
-        reference_sequences_in_data_sets_has_name = self._chunk_query_rs_objs_with_name_from_dss_objs()
-
-        no_name_dict = {rs.id: rs.sequence for rs in reference_sequences_in_data_sets_no_name}
-        has_name_dict = {rs.name: (rs.id, rs.sequence) for rs in reference_sequences_in_data_sets_has_name}
+        no_name_dict = {rs.id: rs.sequence for rs in self.ref_seqs_in_datasets if not rs.has_name}
+        has_name_dict = {rs.name: (rs.id, rs.sequence) for rs in self.ref_seqs_in_datasets if rs.has_name}
         accession_list = []
         num_cols = len(list(self.output_df_relative_post_med))
         for i, col_name in enumerate(list(self.output_df_relative_post_med)):
@@ -1502,24 +1503,6 @@ class SequenceCountTableCreator:
         self.output_df_absolute_post_med = self.output_df_absolute_post_med.append(temp_series)
         self.output_df_relative_post_med = self.output_df_relative_post_med.append(temp_series)
 
-    def _chunk_query_rs_objs_with_name_from_dss_objs(self):
-        reference_sequences_in_data_sets_no_name_set = set()
-        for uid_list in self.thread_safe_general.chunks(self.list_of_dss_objects):
-            reference_sequences_in_data_sets_no_name_set.update(list(
-                ReferenceSequence.objects.filter(datasetsamplesequence__data_set_sample_from__in=uid_list,
-                                                 has_name=True)))
-        reference_sequences_in_data_sets_no_name = list(reference_sequences_in_data_sets_no_name_set)
-        return reference_sequences_in_data_sets_no_name
-
-    def _chunk_query_rs_objs_no_name_from_dss_objs(self):
-        reference_sequences_in_data_sets_no_name_set = set()
-        for uid_list in self.thread_safe_general.chunks(self.list_of_dss_objects):
-            reference_sequences_in_data_sets_no_name_set.update(list(
-                ReferenceSequence.objects.filter(datasetsamplesequence__data_set_sample_from__in=uid_list,
-                                                 has_name=False)))
-        reference_sequences_in_data_sets_no_name = list(reference_sequences_in_data_sets_no_name_set)
-        return reference_sequences_in_data_sets_no_name
-
     def _create_ordered_output_dfs_from_series(self):
         """Put together the pandas series that hold sequences abundance outputs for each sample in order of the samples
         either according to a predefined ordered list or by an order that will be generated below.
@@ -1567,84 +1550,9 @@ class SequenceCountTableCreator:
         return output_df_relative
 
     def _get_sample_order_from_rel_seq_abund_df(self, sequence_only_df_relative):
-
-        max_seq_ddict, no_maj_samps, seq_to_samp_ddict = self._generate_most_abundant_sequence_dictionaries(
-            sequence_only_df_relative)
-
-        return self._generate_ordered_sample_list_from_most_abund_seq_dicts(max_seq_ddict, no_maj_samps,
-                                                                            seq_to_samp_ddict)
-
-    @staticmethod
-    def _generate_ordered_sample_list_from_most_abund_seq_dicts(max_seq_ddict, no_maj_samps, seq_to_samp_ddict):
-        # then once we have compelted this for all sequences go clade by clade
-        # and generate the sample order
-        ordered_sample_list_by_uid = []
-        sys.stdout.write('\nGoing clade by clade sorting by abundance\n')
-        for clade in list('ABCDEFGHI'):
-            sys.stdout.write(f'\rGetting clade {clade} seqs')
-            tup_list_of_clade = []
-            # get the clade specific list of the max_seq_ddict
-            for k, v in max_seq_ddict.items():
-                sys.stdout.write('\r{}'.format(k))
-                if k.startswith(clade) or k[-2:] == '_{}'.format(clade):
-                    tup_list_of_clade.append((k, v))
-
-            if not tup_list_of_clade:
-                continue
-            # now get an ordered list of the sequences for this clade
-            sys.stdout.write('\rOrdering clade {} seqs'.format(clade))
-            tup_list_of_clade.sort(key=lambda x: x[0], reverse=True)
-            tup_list_of_clade.sort(key=lambda x: x[1], reverse=True)
-            ordered_sequence_of_clade_list = [x[0] for x in tup_list_of_clade]
-
-            for seq_to_order_samples_by in ordered_sequence_of_clade_list:
-                sys.stdout.write('\r{}'.format(seq_to_order_samples_by))
-                tup_list_of_samples_that_had_sequence_as_most_abund = seq_to_samp_ddict[seq_to_order_samples_by]
-                tup_list_of_samples_that_had_sequence_as_most_abund.sort(key=lambda x: x[0], reverse=True)
-                tup_list_of_samples_that_had_sequence_as_most_abund.sort(key=lambda x: x[1], reverse=True)
-                ordered_list_of_samples_for_seq_ordered = \
-                    [x[0] for x in
-                     tup_list_of_samples_that_had_sequence_as_most_abund]
-                ordered_sample_list_by_uid.extend(ordered_list_of_samples_for_seq_ordered)
-        # finally add in the samples that didn't have a maj sequence
-        no_maj_samps.sort(reverse=True)
-        ordered_sample_list_by_uid.extend(no_maj_samps)
-        return ordered_sample_list_by_uid
-
-    def _generate_most_abundant_sequence_dictionaries(self, sequence_only_df_relative):
-        # {sequence_name_found_to_be_most_abund_in_sample: num_samples_it_was_found_to_be_most_abund_in}
-        max_seq_ddict = defaultdict(int)
-        # {most_abundant_seq_name: [(dss.id, rel_abund_of_most_abund_seq) for samples with that seq as most abund]}
-        seq_to_samp_ddict = defaultdict(list)
-        # a list to hold the names of samples in which there was no most abundant sequence identified
-        no_maj_samps = []
-        for sample_to_sort_uid in sequence_only_df_relative.index.values.tolist():
-            sys.stdout.write(f'\r{sample_to_sort_uid}: Getting maj seq for sample')
-            sample_series_as_float = self._get_sample_seq_abund_info_as_pd_series_float_type(
-                sample_to_sort_uid, sequence_only_df_relative)
-            max_rel_abund = self._get_rel_abund_of_most_abund_seq(sample_series_as_float)
-            if not max_rel_abund > 0:
-                no_maj_samps.append(sample_to_sort_uid)
-            else:
-                max_abund_seq = self._get_name_of_most_abundant_seq(sample_series_as_float)
-                # add a tup of sample name and rel abund of seq to the seq_to_samp_dict
-                seq_to_samp_ddict[max_abund_seq].append((sample_to_sort_uid, max_rel_abund))
-                # add this to the ddict count
-                max_seq_ddict[max_abund_seq] += 1
-        return max_seq_ddict, no_maj_samps, seq_to_samp_ddict
-
-    @staticmethod
-    def _get_sample_seq_abund_info_as_pd_series_float_type(sample_to_sort_uid, sequence_only_df_relative):
-        return sequence_only_df_relative.loc[sample_to_sort_uid].astype('float')
-
-    @staticmethod
-    def _get_rel_abund_of_most_abund_seq(sample_series_as_float):
-        return sample_series_as_float.max()
-
-    @staticmethod
-    def _get_name_of_most_abundant_seq(sample_series_as_float):
-        max_abund_seq = sample_series_as_float.idxmax()
-        return max_abund_seq
+        sys.stdout.write('\nOrdering samples clade by clade by their most abundant sequence\n')
+        return self.thread_safe_general.order_samples_by_most_abundant_seq(
+            sequence_only_df_relative, group_seqs_by_clade=True, descending_tie_break=True)
 
     def _create_ordered_output_dfs_from_series_with_sorted_sample_list(self):
         # NB I was originally performing the concat directly on the managedSampleOutputDict (i.e. the mp dict)
@@ -1686,25 +1594,22 @@ class SequenceCountTableCreator:
         seq_count_table_output_series_generator_handler = SeqOutputSeriesGeneratorHandler(parent=self)
         seq_count_table_output_series_generator_handler.execute_sequence_count_table_dataframe_contructor_handler()
         self.dss_id_to_pandas_series_results_list_dict = \
-            dict(seq_count_table_output_series_generator_handler.dss_id_to_pandas_series_results_list_mp_dict)
+            seq_count_table_output_series_generator_handler.dss_id_to_pandas_series_results_list_dict
 
     def _collect_abundances_for_creating_the_output(self):
         seq_collection_handler = SequenceCountTableCollectAbundanceHandler(parent_seq_count_tab_creator=self)
-        seq_collection_handler.execute_sequence_count_table_ordered_seqs_worker()
-        # update the dictionaries that will be used in the second worker from the first worker
-        self.update_dicts_for_the_second_worker_from_first_worker(seq_collection_handler)
+        seq_collection_handler.execute_sequence_count_table_ordered_seqs_collection()
+        # update the dictionaries that will be used by the SeqOutputSeriesGeneratorHandler
+        self._update_dicts_from_seq_collection_handler(seq_collection_handler)
 
-    def update_dicts_for_the_second_worker_from_first_worker(self, seq_collection_handler):
-        self.dss_id_to_list_of_dsss_objects_dict_mp_dict = \
-            seq_collection_handler.dss_id_to_list_of_dsss_objects_mp_dict
+    def _update_dicts_from_seq_collection_handler(self, seq_collection_handler):
+        self.ref_seq_names_clade_annotated = seq_collection_handler.ref_seq_names_clade_annotated
 
-        self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict = \
-            seq_collection_handler.\
-                dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict
+        self.dss_id_to_seq_index_and_abs_abund_arrays_dict = \
+            seq_collection_handler.dss_id_to_seq_index_and_abs_abund_arrays_dict
 
-        self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict = \
-            seq_collection_handler.\
-                dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict
+        self.dss_id_to_noname_clade_summary_abs_abund_array_dict = \
+            seq_collection_handler.dss_id_to_noname_clade_summary_abs_abund_array_dict
 
         self.clade_abundance_ordered_ref_seq_list = \
             seq_collection_handler.clade_abundance_ordered_ref_seq_list
@@ -1774,11 +1679,6 @@ class SequenceCountTableCreator:
             self._make_pre_med_rect_array()
 
         def _make_pre_med_rect_array(self):
-            # now we need to create the rectangle array
-            pre_med_rect_dict = {sample_uid: [] for sample_uid in
-                                  self.abs_count_df.index.values.tolist()}
-
-
             # get the names of the sequences sorted according to their totalled abundance
             # NB these are already sorted purely by abundance in the premed df
             sorted_seq_names = list(self.abs_count_df)[1:]
@@ -1792,54 +1692,30 @@ class SequenceCountTableCreator:
             # merge the two colour dictionaries and add to the html output
             combi_color_dict = {**c_dict_post_med, **seq_colour_dict}
 
-            max_cumulative_abs = self._populate_pre_med_rect_dict(
-                pre_med_rect_dict, seq_colour_dict, sorted_seq_names)
-            # now we have the dictionary that holds the rectangle arrays populated
-            # and we have the maximum abundance
+            # The largest total abundance of a sample. The per sample rectangle matrices are not needed
+            # as the rectangle data is not output (see below).
+            max_cumulative_abs = int(self.abs_count_df[sorted_seq_names].sum(axis=1).max()) \
+                if len(self.abs_count_df.index) else 0
             # now write these out as js file and functions to return.
             js_file_path = os.path.join(self.html_dir, 'study_data.js')
-            # For the time being we are going to no longer output the pre_med_rect_dict data
+            # For the time being we are going to no longer output the pre_med rectangle data
             # as it very slow to render online using d3 and takes up a huge amount of space.
             # However, if we want to reimpleent its output in the future we can simply uncomment the below
-            # general.write_out_js_file_to_return_python_objs_as_js_objs(
-            #     [{'function_name': 'getRectDataPreMEDBySample', 'python_obj': pre_med_rect_dict},
-            #      {'function_name': 'getRectDataPreMEDBySampleMaxSeq', 'python_obj': max_cumulative_abs},
-            #      {'function_name': 'getSeqColor', 'python_obj': combi_color_dict}],
+            # abs_matrix, rel_matrix, cumulative_abs_matrix, cumulative_rel_matrix = \
+            #     self.parent._make_cumulative_rect_matrices(
+            #         abs_df=self.abs_count_df, rel_df=self.rel_count_df, sorted_seq_names=sorted_seq_names)
+            # self.parent.thread_safe_general.write_out_js_function_to_return_streamed_js_obj(
+            #     function_name='getRectDataPreMEDBySample',
+            #     key_value_iterable=self.parent._iter_sample_rect_arrays(
+            #         sample_uids=self.abs_count_df.index.values.tolist(), sorted_seq_names=sorted_seq_names,
+            #         abs_matrix=abs_matrix, rel_matrix=rel_matrix, cumulative_abs_matrix=cumulative_abs_matrix,
+            #         cumulative_rel_matrix=cumulative_rel_matrix),
             #     js_outpath=js_file_path)
             self.parent.thread_safe_general.write_out_js_file_to_return_python_objs_as_js_objs(
                 [{'function_name': 'getRectDataPreMEDBySampleMaxSeq', 'python_obj': max_cumulative_abs},
                  {'function_name': 'getSeqColor', 'python_obj': combi_color_dict}],
                 js_outpath=js_file_path)
 
-        def _populate_pre_med_rect_dict(self, post_med_rect_dict, seq_colour_dict,
-                                         sorted_seq_names):
-            max_cumulative_abs = 0
-            for sample_uid in self.abs_count_df.index:
-                new_rect_list = []
-                abs_series = self.abs_count_df.loc[sample_uid]
-                rel_series = self.rel_count_df.loc[sample_uid]
-                cumulative_count_abs = 0
-                cumulative_count_rel = 0
-
-                for seq in sorted_seq_names:
-                    seq_abund_abs = abs_series.at[seq]
-                    seq_abund_rel = rel_series.at[seq]
-                    if seq_abund_abs:
-                        cumulative_count_abs += int(seq_abund_abs)
-                        cumulative_count_rel += float(seq_abund_rel)
-                        new_rect_list.append({
-                            "seq_name": seq,
-                            "y_abs": cumulative_count_abs,
-                            "y_rel": f'{cumulative_count_rel:.3f}',
-                            "height_rel": f'{float(seq_abund_rel):.3f}',
-                            "height_abs": int(seq_abund_abs),
-                        })
-
-                post_med_rect_dict[sample_uid] = new_rect_list
-                if cumulative_count_abs > max_cumulative_abs:
-                    max_cumulative_abs = cumulative_count_abs
-            return max_cumulative_abs
-
         def _output_pre_med_master_fasta(self):
 
             fasta_out = []
@@ -1897,14 +1773,22 @@ class SequenceCountTableCreator:
             This will be used to make the master fasta that will represent every sequence in the pre-med sequence
             collection."""
             print('\nCounting pre-MED sequences in DataSetSamples')
+            # The DataSetSampleSequencePM abundances are pulled in bulk as integer columns
+            dsspm_dss_uid_array, dsspm_ref_seq_uid_array, dsspm_abundance_array = \
+                self.parent._chunk_query_seq_abundance_columns(seq_model=DataSetSampleSequencePM)
+            ref_seq_uid_to_ref_seq_dict = {
+                ref_seq.id: ref_seq for ref_seq in
+                self.parent._chunk_query_rs_objs_from_rs_uids(np.unique(dsspm_ref_seq_uid_array))}
+            dss_uid_to_dsspm_arrays_dict = self.parent._split_seq_abundance_columns_by_sample(
+                dsspm_dss_uid_array, dsspm_ref_seq_uid_array, dsspm_abundance_array)
+            dss_uid_to_num_dsss_dict = Counter(self.parent.dsss_dss_uid_array.tolist())
             count = 0
             num_samples = len(self.parent.list_of_dss_objects)
             for dss_obj in self.parent.list_of_dss_objects:
                 count += 1
                 sys.stdout.write(f'\rcounting pre-MED sequences for {dss_obj.name}: {count} out of {num_samples} samples')
                 self.sample_uid_to_name_dict[dss_obj.id] = dss_obj.name
-                dsspm_objs_of_sample = DataSetSampleSequencePM.objects.filter(data_set_sample_from=dss_obj)
-                dss_objs_of_sample = DataSetSampleSequence.objects.filter(data_set_sample_from=dss_obj)
+                ref_seq_uids_of_sample, abundances_of_sample = dss_uid_to_dsspm_arrays_dict[dss_obj.id]
                 # Check to see that there are DataSetSampleSequencePM associated with the sample
                 # If there are no sequenecs associated with the sample, then we will assume that
                 # DataSetSampleSequencePM objects were not generated during the loading of this dataset
@@ -1912,124 +1796,98 @@ class SequenceCountTableCreator:
                 # of this output.
                 # Also check that there are data set sample sequences. Else there could be no DataSetSamplePM objects
                 # due to the fact that there were no symbiodiniaceae sequences in this sample.
-                if len(dsspm_objs_of_sample) < 1 and len(dss_objs_of_sample) > 1:
+                if len(ref_seq_uids_of_sample) < 1 and dss_uid_to_num_dsss_dict[dss_obj.id] > 1:
                     raise NoDataSetSampleSequencePMObjects(f'No DataSetSampleSequence objects found')
                 # total_seqs = dss_obj.non_sym_absolute_num_seqs
                 sample_temp_abundance_dict = {}
-                for dsspm_obj in dsspm_objs_of_sample:
-                    if str(dsspm_obj.reference_sequence_of) not in self.master_fasta_dict:
-                        self.master_fasta_dict[str(dsspm_obj.reference_sequence_of)] = dsspm_obj.reference_sequence_of.sequence
-                    sample_temp_abundance_dict[str(dsspm_obj.reference_sequence_of)] = dsspm_obj.abundance
-                    self.master_sequence_count_dict[str(dsspm_obj.reference_sequence_of)] += dsspm_obj.abundance / dss_obj.absolute_num_sym_seqs
+                for ref_seq_uid, abundance in zip(ref_seq_uids_of_sample.tolist(), abundances_of_sample.tolist()):
+                    ref_seq = ref_seq_uid_to_ref_seq_dict[ref_seq_uid]
+                    ref_seq_name = str(ref_seq)
+                    if ref_seq_name not in self.master_fasta_dict:
+                        self.master_fasta_dict[ref_seq_name] = ref_seq.sequence
+                    sample_temp_abundance_dict[ref_seq_name] = abundance
+                    self.master_sequence_count_dict[ref_seq_name] += abundance / dss_obj.absolute_num_sym_seqs
                 self.master_sample_uid_to_abund_dict[dss_obj.id] = sample_temp_abundance_dict
             print('\nPre-MED sequence counting complete')
 
 
 class SequenceCountTableCollectAbundanceHandler:
-    """The purpose of this handler and the associated worker is to populate three dictionaries that will be used
-    in making the count table output.
-    1 - dict(ref_seq_name : cumulative relative abundance for each sequence across all samples)
-    2 - sample_id : list(
-                         dict(ref_seq_of_sample_name:absolute_abundance_of_dsss_in_sample),
-                         dict(ref_seq_of_sample_name:relative_abundance_of_dsss_in_sample)
-                         )
-    3 - sample_id : list(
-                         dict(clade:total_abund_of_no_name_seqs_of_clade_in_q_),
-                         dict(clade:relative_abund_of_no_name_seqs_of_clade_in_q_)
-                         )
+    """The purpose of this handler is to collect the sequence abundances of each of the
+    samples that will be used in making the count table output.
+    The abundances are taken from the columnar (dss uid, ref_seq uid, abundance) arrays that the count table creator
+    pulls from the db in bulk. Each sequence is represented by its seq index (its index in
+    ref_seq_names_clade_annotated) and the following are populated with vectorised reductions:
+    1 - array of the cumulative relative abundance for each sequence across all samples
+    2 - sample_id : (array of seq indices, array of absolute abundances)
+    3 - sample_id : array of the total absolute abundance of the no name seqs of each clade (in order ABCDEFGHI)
     Abbreviations:
     ds = DataSet
     dss = DataSetSample
     dsss = DataSetSampleSequence
     ref_seq = ReferenceSeqeunce
-    The end product of this method will be returned to the count table creator. The first dict will be used to create a
+    The end product of this method will be returned to the count table creator. The first array will be used to create a
     list of the ReferenceSequence objects of this output ordered first by clade and then by cumulative relative
     abundance across all samples in the output.
     """
     def __init__(self, parent_seq_count_tab_creator):
         self.seq_count_table_creator = parent_seq_count_tab_creator
-        if self.seq_count_table_creator.multiprocess:
-            self.mp_manager = Manager()
-            self.input_dss_mp_queue = mp_Queue()
-            self._populate_input_dss_mp_queue()
-            self.ref_seq_names_clade_annotated = [
-                ref_seq.name if ref_seq.has_name else str(ref_seq) for
-                ref_seq in self.seq_count_table_creator.ref_seqs_in_datasets]
-            self.dss_id_to_list_of_dsss_objects_mp_dict = self.mp_manager.dict()
-            self._populate_dss_id_to_list_of_dsss_objects()
-            self.annotated_dss_name_to_cummulative_rel_abund_mp_dict = self.mp_manager.dict(
-            {refSeq_name: 0 for refSeq_name in self.ref_seq_names_clade_annotated})
-            self.lock = mp_Lock()
-            self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict = self.mp_manager.dict()
-            self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict = self.mp_manager.dict()
-        else:
-            self.input_dss_mp_queue = mt_Queue()
-            self._populate_input_dss_mp_queue()
-            self.ref_seq_names_clade_annotated = [
-                ref_seq.name if ref_seq.has_name else str(ref_seq) for
-                ref_seq in self.seq_count_table_creator.ref_seqs_in_datasets]
-            self.dss_id_to_list_of_dsss_objects_mp_dict = {}
-            self._populate_dss_id_to_list_of_dsss_objects()
-            self.annotated_dss_name_to_cummulative_rel_abund_mp_dict = {refSeq_name: 0 for refSeq_name in self.ref_seq_names_clade_annotated}
-            self.lock = mt_Lock()
-            self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict = {}
-            self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict = {}
-
-        # this is the list that we will use the self.annotated_dss_name_to_cummulative_rel_abund_mp_dict to create
+        self.ref_seq_names_clade_annotated = [
+            ref_seq.name if ref_seq.has_name else str(ref_seq) for
+            ref_seq in self.seq_count_table_creator.ref_seqs_in_datasets]
+        # The uids of the ReferenceSequences in seq index order (ref_seqs_in_datasets is ordered by uid)
+        self.ref_seq_uid_array = np.array(
+            [ref_seq.id for ref_seq in self.seq_count_table_creator.ref_seqs_in_datasets], dtype=np.int64)
+        # The clade index (0-8 for A-I) of each seq index. Named seqs are given the index 9 so that they
+        # are excluded from the no name clade summaries
+        self.noname_clade_index_array = np.array(
+            [9 if ref_seq.has_name else 'ABCDEFGHI'.index(ref_seq.clade) for
+             ref_seq in self.seq_count_table_creator.ref_seqs_in_datasets], dtype=np.int64)
+        self.cumulative_rel_abund_array = np.zeros(len(self.ref_seq_names_clade_annotated), dtype=float)
+        self.dss_id_to_seq_index_and_abs_abund_arrays_dict = {}
+        self.dss_id_to_noname_clade_summary_abs_abund_array_dict = {}
+
+        # this is the list that we will use the self.cumulative_rel_abund_array to create
         # it is a list of the ref_seqs_ordered first by clade then by abundance.
         self.clade_abundance_ordered_ref_seq_list = []
 
-    def execute_sequence_count_table_ordered_seqs_worker(self):
-        all_processes = []
-        
-        # close all connections to the db so that they are automatically recreated for each process
-        # http://stackoverflow.com/questions/8242837/django-multiprocessing-and-database-connections
-        db.connections.close_all()
-        for n in range(self.seq_count_table_creator.num_proc):
-            if self.seq_count_table_creator.multiprocess:
-                p = Process(target=self._sequence_count_table_ordered_seqs_worker, args=(
-                    self.input_dss_mp_queue, 
-                    self.dss_id_to_list_of_dsss_objects_mp_dict, 
-                    self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict, 
-                    self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict,
-                    self.annotated_dss_name_to_cummulative_rel_abund_mp_dict, self.ref_seq_names_clade_annotated, self.lock))
-            else:
-                p = Thread(target=self._sequence_count_table_ordered_seqs_worker, args=(
-                    self.input_dss_mp_queue, 
-                    self.dss_id_to_list_of_dsss_objects_mp_dict, 
-                    self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict, 
-                    self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict,
-                    self.annotated_dss_name_to_cummulative_rel_abund_mp_dict, self.ref_seq_names_clade_annotated, self.lock))
-            all_processes.append(p)
-            p.start()
-
-        for p in all_processes:
-            p.join()
+    @profile_stage()
+    def execute_sequence_count_table_ordered_seqs_collection(self):
+        sys.stdout.write('\nCollecting seq abundances\n')
+        list_of_dss_objects = self.seq_count_table_creator.list_of_dss_objects
+        dss_uid_array = self.seq_count_table_creator.dsss_dss_uid_array
+        abs_abund_array = self.seq_count_table_creator.dsss_abundance_array
+        seq_index_array = np.searchsorted(self.ref_seq_uid_array, self.seq_count_table_creator.dsss_ref_seq_uid_array)
+
+        # The position of the sample of each dsss in list_of_dss_objects
+        dss_uid_to_sample_position_dict = {dss.id: i for i, dss in enumerate(list_of_dss_objects)}
+        sample_position_array = np.fromiter(
+            (dss_uid_to_sample_position_dict[dss_uid] for dss_uid in dss_uid_array.tolist()),
+            dtype=np.int64, count=len(dss_uid_array))
+        sample_total_abund_array = np.array(
+            [sum([int(a) for a in json.loads(dss.cladal_seq_totals)]) for dss in list_of_dss_objects], dtype=float)
+
+        if len(seq_index_array):
+            self.cumulative_rel_abund_array = np.bincount(
+                seq_index_array, weights=abs_abund_array / sample_total_abund_array[sample_position_array],
+                minlength=len(self.ref_seq_names_clade_annotated))
+
+        noname_clade_summary_matrix = np.bincount(
+            sample_position_array * 10 + self.noname_clade_index_array[seq_index_array], weights=abs_abund_array,
+            minlength=len(list_of_dss_objects) * 10).reshape(-1, 10)[:, :9].astype(np.int64)
+
+        self.dss_id_to_seq_index_and_abs_abund_arrays_dict = self.seq_count_table_creator.\
+            _split_seq_abundance_columns_by_sample(dss_uid_array, seq_index_array, abs_abund_array)
+        for i, dss in enumerate(list_of_dss_objects):
+            self.dss_id_to_noname_clade_summary_abs_abund_array_dict[dss.id] = noname_clade_summary_matrix[i]
 
         self._generate_clade_abundance_ordered_ref_seq_list_from_seq_name_abund_dict()
 
-    @staticmethod
-    def _sequence_count_table_ordered_seqs_worker(
-        in_q, 
-        dss_id_to_list_of_dsss_objects_mp_dict, 
-        dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict, 
-        dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict, 
-        annotated_dss_name_to_cummulative_rel_abund_mp_dict, ref_seq_names_clade_annotated, lock):
-        for dss in iter(in_q.get, 'STOP'):
-            sys.stdout.write(f'\r{dss.name}: collecting seq abundances')
-            sequence_count_table_ordered_seqs_worker_instance = SequenceCountTableCollectAbundanceWorker(
-                dss_id_to_list_of_dsss_objects_mp_dict=dss_id_to_list_of_dsss_objects_mp_dict,
-                dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict=dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict,
-                dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict=dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict,
-                annotated_dss_name_to_cummulative_rel_abund_mp_dict=annotated_dss_name_to_cummulative_rel_abund_mp_dict, 
-                ref_seq_names_clade_annotated=ref_seq_names_clade_annotated,
-                dss=dss, lock=lock)
-            sequence_count_table_ordered_seqs_worker_instance.start_seq_abund_collection()
-    
     def _generate_clade_abundance_ordered_ref_seq_list_from_seq_name_abund_dict(self):
+        seq_name_to_cumulative_rel_abund_dict = dict(
+            zip(self.ref_seq_names_clade_annotated, self.cumulative_rel_abund_array.tolist()))
         for i in range(len(self.seq_count_table_creator.ordered_list_of_clades_found)):
             temp_within_clade_list_for_sorting = []
-            for seq_name, abund_val in self.annotated_dss_name_to_cummulative_rel_abund_mp_dict.items():
+            for seq_name, abund_val in seq_name_to_cumulative_rel_abund_dict.items():
                 if seq_name.startswith(
                         self.seq_count_table_creator.ordered_list_of_clades_found[i]) or seq_name[-2:] == \
                         f'_{self.seq_count_table_creator.ordered_list_of_clades_found[i]}':
@@ -2045,117 +1903,27 @@ class SequenceCountTableCollectAbundanceHandler:
             sorted_within_clade = [a[0] for a in temp_within_clade_list_for_sorting]
             self.clade_abundance_ordered_ref_seq_list.extend(sorted_within_clade)
 
-    def _populate_input_dss_mp_queue(self):
-        for dss in self.seq_count_table_creator.list_of_dss_objects:
-            self.input_dss_mp_queue.put(dss)
-
-        for N in range(self.seq_count_table_creator.num_proc):
-            self.input_dss_mp_queue.put('STOP')
-
-    def _populate_dss_id_to_list_of_dsss_objects(self):
-        for dss in self.seq_count_table_creator.list_of_dss_objects:
-            sys.stdout.write(f'\r{dss.name}')
-            self.dss_id_to_list_of_dsss_objects_mp_dict[dss.id] = list(
-                DataSetSampleSequence.objects.filter(data_set_sample_from=dss))
-
-
-class SequenceCountTableCollectAbundanceWorker:
-    def __init__(
-        self,
-        dss_id_to_list_of_dsss_objects_mp_dict, 
-        dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict, 
-        dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict, 
-        annotated_dss_name_to_cummulative_rel_abund_mp_dict, ref_seq_names_clade_annotated,
-        dss, lock):
-        self.dss_id_to_list_of_dsss_objects_mp_dict = dss_id_to_list_of_dsss_objects_mp_dict
-        self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict = dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict
-        self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict = dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict
-        self.annotated_dss_name_to_cummulative_rel_abund_mp_dict = annotated_dss_name_to_cummulative_rel_abund_mp_dict
-        self.ref_seq_names_clade_annotated = ref_seq_names_clade_annotated
-        self.dss = dss
-        self.total_abundance_of_sequences_in_sample = sum([int(a) for a in json.loads(self.dss.cladal_seq_totals)])
-        self.lock = lock
-
-    def start_seq_abund_collection(self):
-        clade_summary_absolute_dict, clade_summary_relative_dict = \
-            self._generate_empty_noname_seq_abund_summary_by_clade_dicts()
-
-        smple_seq_count_aboslute_dict, smple_seq_count_relative_dict = self._generate_empty_seq_name_to_abund_dicts()
-
-        dsss_in_sample = self.dss_id_to_list_of_dsss_objects_mp_dict[self.dss.id]
-
-        for dsss in dsss_in_sample:
-            # determine what the name of the seq will be in the output
-            name_unit = self._determine_output_name_of_dsss_and_pop_noname_clade_dicts(
-                clade_summary_absolute_dict, clade_summary_relative_dict, dsss)
-
-            self._populate_abs_and_rel_abundances_for_dsss(dsss, name_unit, smple_seq_count_aboslute_dict,
-                                                           smple_seq_count_relative_dict)
-
-        self._associate_sample_abundances_to_mp_dicts(
-            clade_summary_absolute_dict,
-            clade_summary_relative_dict,
-            smple_seq_count_aboslute_dict,
-            smple_seq_count_relative_dict)
-
-    def _associate_sample_abundances_to_mp_dicts(self, clade_summary_absolute_dict, clade_summary_relative_dict,
-                                                 smple_seq_count_aboslute_dict, smple_seq_count_relative_dict):
-        with self.lock:
-            self.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict[self.dss.id] = [smple_seq_count_aboslute_dict,
-                                                                                                            smple_seq_count_relative_dict]
-            self.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict[self.dss.id] = [
-                clade_summary_absolute_dict, clade_summary_relative_dict]
-
-    def _populate_abs_and_rel_abundances_for_dsss(self, dsss, name_unit, smple_seq_count_aboslute_dict,
-                                                  smple_seq_count_relative_dict):
-        rel_abund_of_dsss = dsss.abundance / self.total_abundance_of_sequences_in_sample
-        with self.lock:
-            self.annotated_dss_name_to_cummulative_rel_abund_mp_dict[name_unit] += rel_abund_of_dsss
-        smple_seq_count_aboslute_dict[name_unit] += dsss.abundance
-        smple_seq_count_relative_dict[name_unit] += rel_abund_of_dsss
-
-    def _determine_output_name_of_dsss_and_pop_noname_clade_dicts(
-            self, clade_summary_absolute_dict, clade_summary_relative_dict, dsss):
-        if not dsss.reference_sequence_of.has_name:
-            name_unit = str(dsss.reference_sequence_of.id) + f'_{dsss.reference_sequence_of.clade}'
-            # the clade summries are only for the noName seqs
-            clade_summary_absolute_dict[dsss.reference_sequence_of.clade] += dsss.abundance
-            clade_summary_relative_dict[
-                dsss.reference_sequence_of.clade] += dsss.abundance / self.total_abundance_of_sequences_in_sample
-        else:
-            name_unit = str(dsss.reference_sequence_of)
-        return name_unit
-
-    def _generate_empty_seq_name_to_abund_dicts(self):
-        smple_seq_count_aboslute_dict = {seq_name: 0 for seq_name in self.ref_seq_names_clade_annotated}
-        smple_seq_count_relative_dict = {seq_name: 0 for seq_name in self.ref_seq_names_clade_annotated}
-        return smple_seq_count_aboslute_dict, smple_seq_count_relative_dict
-
-    @staticmethod
-    def _generate_empty_noname_seq_abund_summary_by_clade_dicts():
-        clade_summary_absolute_dict = {clade: 0 for clade in list('ABCDEFGHI')}
-        clade_summary_relative_dict = {clade: 0 for clade in list('ABCDEFGHI')}
-        return clade_summary_absolute_dict, clade_summary_relative_dict
-
-
 class SeqOutputSeriesGeneratorHandler:
     def __init__(self, parent):
         self.seq_count_table_creator = parent
         self.output_df_header = self._create_output_df_header()
+        # The position of each seq index in the output i.e. in clade_abundance_ordered_ref_seq_list
+        seq_name_to_output_position_dict = {
+            seq_name: i for i, seq_name in enumerate(self.seq_count_table_creator.clade_abundance_ordered_ref_seq_list)}
+        self.seq_index_to_output_position_array = np.array(
+            [seq_name_to_output_position_dict[seq_name] for
+             seq_name in self.seq_count_table_creator.ref_seq_names_clade_annotated], dtype=np.int64)
         if self.seq_count_table_creator.multiprocess:
-            self.worker_manager = Manager()
-            # dss.id : [pandas_series_for_absolute_abundace, pandas_series_for_absolute_abundace]
-            self.dss_id_to_pandas_series_results_list_mp_dict = self.worker_manager.dict()
             self.dss_input_queue = mp_Queue()
-            self._populate_dss_input_queue()
-            self.lock = mp_Lock()
+            self.series_output_queue = mp_Queue()
         else:
-            # dss.id : [pandas_series_for_absolute_abundace, pandas_series_for_absolute_abundace]
-            self.dss_id_to_pandas_series_results_list_mp_dict = {}
             self.dss_input_queue = mt_Queue()
-            self._populate_dss_input_queue()
-            self.lock = mt_Lock()
+            self.series_output_queue = mt_Queue()
+        self._populate_dss_input_queue()
+        # dss.id : [pandas_series_for_absolute_abundace, pandas_series_for_absolute_abundace]
+        self.dss_id_to_pandas_series_results_list_dict = {}
 
+    @profile_stage()
     def execute_sequence_count_table_dataframe_contructor_handler(self):
         all_processes = []
         # close all connections to the db so that they are automatically recreated for each process
@@ -2163,50 +1931,56 @@ class SeqOutputSeriesGeneratorHandler:
         db.connections.close_all()
 
         sys.stdout.write('\n\nOutputting seq data\n')
+        num_seqs = len(self.seq_count_table_creator.clade_abundance_ordered_ref_seq_list)
         for n in range(self.seq_count_table_creator.num_proc):
             if self.seq_count_table_creator.multiprocess:
                 p = Process(target=self._output_df_contructor_worker, args=(
-                    self.dss_input_queue,
-                    self.seq_count_table_creator.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict,
-                    self.seq_count_table_creator.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict,
-                    self.seq_count_table_creator.clade_abundance_ordered_ref_seq_list,
-                    self.dss_id_to_pandas_series_results_list_mp_dict,
-                    self.output_df_header, self.lock))
+                    self.dss_input_queue, self.series_output_queue, num_seqs, self.output_df_header))
             else:
                 p = Thread(target=self._output_df_contructor_worker, args=(
-                self.dss_input_queue,
-                self.seq_count_table_creator.dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict,
-                self.seq_count_table_creator.dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict,
-                self.seq_count_table_creator.clade_abundance_ordered_ref_seq_list,
-                self.dss_id_to_pandas_series_results_list_mp_dict,
-                self.output_df_header, self.lock))
+                    self.dss_input_queue, self.series_output_queue, num_seqs, self.output_df_header))
             all_processes.append(p)
             p.start()
 
+        # Process the output queue as we go so that it doesn't grow large enough to cause p.join() to hang.
+        done_count = 0
+        while done_count < self.seq_count_table_creator.num_proc:
+            worker_output = self.series_output_queue.get()
+            if isinstance(worker_output, str) and worker_output == 'DONE':
+                done_count += 1
+            else:
+                dss_id, list_of_series = worker_output
+                self.dss_id_to_pandas_series_results_list_dict[dss_id] = list_of_series
+
         for p in all_processes:
             p.join()
 
     @staticmethod
-    def _output_df_contructor_worker(
-        in_q, 
-        dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict,
-        dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict,
-        clade_abundance_ordered_ref_seq_list,
-        dss_id_to_pandas_series_results_list_mp_dict,
-        output_df_header, lock):
-        for dss in iter(in_q.get, 'STOP'):
+    def _output_df_contructor_worker(in_q, out_q, num_seqs, output_df_header):
+        for dss_dict, output_position_array, abs_abund_array, noname_clade_summary_abs_abund_array in \
+                iter(in_q.get, 'STOP'):
             seq_output_series_generator_worker = SeqOutputSeriesGeneratorWorker(
-                dss=dss,
-                list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs=dss_id_to_list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs_mp_dict[dss.id],
-                list_of_abs_and_rel_abund_of_contained_dsss_dicts=dss_id_to_list_of_abs_and_rel_abund_of_contained_dsss_dicts_mp_dict[dss.id],
-                clade_abundance_ordered_ref_seq_list=clade_abundance_ordered_ref_seq_list,
-                dss_id_to_pandas_series_results_list_mp_dict=dss_id_to_pandas_series_results_list_mp_dict,
-                output_df_header=output_df_header, lock=lock)
-            seq_output_series_generator_worker.make_series()
+                dss_dict=dss_dict, output_position_array=output_position_array, abs_abund_array=abs_abund_array,
+                noname_clade_summary_abs_abund_array=noname_clade_summary_abs_abund_array,
+                num_seqs=num_seqs, output_df_header=output_df_header)
+            out_q.put((dss_dict['id'], seq_output_series_generator_worker.make_series()))
+        out_q.put('DONE')
 
     def _populate_dss_input_queue(self):
+        # Each sample is passed as a dict of the field values that the worker needs (rather than as a
+        # DataSetSample object that would have to be pickled and whose DataSet would be queried by the worker)
+        # along with its compact (output position, absolute abundance) arrays
+        ds_uid_to_name_dict = {ds.id: ds.name for ds in self.seq_count_table_creator.ds_objs_to_output}
         for dss in self.seq_count_table_creator.list_of_dss_objects:
-            self.dss_input_queue.put(dss)
+            dss_dict = {field_name: getattr(dss, field_name) for
+                        field_name in SeqOutputSeriesGeneratorWorker.dss_field_names}
+            dss_dict['data_set_uid'] = dss.data_submission_from_id
+            dss_dict['data_set_name'] = ds_uid_to_name_dict[dss.data_submission_from_id]
+            seq_index_array, abs_abund_array = \
+                self.seq_count_table_creator.dss_id_to_seq_index_and_abs_abund_arrays_dict[dss.id]
+            self.dss_input_queue.put((
+                dss_dict, self.seq_index_to_output_position_array[seq_index_array], abs_abund_array,
+                self.seq_count_table_creator.dss_id_to_noname_clade_summary_abs_abund_array_dict[dss.id]))
 
         for N in range(self.seq_count_table_creator.num_proc):
             self.dss_input_queue.put('STOP')
@@ -2233,64 +2007,66 @@ class SeqOutputSeriesGeneratorHandler:
 
 
 class SeqOutputSeriesGeneratorWorker:
+    # The DataSetSample fields that are passed to the worker (see SeqOutputSeriesGeneratorHandler)
+    dss_field_names = [
+        'id', 'name', 'fastq_fwd_file_name', 'fastq_fwd_file_hash', 'fastq_rev_file_name', 'fastq_rev_file_hash',
+        'cladal_seq_totals', 'error_in_processing', 'num_contigs', 'post_qc_absolute_num_seqs',
+        'post_qc_unique_num_seqs', 'absolute_num_sym_seqs', 'unique_num_sym_seqs', 'size_violation_absolute',
+        'size_violation_unique', 'non_sym_absolute_num_seqs', 'non_sym_unique_num_seqs', 'post_med_absolute',
+        'post_med_unique', 'sample_type', 'host_phylum', 'host_class', 'host_order', 'host_family', 'host_genus',
+        'host_species', 'collection_latitude', 'collection_longitude', 'collection_date', 'collection_depth']
+
     def __init__(
-            self, dss, list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs,
-            list_of_abs_and_rel_abund_of_contained_dsss_dicts,
-            dss_id_to_pandas_series_results_list_mp_dict,
-            clade_abundance_ordered_ref_seq_list, output_df_header, lock
+            self, dss_dict, output_position_array, abs_abund_array, noname_clade_summary_abs_abund_array,
+            num_seqs, output_df_header
     ):
 
-        self.dss = dss
-        # dss.id : [{dsss:absolute abundance in dss}, {dsss:relative abundance in dss}]
-        # dss.id : [{clade:total absolute abundance of no name seqs from that clade},
-        #           {clade:total relative abundance of no name seqs from that clade}
-        #          ]
-        self.list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs = list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs
-        self.list_of_abs_and_rel_abund_of_contained_dsss_dicts = list_of_abs_and_rel_abund_of_contained_dsss_dicts
-        self.dss_id_to_pandas_series_results_list_mp_dict = dss_id_to_pandas_series_results_list_mp_dict
-        self.clade_abundance_ordered_ref_seq_list = clade_abundance_ordered_ref_seq_list
+        # The values of the dss_field_names of the DataSetSample along with its data_set_uid and data_set_name
+        self.dss_dict = dss_dict
+        # The position (in clade_abundance_ordered_ref_seq_list) and absolute abundance of each of the seqs
+        # found in the sample
+        self.output_position_array = output_position_array
+        self.abs_abund_array = abs_abund_array
+        # The total absolute abundance of the no name seqs of each clade (in order ABCDEFGHI)
+        self.noname_clade_summary_abs_abund_array = noname_clade_summary_abs_abund_array
+        self.num_seqs = num_seqs
         self.output_df_header = output_df_header
         self.sample_row_data_absolute = []
         self.sample_row_data_relative = []
-        self.sample_seq_tot = sum([int(a) for a in json.loads(dss.cladal_seq_totals)])
-        self.lock = lock
+        self.sample_seq_tot = sum([int(a) for a in json.loads(dss_dict['cladal_seq_totals'])])
 
     def make_series(self):
-        sys.stdout.write(f'\r{self.dss.name}: Creating data ouput row')
-        ds = self.dss.data_submission_from
-        self.sample_row_data_absolute.append(self.dss.name)
-        self.sample_row_data_absolute.append(self.dss.fastq_fwd_file_name)
-        self.sample_row_data_absolute.append(self.dss.fastq_fwd_file_hash)
-        self.sample_row_data_absolute.append(self.dss.fastq_rev_file_name)
-        self.sample_row_data_absolute.append(self.dss.fastq_rev_file_hash)
-        self.sample_row_data_absolute.append(ds.id)
-        self.sample_row_data_absolute.append(ds.name)
-
-        self.sample_row_data_relative.append(self.dss.name)
-        self.sample_row_data_relative.append(self.dss.fastq_fwd_file_name)
-        self.sample_row_data_relative.append(self.dss.fastq_fwd_file_hash)
-        self.sample_row_data_relative.append(self.dss.fastq_rev_file_name)
-        self.sample_row_data_relative.append(self.dss.fastq_rev_file_hash)
-        self.sample_row_data_relative.append(ds.id)
-        self.sample_row_data_relative.append(ds.name)
+        sys.stdout.write(f'\r{self.dss_dict["name"]}: Creating data ouput row')
+        self.sample_row_data_absolute.append(self.dss_dict['name'])
+        self.sample_row_data_absolute.append(self.dss_dict['fastq_fwd_file_name'])
+        self.sample_row_data_absolute.append(self.dss_dict['fastq_fwd_file_hash'])
+        self.sample_row_data_absolute.append(self.dss_dict['fastq_rev_file_name'])
+        self.sample_row_data_absolute.append(self.dss_dict['fastq_rev_file_hash'])
+        self.sample_row_data_absolute.append(self.dss_dict['data_set_uid'])
+        self.sample_row_data_absolute.append(self.dss_dict['data_set_name'])
+
+        self.sample_row_data_relative.append(self.dss_dict['name'])
+        self.sample_row_data_relative.append(self.dss_dict['fastq_fwd_file_name'])
+        self.sample_row_data_relative.append(self.dss_dict['fastq_fwd_file_hash'])
+        self.sample_row_data_relative.append(self.dss_dict['fastq_rev_file_name'])
+        self.sample_row_data_relative.append(self.dss_dict['fastq_rev_file_hash'])
+        self.sample_row_data_relative.append(self.dss_dict['data_set_uid'])
+        self.sample_row_data_relative.append(self.dss_dict['data_set_name'])
 
         if self._dss_had_problem_in_processing():
 
             self._populate_quality_control_data_of_failed_sample()
 
-            self._output_the_failed_sample_pandas_series()
-            return
+            return self._output_the_failed_sample_pandas_series()
 
         self._populate_quality_control_data_of_successful_sample()
 
-        self._output_the_successful_sample_pandas_series()
+        return self._output_the_successful_sample_pandas_series()
 
     def _output_the_successful_sample_pandas_series(self):
-        sample_series_absolute = pd.Series(self.sample_row_data_absolute, index=self.output_df_header, name=self.dss.id)
-        sample_series_relative = pd.Series(self.sample_row_data_relative, index=self.output_df_header, name=self.dss.id)
-        with self.lock:
-            self.dss_id_to_pandas_series_results_list_mp_dict[self.dss.id] = [
-                sample_series_absolute, sample_series_relative]
+        sample_series_absolute = pd.Series(self.sample_row_data_absolute, index=self.output_df_header, name=self.dss_dict['id'])
+        sample_series_relative = pd.Series(self.sample_row_data_relative, index=self.output_df_header, name=self.dss_dict['id'])
+        return [sample_series_absolute, sample_series_relative]
 
     def _populate_quality_control_data_of_successful_sample(self):
         self._populate_qc_meta_successful_sample()
@@ -2304,21 +2080,20 @@ class SeqOutputSeriesGeneratorWorker:
     def _populate_seq_abunds_successful_sample(self):
         # and append these abundances in order of cladeAbundanceOrderedRefSeqList to
         # the sampleRowDataCounts and the sampleRowDataProps
-        for seq_name in self.clade_abundance_ordered_ref_seq_list:
-            sys.stdout.write('\rOutputting seq data for {}: sequence {}'.format(self.dss.name, seq_name))
-            self.sample_row_data_absolute.append(
-                self.list_of_abs_and_rel_abund_of_contained_dsss_dicts[0][seq_name])
-            self.sample_row_data_relative.append(
-                self.list_of_abs_and_rel_abund_of_contained_dsss_dicts[1][seq_name])
+        sys.stdout.write(f'\rOutputting seq data for {self.dss_dict["name"]}')
+        seq_abund_row = np.zeros(self.num_seqs, dtype=np.int64)
+        np.add.at(seq_abund_row, self.output_position_array, self.abs_abund_array)
+        self._append_abs_and_rel_abunds(seq_abund_row.tolist())
 
     def _populate_no_name_seq_clade_summaries_successful_sample(self):
         # now add the clade divided summaries of the clades
-        for clade in list('ABCDEFGHI'):
-            
-            self.sample_row_data_absolute.append(
-                self.list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs[0][clade])
-            self.sample_row_data_relative.append(
-                self.list_of_abs_and_rel_abund_clade_summaries_of_noname_seqs[1][clade])
+        self._append_abs_and_rel_abunds(self.noname_clade_summary_abs_abund_array.tolist())
+
+    def _append_abs_and_rel_abunds(self, abs_abunds):
+        # Seqs that are not found in the sample are given a relative abundance of int 0 (rather than 0.0)
+        self.sample_row_data_absolute.extend(abs_abunds)
+        self.sample_row_data_relative.extend(
+            [abs_abund / self.sample_seq_tot if abs_abund else 0 for abs_abund in abs_abunds])
 
     def _populate_qc_meta_successful_sample(self):
         # Here we add in the post qc and post-taxa id counts
@@ -2328,58 +2103,56 @@ class SeqOutputSeriesGeneratorWorker:
 
         # CONTIGS
         # This is the absolute number of sequences after make.contigs
-        contig_num = self.dss.num_contigs
+        contig_num = self.dss_dict['num_contigs']
         self.sample_row_data_absolute.append(contig_num)
         self.sample_row_data_relative.append(contig_num / self.sample_seq_tot)
         # POST-QC
         # store the aboslute number of sequences after sequencing QC at this stage
-        post_qc_absolute = self.dss.post_qc_absolute_num_seqs
+        post_qc_absolute = self.dss_dict['post_qc_absolute_num_seqs']
         self.sample_row_data_absolute.append(post_qc_absolute)
         self.sample_row_data_relative.append(post_qc_absolute / self.sample_seq_tot)
         # This is the unique number of sequences after the sequencing QC
-        post_qc_unique = self.dss.post_qc_unique_num_seqs
+        post_qc_unique = self.dss_dict['post_qc_unique_num_seqs']
         self.sample_row_data_absolute.append(post_qc_unique)
         self.sample_row_data_relative.append(post_qc_unique / self.sample_seq_tot)
         # POST TAXA-ID
         # Absolute number of sequences after sequencing QC and screening for Symbiodinium (i.e. Symbiodinium only)
-        tax_id_symbiodiniaceae_absolute = self.dss.absolute_num_sym_seqs
+        tax_id_symbiodiniaceae_absolute = self.dss_dict['absolute_num_sym_seqs']
         self.sample_row_data_absolute.append(tax_id_symbiodiniaceae_absolute)
         self.sample_row_data_relative.append(tax_id_symbiodiniaceae_absolute / self.sample_seq_tot)
         # Same as above but the number of unique seqs
-        tax_id_symbiodiniaceae_unique = self.dss.unique_num_sym_seqs
+        tax_id_symbiodiniaceae_unique = self.dss_dict['unique_num_sym_seqs']
         self.sample_row_data_absolute.append(tax_id_symbiodiniaceae_unique)
         self.sample_row_data_relative.append(tax_id_symbiodiniaceae_unique / self.sample_seq_tot)
         # store the absolute number of sequences lost to size cutoff violations
-        size_violation_aboslute = self.dss.size_violation_absolute
+        size_violation_aboslute = self.dss_dict['size_violation_absolute']
         self.sample_row_data_absolute.append(size_violation_aboslute)
         self.sample_row_data_relative.append(size_violation_aboslute / self.sample_seq_tot)
         # store the unique size cutoff violations
-        size_violation_unique = self.dss.size_violation_unique
+        size_violation_unique = self.dss_dict['size_violation_unique']
         self.sample_row_data_absolute.append(size_violation_unique)
         self.sample_row_data_relative.append(size_violation_unique / self.sample_seq_tot)
         # store the abosolute number of sequenes that were not considered Symbiodinium
-        tax_id_non_symbiodinum_abosulte = self.dss.non_sym_absolute_num_seqs
+        tax_id_non_symbiodinum_abosulte = self.dss_dict['non_sym_absolute_num_seqs']
         self.sample_row_data_absolute.append(tax_id_non_symbiodinum_abosulte)
         self.sample_row_data_relative.append(tax_id_non_symbiodinum_abosulte / self.sample_seq_tot)
         # This is the number of unique sequences that were not considered Symbiodinium
-        tax_id_non_symbiodiniaceae_unique = self.dss.non_sym_unique_num_seqs
+        tax_id_non_symbiodiniaceae_unique = self.dss_dict['non_sym_unique_num_seqs']
         self.sample_row_data_absolute.append(tax_id_non_symbiodiniaceae_unique)
         self.sample_row_data_relative.append(tax_id_non_symbiodiniaceae_unique / self.sample_seq_tot)
         # Post MED absolute
-        post_med_absolute = self.dss.post_med_absolute
+        post_med_absolute = self.dss_dict['post_med_absolute']
         self.sample_row_data_absolute.append(post_med_absolute)
         self.sample_row_data_relative.append(post_med_absolute / self.sample_seq_tot)
         # Post MED unique
-        post_med_unique = self.dss.post_med_unique
+        post_med_unique = self.dss_dict['post_med_unique']
         self.sample_row_data_absolute.append(post_med_unique)
         self.sample_row_data_relative.append(post_med_unique / self.sample_seq_tot)
 
     def _output_the_failed_sample_pandas_series(self):
-        sample_series_absolute = pd.Series(self.sample_row_data_absolute, index=self.output_df_header, name=self.dss.id)
-        sample_series_relative = pd.Series(self.sample_row_data_relative, index=self.output_df_header, name=self.dss.id)
-        with self.lock:
-            self.dss_id_to_pandas_series_results_list_mp_dict[self.dss.id] = [sample_series_absolute,
-                                                                                    sample_series_relative]
+        sample_series_absolute = pd.Series(self.sample_row_data_absolute, index=self.output_df_header, name=self.dss_dict['id'])
+        sample_series_relative = pd.Series(self.sample_row_data_relative, index=self.output_df_header, name=self.dss_dict['id'])
+        return [sample_series_absolute, sample_series_relative]
 
     def _populate_quality_control_data_of_failed_sample(self):
         # Add in the qc totals if possible
@@ -2395,55 +2168,55 @@ class SeqOutputSeriesGeneratorWorker:
 
     def _populate_seq_abunds_failed_sample(self):
         # All sequences get 0s
-        for _ in self.clade_abundance_ordered_ref_seq_list:
+        for _ in range(self.num_seqs):
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
 
     def _populate_user_supplied_meta(self):
         # insert the user supplied meta stats
         # sample_type
-        self.sample_row_data_absolute.append(self.dss.sample_type)
-        self.sample_row_data_relative.append(self.dss.sample_type)
+        self.sample_row_data_absolute.append(self.dss_dict['sample_type'])
+        self.sample_row_data_relative.append(self.dss_dict['sample_type'])
 
         # host_phylum
-        self.sample_row_data_absolute.append(self.dss.host_phylum)
-        self.sample_row_data_relative.append(self.dss.host_phylum)
+        self.sample_row_data_absolute.append(self.dss_dict['host_phylum'])
+        self.sample_row_data_relative.append(self.dss_dict['host_phylum'])
 
         # host_class
-        self.sample_row_data_absolute.append(self.dss.host_class)
-        self.sample_row_data_relative.append(self.dss.host_class)
+        self.sample_row_data_absolute.append(self.dss_dict['host_class'])
+        self.sample_row_data_relative.append(self.dss_dict['host_class'])
 
         # host_order
-        self.sample_row_data_absolute.append(self.dss.host_order)
-        self.sample_row_data_relative.append(self.dss.host_order)
+        self.sample_row_data_absolute.append(self.dss_dict['host_order'])
+        self.sample_row_data_relative.append(self.dss_dict['host_order'])
 
         # host_family
-        self.sample_row_data_absolute.append(self.dss.host_family)
-        self.sample_row_data_relative.append(self.dss.host_family)
+        self.sample_row_data_absolute.append(self.dss_dict['host_family'])
+        self.sample_row_data_relative.append(self.dss_dict['host_family'])
 
         # host_genus
-        self.sample_row_data_absolute.append(self.dss.host_genus)
-        self.sample_row_data_relative.append(self.dss.host_genus)
+        self.sample_row_data_absolute.append(self.dss_dict['host_genus'])
+        self.sample_row_data_relative.append(self.dss_dict['host_genus'])
 
         # host_species
-        self.sample_row_data_absolute.append(self.dss.host_species)
-        self.sample_row_data_relative.append(self.dss.host_species)
+        self.sample_row_data_absolute.append(self.dss_dict['host_species'])
+        self.sample_row_data_relative.append(self.dss_dict['host_species'])
 
         # collection_latitude
-        self.sample_row_data_absolute.append(self.dss.collection_latitude)
-        self.sample_row_data_relative.append(self.dss.collection_latitude)
+        self.sample_row_data_absolute.append(self.dss_dict['collection_latitude'])
+        self.sample_row_data_relative.append(self.dss_dict['collection_latitude'])
 
         # collection_longitude
-        self.sample_row_data_absolute.append(self.dss.collection_longitude)
-        self.sample_row_data_relative.append(self.dss.collection_longitude)
+        self.sample_row_data_absolute.append(self.dss_dict['collection_longitude'])
+        self.sample_row_data_relative.append(self.dss_dict['collection_longitude'])
 
         # collection_date
-        self.sample_row_data_absolute.append(self.dss.collection_date)
-        self.sample_row_data_relative.append(self.dss.collection_date)
+        self.sample_row_data_absolute.append(self.dss_dict['collection_date'])
+        self.sample_row_data_relative.append(self.dss_dict['collection_date'])
 
         # collection_depth
-        self.sample_row_data_absolute.append(self.dss.collection_depth)
-        self.sample_row_data_relative.append(self.dss.collection_depth)
+        self.sample_row_data_absolute.append(self.dss_dict['collection_depth'])
+        self.sample_row_data_relative.append(self.dss_dict['collection_depth'])
 
 
     def _populate_no_name_seq_clade_summaries_failed_sample(self):
@@ -2453,8 +2226,8 @@ class SeqOutputSeriesGeneratorWorker:
             self.sample_row_data_relative.append(0)
 
     def _populate_qc_meta_failed_sample(self):
-        if self.dss.num_contigs:
-            contig_num = self.dss.num_contigs
+        if self.dss_dict['num_contigs']:
+            contig_num = self.dss_dict['num_contigs']
             self.sample_row_data_absolute.append(contig_num)
             self.sample_row_data_relative.append(0)
         else:
@@ -2462,16 +2235,16 @@ class SeqOutputSeriesGeneratorWorker:
             self.sample_row_data_relative.append(0)
         # POST-QC
         # store the aboslute number of sequences after sequencing QC at this stage
-        if self.dss.post_qc_absolute_num_seqs:
-            post_qc_absolute = self.dss.post_qc_absolute_num_seqs
+        if self.dss_dict['post_qc_absolute_num_seqs']:
+            post_qc_absolute = self.dss_dict['post_qc_absolute_num_seqs']
             self.sample_row_data_absolute.append(post_qc_absolute)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # This is the unique number of sequences after the sequencing QC
-        if self.dss.post_qc_unique_num_seqs:
-            post_qc_unique = self.dss.post_qc_unique_num_seqs
+        if self.dss_dict['post_qc_unique_num_seqs']:
+            post_qc_unique = self.dss_dict['post_qc_unique_num_seqs']
             self.sample_row_data_absolute.append(post_qc_unique)
             self.sample_row_data_relative.append(0)
         else:
@@ -2479,64 +2252,64 @@ class SeqOutputSeriesGeneratorWorker:
             self.sample_row_data_relative.append(0)
         # POST TAXA-ID
         # Absolute number of sequences after sequencing QC and screening for Symbiodinium (i.e. Symbiodinium only)
-        if self.dss.absolute_num_sym_seqs:
-            tax_id_symbiodiniaceae_absolute = self.dss.absolute_num_sym_seqs
+        if self.dss_dict['absolute_num_sym_seqs']:
+            tax_id_symbiodiniaceae_absolute = self.dss_dict['absolute_num_sym_seqs']
             self.sample_row_data_absolute.append(tax_id_symbiodiniaceae_absolute)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # Same as above but the number of unique seqs
-        if self.dss.unique_num_sym_seqs:
-            tax_id_symbiodiniaceae_unique = self.dss.unique_num_sym_seqs
+        if self.dss_dict['unique_num_sym_seqs']:
+            tax_id_symbiodiniaceae_unique = self.dss_dict['unique_num_sym_seqs']
             self.sample_row_data_absolute.append(tax_id_symbiodiniaceae_unique)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # size violation absolute
-        if self.dss.size_violation_absolute:
-            size_viol_ab = self.dss.size_violation_absolute
+        if self.dss_dict['size_violation_absolute']:
+            size_viol_ab = self.dss_dict['size_violation_absolute']
             self.sample_row_data_absolute.append(size_viol_ab)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # size violation unique
-        if self.dss.size_violation_unique:
-            size_viol_uni = self.dss.size_violation_unique
+        if self.dss_dict['size_violation_unique']:
+            size_viol_uni = self.dss_dict['size_violation_unique']
             self.sample_row_data_absolute.append(size_viol_uni)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # store the abosolute number of sequenes that were not considered Symbiodinium
-        if self.dss.non_sym_absolute_num_seqs:
-            tax_id_non_symbiodinum_abosulte = self.dss.non_sym_absolute_num_seqs
+        if self.dss_dict['non_sym_absolute_num_seqs']:
+            tax_id_non_symbiodinum_abosulte = self.dss_dict['non_sym_absolute_num_seqs']
             self.sample_row_data_absolute.append(tax_id_non_symbiodinum_abosulte)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # This is the number of unique sequences that were not considered Symbiodinium
-        if self.dss.non_sym_unique_num_seqs:
-            tax_id_non_symbiodiniaceae_unique = self.dss.non_sym_unique_num_seqs
+        if self.dss_dict['non_sym_unique_num_seqs']:
+            tax_id_non_symbiodiniaceae_unique = self.dss_dict['non_sym_unique_num_seqs']
             self.sample_row_data_absolute.append(tax_id_non_symbiodiniaceae_unique)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # post-med absolute
-        if self.dss.post_med_absolute:
-            post_med_abs = self.dss.post_med_absolute
+        if self.dss_dict['post_med_absolute']:
+            post_med_abs = self.dss_dict['post_med_absolute']
             self.sample_row_data_absolute.append(post_med_abs)
             self.sample_row_data_relative.append(0)
         else:
             self.sample_row_data_absolute.append(0)
             self.sample_row_data_relative.append(0)
         # post-med absolute
-        if self.dss.post_med_unique:
-            post_med_uni = self.dss.post_med_unique
+        if self.dss_dict['post_med_unique']:
+            post_med_uni = self.dss_dict['post_med_unique']
             self.sample_row_data_absolute.append(post_med_uni)
             self.sample_row_data_relative.append(0)
         else:
@@ -2544,7 +2317,7 @@ class SeqOutputSeriesGeneratorWorker:
             self.sample_row_data_relative.append(0)
 
     def _dss_had_problem_in_processing(self):
-        return self.dss.error_in_processing or self.sample_seq_tot == 0
+        return self.dss_dict['error_in_processing'] or self.sample_seq_tot == 0
 
 
 
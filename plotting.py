@@ -1,21 +1,23 @@
 from matplotlib.patches import Rectangle  # Rectangle is used despite it being greyed out in pycharm
-from matplotlib.collections import PatchCollection
+from matplotlib.collections import PolyCollection
 # https://stackoverflow.com/questions/21784641/installation-issue-with-matplotlib-python
 import matplotlib as mpl
 mpl.use('Agg')
 import matplotlib.pyplot as plt
 plt.ioff()
 import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
 from matplotlib.lines import Line2D
-from collections import defaultdict
 import pandas as pd
 from exceptions import DistanceTypeNotIdentifiedError
 import os
+import math
 import numpy as np
 import sys
+from multiprocessing import Queue, Process
 from datetime import datetime
 from general import ThreadSafeGeneral
+from stage_profiling import profile_stage
+from figure_export import figure_exporter
 import json
 plt.ioff()
 
@@ -64,17 +66,15 @@ class DistScatterPlotter:
             self.ax.set_title(f'{title_prefix} {self.clade} {self.dist_type} no_sqrt')
 
     def _output_dist_scatter(self):
-        plt.tight_layout()
-        sys.stdout.write('\rsaving as .svg')
-        svg_path = '{}.svg'.format(self.fig_output_base)
-        plt.savefig(svg_path)
-        png_path = '{}.png'.format(self.fig_output_base)
-        sys.stdout.write('\rsaving as .png')
-        plt.savefig(png_path, dpi=600)
+        self.f.tight_layout()
+        sys.stdout.write(f'\rsaving as {", ".join(figure_exporter.formats)}')
+        output_path_list = figure_exporter.export_figure(figure=self.f, fig_output_path_base=self.fig_output_base)
+        plt.close(self.f)
         sys.stdout.write('\r\nDistance plots output to:')
-        sys.stdout.write('\n{}'.format(svg_path))
-        sys.stdout.write('\n{}\n'.format(png_path))
-        self.output_path_list.extend([svg_path, png_path])
+        for output_path in output_path_list:
+            sys.stdout.write('\n{}'.format(output_path))
+        sys.stdout.write('\n')
+        self.output_path_list.extend(output_path_list)
 
 
 class DistScatterPlotterSamples(DistScatterPlotter):
@@ -82,6 +82,7 @@ class DistScatterPlotterSamples(DistScatterPlotter):
         super().__init__(csv_path=csv_path, date_time_str=date_time_str)
         self.labels = labels
 
+    @profile_stage()
     def make_sample_dist_scatter_plot(self):
         self.create_base_scatter_plot()
         self._annotate_plot_with_sample_names()
@@ -111,6 +112,7 @@ class DistScatterPlotterTypes(DistScatterPlotter):
     def __init__(self, csv_path, date_time_str):
         super().__init__(csv_path=csv_path, date_time_str=date_time_str)
 
+    @profile_stage()
     def make_type_dist_scatter_plot(self):
         self.create_base_scatter_plot()
         self._annotate_plot_with_type_uids()
@@ -132,32 +134,27 @@ class DistScatterPlotterTypes(DistScatterPlotter):
 
 class SubPlotter:
     """A class that can be used for the sub plots of the SeqStackedBarPlotter and the TypeStackedBarPlotter.
+    The bars of all samples of the subplot are drawn as a single PolyCollection whose vertices are
+    calculated from the cumulative relative abundance matrix of the samples.
     """
     def __init__(self, parent_plotter_instance, index_of_this_subplot):
         self.parent_plotter = parent_plotter_instance
-        self.patches_list = []
         self.x_tick_label_list = []
-        self.x_index_for_plot = 0
-        self.colour_list = []
         self.index_of_this_subplot = index_of_this_subplot
         self.subplot_axes = self.parent_plotter.axarr[self.index_of_this_subplot]
         self.end_slice = self._get_end_index_for_slicing_plotting_data()
-        self.num_samples_in_this_subplot = len(
-                self.parent_plotter.output_count_table_as_df.index.values.tolist()[
-                self.index_of_this_subplot * self.parent_plotter.samples_per_subplot:self.end_slice])
-        # Make a custom colour map
-        # https://matplotlib.org/api/_as_gen/matplotlib.colors.ListedColormap.html
-        self.listed_colour_map = None
-        self.patches_collection = None
+        self.subplot_df = self.parent_plotter.output_count_table_as_df.iloc[
+                self.index_of_this_subplot * self.parent_plotter.samples_per_subplot:self.end_slice]
+        self.num_samples_in_this_subplot = len(self.subplot_df.index)
+        self.bar_collection = None
 
     def plot_seq_subplot(self):
-        self._create_rect_patches_and_populate_colour_list()
-
-        self._make_listed_colour_map()
+        for sample_uid in self.subplot_df.index.values.tolist():
+            self._add_sample_names_to_tick_label_list(sample_uid)
 
-        self._make_patches_collection()
+        self._make_bar_collection()
 
-        self._draw_patches_on_axes()
+        self.subplot_axes.add_collection(self.bar_collection)
 
         self._format_axes()
 
@@ -178,17 +175,28 @@ class SubPlotter:
         self.subplot_axes.add_line(
             Line2D((0 - 0.5, self.num_samples_in_this_subplot - 0.5), (0, 0), linewidth=2, color='black'))
 
-    def _draw_patches_on_axes(self):
-        self.subplot_axes.add_collection(self.patches_collection)
-        self.subplot_axes.autoscale_view()
-        self.subplot_axes.figure.canvas.draw()
-
-    def _make_patches_collection(self):
-        self.patches_collection = PatchCollection(self.patches_list, cmap=self.listed_colour_map)
-        self.patches_collection.set_array(np.arange(len(self.patches_list)))
-
-    def _make_listed_colour_map(self):
-        self.listed_colour_map = ListedColormap(self.colour_list)
+    def _make_bar_collection(self):
+        """Each sample is a bar 1 in width centered about its index with one rectangle per non-zero
+        sequence (or type) stacked in column order from 0 up to 1."""
+        abund_array = np.nan_to_num(self.subplot_df.to_numpy(dtype=float), nan=0.0)
+        sample_totals = abund_array.sum(axis=1, keepdims=True)
+        rel_abund_array = np.divide(
+            abund_array, sample_totals, out=np.zeros_like(abund_array), where=sample_totals > 0)
+        tops = np.cumsum(rel_abund_array, axis=1)
+        bottoms = tops - rel_abund_array
+        sample_indices, col_indices = np.nonzero(rel_abund_array)
+        lefts = sample_indices - 0.5
+        rights = sample_indices + 0.5
+        rect_bottoms = bottoms[sample_indices, col_indices]
+        rect_tops = tops[sample_indices, col_indices]
+        rect_verts = np.stack([
+            np.column_stack((lefts, rect_bottoms)), np.column_stack((rights, rect_bottoms)),
+            np.column_stack((rights, rect_tops)), np.column_stack((lefts, rect_tops))], axis=1)
+        col_colour_array = np.array(
+            [self.parent_plotter.colour_dict[col] for col in self.subplot_df.columns], dtype=object)
+        self.bar_collection = PolyCollection(
+            rect_verts, facecolors=col_colour_array[col_indices].tolist(), edgecolors='none',
+            rasterized=self.parent_plotter.rasterize_bars)
 
     def _get_end_index_for_slicing_plotting_data(self):
         if self.index_of_this_subplot == self.parent_plotter.number_of_subplots - 1:
@@ -197,32 +205,6 @@ class SubPlotter:
             end_slice = self.parent_plotter.samples_per_subplot * (self.index_of_this_subplot + 1)
         return end_slice
 
-    def _create_rect_patches_and_populate_colour_list(self):
-        for sample_uid in self.parent_plotter.output_count_table_as_df.index.values.tolist()[
-                      self.index_of_this_subplot * self.parent_plotter.samples_per_subplot:self.end_slice]:
-
-            sys.stdout.write(f'\rPlotting sample: {self.parent_plotter.smp_uid_to_smp_name_dict[int(sample_uid)]}')
-
-            self._add_sample_names_to_tick_label_list(sample_uid)
-            # for each sample we will start at 0 for the y and then add the height of each bar to this
-            bottom = 0
-            # for each sequence, create a rect patch
-            # the rect will be 1 in width and centered about the ind value.
-            non_zero_indices = self.parent_plotter.output_count_table_as_df.loc[sample_uid].to_numpy().nonzero()[0]
-            current_sample_series = self.parent_plotter.output_count_table_as_df.loc[sample_uid]
-            non_zero_sample_series = current_sample_series.iloc[non_zero_indices]
-            sample_total = non_zero_sample_series.sum()
-            for ser_index, rel_abund in non_zero_sample_series.iteritems():
-
-                self.patches_list.append(Rectangle(
-                    (self.x_index_for_plot - 0.5, bottom),
-                    1,
-                    rel_abund / sample_total, color=self.parent_plotter.colour_dict[ser_index]))
-                self.colour_list.append(self.parent_plotter.colour_dict[ser_index])
-                bottom += rel_abund / sample_total
-
-            self.x_index_for_plot += 1
-
     def _add_sample_names_to_tick_label_list(self, sample_uid):
         sample_name = self.parent_plotter.smp_uid_to_smp_name_dict[int(sample_uid)]
         if len(sample_name) < 20:
@@ -345,9 +327,125 @@ class LegendPlotter:
         return leg_box_x, leg_box_y
 
 
-class TypeStackedBarPlotter:
+class StackedBarPlotPage:
+    """One page (figure) of a stacked bar plot: up to subplots_per_page subplots of samples followed by the
+    legend subplot. The page holds only the plotting information of its parent plotter that the SubPlotter and
+    the LegendPlotter need so that it can be sent to, and plotted in, a separate process.
+    """
+    legend_attribute_names = [
+        'max_n_cols', 'max_n_rows', 'num_leg_cells', 'colour_dict', 'ordered_list_of_seqs_names',
+        'sorted_type_prof_uids_by_local_abund', 'type_uid_to_type_name_dict']
+
+    def __init__(self, parent_plotter, page_df, fig_output_path_base, type_plotting, rasterize_bars):
+        self.output_count_table_as_df = page_df
+        self.num_samples = len(page_df.index)
+        self.samples_per_subplot = parent_plotter.samples_per_subplot
+        self.number_of_subplots = math.ceil(self.num_samples / self.samples_per_subplot)
+        self.smp_uid_to_smp_name_dict = {
+            int(smp_uid): parent_plotter.smp_uid_to_smp_name_dict[int(smp_uid)] for smp_uid in page_df.index}
+        for attribute_name in self.legend_attribute_names:
+            setattr(self, attribute_name, getattr(parent_plotter, attribute_name, None))
+        self.fig_output_path_base = fig_output_path_base
+        self.type_plotting = type_plotting
+        self.rasterize_bars = rasterize_bars
+        # The export settings are carried with the page for when it is plotted in a separate process
+        self.figure_formats = figure_exporter.formats
+        self.figure_dpi = figure_exporter.dpi
+        self.axarr = None
+        self.output_path_list = figure_exporter.get_output_path_list(self.fig_output_path_base)
+
+    def plot_and_write_out_page(self):
+        # we add  1 to the n_subplots here for the legend at the bottom
+        f, self.axarr = plt.subplots(self.number_of_subplots + 1, 1, figsize=(10, 3 * self.number_of_subplots))
+        for sub_plot_index in range(self.number_of_subplots):
+            sub_plotter = SubPlotter(index_of_this_subplot=sub_plot_index, parent_plotter_instance=self)
+            sub_plotter.plot_seq_subplot()
+
+        legend_plotter = LegendPlotter(parent_plotter=self, type_plotting=self.type_plotting)
+        legend_plotter.plot_legend_seqs()
+
+        f.tight_layout()
+
+        figure_exporter.export_figure(figure=f, fig_output_path_base=self.fig_output_path_base)
+        plt.close(f)
+        self.axarr = None
+
+
+class StackedBarPlotter:
+    """Base class of the TypeStackedBarPlotter and SeqStackedBarPlotter (and its PreMedSeqPlotter).
+    Samples are plotted samples_per_subplot to a subplot and subplots_per_page subplots to a page (figure).
+    A plot that fits on a single page is written to <fig_output_path_base> in each of the figure formats of the
+    figure_exporter. Larger plots are written one figure per page (<fig_output_path_base>_page_<n>) so that the size
+    of each figure, and so the time and memory needed to plot it, is bounded whatever the number of samples.
+    The pages are plotted in parallel across num_proc processes and their bars are rasterized.
+    """
+    subplots_per_page = 20
+
+    def _plot_and_write_out_pages(self, fig_output_path_base, type_plotting=False):
+        plot_page_list = self._make_plot_page_list(
+            fig_output_path_base=fig_output_path_base, type_plotting=type_plotting)
+        if self.num_proc == 1 or len(plot_page_list) == 1:
+            for plot_page in plot_page_list:
+                plot_page.plot_and_write_out_page()
+        else:
+            self._plot_and_write_out_pages_in_parallel(plot_page_list)
+
+        sys.stdout.write('\nFigure generation complete')
+        sys.stdout.write('\nFigures output to:\n')
+        for plot_page in plot_page_list:
+            for output_path in plot_page.output_path_list:
+                sys.stdout.write(f'{output_path}\n')
+                self.output_path_list.append(output_path)
+
+    def _make_plot_page_list(self, fig_output_path_base, type_plotting):
+        samples_per_page = self.samples_per_subplot * self.subplots_per_page
+        num_pages = max(math.ceil(self.num_samples / samples_per_page), 1)
+        if num_pages == 1:
+            return [StackedBarPlotPage(
+                parent_plotter=self, page_df=self.output_count_table_as_df,
+                fig_output_path_base=fig_output_path_base, type_plotting=type_plotting, rasterize_bars=False)]
+        sys.stdout.write(f'\n{self.num_samples} samples will be plotted across {num_pages} figures\n')
+        return [StackedBarPlotPage(
+            parent_plotter=self,
+            page_df=self.output_count_table_as_df.iloc[page_index * samples_per_page:(page_index + 1) * samples_per_page],
+            fig_output_path_base=f'{fig_output_path_base}_page_{page_index + 1}', type_plotting=type_plotting,
+            rasterize_bars=True) for page_index in range(num_pages)]
+
+    def _plot_and_write_out_pages_in_parallel(self, plot_page_list):
+        page_input_queue = Queue()
+        for plot_page in plot_page_list:
+            page_input_queue.put(plot_page)
+        num_processes = min(self.num_proc, len(plot_page_list))
+        for n in range(num_processes):
+            page_input_queue.put('STOP')
+
+        all_processes = []
+        for n in range(num_processes):
+            p = Process(target=self._plot_page_worker, args=(page_input_queue,))
+            all_processes.append(p)
+            p.start()
+
+        for p in all_processes:
+            p.join()
+
+        for p in all_processes:
+            if p.exitcode != 0:
+                raise RuntimeError('Error plotting stacked bar plot figure pages')
+
+    @staticmethod
+    def _plot_page_worker(page_input_queue):
+        for plot_page in iter(page_input_queue.get, 'STOP'):
+            sys.stdout.write(f'\rPlotting {plot_page.fig_output_path_base}')
+            # The pages are already being plotted in parallel so the vector formats are written in this process
+            figure_exporter.configure(formats=plot_page.figure_formats, dpi=plot_page.figure_dpi)
+            plot_page.plot_and_write_out_page()
+
+
+class TypeStackedBarPlotter(StackedBarPlotter):
     """Class for plotting the type count table output"""
-    def __init__(self, type_relative_abund_count_table_path, output_directory, date_time_str=None):
+    def __init__(
+            self, type_relative_abund_count_table_path, output_directory, date_time_str=None,
+            num_proc=1):
         self.type_rel_abund_count_table_path = type_relative_abund_count_table_path
         self.output_directory = output_directory
         if date_time_str:
@@ -367,39 +465,14 @@ class TypeStackedBarPlotter:
         self.num_samples = len(self.output_count_table_as_df.index.values.tolist())
         self.samples_per_subplot = 50
         self.number_of_subplots = self._infer_num_subplots()
-        self.f, self.axarr = plt.subplots(self.number_of_subplots + 1, 1, figsize=(10, 3 * self.number_of_subplots))
+        self.num_proc = num_proc
         self.output_path_list = []
 
+    @profile_stage()
     def plot_stacked_bar_profiles(self):
         print('\n\nPlotting ITS2 type profile abundances')
-        for sub_plot_index in range(self.number_of_subplots):
-            sub_plotter = SubPlotter(index_of_this_subplot=sub_plot_index, parent_plotter_instance=self)
-            sub_plotter.plot_seq_subplot()
-
-        self._plot_legend()
-
-        plt.tight_layout()
-
-        self._write_out_plot()
-
-
-    def _write_out_plot(self):
-        sys.stdout.write('\nFigure generation complete')
-        sys.stdout.write('\nFigures output to:\n')
-
-        svg_path = f'{self.fig_output_base}_type_abundance_stacked_bar_plot.svg'
-        self.output_path_list.append(svg_path)
-        sys.stdout.write(f'{svg_path}\n')
-        plt.savefig(svg_path)
-
-        png_path = f'{self.fig_output_base}_type_abundance_stacked_bar_plot.png'
-        self.output_path_list.append(png_path)
-        sys.stdout.write(f'{png_path}\n')
-        plt.savefig(png_path, dpi=600)
-
-    def _plot_legend(self):
-        legend_plotter = LegendPlotter(parent_plotter=self, type_plotting=True)
-        legend_plotter.plot_legend_seqs()
+        self._plot_and_write_out_pages(
+            fig_output_path_base=f'{self.fig_output_base}_type_abundance_stacked_bar_plot', type_plotting=True)
 
     def _infer_num_subplots(self):
         # number of subplots will be one per smp_per_plot
@@ -473,11 +546,12 @@ class TypeStackedBarPlotter:
         return {int(k):v for k, v in str_color_dict.items()}
 
 
-class SeqStackedBarPlotter():
+class SeqStackedBarPlotter(StackedBarPlotter):
     """Class for plotting the sequence count table output"""
     def __init__(
             self, seq_relative_abund_count_table_path_post_med, seq_relative_abund_df_pre_med, output_directory,
-            no_pre_med_seqs, ordered_seq_list, date_time_str=None, ordered_sample_uid_list=None):
+            no_pre_med_seqs, ordered_seq_list, date_time_str=None, ordered_sample_uid_list=None,
+            num_proc=1):
         self.seq_relative_abund_count_table_path_post_med = seq_relative_abund_count_table_path_post_med
         self.seq_relative_abund_df_pre_med = seq_relative_abund_df_pre_med
         self.ordered_seq_list = ordered_seq_list
@@ -507,11 +581,11 @@ class SeqStackedBarPlotter():
         self.num_samples = len(self.output_count_table_as_df.index.values.tolist())
         self.samples_per_subplot = 50
         self.number_of_subplots = self._infer_number_of_subplots()
-        # we add  1 to the n_subplots here for the legend at the bottom
-        self.f, self.axarr = plt.subplots(self.number_of_subplots + 1, 1, figsize=(10, 3 * self.number_of_subplots))
+        self.num_proc = num_proc
         self.output_path_list = []
         self.no_pre_med_seqs = no_pre_med_seqs
 
+    @profile_stage()
     def plot_stacked_bar_seqs(self):
         self._plot_stacked_bar_seqs_post_med()
         if not self.no_pre_med_seqs:
@@ -520,37 +594,7 @@ class SeqStackedBarPlotter():
 
     def _plot_stacked_bar_seqs_post_med(self):
         print('\n\nPlotting sequence abundances')
-        for sub_plot_index in range(self.number_of_subplots):
-            sub_plotter = SubPlotter(index_of_this_subplot=sub_plot_index, parent_plotter_instance=self)
-            sub_plotter.plot_seq_subplot()
-
-        self._plot_legend()
-
-        plt.tight_layout()
-
-        self._write_out_plot()
-
-        self.output_path_list.extend(
-            [
-                f'{self.fig_output_base}_seq_abundance_stacked_bar_plots.svg',
-                f'{self.fig_output_base}_seq_abundance_stacked_bar_plots.png'
-            ])
-
-    def _write_out_plot(self):
-        sys.stdout.write('\nFigure generation complete')
-        sys.stdout.write('\nFigures output to:\n')
-
-        svg_path = f'{self.fig_output_base}_seq_abundance_stacked_bar_plot.svg'
-        sys.stdout.write(f'{svg_path}\n')
-        plt.savefig(svg_path)
-
-        png_path = f'{self.fig_output_base}_seq_abundance_stacked_bar_plot.png'
-        sys.stdout.write(f'{png_path}\n')
-        plt.savefig(png_path, dpi=600)
-
-    def _plot_legend(self):
-        legend_plotter = LegendPlotter(parent_plotter=self)
-        legend_plotter.plot_legend_seqs()
+        self._plot_and_write_out_pages(fig_output_path_base=f'{self.fig_output_base}_seq_abundance_stacked_bar_plot')
 
     def _get_end_index_for_slicing_plotting_data(self, i):
         if i == self.number_of_subplots - 1:
@@ -604,42 +648,7 @@ class SeqStackedBarPlotter():
         """At this stage we have the ordered list of seqs we now need to order the samples
         this method will return us the names of the samples in order that they should be plotted.
         """
-        # {sequence_name_found_to_be_most_abund_in_sample: num_samples_it_was_found_to_be_most_abund_in}
-        max_seq_ddict = defaultdict(int)
-        # {most_abundant_seq_name: [(dss.id, rel_abund_of_most_abund_seq) for samples with that seq as most abund]}
-        seq_to_samp_ddict = defaultdict(list)
-
-        # for each sample get the columns name of the max value of a div not including the columns in the following:
-        no_maj_seq = []
-        for sample_id_to_sort in self.output_count_table_as_df.index.values.tolist():
-            smp_series = self.output_count_table_as_df.loc[sample_id_to_sort].astype('float')
-
-            rel_abund_of_max_abund_seq_name = smp_series.max()
-            if not rel_abund_of_max_abund_seq_name > 0:
-                no_maj_seq.append(sample_id_to_sort)
-            else:
-                max_abund_seq_name = smp_series.idxmax()
-                # add a tup of sample name and rel abund of seq to the seq_to_samp_dict
-                seq_to_samp_ddict[max_abund_seq_name].append((sample_id_to_sort, rel_abund_of_max_abund_seq_name))
-                # add this to the ddict count
-                max_seq_ddict[max_abund_seq_name] += 1
-
-        # then once we have compelted this for all sequences
-        # generate the sample order according to the sequence order
-        ordered_sample_list = []
-        # get an ordered list of the sequencs according to the max_seq_ddict
-        ordered_list_of_sequences = [x[0] for x in sorted(max_seq_ddict.items(), key=lambda x: x[1], reverse=True)]
-
-        for seq_to_order_samples_by in ordered_list_of_sequences:
-            tup_list_of_samples_that_had_sequence_as_most_abund = seq_to_samp_ddict[seq_to_order_samples_by]
-            ordered_list_of_samples_for_seq_ordered = [
-                x[0] for x in sorted(tup_list_of_samples_that_had_sequence_as_most_abund,
-                                     key=lambda x: x[1], reverse=True)]
-            ordered_sample_list.extend(ordered_list_of_samples_for_seq_ordered)
-
-        ordered_sample_list.extend(no_maj_seq)
-
-        return ordered_sample_list
+        return self.thread_safe_general.order_samples_by_most_abundant_seq(self.output_count_table_as_df)
 
     def _set_ordered_list_of_seqs_names(self):
         """Get a list of the sequences in order of their abundance and use this list to create the colour dict
@@ -758,8 +767,9 @@ class SeqStackedBarPlotter():
     def _plot_stacked_bar_seqs_pre_med(self):
         pre_med_seq_plotter = self.PreMedSeqPlotter(parent=self)
         pre_med_seq_plotter.plot_stacked_bar_seqs()
+        self.output_path_list.extend(pre_med_seq_plotter.output_path_list)
 
-    class PreMedSeqPlotter():
+    class PreMedSeqPlotter(StackedBarPlotter):
         def __init__(self, parent):
             self.parent = parent
             self.thread_safe_general = ThreadSafeGeneral()
@@ -777,8 +787,7 @@ class SeqStackedBarPlotter():
             self.num_samples = len(self.output_count_table_as_df.index.values.tolist())
             self.samples_per_subplot = 50
             self.number_of_subplots = self._infer_number_of_subplots()
-            # we add  1 to the n_subplots here for the legend at the bottom
-            self.f, self.axarr = plt.subplots(self.number_of_subplots + 1, 1, figsize=(10, 3 * self.number_of_subplots))
+            self.num_proc = self.parent.num_proc
             self.output_path_list = []
 
         def _curate_output_count_table(self, rel_abund_df):
@@ -793,37 +802,8 @@ class SeqStackedBarPlotter():
 
         def plot_stacked_bar_seqs(self):
             print('\n\nPlotting sequence abundances')
-            for sub_plot_index in range(self.number_of_subplots):
-                sub_plotter = SubPlotter(index_of_this_subplot=sub_plot_index, parent_plotter_instance=self)
-                sub_plotter.plot_seq_subplot()
-
-            self._plot_legend()
-
-            plt.tight_layout()
-
-            self._write_out_plot()
-
-            self.output_path_list.extend(
-                [
-                    f'{self.fig_output_base}_seq_abundance_stacked_bar_plots.svg',
-                    f'{self.fig_output_base}_seq_abundance_stacked_bar_plots.png'
-                ])
-
-        def _write_out_plot(self):
-            sys.stdout.write('\nFigure generation complete')
-            sys.stdout.write('\nFigures output to:\n')
-
-            svg_path = f'{self.fig_output_base}_seq_abundance_stacked_bar_plot.svg'
-            sys.stdout.write(f'{svg_path}\n')
-            plt.savefig(svg_path)
-
-            png_path = f'{self.fig_output_base}_seq_abundance_stacked_bar_plot.png'
-            sys.stdout.write(f'{png_path}\n')
-            plt.savefig(png_path, dpi=600)
-
-        def _plot_legend(self):
-            legend_plotter = LegendPlotter(parent_plotter=self)
-            legend_plotter.plot_legend_seqs()
+            self._plot_and_write_out_pages(
+                fig_output_path_base=f'{self.fig_output_base}_seq_abundance_stacked_bar_plot')
 
         def _infer_number_of_subplots(self):
             if (self.num_samples % self.samples_per_subplot) != 0:
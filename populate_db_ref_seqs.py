@@ -18,13 +18,32 @@ def populate_db_with_ref_seqs():
     thread_safe_general = ThreadSafeGeneral()
     fasta_path = os.path.abspath(os.path.join(os.path.dirname(__file__), 'symbiodiniaceaeDB', 'refSeqDB.fa'))
     fasta_dict = thread_safe_general.create_dict_from_fasta(fasta_path=fasta_path)
-    current_ref_seq_names = [rs.name for rs in ReferenceSequence.objects.all()]
+    current_ref_seq_names = set(ReferenceSequence.objects.values_list('name', flat=True))
+    # sequence hash: ReferenceSequence name of the sequences already in the db, fetched in a single query
+    existing_hash_to_name_dict = {
+        sequence_hash: name if has_name else f'{uid}_{clade}' for sequence_hash, name, has_name, uid, clade in
+        ReferenceSequence.objects.exclude(sequence_hash=None).values_list(
+            'sequence_hash', 'name', 'has_name', 'id', 'clade')}
+    # sequence hash: name of the sequences queued for creation in this run.
+    # refSeqDB.fa itself contains some duplicate sequences and only the first of each is created.
+    queued_hash_to_name_dict = {}
     bulk_new_rs_list = []
     created_name_list = []
     for new_name, new_seq in fasta_dict.items():
         if new_name not in current_ref_seq_names:
+            sequence_hash = ReferenceSequence.make_sequence_hash(new_seq)
+            if sequence_hash in existing_hash_to_name_dict:
+                print(f'Sequence {new_name} already present in db as {existing_hash_to_name_dict[sequence_hash]}. '
+                      f'Sequence will not be added.')
+                continue
+            if sequence_hash in queued_hash_to_name_dict:
+                print(f'Sequence {new_name} is a duplicate of {queued_hash_to_name_dict[sequence_hash]} '
+                      f'in refSeqDB.fa. Sequence will not be added.')
+                continue
+            queued_hash_to_name_dict[sequence_hash] = new_name
             bulk_new_rs_list.append(
-                ReferenceSequence(name=new_name, clade=new_name[0], sequence=new_seq, has_name=True))
+                ReferenceSequence(
+                    name=new_name, clade=new_name[0], sequence=new_seq, has_name=True, sequence_hash=sequence_hash))
             created_name_list.append(new_name)
     ReferenceSequence.objects.bulk_create(bulk_new_rs_list)
     if created_name_list:
@@ -34,4 +53,5 @@ def populate_db_with_ref_seqs():
         print('All sequences already present in database.')
 
 
-populate_db_with_ref_seqs()
+if __name__ == "__main__":
+    populate_db_with_ref_seqs()
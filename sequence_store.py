@@ -0,0 +1,165 @@
+import os
+import numpy as np
+from general import ThreadSafeGeneral
+
+
+class UniqueSequenceStore:
+    """
+    A compact, per-DataSet store of the unique nucleotide sequences found in each of the samples.
+    It is used in place of the .fasta and .names file pairs that were previously written out (and read back in)
+    between the taxonomic screening, MED and pre-MED stages of data loading.
+
+    Every unique sequence of the DataSet is held once in an interned sequence table: sequences.bin holds the
+    concatenated nucleotide sequences and sequence_offsets.npy holds the start offset of each sequence
+    (the seq_id of a sequence is its index in the offsets array). Each sample (separated by clade) is then represented
+    by an array of (seq_id, count) pairs. All files are raw binary or .npy so that they can be memory mapped by the
+    workers that read them.
+
+    The workers that populate the store run in parallel. Each worker therefore writes a shard for each of its samples
+    (the sequences as text and the counts as an array) and the shards are interned into the sequence table
+    by a single call to consolidate_shards once all of the workers are complete.
+
+    Text files are only materialised (e.g. write_redundant_fasta) for the external tools that need them.
+    """
+    seq_id_count_dtype = np.dtype([('seq_id', '<u4'), ('count', '<u4')])
+
+    def __init__(self, store_directory):
+        self.store_directory = store_directory
+        self.shard_directory = os.path.join(self.store_directory, 'shards')
+        self.sample_array_directory = os.path.join(self.store_directory, 'samples')
+        self.sequences_path = os.path.join(self.store_directory, 'sequences.bin')
+        self.sequence_offsets_path = os.path.join(self.store_directory, 'sequence_offsets.npy')
+        os.makedirs(self.shard_directory, exist_ok=True)
+        os.makedirs(self.sample_array_directory, exist_ok=True)
+        # The memory mapped sequence table. Loaded lazily.
+        self._sequences = None
+        self._sequence_offsets = None
+        self.thread_safe_general = ThreadSafeGeneral()
+
+    @staticmethod
+    def make_sample_key(sample_name, clade):
+        return f'{sample_name}_clade_{clade}'
+
+    @staticmethod
+    def split_sample_key(sample_key):
+        """Return the sample name and the clade of a sample key"""
+        sample_name, clade = sample_key.rsplit('_clade_', 1)
+        return sample_name, clade
+
+    # Writing
+    def write_sample_shard(self, sample_key, sequence_to_count_dict):
+        """Called by the workers to record the unique sequences (and their absolute abundances) of a sample"""
+        sequences = list(sequence_to_count_dict.keys())
+        counts = np.fromiter(
+            (sequence_to_count_dict[sequence] for sequence in sequences), dtype='<u4', count=len(sequences))
+        np.save(os.path.join(self.shard_directory, f'{sample_key}.counts.npy'), counts)
+        with open(os.path.join(self.shard_directory, f'{sample_key}.seqs'), 'w') as f:
+            f.write('\n'.join(sequences))
+
+    def consolidate_shards(self):
+        """
+        Intern the sequences of all outstanding shards into the sequence table and write out the
+        (seq_id, count) array for each of the shards. The shards are deleted once consolidated.
+        """
+        sequence_to_seq_id_dict = self._get_sequence_to_seq_id_dict()
+        new_sequences = []
+        for shard_file_name in sorted(os.listdir(self.shard_directory)):
+            if not shard_file_name.endswith('.seqs'):
+                continue
+            sample_key = shard_file_name[:-len('.seqs')]
+            shard_sequences_path = os.path.join(self.shard_directory, shard_file_name)
+            shard_counts_path = os.path.join(self.shard_directory, f'{sample_key}.counts.npy')
+            with open(shard_sequences_path, 'r') as f:
+                shard_sequences = f.read().split('\n')
+            counts = np.load(shard_counts_path)
+            if not len(counts):
+                shard_sequences = []
+
+            sample_array = np.empty(len(counts), dtype=self.seq_id_count_dtype)
+            for i, sequence in enumerate(shard_sequences):
+                seq_id = sequence_to_seq_id_dict.get(sequence)
+                if seq_id is None:
+                    seq_id = len(sequence_to_seq_id_dict)
+                    sequence_to_seq_id_dict[sequence] = seq_id
+                    new_sequences.append(sequence)
+                sample_array['seq_id'][i] = seq_id
+            sample_array['count'] = counts
+            np.save(self._get_sample_array_path(sample_key), sample_array)
+            os.remove(shard_sequences_path)
+            os.remove(shard_counts_path)
+
+        self._append_to_sequence_table(new_sequences)
+
+    def _append_to_sequence_table(self, new_sequences):
+        if not new_sequences and os.path.exists(self.sequence_offsets_path):
+            return
+        existing_offsets = self._load_sequence_offsets()
+        new_sequence_lengths = np.fromiter(
+            (len(sequence) for sequence in new_sequences), dtype='<i8', count=len(new_sequences))
+        new_offsets = np.concatenate(
+            (np.asarray(existing_offsets), existing_offsets[-1] + np.cumsum(new_sequence_lengths)))
+        with open(self.sequences_path, 'ab') as f:
+            f.write(''.join(new_sequences).encode('ascii'))
+        np.save(self.sequence_offsets_path, new_offsets)
+        # Invalidate the memory mapped table so that it is reloaded on next access
+        self._sequences = None
+        self._sequence_offsets = None
+
+    # Reading
+    def get_sample_keys(self):
+        return sorted(
+            file_name[:-len('.npy')] for file_name in os.listdir(self.sample_array_directory)
+            if file_name.endswith('.npy'))
+
+    def get_sample_array(self, sample_key):
+        """The memory mapped (seq_id, count) array of the sample"""
+        return np.load(self._get_sample_array_path(sample_key), mmap_mode='r')
+
+    def get_sample_absolute_abundance(self, sample_key):
+        return int(self.get_sample_array(sample_key)['count'].sum())
+
+    def get_sequence(self, seq_id):
+        self._load_sequence_table()
+        return self._sequences[
+               self._sequence_offsets[seq_id]:self._sequence_offsets[seq_id + 1]].tobytes().decode('ascii')
+
+    def iter_sample_sequences(self, sample_key):
+        """Yield the nucleotide sequence and absolute abundance of each of the unique sequences of a sample"""
+        for seq_id, count in self.get_sample_array(sample_key):
+            yield self.get_sequence(int(seq_id)), int(count)
+
+    def write_redundant_fasta(self, sample_key, fasta_path, sequence_name_prefix):
+        """
+        Materialise the de-uniqued (redundant) fasta of a sample e.g. for MED.
+        Sequences are named {sequence_name_prefix}_{counter}.
+        """
+        self.thread_safe_general.write_fasta_records(fasta_path, self._iter_redundant_records(
+            sample_key=sample_key, sequence_name_prefix=sequence_name_prefix))
+
+    def _iter_redundant_records(self, sample_key, sequence_name_prefix):
+        sequence_counter = 0
+        for sequence, count in self.iter_sample_sequences(sample_key):
+            for _ in range(count):
+                yield f'{sequence_name_prefix}_{sequence_counter}', sequence
+                sequence_counter += 1
+
+    def _get_sample_array_path(self, sample_key):
+        return os.path.join(self.sample_array_directory, f'{sample_key}.npy')
+
+    def _load_sequence_offsets(self):
+        if os.path.exists(self.sequence_offsets_path):
+            return np.load(self.sequence_offsets_path, mmap_mode='r')
+        return np.zeros(1, dtype='<i8')
+
+    def _load_sequence_table(self):
+        if self._sequence_offsets is None:
+            self._sequence_offsets = self._load_sequence_offsets()
+            if os.path.exists(self.sequences_path) and os.path.getsize(self.sequences_path):
+                self._sequences = np.memmap(self.sequences_path, dtype=np.uint8, mode='r')
+            else:
+                self._sequences = np.zeros(0, dtype=np.uint8)
+
+    def _get_sequence_to_seq_id_dict(self):
+        self._load_sequence_table()
+        return {
+            self.get_sequence(seq_id): seq_id for seq_id in range(len(self._sequence_offsets) - 1)}
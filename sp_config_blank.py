@@ -1,3 +1,8 @@
 system_type = "local"
 user_name = "undefined"
 user_email = "undefined"
+# Optional defaults of the --figure_formats and --figure_dpi arguments
+figure_formats = "svg,png"
+figure_dpi = 600
+# Optional. The number of parallel SFTP channels used to transfer the submissions from the web server
+sftp_transfer_channels = 4
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+from django import db
+try:
+    # Not available on Windows. Peak RSS and child process CPU times are then reported as None.
+    import resource
+except ImportError:
+    resource = None
+
+
+class StageProfiler:
+    """
+    Records the wall time, CPU time, peak RSS and number of DB queries of named stages of a SymPortal run
+    (e.g. the MED decomposition of a DataLoading or the profile discovery of an SPDataAnalysis) so that the
+    time of a run can be attributed to mothur, BLAST, MED, ORM writes, plotting etc.
+
+    Stages are recorded using the stage context manager or the profile_stage decorator and may be nested.
+    CPU times are reported for this process and, separately, for its terminated child processes
+    (e.g. mothur, BLAST, MED and the worker processes of the handlers). Peak RSS is the high water mark of the
+    process (and of its largest child) at the end of the stage. DB queries are only counted for the connections
+    of the thread that runs the stage (i.e. not for those of worker threads or processes).
+
+    A JSON report of all of the recorded stages is written out with write_report.
+    """
+    def __init__(self):
+        self.start_time_stamp = str(datetime.utcnow()).split('.')[0]
+        self.stage_records = []
+        self._lock = threading.Lock()
+        # Each thread keeps its own stack of the names of the currently open stages
+        self._thread_local = threading.local()
+
+    def reset(self):
+        """Clear the recorded stages so that a report only covers the run that it is written for
+        (e.g. when several SymPortalWorkFlowManager runs are made in the same process).
+        The profiler is reset in place as profile_stage has already been bound to it by the decorated modules."""
+        with self._lock:
+            self.start_time_stamp = str(datetime.utcnow()).split('.')[0]
+            self.stage_records = []
+
+    def _get_open_stage_stack(self):
+        if not hasattr(self._thread_local, 'open_stage_stack'):
+            self._thread_local.open_stage_stack = []
+        return self._thread_local.open_stage_stack
+
+    @contextmanager
+    def stage(self, stage_name):
+        open_stage_stack = self._get_open_stage_stack()
+        parent_stage_name = open_stage_stack[-1] if open_stage_stack else None
+        open_stage_stack.append(stage_name)
+        db_query_counter = DBQueryCounter()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_cpu_start = self._get_children_cpu_time()
+        try:
+            with ExitStack() as stack:
+                for connection in db.connections.all():
+                    stack.enter_context(connection.execute_wrapper(db_query_counter))
+                yield
+        finally:
+            children_cpu_end = self._get_children_cpu_time()
+            record = {
+                'stage': stage_name,
+                'parent_stage': parent_stage_name,
+                'depth': len(open_stage_stack) - 1,
+                'thread': threading.current_thread().name,
+                'wall_time_s': round(time.perf_counter() - wall_start, 3),
+                'cpu_time_s': round(time.process_time() - cpu_start, 3),
+                'children_cpu_time_s': round(
+                    children_cpu_end - children_cpu_start, 3) if children_cpu_end is not None else None,
+                'peak_rss_mb': self._get_peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+                'children_peak_rss_mb': self._get_peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+                'db_query_count': db_query_counter.query_count,
+                'db_query_time_s': round(db_query_counter.query_time, 3)
+            }
+            open_stage_stack.pop()
+            with self._lock:
+                self.stage_records.append(record)
+
+    def profile_stage(self, stage_name=None):
+        """Decorator version of stage. The stage name defaults to the qualified name of the function."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name or function.__qualname__):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def _get_children_cpu_time():
+        if resource is None:
+            return None
+        children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return children_usage.ru_utime + children_usage.ru_stime
+
+    @staticmethod
+    def _get_peak_rss_mb(who):
+        # ru_maxrss is in kilobytes on linux and in bytes on macOS
+        max_rss = resource.getrusage(who).ru_maxrss
+        if sys.platform == 'darwin':
+            return round(max_rss / (1024 * 1024), 1)
+        return round(max_rss / 1024, 1)
+
+    def write_report(self, report_path):
+        """Write the recorded stages (in the order they were completed) out as JSON"""
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        with self._lock:
+            report = {
+                'start_time_stamp': self.start_time_stamp,
+                'command': ' '.join(sys.argv),
+                'num_stages': len(self.stage_records),
+                'stages': list(self.stage_records)
+            }
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nStage profile report written to {report_path}')
+
+
+class DBQueryCounter:
+    """A django execute_wrapper that counts the queries (and the time spent executing them)"""
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_count += 1
+            self.query_time += time.perf_counter() - start
+
+
+# The profiler shared by all of the modules of a run
+stage_profiler = StageProfiler()
+profile_stage = stage_profiler.profile_stage
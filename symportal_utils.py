@@ -1,6 +1,8 @@
-from collections import defaultdict
+from collections import defaultdict, Counter
 import subprocess
 import os
+import gzip
+import numpy as np
 from general import ThreadSafeGeneral
 
 class BlastnAnalysis:
@@ -132,7 +134,7 @@ class MothurAnalysis:
         self.report_path = self.dot_file_file_path.replace('.file', '.contigs.report')
 
         try:
-            num_contigs = int(len(self.thread_safe_general.read_defined_file_to_list(self.fasta_path))/2)
+            num_contigs = self.thread_safe_general.count_fasta_records(self.fasta_path)
         except FileNotFoundError:
             raise RuntimeError('Make.contigs out fasta not found')
 
@@ -160,7 +162,7 @@ class MothurAnalysis:
 
         if os.path.exists(new_fasta_path):
             self.fasta_path = new_fasta_path
-            remaining_seqs = int(len(self.thread_safe_general.read_defined_file_to_list(self.fasta_path))/2)
+            remaining_seqs = self.thread_safe_general.count_fasta_records(self.fasta_path)
             if remaining_seqs == 0 and self.screening_for == 'overlap':
                 raise RuntimeError("no seqs left after overlap/mismatch seq screening")
 
@@ -219,21 +221,20 @@ class MothurAnalysis:
             )
         else:
             self.fasta_path = fwd_output_good_fasta_path
-        if len(self.thread_safe_general.read_defined_file_to_list(self.fasta_path)) == 0:
+        if self.thread_safe_general.count_fasta_records(self.fasta_path) == 0:
             raise RuntimeError('PCR fasta file is blank')
 
 
     def remove_primer_mismatch_annotations_from_fasta(self, fasta_path):
-        temp_fasta = []
-        fasta_to_clean = self.thread_safe_general.read_defined_file_to_list(fasta_path)
-        for i in range(len(fasta_to_clean) - 1):
-            if fasta_to_clean[i]:
-                if fasta_to_clean[i][0] == '>' and fasta_to_clean[i + 1]:
-                    if '|' in fasta_to_clean[i]:
-                        temp_fasta.extend([fasta_to_clean[i].split('|')[0], fasta_to_clean[i + 1]])
-                    else:
-                        temp_fasta.extend([fasta_to_clean[i].split('\t')[0], fasta_to_clean[i + 1]])
-        self.thread_safe_general.write_list_to_destination(fasta_path, temp_fasta)
+        cleaned_fasta_path = f'{fasta_path}.cleaned'
+        self.thread_safe_general.write_fasta_records(
+            cleaned_fasta_path,
+            (
+                (name.split('|')[0] if '|' in name else name.split('\t')[0], sequence) for name, sequence in
+                self.thread_safe_general.iter_fasta_records(fasta_path) if sequence
+            )
+        )
+        os.replace(cleaned_fasta_path, fasta_path)
     
     def check_fasta_and_name_valid(self):
         if self.name_file_path is None or self.fasta_path is None:
@@ -283,23 +284,23 @@ class MothurAnalysis:
         if not os.path.exists(fwd_output_scrapped_fasta_path):
             return False
         else:
-            scrapped_fasta_as_list = self.thread_safe_general.read_defined_file_to_list(fwd_output_scrapped_fasta_path)
-            if scrapped_fasta_as_list:
-                new_scrapped_fasta = self._make_new_fasta_no_multi_match_lines(scrapped_fasta_as_list)
-                if new_scrapped_fasta:
-                    self.thread_safe_general.write_list_to_destination(fwd_output_scrapped_fasta_path, new_scrapped_fasta)
-                    return True
-                else:
-                    return False
+            cleaned_scrapped_fasta_path = f'{fwd_output_scrapped_fasta_path}.cleaned'
+            num_written = 0
+            with open(cleaned_scrapped_fasta_path, 'w') as f:
+                for name, sequence in self._iter_scrapped_fasta_no_multi_match_records(fwd_output_scrapped_fasta_path):
+                    f.write(f'>{name}\n{sequence}\n')
+                    num_written += 1
+            if num_written:
+                os.replace(cleaned_scrapped_fasta_path, fwd_output_scrapped_fasta_path)
+                return True
             else:
+                os.remove(cleaned_scrapped_fasta_path)
                 return False
 
-    def _make_new_fasta_no_multi_match_lines(self, scrapped_fasta_as_list):
-        new_scrapped_fasta = []
-        for i in range(0, len(scrapped_fasta_as_list), 2):
-            if not 'multipleMatches' in scrapped_fasta_as_list[i] and len(scrapped_fasta_as_list[i + 1]) > 1:
-                new_scrapped_fasta.extend([scrapped_fasta_as_list[i], scrapped_fasta_as_list[i + 1]])
-        return new_scrapped_fasta
+    def _iter_scrapped_fasta_no_multi_match_records(self, scrapped_fasta_path):
+        for name, sequence in self.thread_safe_general.iter_fasta_records(scrapped_fasta_path):
+            if not 'multipleMatches' in name and len(sequence) > 1:
+                yield name, sequence
 
 
     def _split_abund_extract_output_path_name_and_fasta(self):
@@ -524,6 +525,536 @@ class MothurAnalysis:
             self.thread_safe_general.write_list_to_destination(self.pcr_oligo_file_path, oligo_file)
 
 
+class NativeQCAnalysis:
+    """
+    An in-process alternative to MothurAnalysis for the initial QC of a single sample.
+    It exposes the same execute_... methods and the same fasta_path/name_file_path attributes so that it can be
+    driven by the InitialMothurWorker in exactly the same way. Rather than running a mothur batch file for each
+    step (and writing out a new fasta/names pair each time), the paired fastq(.gz) files are streamed, assembled into
+    contigs and the remaining QC steps are performed on an in-memory collection of unique sequences.
+    Only the final .fasta and .names pair is written to disk (in execute_split_abund).
+
+    The parameters replicate those that we use with mothur:
+    make.contigs: match=1, mismatch=-4, gapopen=-4, gapextend=-1, deltaq=6, insert=20
+    screen.seqs: minoverlap=30, then maxambig=0
+    pcr.seqs: SymVar primers with pdiffs=2 and rdiffs=2, trying the reverse complement of the scrapped seqs
+    split.abund: cutoff=2
+    """
+    def __init__(
+            self, input_dir, output_dir, name,
+            fastq_gz_fwd_path, fastq_gz_rev_path, stdout_and_sterr_to_pipe):
+        self.name = name
+        self.fastq_gz_fwd_path = fastq_gz_fwd_path
+        self.fastq_gz_rev_path = fastq_gz_rev_path
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.stdout_and_sterr_to_pipe = stdout_and_sterr_to_pipe
+        # These are only populated once the final fasta and names pair has been written out
+        self.fasta_path = None
+        self.name_file_path = None
+        # Kept for compatability with the InitialMothurWorker which updates this attribute between screenings
+        self.screening_for = 'overlap'
+        # There is no subprocess so there is no completed process to scrape for errors
+        self.latest_completed_process_command = None
+        # make.contigs alignment parameters
+        self.match_score = 1
+        self.mismatch_score = -4
+        self.gap_open_score = -4
+        self.gap_extend_score = -1
+        self.delta_q = 6
+        self.insert_q = 20
+        # The size of the kmers used to find the diagonal on which the fwd and rev reads overlap and the
+        # number of diagonals either side of this that the banded alignment will consider
+        self.kmer_size = 10
+        self.band_width = 5
+        # The number of read pairs that are assembled (and aligned) together
+        self.contig_batch_size = 2000
+        # screening parameters
+        self.min_overlap = 30
+        self.max_ambig = 0
+        # The SymVar primers
+        self.pcr_fwd_primer = 'GAATTGCAGAACTCCGTGAACC'
+        self.pcr_rev_primer = 'CGGGTTCWCTTGTYTGACTTCATGC'
+        self.pcr_fwd_primer_mismatch = 2
+        self.pcr_rev_primer_mismatch = 2
+        self.split_abund_cutoff = 2
+        self.iupac_dict = {
+            'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T', 'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT',
+            'M': 'AC', 'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG', 'N': 'ACGT'
+        }
+        self.complement_trans = str.maketrans('ACGTRYSWKMBDHVN', 'TGCAYRSWMKVHDBN')
+        # The primer that we search for at the 3' end of the contigs is the reverse complement of the rev primer
+        self.pcr_rev_primer_rc = self._rev_comp(self.pcr_rev_primer)
+        self.pcr_fwd_primer_variants = self._expand_ambiguous_primer(self.pcr_fwd_primer)
+        self.pcr_rev_primer_rc_variants = self._expand_ambiguous_primer(self.pcr_rev_primer_rc)
+        # The in-memory equivalent of the fasta and names file pair.
+        # The key is the name of the representative sequence (as in the first column of a .names file)
+        self.rep_name_to_seq_dict = {}
+        self.rep_name_to_member_names_dict = {}
+        # The equivalent of the make.contigs .report file. Only required for the overlap screening.
+        self.seq_name_to_overlap_length_dict = {}
+        self.thread_safe_general = ThreadSafeGeneral()
+
+    # main QC commands
+    def execute_make_contigs(self):
+        """
+        Stream the fwd and rev fastq files and assemble each read pair into a contig. The read pairs are assembled
+        in batches of contig_batch_size so that the gapped alignments of a batch can be computed together.
+        Every contig is initially its own representative sequence.
+        """
+        try:
+            read_pair_batch = []
+            for read_pair in self._stream_fastq_pairs():
+                read_pair_batch.append(read_pair)
+                if len(read_pair_batch) == self.contig_batch_size:
+                    self._add_contigs(read_pair_batch)
+                    read_pair_batch = []
+            self._add_contigs(read_pair_batch)
+        except (OSError, EOFError, ValueError):
+            # Unreadable or truncated (g)zipped files and read pairs that don't match
+            raise RuntimeError('error in make.contigs')
+
+        num_contigs = len(self.rep_name_to_seq_dict)
+        if num_contigs == 0:
+            raise RuntimeError('empty fasta')
+        return num_contigs
+
+    def execute_screen_seqs(self):
+        if self.screening_for == 'overlap':
+            self._remove_reps([
+                rep_name for rep_name in self.rep_name_to_seq_dict
+                if self.seq_name_to_overlap_length_dict[rep_name] < self.min_overlap])
+            if not self.rep_name_to_seq_dict:
+                raise RuntimeError("no seqs left after overlap seq screening")
+        elif self.screening_for == 'ambig':
+            self._remove_reps([
+                rep_name for rep_name, seq in self.rep_name_to_seq_dict.items()
+                if self._count_ambiguous_nucleotides(seq) > self.max_ambig])
+        else:
+            raise RuntimeError("Unrecognized 'screening for' value")
+
+    def execute_pcr(self, do_reverse_pcr_as_well=False):
+        """
+        Trim each of the sequences to the region between the fwd primer and the reverse complement of the
+        rev primer (the primers are removed). Sequences in which the primers are not found (scrapped sequences) are
+        reverse complemented and tried again if do_reverse_pcr_as_well is True.
+        As with mothur, sequences for which a primer matches in multiple places equally well are discarded and
+        the name members are not modified. Identical trimmed sequences are collapsed by the subsequent
+        execute_unique_seqs.
+        """
+        reps_to_remove = []
+        for rep_name, seq in self.rep_name_to_seq_dict.items():
+            trimmed_seq, multiple_matches = self._pcr_trim(seq)
+            if trimmed_seq is None and not multiple_matches and do_reverse_pcr_as_well:
+                trimmed_seq, multiple_matches = self._pcr_trim(self._rev_comp(seq))
+            if trimmed_seq:
+                self.rep_name_to_seq_dict[rep_name] = trimmed_seq
+            else:
+                reps_to_remove.append(rep_name)
+        self._remove_reps(reps_to_remove)
+        if not self.rep_name_to_seq_dict:
+            raise RuntimeError('PCR fasta file is blank')
+
+    def execute_unique_seqs(self):
+        """Collapse identical sequences. The representative is the first sequence encountered."""
+        seq_to_rep_name_dict = {}
+        new_rep_name_to_seq_dict = {}
+        new_rep_name_to_member_names_dict = {}
+        for rep_name, seq in self.rep_name_to_seq_dict.items():
+            if seq in seq_to_rep_name_dict:
+                new_rep_name_to_member_names_dict[seq_to_rep_name_dict[seq]].extend(
+                    self.rep_name_to_member_names_dict[rep_name])
+            else:
+                seq_to_rep_name_dict[seq] = rep_name
+                new_rep_name_to_seq_dict[rep_name] = seq
+                new_rep_name_to_member_names_dict[rep_name] = self.rep_name_to_member_names_dict[rep_name]
+        self.rep_name_to_seq_dict = new_rep_name_to_seq_dict
+        self.rep_name_to_member_names_dict = new_rep_name_to_member_names_dict
+
+    def execute_split_abund(self):
+        """
+        Keep only those sequences with an abundance greater than the cutoff and write out the final
+        .fasta and .names pair. As with the MothurAnalysis, if there are no abundant sequences then the
+        sequences are left unchanged.
+        """
+        rare_reps = [
+            rep_name for rep_name, member_names in self.rep_name_to_member_names_dict.items()
+            if len(member_names) <= self.split_abund_cutoff]
+        if len(rare_reps) < len(self.rep_name_to_seq_dict):
+            self._remove_reps(rare_reps)
+
+        self._write_out_fasta_and_name_file()
+
+    def check_fasta_and_name_valid(self):
+        if self.name_file_path is None or self.fasta_path is None:
+            raise RuntimeError
+        if 'fasta' not in self.fasta_path or 'names' not in self.name_file_path:
+            raise RuntimeError
+
+    # #####################
+    def _write_out_fasta_and_name_file(self):
+        self.fasta_path = os.path.join(self.output_dir, f'{self.name}.native.qc.abund.fasta')
+        self.name_file_path = os.path.join(self.output_dir, f'{self.name}.native.qc.abund.names')
+        self.thread_safe_general.write_fasta_records(self.fasta_path, self.rep_name_to_seq_dict.items())
+        self.thread_safe_general.write_list_to_destination(
+            self.name_file_path,
+            (f'{rep_name}\t{",".join(member_names)}' for rep_name, member_names in
+             self.rep_name_to_member_names_dict.items()))
+        self.check_fasta_and_name_valid()
+
+    def _remove_reps(self, rep_names_to_remove):
+        for rep_name in rep_names_to_remove:
+            del self.rep_name_to_seq_dict[rep_name]
+            del self.rep_name_to_member_names_dict[rep_name]
+
+    def _stream_fastq_pairs(self):
+        """
+        Yield the sequence name, fwd seq, fwd quality string, rev seq and rev quality string for each read pair.
+        As with mothur, the ':' characters of the read names are replaced with '_'.
+        """
+        with self._open_fastq(self.fastq_gz_fwd_path) as fwd_file, \
+                self._open_fastq(self.fastq_gz_rev_path) as rev_file:
+            while True:
+                fwd_record = [fwd_file.readline().rstrip() for _ in range(4)]
+                rev_record = [rev_file.readline().rstrip() for _ in range(4)]
+                if not fwd_record[0] and not rev_record[0]:
+                    return
+                if not fwd_record[0].startswith('@') or not rev_record[0].startswith('@'):
+                    raise ValueError('malformed fastq record')
+                fwd_read_name = fwd_record[0][1:].split()[0]
+                rev_read_name = rev_record[0][1:].split()[0]
+                if fwd_read_name.endswith('/1') and rev_read_name.endswith('/2'):
+                    fwd_read_name, rev_read_name = fwd_read_name[:-2], rev_read_name[:-2]
+                if fwd_read_name != rev_read_name:
+                    raise ValueError('fwd and rev read names do not match')
+                if len(fwd_record[1]) != len(fwd_record[3]) or len(rev_record[1]) != len(rev_record[3]):
+                    raise ValueError('sequence and quality lengths do not match')
+                yield (
+                    fwd_read_name.replace(':', '_'),
+                    fwd_record[1].upper(), fwd_record[3], rev_record[1].upper(), rev_record[3])
+
+    @staticmethod
+    def _open_fastq(fastq_path):
+        if fastq_path.endswith('.gz'):
+            return gzip.open(fastq_path, 'rt')
+        return open(fastq_path, 'r')
+
+    def _add_contigs(self, read_pair_batch):
+        contig_list = self._make_contigs(
+            [(fwd_seq, fwd_qual, rev_seq, rev_qual) for _, fwd_seq, fwd_qual, rev_seq, rev_qual in read_pair_batch])
+        for read_pair, (contig, overlap_length) in zip(read_pair_batch, contig_list):
+            seq_name = read_pair[0]
+            self.rep_name_to_seq_dict[seq_name] = contig
+            self.rep_name_to_member_names_dict[seq_name] = [seq_name]
+            self.seq_name_to_overlap_length_dict[seq_name] = overlap_length
+
+    def _make_contigs(self, read_pair_list):
+        """
+        For each of a list of (fwd_seq, fwd_qual, rev_seq, rev_qual) read pairs, assemble a contig from the fwd read
+        and the reverse complement of the rev read. Returns a list of (contig, length of the overlap) tuples.
+        If no overlap can be found, the reads are concatenated and an overlap of 0 is returned so that the contig is
+        removed during the overlap screening.
+        The read pairs that do not overlap perfectly are aligned together by _banded_overlap_alignments.
+        """
+        rc_read_pair_list = []
+        aligned_columns_list = []
+        to_align_list = []
+        for index, (fwd_seq, fwd_qual, rev_seq, rev_qual) in enumerate(read_pair_list):
+            rc_seq = self._rev_comp(rev_seq)
+            rc_read_pair_list.append((fwd_seq, fwd_qual, rc_seq, rev_qual[::-1]))
+            aligned_columns = None
+            diagonal = self._find_overlap_diagonal(fwd_seq, rc_seq)
+            if diagonal is not None:
+                aligned_columns = self._get_ungapped_overlap_if_perfect(fwd_seq, rc_seq, diagonal)
+                if aligned_columns is None:
+                    to_align_list.append((index, fwd_seq, rc_seq, diagonal))
+            aligned_columns_list.append(aligned_columns)
+
+        banded_alignment_list = self._banded_overlap_alignments(
+            [(fwd_seq, rc_seq, diagonal) for _, fwd_seq, rc_seq, diagonal in to_align_list])
+        for (index, _, _, _), aligned_columns in zip(to_align_list, banded_alignment_list):
+            aligned_columns_list[index] = aligned_columns
+
+        return [
+            self._build_contig(fwd_seq, fwd_qual, rc_seq, rc_qual, aligned_columns) for
+            (fwd_seq, fwd_qual, rc_seq, rc_qual), aligned_columns in zip(rc_read_pair_list, aligned_columns_list)]
+
+    def _build_contig(self, fwd_seq, fwd_qual, rc_seq, rc_qual, aligned_columns):
+        if aligned_columns is None:
+            return fwd_seq + rc_seq, 0
+
+        fwd_start, rc_start = next((f, r) for f, r in aligned_columns if f is not None and r is not None)
+        fwd_end, rc_end = next((f, r) for f, r in reversed(aligned_columns) if f is not None and r is not None)
+
+        # The non-overlapping 5' end (only one of the two reads will have bases here)
+        contig = [fwd_seq[:fwd_start], rc_seq[:rc_start]]
+        for fwd_index, rc_index in aligned_columns:
+            if fwd_index is not None and rc_index is not None:
+                contig.append(self._resolve_overlap_base(
+                    fwd_seq[fwd_index], fwd_qual[fwd_index], rc_seq[rc_index], rc_qual[rc_index]))
+            elif fwd_index is not None:
+                if ord(fwd_qual[fwd_index]) - 33 >= self.insert_q:
+                    contig.append(fwd_seq[fwd_index])
+            else:
+                if ord(rc_qual[rc_index]) - 33 >= self.insert_q:
+                    contig.append(rc_seq[rc_index])
+        # The non-overlapping 3' end
+        contig.extend([fwd_seq[fwd_end + 1:], rc_seq[rc_end + 1:]])
+        return ''.join(contig), len(aligned_columns)
+
+    def _resolve_overlap_base(self, fwd_base, fwd_q_char, rc_base, rc_q_char):
+        if fwd_base == rc_base:
+            return fwd_base
+        if fwd_base == 'N':
+            return rc_base
+        if rc_base == 'N':
+            return fwd_base
+        fwd_q = ord(fwd_q_char) - 33
+        rc_q = ord(rc_q_char) - 33
+        if abs(fwd_q - rc_q) < self.delta_q:
+            return 'N'
+        return fwd_base if fwd_q > rc_q else rc_base
+
+    def _find_overlap_diagonal(self, fwd_seq, rc_seq):
+        """
+        Return the offset of the rc read relative to the fwd read (i.e. fwd index - rc index) that is supported
+        by the greatest number of shared kmers. None if fewer than two kmers are shared.
+        """
+        k = self.kmer_size
+        fwd_kmer_to_index_dict = {fwd_seq[i:i + k]: i for i in range(len(fwd_seq) - k + 1)}
+        diagonal_counter = Counter()
+        for j in range(len(rc_seq) - k + 1):
+            i = fwd_kmer_to_index_dict.get(rc_seq[j:j + k])
+            if i is not None:
+                diagonal_counter[i - j] += 1
+        if not diagonal_counter:
+            return None
+        diagonal, support = diagonal_counter.most_common(1)[0]
+        if support < 2:
+            return None
+        return diagonal
+
+    @staticmethod
+    def _get_ungapped_overlap_if_perfect(fwd_seq, rc_seq, diagonal):
+        """
+        If the reads overlap without a single mismatch on the diagonal identified from the shared kmers,
+        take the ungapped overlap rather than aligning the reads. This is only the case for a minority of the
+        read pairs (most overlaps contain at least one sequencing error) and these are aligned by
+        _banded_overlap_alignments. Only in a repetitive overlap could the banded alignment find a different
+        (equally perfect but longer) overlap on a neighbouring diagonal.
+        """
+        rc_start = max(0, -diagonal)
+        rc_end = min(len(rc_seq), len(fwd_seq) - diagonal)
+        if rc_end <= rc_start:
+            return None
+        if fwd_seq[rc_start + diagonal:rc_end + diagonal] != rc_seq[rc_start:rc_end]:
+            return None
+        return [(j + diagonal, j) for j in range(rc_start, rc_end)]
+
+    def _banded_overlap_alignments(self, alignment_input_list):
+        """
+        An overlap (end gaps free) alignment of the fwd and rc reads with affine gap penalties,
+        restricted to a band around the diagonal identified from the shared kmers.
+        The input is a list of (fwd_seq, rc_seq, diagonal) tuples. For each, a list of aligned columns
+        as (fwd_index, rc_index) tuples (where a gap is represented by None) is returned, or None if the
+        reads could not be aligned.
+        The band is only 2 * band_width + 1 cells wide so rather than vectorising a single alignment,
+        each row of the dynamic programming is computed with numpy for all of the read pairs at once.
+        """
+        if not alignment_input_list:
+            return []
+        num_pairs = len(alignment_input_list)
+        w = self.band_width
+        band_size = 2 * w + 1
+        neg_inf = float('-inf')
+        band_indices = np.arange(band_size)
+        pair_indices = np.arange(num_pairs)
+
+        n = np.array([len(fwd_seq) for fwd_seq, _, _ in alignment_input_list])
+        m = np.array([len(rc_seq) for _, rc_seq, _ in alignment_input_list])
+        diagonal = np.array([diag for _, _, diag in alignment_input_list])
+        fwd_array = np.zeros((num_pairs, max(n.max(), 1)), dtype=np.uint8)
+        rc_array = np.zeros((num_pairs, max(m.max(), 1)), dtype=np.uint8)
+        for p, (fwd_seq, rc_seq, _) in enumerate(alignment_input_list):
+            fwd_array[p, :len(fwd_seq)] = np.frombuffer(fwd_seq.encode(), dtype=np.uint8)
+            rc_array[p, :len(rc_seq)] = np.frombuffer(rc_seq.encode(), dtype=np.uint8)
+
+        # For cell (i, j), the band index is k = j - i + diagonal + w.
+        # (i-1, j-1) has the same k in the previous row, (i-1, j) has k + 1 and (i, j-1) has k - 1 in the same row.
+        # Row r of the arrays is row i = first_row + r of the dynamic programming of each read pair.
+        first_row = np.maximum(0, diagonal - w)
+        last_row = np.minimum(n, m + diagonal + w)
+        num_rows = int((last_row - first_row).max()) + 1
+        # traceback: for h, 0=match, 1=x, 2=y, 3=start. For x and y, whether the gap was extended.
+        tb_h = np.full((num_pairs, num_rows, band_size), 3, dtype=np.int8)
+        tb_x = np.zeros((num_pairs, num_rows, band_size), dtype=bool)
+        tb_y = np.zeros((num_pairs, num_rows, band_size), dtype=bool)
+        prev_h = np.full((num_pairs, band_size), neg_inf)
+        prev_x = np.full((num_pairs, band_size), neg_inf)
+        neg_inf_column = np.full((num_pairs, 1), neg_inf)
+        best_score = np.full(num_pairs, neg_inf)
+        best_row = np.full(num_pairs, -1)
+        best_k = np.zeros(num_pairs, dtype=int)
+        for r in range(num_rows):
+            i = first_row + r
+            j = band_indices + (i - diagonal - w)[:, None]
+            valid = (j >= 0) & (j <= m[:, None]) & (i <= last_row)[:, None]
+            # free leading end gaps
+            start = valid & ((i == 0)[:, None] | (j == 0))
+            inner = valid & ~start
+
+            fwd_bases = fwd_array[pair_indices, np.clip(i - 1, 0, fwd_array.shape[1] - 1)]
+            rc_bases = rc_array[pair_indices[:, None], np.clip(j - 1, 0, rc_array.shape[1] - 1)]
+            match_score = prev_h + np.where(
+                fwd_bases[:, None] == rc_bases, self.match_score, self.mismatch_score)
+
+            open_score = np.hstack((prev_h[:, 1:], neg_inf_column)) + self.gap_open_score
+            extend_score = np.hstack((prev_x[:, 1:], neg_inf_column)) + self.gap_extend_score
+            x_extended = inner & (extend_score > open_score)
+            x_score = np.where(inner, np.where(x_extended, extend_score, open_score), neg_inf)
+
+            # The best score of each cell that does not end in a y gap (0 for the start cells). As a y gap is
+            # better extended than closed and opened again, the y score is the best of opening a gap after each of
+            # the cells to the left and extending it: y[k] = max over k' < k of h[k'] + open + (k - 1 - k') * extend
+            h_no_y = np.where(start, 0, np.where(inner, np.maximum(match_score, x_score), neg_inf))
+            cumulative_max = np.maximum.accumulate(h_no_y - band_indices * self.gap_extend_score, axis=1)
+            y_score = np.hstack((
+                neg_inf_column,
+                cumulative_max[:, :-1] + self.gap_open_score + band_indices[:-1] * self.gap_extend_score))
+            y_score = np.where(inner, y_score, neg_inf)
+
+            use_match = (match_score >= x_score) & (match_score >= y_score)
+            use_x = ~use_match & (x_score >= y_score)
+            h = np.where(use_match, match_score, np.where(use_x, x_score, y_score))
+            h = np.where(start, 0, np.where(inner, h, neg_inf))
+            tb_h[:, r] = np.where(inner, np.where(use_match, 0, np.where(use_x, 1, 2)), 3)
+            tb_x[:, r] = x_extended
+            tb_y[:, r, 1:] = inner[:, 1:] & (
+                y_score[:, :-1] + self.gap_extend_score > h[:, :-1] + self.gap_open_score)
+
+            # free trailing end gaps
+            end_score = np.where(valid & ((i == n)[:, None] | (j == m[:, None])), h, neg_inf)
+            row_best_k = end_score.argmax(axis=1)
+            row_best_score = end_score[pair_indices, row_best_k]
+            improved = row_best_score > best_score
+            best_score = np.where(improved, row_best_score, best_score)
+            best_row = np.where(improved, r, best_row)
+            best_k = np.where(improved, row_best_k, best_k)
+            prev_h, prev_x = h, x_score
+
+        return [
+            self._traceback_overlap_alignment(
+                tb_h[p], tb_x[p], tb_y[p], int(first_row[p]),
+                int(diagonal[p]), int(best_row[p]), int(best_k[p]))
+            if best_row[p] != -1 and best_score[p] > 0 else None
+            for p in range(num_pairs)]
+
+    def _traceback_overlap_alignment(self, tb_h, tb_x, tb_y, first_row, diagonal, best_row, best_k):
+        w = self.band_width
+        aligned_columns = []
+        r, k = best_row, best_k
+        state = tb_h[r, k]
+        while True:
+            i = first_row + r
+            j = k + i - diagonal - w
+            if state == 3 or i == 0 or j == 0:
+                break
+            if state == 0:
+                aligned_columns.append((i - 1, j - 1))
+                r -= 1
+                state = tb_h[r, k]
+            elif state == 1:
+                aligned_columns.append((i - 1, None))
+                extended = tb_x[r, k]
+                r -= 1
+                k += 1
+                state = 1 if extended else tb_h[r, k]
+            else:
+                aligned_columns.append((None, j - 1))
+                extended = tb_y[r, k]
+                k -= 1
+                state = 2 if extended else tb_h[r, k]
+        aligned_columns.reverse()
+        # Trim any terminal gap columns so that the overlap begins and ends with aligned bases
+        while aligned_columns and (aligned_columns[0][0] is None or aligned_columns[0][1] is None):
+            aligned_columns.pop(0)
+        while aligned_columns and (aligned_columns[-1][0] is None or aligned_columns[-1][1] is None):
+            aligned_columns.pop()
+        if not aligned_columns:
+            return None
+        return aligned_columns
+
+    def _pcr_trim(self, seq):
+        """
+        Return the sequence found between the fwd primer and the reverse complement of the rev primer
+        (or None if either primer could not be found) and whether a primer matched in multiple places.
+        """
+        fwd_match = self._find_primer(
+            seq, self.pcr_fwd_primer, self.pcr_fwd_primer_variants, self.pcr_fwd_primer_mismatch, from_end=False)
+        if fwd_match is None:
+            return None, False
+        if fwd_match == 'multipleMatches':
+            return None, True
+        region_start = fwd_match + len(self.pcr_fwd_primer)
+        rev_match = self._find_primer(
+            seq[region_start:], self.pcr_rev_primer_rc, self.pcr_rev_primer_rc_variants,
+            self.pcr_rev_primer_mismatch, from_end=True)
+        if rev_match is None:
+            return None, False
+        if rev_match == 'multipleMatches':
+            return None, True
+        trimmed_seq = seq[region_start:region_start + rev_match]
+        if not trimmed_seq:
+            return None, False
+        return trimmed_seq, False
+
+    def _find_primer(self, seq, primer, primer_variants, max_mismatch, from_end):
+        """
+        Return the start index of the primer in seq. Exact matches are looked for first (the first
+        occurrence for the fwd primer and the last for the rev primer). Otherwise the position with the fewest
+        mismatches (up to max_mismatch) is returned. If this position is not unique 'multipleMatches' is returned.
+        """
+        exact_indices = [
+            seq.rfind(variant) if from_end else seq.find(variant) for variant in primer_variants]
+        exact_indices = [index for index in exact_indices if index != -1]
+        if exact_indices:
+            return max(exact_indices) if from_end else min(exact_indices)
+
+        best_mismatches = max_mismatch + 1
+        best_indices = []
+        primer_length = len(primer)
+        for start in range(len(seq) - primer_length + 1):
+            mismatches = 0
+            for offset in range(primer_length):
+                if seq[start + offset] not in self.iupac_dict[primer[offset]]:
+                    mismatches += 1
+                    if mismatches > best_mismatches:
+                        break
+            if mismatches < best_mismatches:
+                best_mismatches = mismatches
+                best_indices = [start]
+            elif mismatches == best_mismatches and mismatches <= max_mismatch:
+                best_indices.append(start)
+        if not best_indices:
+            return None
+        if len(best_indices) > 1:
+            return 'multipleMatches'
+        return best_indices[0]
+
+    def _expand_ambiguous_primer(self, primer):
+        variants = ['']
+        for nucleotide in primer:
+            variants = [variant + option for variant in variants for option in self.iupac_dict[nucleotide]]
+        return variants
+
+    def _rev_comp(self, seq):
+        return seq.translate(self.complement_trans)[::-1]
+
+    @staticmethod
+    def _count_ambiguous_nucleotides(seq):
+        return len(seq) - seq.count('A') - seq.count('C') - seq.count('G') - seq.count('T')
+
+
 class NucleotideSequence:
     def __init__(self, sequence, name=None, abundance=None):
         self.sequence = sequence
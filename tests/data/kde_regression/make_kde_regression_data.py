@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Generate kde_regression_data.json, the reference for DataAnalysisKDETesting (see django_tests.py).
+For a few representative distributions of DIV relative abundances, the modes, extrema and VCC split of the
+MultiModalDetectionWorker are recorded using the exact scipy.stats.gaussian_kde rather than the binned KDE that
+the worker uses. This only needs to be run again if the distributions are changed. scipy is required.
+"""
+import json
+import os
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parents[3]))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
+import django
+django.setup()
+import numpy as np
+import pandas as pd
+from scipy.stats import gaussian_kde
+from data_analysis import SPDataAnalysis
+
+
+class ExactKDEMultiModalDetectionWorker(SPDataAnalysis.MultiModalDetectionWorker):
+    @staticmethod
+    def _binned_gaussian_kde(values, x_grid):
+        return gaussian_kde(values)(x_grid)
+
+
+def make_distributions():
+    rng = np.random.default_rng(34)
+    return {
+        'unimodal': rng.normal(0.3, 0.05, 40),
+        'bimodal_separated': np.concatenate((rng.normal(0.2, 0.05, 20), rng.normal(1.5, 0.1, 20))),
+        'bimodal_unequal': np.concatenate((rng.normal(0.5, 0.1, 30), rng.normal(2.0, 0.1, 6))),
+        'bimodal_close': np.concatenate((rng.normal(0.4, 0.08, 20), rng.normal(0.9, 0.08, 20))),
+        'skewed': rng.lognormal(-1, 0.6, 50),
+        'bimodal_small': np.concatenate((rng.normal(0.1, 0.02, 4), rng.normal(1.2, 0.02, 4))),
+    }
+
+
+def main():
+    case_list = []
+    for name, values in make_distributions().items():
+        values = [round(float(value), 6) for value in values]
+        rel_abund_df = pd.DataFrame({1: values}, index=list(range(1, len(values) + 1)))
+        worker = ExactKDEMultiModalDetectionWorker(rel_abund_df)
+        c, modes, pdf, x_grid = worker._find_modes_of_abundances(1)
+        split = worker.get_split_vcc_uid_lists()
+        case_list.append({
+            'name': name, 'values': values, 'mode_indices': [int(i) for i in c],
+            'extrema_indices': [int(i) for i in worker._get_extrema_indices(pdf)],
+            'split': None if split is None else [list(split[0]), list(split[1])]})
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kde_regression_data.json'), 'w') as f:
+        json.dump(case_list, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
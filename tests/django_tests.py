@@ -327,4 +327,1000 @@ class SPIntegrativeTestingJSONOnly(TransactionTestCase):
         custom_args_list = ['--between_sample_distances_sample_set', dss_uids_of_ds_str, '--num_proc',
                             str(self.num_proc), '--distance_method', 'braycurtis']
         test_spwfm = main.SymPortalWorkFlowManager(custom_args_list)
-        test_spwfm.start_work_flow()
\ No newline at end of file
+        test_spwfm.start_work_flow()
+
+class CronLoadingSchedulerTesting(TransactionTestCase):
+    """Tests of the concurrent scheduling of the cron loadings (cron_jobs/loading_scheduler.py) and of the
+    submission pipeline (cron_jobs/submission_pipeline.py).
+    The SymPortal workflows are replaced by fakes and run in threads so that these
+    tests can be run against the SQLite test database without any sequencing data."""
+
+    @classmethod
+    def setUp(cls):
+        import sys
+        from dbApp.models import User
+        # The cron_jobs modules import each other as they are run as scripts from that directory
+        cron_jobs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cron_jobs')
+        if cron_jobs_dir not in sys.path:
+            sys.path.append(cron_jobs_dir)
+        cls.user = User.objects.create(name='cron_test_user')
+        cls.symportal_testing_root_dir = os.path.abspath(os.path.dirname(__file__))
+
+    def _make_submission(self, name, number_samples, progress_status='transfer_to_framework_server_complete'):
+        from dbApp.models import Submission
+        submission_dir = os.path.join(self.symportal_testing_root_dir, 'cron_test_submissions', name)
+        os.makedirs(submission_dir, exist_ok=True)
+        open(os.path.join(submission_dir, f'{name}_datasheet.csv'), 'w').close()
+        return Submission.objects.create(
+            name=name, web_local_dir_path=f'/web/{name}', framework_local_dir_path=submission_dir,
+            progress_status=progress_status, submitting_user=self.user,
+            number_samples=number_samples, for_analysis=True)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(os.path.join(self.symportal_testing_root_dir, 'cron_test_submissions'), ignore_errors=True)
+
+    def test_concurrent_loading_within_core_budget(self):
+        print('\n\nTesting: concurrent_loading_within_core_budget\n\n')
+        import threading
+        from types import SimpleNamespace
+        from loading_scheduler import LoadingScheduler
+        from dbApp.models import Submission
+        large = self._make_submission('large_submission', 1000)
+        small = self._make_submission('small_submission', 10)
+        failing = self._make_submission('failing_submission', 5)
+        lock = threading.Lock()
+        running_num_procs = []
+        max_concurrent_num_procs = []
+        max_concurrent_loadings = []
+
+        def fake_work_flow_runner(custom_args_list):
+            num_proc = int(custom_args_list[custom_args_list.index('--num_proc') + 1])
+            with lock:
+                running_num_procs.append(num_proc)
+                max_concurrent_num_procs.append(sum(running_num_procs))
+                max_concurrent_loadings.append(len(running_num_procs))
+            try:
+                threading.Event().wait(0.2)
+                if 'failing_submission' in custom_args_list:
+                    raise RuntimeError('Fake loading error')
+                return SimpleNamespace(data_loading_object=SimpleNamespace(
+                    output_directory=None, dataset_object=None, study=None))
+            finally:
+                with lock:
+                    running_num_procs.remove(num_proc)
+
+        loading_scheduler = LoadingScheduler(
+            core_budget=8, work_flow_runner=fake_work_flow_runner, multiprocess=False, poll_interval=1)
+        loaded_submission_uids, failed_submission_uids = loading_scheduler.run()
+        self.assertEqual(sorted(loaded_submission_uids), sorted([large.id, small.id]))
+        self.assertEqual(failed_submission_uids, [failing.id])
+        # All three loadings run at once without going over the core budget
+        self.assertEqual(max(max_concurrent_loadings), 3)
+        self.assertLessEqual(max(max_concurrent_num_procs), 8)
+        # The cores are shared in proportion to the number of samples
+        self.assertGreater(loading_scheduler.get_num_proc_allocation(large, 1015, 3),
+                           loading_scheduler.get_num_proc_allocation(small, 1015, 3))
+        self.assertEqual(Submission.objects.get(id=large.id).progress_status, 'framework_loading_complete')
+        self.assertTrue(Submission.objects.get(id=failing.id).error_has_occured)
+        # A claimed Submission cannot be claimed again
+        self.assertFalse(loading_scheduler._claim_submission(small))
+
+    def test_submission_pipeline(self):
+        print('\n\nTesting: submission_pipeline\n\n')
+        from submission_pipeline import SubmissionPipeline
+        from dbApp.models import Submission
+        first = self._make_submission('first_submission', 10, progress_status='submitted')
+        second = self._make_submission('second_submission', 10, progress_status='submitted')
+        # Interrupted after its transfer
+        resumed = self._make_submission('resumed_submission', 10)
+        not_for_analysis = self._make_submission('not_for_analysis_submission', 10, progress_status='submitted')
+        Submission.objects.filter(id=not_for_analysis.id).update(for_analysis=False)
+        failing = self._make_submission('failing_submission', 10, progress_status='submitted')
+        stage_batches = []
+
+        def make_fake_stage_runner(stage, next_status):
+            def fake_stage_runner(submissions):
+                stage_batches.append((stage, sorted([sub.id for sub in submissions])))
+                for sub in submissions:
+                    if stage == 'load' and sub.name == 'failing_submission':
+                        raise RuntimeError('Fake loading error')
+                    if stage == 'load' and not sub.for_analysis:
+                        sub.progress_status = 'framework_output_complete'
+                    else:
+                        sub.progress_status = next_status
+                    sub.save()
+            return fake_stage_runner
+
+        submission_pipeline = SubmissionPipeline(stage_runner_dict={
+            'transfer': make_fake_stage_runner('transfer', 'transfer_to_framework_server_complete'),
+            'load': make_fake_stage_runner('load', 'framework_loading_complete'),
+            'analyse': make_fake_stage_runner('analyse', 'framework_analysis_complete'),
+            'output': make_fake_stage_runner('output', 'framework_output_complete')
+        }, multiprocess=False, poll_interval=1)
+        submission_pipeline.run(stop_when_idle=True)
+        for sub in [first, second, resumed, not_for_analysis]:
+            self.assertEqual(Submission.objects.get(id=sub.id).progress_status, 'framework_output_complete')
+        failing = Submission.objects.get(id=failing.id)
+        self.assertTrue(failing.error_has_occured)
+        self.assertEqual(failing.progress_status, 'transfer_to_framework_server_complete')
+        # The Submissions are analysed together once there is nothing left to transfer or load
+        self.assertEqual([batch for batch in stage_batches if batch[0] == 'analyse'],
+                         [('analyse', sorted([first.id, second.id, resumed.id]))])
+
+    def test_submission_pipeline_retries(self):
+        print('\n\nTesting: submission_pipeline_retries\n\n')
+        from submission_pipeline import SubmissionPipeline
+        from exceptions import TransientStageError
+        from dbApp.models import Submission
+        first = self._make_submission('first_submission', 10, progress_status='submitted')
+        second = self._make_submission('second_submission', 10, progress_status='submitted')
+        broken = self._make_submission('broken_submission', 10, progress_status='framework_loading_complete')
+        stage_batches = []
+
+        def fake_transfer(submissions):
+            stage_batches.append(('transfer', sorted([sub.id for sub in submissions])))
+            if len(stage_batches) == 1:
+                # e.g. the web server could not be reached
+                raise TransientStageError('Fake connection error')
+            for sub in submissions:
+                sub.progress_status = 'transfer_to_framework_server_complete'
+                sub.save()
+
+        def fake_load(submissions):
+            stage_batches.append(('load', sorted([sub.id for sub in submissions])))
+            for sub in submissions:
+                sub.progress_status = 'framework_output_complete'
+                sub.save()
+
+        def fake_analyse(submissions):
+            stage_batches.append(('analyse', sorted([sub.id for sub in submissions])))
+            raise RuntimeError('Fake error that is not recorded against the Submissions')
+
+        submission_pipeline = SubmissionPipeline(stage_runner_dict={
+            'transfer': fake_transfer, 'load': fake_load, 'analyse': fake_analyse, 'output': fake_load
+        }, multiprocess=False, poll_interval=1, max_stage_attempts=2)
+        submission_pipeline.run(stop_when_idle=True)
+        # The transient error is not held against the Submissions and the transfer is tried again
+        self.assertEqual([batch for batch in stage_batches if batch[0] == 'transfer'],
+                         [('transfer', sorted([first.id, second.id]))] * 2)
+        for sub in [first, second]:
+            sub = Submission.objects.get(id=sub.id)
+            self.assertFalse(sub.error_has_occured)
+            self.assertEqual(sub.progress_status, 'framework_output_complete')
+        # Any other error is tried again up to max_stage_attempts times
+        self.assertEqual([batch for batch in stage_batches if batch[0] == 'analyse'],
+                         [('analyse', [broken.id])] * 2)
+        broken = Submission.objects.get(id=broken.id)
+        self.assertTrue(broken.error_has_occured)
+        self.assertEqual(broken.progress_status, 'framework_loading_complete')
+        self.assertEqual(submission_pipeline.retry_time_dict, {})
+
+    def test_transfer_submissions_errors(self):
+        print('\n\nTesting: transfer_submissions_errors\n\n')
+        import paramiko
+        import web_to_framework_transfer
+        from exceptions import TransientStageError
+        from dbApp.models import Submission
+        transferred = self._make_submission('transferred_submission', 10, progress_status='submitted')
+        dropped = self._make_submission('dropped_submission', 10, progress_status='submitted')
+        bad_md5 = self._make_submission('bad_md5_submission', 10, progress_status='submitted')
+        connect_error_list = []
+
+        class FakeTransferWebToFramework:
+            def __init__(self, submissions_to_transfer=None):
+                if connect_error_list:
+                    raise connect_error_list.pop()
+
+            def transfer_submission(self, sub_to_trans):
+                if sub_to_trans.name == 'dropped_submission':
+                    raise ConnectionError('Fake dropped connection')
+                if sub_to_trans.name == 'bad_md5_submission':
+                    raise RuntimeError('Fake md5sum mismatch')
+                sub_to_trans.progress_status = 'transfer_to_framework_server_complete'
+                sub_to_trans.save()
+
+            def close(self):
+                pass
+
+        transfer_class = web_to_framework_transfer.TransferWebToFramework
+        web_to_framework_transfer.TransferWebToFramework = FakeTransferWebToFramework
+        try:
+            # Not being able to connect leaves all of the Submissions as they are
+            connect_error_list.append(paramiko.SSHException('Fake connection refused'))
+            submissions = list(Submission.objects.filter(progress_status='submitted').order_by('id'))
+            with self.assertRaises(TransientStageError):
+                web_to_framework_transfer.transfer_submissions(submissions)
+            self.assertFalse(Submission.objects.filter(error_has_occured=True).exists())
+            self.assertEqual(Submission.objects.filter(progress_status='submitted').count(), 3)
+
+            # Only the Submission whose files are bad is marked as errored
+            with self.assertRaises(TransientStageError):
+                web_to_framework_transfer.transfer_submissions(submissions)
+        finally:
+            web_to_framework_transfer.TransferWebToFramework = transfer_class
+        self.assertEqual(
+            Submission.objects.get(id=transferred.id).progress_status, 'transfer_to_framework_server_complete')
+        dropped = Submission.objects.get(id=dropped.id)
+        self.assertFalse(dropped.error_has_occured)
+        self.assertEqual(dropped.progress_status, 'submitted')
+        self.assertTrue(Submission.objects.get(id=bad_md5.id).error_has_occured)
+
+    def test_submission_analysis_errors(self):
+        print('\n\nTesting: submission_analysis_errors\n\n')
+        import submission_analysis
+        from dbApp.models import Submission, DataSet
+        analysed = self._make_submission('analysed_submission', 10, progress_status='framework_loading_complete')
+        other = self._make_submission('other_submission', 10, progress_status='framework_loading_complete')
+        untouched = self._make_submission('untouched_submission', 10, progress_status='framework_loading_complete')
+        for sub in [analysed, other]:
+            sub.associated_dataset = DataSet.objects.create(name=sub.name)
+            sub.save()
+
+        class FailingWorkFlowManager:
+            def __init__(self, custom_args_list):
+                self.date_time_str = 'fake_date_time'
+
+            def start_work_flow(self):
+                raise RuntimeError('Fake analysis error')
+
+        main_module = submission_analysis.main
+        work_flow_manager_class = getattr(main_module, 'SymPortalWorkFlowManager', None)
+        main_module.SymPortalWorkFlowManager = FailingWorkFlowManager
+        try:
+            # A failed analysis is recorded against each of the Submissions of the analysis
+            with self.assertRaises(RuntimeError) as context:
+                submission_analysis.SubmissionAnalysis(num_proc=1).analyse([analysed, other])
+            self.assertEqual(str(context.exception.__cause__), 'Fake analysis error')
+            for sub in [analysed, other]:
+                sub = Submission.objects.get(id=sub.id)
+                self.assertTrue(sub.error_has_occured)
+                self.assertEqual(sub.progress_status, 'framework_loading_complete')
+            self.assertFalse(Submission.objects.get(id=untouched.id).error_has_occured)
+        finally:
+            if work_flow_manager_class is None:
+                del main_module.SymPortalWorkFlowManager
+            else:
+                main_module.SymPortalWorkFlowManager = work_flow_manager_class
+
+
+class SFTPTransferEngineTesting(TransactionTestCase):
+    """Tests of the parallel, resumable SFTP transfer of the submissions (cron_jobs/sftp_transfer.py)
+    against a local paramiko SFTP server that serves a temporary directory."""
+
+    @classmethod
+    def setUp(cls):
+        import sys
+        import tempfile
+        import paramiko
+        cron_jobs_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cron_jobs')
+        if cron_jobs_dir not in sys.path:
+            sys.path.append(cron_jobs_dir)
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.remote_dir = os.path.join(cls.temp_dir, 'remote')
+        cls.local_dir = os.path.join(cls.temp_dir, 'local')
+        os.makedirs(cls.remote_dir)
+        # (file name, size in bytes)
+        cls.file_size_dict = {'sample_1.fastq.gz': 3000000, 'sample_2.fastq.gz': 1500000, 'datasheet.csv': 0}
+        for file_name, file_size in cls.file_size_dict.items():
+            with open(os.path.join(cls.remote_dir, file_name), 'wb') as f:
+                f.write(os.urandom(file_size))
+        # file name: offsets of the reads requested from the server
+        cls.read_offset_dict = {}
+        # file name: offset from which the reads fail once
+        cls.fail_read_from_offset_dict = {}
+        cls.ssh_client, cls.server_transport = cls._connect_to_stub_sftp_server(paramiko)
+
+    @classmethod
+    def _connect_to_stub_sftp_server(cls, paramiko):
+        import socket
+        import threading
+        test_case = cls
+
+        class StubServer(paramiko.ServerInterface):
+            def check_auth_password(self, username, password):
+                return paramiko.AUTH_SUCCESSFUL
+
+            def check_channel_request(self, kind, chanid):
+                return paramiko.OPEN_SUCCEEDED
+
+        class StubSFTPHandle(paramiko.SFTPHandle):
+            def read(self, offset, length):
+                test_case.read_offset_dict.setdefault(self.file_name, []).append(offset)
+                fail_from_offset = test_case.fail_read_from_offset_dict.get(self.file_name)
+                if fail_from_offset is not None and offset >= fail_from_offset:
+                    # Fail once, as if the connection had dropped part way through the file
+                    del test_case.fail_read_from_offset_dict[self.file_name]
+                    return paramiko.SFTP_FAILURE
+                return super().read(offset, length)
+
+        class StubSFTPServerInterface(paramiko.SFTPServerInterface):
+            def list_folder(self, path):
+                return [
+                    paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, file_name)), file_name)
+                    for file_name in os.listdir(path)]
+
+            def stat(self, path):
+                return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+            def lstat(self, path):
+                return paramiko.SFTPAttributes.from_stat(os.lstat(path))
+
+            def open(self, path, flags, attr):
+                handle = StubSFTPHandle(flags)
+                handle.file_name = os.path.basename(path)
+                handle.readfile = open(path, 'rb')
+                return handle
+
+        client_socket, server_socket = socket.socketpair()
+        server_transport = paramiko.Transport(server_socket)
+        server_transport.add_server_key(paramiko.RSAKey.generate(2048))
+        server_transport.set_subsystem_handler('sftp', paramiko.SFTPServer, StubSFTPServerInterface)
+        # Negotiated in the background (the event is set once done) while the client connects
+        server_transport.start_server(event=threading.Event(), server=StubServer())
+        ssh_client = paramiko.SSHClient()
+        ssh_client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh_client.connect(
+            'stub_sftp_server', username='user', password='pass', sock=client_socket,
+            look_for_keys=False, allow_agent=False)
+        return ssh_client, server_transport
+
+    def tearDown(self):
+        import shutil
+        self.ssh_client.close()
+        self.server_transport.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def _get_md5(self, file_path):
+        import hashlib
+        with open(file_path, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def test_parallel_resumable_transfer(self):
+        print('\n\nTesting: parallel_resumable_transfer\n\n')
+        from sftp_transfer import SFTPTransferEngine
+        transfer_engine = SFTPTransferEngine(ssh_client=self.ssh_client, num_channels=2, block_size=32768)
+        self.assertEqual(transfer_engine.get_remote_file_size_dict(self.remote_dir), self.file_size_dict)
+        expected_md5_dict = {
+            file_name: self._get_md5(os.path.join(self.remote_dir, file_name)) for file_name in self.file_size_dict}
+
+        # A partial local copy of the first file is resumed and the download of the second fails part way through
+        os.makedirs(self.local_dir)
+        with open(os.path.join(self.remote_dir, 'sample_1.fastq.gz'), 'rb') as remote_file, \
+                open(os.path.join(self.local_dir, 'sample_1.fastq.gz'), 'wb') as local_file:
+            local_file.write(remote_file.read(1000000))
+        self.fail_read_from_offset_dict['sample_2.fastq.gz'] = 500000
+        transferred_md5_dict = transfer_engine.transfer_files(
+            remote_dir=self.remote_dir, local_dir=self.local_dir, file_size_dict=self.file_size_dict,
+            expected_md5_dict=expected_md5_dict)
+        self.assertEqual(transferred_md5_dict, expected_md5_dict)
+        for file_name, md5 in expected_md5_dict.items():
+            self.assertEqual(self._get_md5(os.path.join(self.local_dir, file_name)), md5)
+        # Nothing before the partial local copy was read again
+        self.assertEqual(min(self.read_offset_dict['sample_1.fastq.gz']), 1000000)
+        # The failed download was resumed rather than started again
+        self.assertEqual(self.read_offset_dict['sample_2.fastq.gz'].count(0), 1)
+
+        # The transferred files are skipped when the transfer is run again
+        self.read_offset_dict.clear()
+        transfer_engine.transfer_files(
+            remote_dir=self.remote_dir, local_dir=self.local_dir, file_size_dict=self.file_size_dict,
+            expected_md5_dict=expected_md5_dict)
+        self.assertEqual(self.read_offset_dict, {})
+
+        # A file that does not match its md5sum is not accepted
+        transfer_engine.remove_manifest(self.local_dir)
+        os.remove(os.path.join(self.local_dir, 'sample_2.fastq.gz'))
+        expected_md5_dict['sample_2.fastq.gz'] = '0' * 32
+        with self.assertRaises(RuntimeError):
+            transfer_engine.transfer_files(
+                remote_dir=self.remote_dir, local_dir=self.local_dir, file_size_dict=self.file_size_dict,
+                expected_md5_dict=expected_md5_dict)
+
+        # A file that could not be downloaded because of the connection is reported as a ConnectionError
+        # so that the transfer is tried again later
+        expected_md5_dict['sample_2.fastq.gz'] = self._get_md5(os.path.join(self.remote_dir, 'sample_2.fastq.gz'))
+        self.fail_read_from_offset_dict['sample_2.fastq.gz'] = 0
+        transfer_engine = SFTPTransferEngine(
+            ssh_client=self.ssh_client, num_channels=2, block_size=32768, max_attempts=1)
+        with self.assertRaises(ConnectionError):
+            transfer_engine.transfer_files(
+                remote_dir=self.remote_dir, local_dir=self.local_dir, file_size_dict=self.file_size_dict,
+                expected_md5_dict=expected_md5_dict)
+
+
+class BulkDeletionTesting(TransactionTestCase):
+    """Tests that django_general.delete_data_set and delete_data_analysis delete the same objects as
+    the ORM cascade (and only those objects)."""
+
+    @classmethod
+    def setUp(cls):
+        from dbApp.models import ReferenceSequence, DataAnalysis, AnalysisType, Study
+        cls.named_ref_seq = ReferenceSequence.objects.create(name='C3', has_name=True, clade='C', sequence='AAAA')
+        cls.shared_ref_seq = ReferenceSequence.objects.create(clade='C', sequence='AAAC')
+        cls.type_ref_seq = ReferenceSequence.objects.create(clade='C', sequence='AAAG')
+        cls.orphaned_ref_seq = ReferenceSequence.objects.create(clade='C', sequence='AAAT')
+        cls.data_set_to_delete = cls._make_data_set(
+            'to_delete', [cls.named_ref_seq, cls.shared_ref_seq, cls.type_ref_seq, cls.orphaned_ref_seq])
+        cls.data_set_to_keep = cls._make_data_set('to_keep', [cls.named_ref_seq, cls.shared_ref_seq])
+        cls.data_analysis = DataAnalysis.objects.create(
+            list_of_data_set_uids=f'{cls.data_set_to_delete.id},{cls.data_set_to_keep.id}', name='analysis')
+        analysis_type = AnalysisType.objects.create(
+            data_analysis_from=cls.data_analysis, clade='C', name='C3-type',
+            ordered_footprint_list=f'{cls.named_ref_seq.id},{cls.type_ref_seq.id}')
+        from dbApp.models import CladeCollection, CladeCollectionType
+        for clade_collection in CladeCollection.objects.all():
+            CladeCollectionType.objects.create(
+                analysis_type_of=analysis_type, clade_collection_found_in=clade_collection)
+        Study.objects.filter(name='to_keep').update(data_analysis=cls.data_analysis)
+
+    @staticmethod
+    def _make_data_set(name, reference_sequences):
+        from dbApp.models import (
+            DataSet, DataSetSample, CladeCollection, DataSetSampleSequence, DataSetSampleSequencePM, Study, User,
+            Submission)
+        data_set = DataSet.objects.create(name=name)
+        study = Study.objects.create(name=name)
+        for sample_number in range(3):
+            data_set_sample = DataSetSample.objects.create(data_submission_from=data_set, name=f'{name}_{sample_number}')
+            study.data_set_samples.add(data_set_sample)
+            clade_collection = CladeCollection.objects.create(data_set_sample_from=data_set_sample, clade='C')
+            for reference_sequence in reference_sequences:
+                DataSetSampleSequence.objects.create(
+                    data_set_sample_from=data_set_sample, clade_collection_found_in=clade_collection,
+                    reference_sequence_of=reference_sequence, abundance=10)
+                DataSetSampleSequencePM.objects.create(
+                    data_set_sample_from=data_set_sample, reference_sequence_of=reference_sequence, abundance=10)
+        Submission.objects.create(
+            name=name, web_local_dir_path=f'/web/{name}', framework_local_dir_path=f'/framework/{name}',
+            submitting_user=User.objects.create(name=name), associated_dataset=data_set, associated_study=study)
+        return data_set
+
+    def _get_object_counts(self):
+        from django.apps import apps
+        return {model.__name__: model.objects.count() for model in apps.get_app_config('dbApp').get_models()}
+
+    def test_delete_data_set(self):
+        print('\n\nTesting: delete_data_set\n\n')
+        import django_general
+        from dbApp.models import DataSet, ReferenceSequence, Study
+        from django.db import transaction
+        # The objects left by the ORM cascade (rolled back)
+        with transaction.atomic():
+            DataSet.objects.get(id=self.data_set_to_delete.id).delete()
+            expected_object_counts = self._get_object_counts()
+            transaction.set_rollback(True)
+        django_general.delete_data_set(self.data_set_to_delete.id)
+        self.assertEqual(self._get_object_counts(), expected_object_counts)
+        self.assertEqual(Study.objects.get(name='to_delete').data_set_samples.count(), 0)
+        self.assertEqual(Study.objects.get(name='to_keep').data_set_samples.count(), 3)
+
+        django_general.delete_data_set(self.data_set_to_keep.id, remove_orphaned_reference_sequences=True)
+        # Of the ReferenceSequences of the DataSet only the unnamed one that is not in the footprint of an
+        # AnalysisType is removed. The ReferenceSequences of the DataSet deleted above are not touched.
+        self.assertEqual(
+            sorted(ReferenceSequence.objects.values_list('id', flat=True)),
+            sorted([self.named_ref_seq.id, self.type_ref_seq.id, self.orphaned_ref_seq.id]))
+
+    def test_delete_data_analysis(self):
+        print('\n\nTesting: delete_data_analysis\n\n')
+        import django_general
+        from dbApp.models import DataAnalysis, Study
+        from django.db import transaction
+        with transaction.atomic():
+            DataAnalysis.objects.get(id=self.data_analysis.id).delete()
+            expected_object_counts = self._get_object_counts()
+            transaction.set_rollback(True)
+        django_general.delete_data_analysis(self.data_analysis.id)
+        self.assertEqual(self._get_object_counts(), expected_object_counts)
+        self.assertIsNone(Study.objects.get(name='to_keep').data_analysis)
+
+
+class ApplyDatasheetTesting(TransactionTestCase):
+    """Tests of the bulk application of a datasheet to the DataSetSamples of a DataSet
+    (django_general.ApplyDatasheetToDataSetSamples)."""
+
+    @classmethod
+    def setUp(cls):
+        import tempfile
+        from dbApp.models import DataSet, DataSetSample
+        cls.data_set = DataSet.objects.create(name='apply_datasheet')
+        # More samples than a single chunk of sample names
+        cls.num_samples = 1200
+        DataSetSample.objects.bulk_create([
+            DataSetSample(data_submission_from=cls.data_set, name=f'sample_{i}', host_genus='porites')
+            for i in range(cls.num_samples)])
+        cls.datasheet_path = os.path.join(tempfile.mkdtemp(), 'datasheet.csv')
+        with open(cls.datasheet_path, 'w') as f:
+            f.write('sample_name,fastq_fwd_file_name,fastq_rev_file_name,sample_type,host_phylum,host_class,'
+                    'host_order,host_family,host_genus,host_species,collection_latitude,collection_longitude,'
+                    'collection_date,collection_depth\n')
+            for i in range(cls.num_samples):
+                if i % 2:
+                    # A new genus and location for every other sample
+                    f.write(f'sample_{i},,,coral,,,,,acropora,,24.5,53.25,,\n')
+                else:
+                    f.write(f'sample_{i},,,coral,,,,,porites,,,,,\n')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(os.path.dirname(self.datasheet_path), ignore_errors=True)
+
+    def test_apply_datasheet(self):
+        print('\n\nTesting: apply_datasheet\n\n')
+        import django_general
+        from decimal import Decimal
+        from dbApp.models import DataSetSample
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        apply_datasheet = django_general.ApplyDatasheetToDataSetSamples(
+            data_set_uid=self.data_set.id, data_sheet_path=self.datasheet_path)
+        with CaptureQueriesContext(connection) as captured_queries:
+            apply_datasheet.apply_datasheet()
+        # One UPDATE per batch of changed samples (plus the transaction) rather than one per sample
+        self.assertLess(len(captured_queries.captured_queries), 20)
+        self.assertEqual(DataSetSample.objects.filter(sample_type='coral').count(), self.num_samples)
+        changed_sample = DataSetSample.objects.get(name='sample_1')
+        self.assertEqual(changed_sample.host_genus, 'acropora')
+        self.assertEqual(changed_sample.collection_latitude, Decimal('24.5'))
+        unchanged_sample = DataSetSample.objects.get(name='sample_2')
+        self.assertEqual(unchanged_sample.host_genus, 'porites')
+        self.assertEqual(unchanged_sample.collection_latitude, Decimal('999.99999999'))
+
+
+class PopulateReferenceSequencesTesting(TransactionTestCase):
+    """Tests of populating a freshly migrated database with the named reference sequences
+    (populate_db_ref_seqs.py)."""
+
+    def test_populate_db_with_ref_seqs(self):
+        print('\n\nTesting: populate_db_with_ref_seqs\n\n')
+        from populate_db_ref_seqs import populate_db_with_ref_seqs
+        from general import ThreadSafeGeneral
+        from dbApp.models import ReferenceSequence
+        fasta_path = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'symbiodiniaceaeDB', 'refSeqDB.fa')
+        fasta_dict = ThreadSafeGeneral().create_dict_from_fasta(fasta_path=fasta_path)
+        populate_db_with_ref_seqs()
+        # refSeqDB.fa contains duplicate sequences. Only one ReferenceSequence is created for each.
+        self.assertEqual(ReferenceSequence.objects.count(), len(set(fasta_dict.values())))
+        self.assertEqual(ReferenceSequence.objects.filter(has_name=True).count(), ReferenceSequence.objects.count())
+        # Populating again adds nothing
+        populate_db_with_ref_seqs()
+        self.assertEqual(ReferenceSequence.objects.count(), len(set(fasta_dict.values())))
+
+
+class NativeQCAnalysisTesting(TransactionTestCase):
+    """Tests of the contig assembly, primer matching and split.abund of the NativeQCAnalysis on small
+    constructed read pairs."""
+
+    def setUp(self):
+        import random
+        import tempfile
+        from symportal_utils import NativeQCAnalysis
+        self.temp_dir = tempfile.mkdtemp()
+        self.native_qc = NativeQCAnalysis(
+            input_dir=self.temp_dir, output_dir=self.temp_dir, name='test_sample',
+            fastq_gz_fwd_path=None, fastq_gz_rev_path=None, stdout_and_sterr_to_pipe=True)
+        random_generator = random.Random(0)
+        self.insert = ''.join(random_generator.choice('ACGT') for _ in range(200))
+        # An amplicon with the ambiguous nucleotides of the rev primer resolved
+        self.amplicon = self.native_qc.pcr_fwd_primer + self.insert + self.native_qc._rev_comp(
+            self.native_qc.pcr_rev_primer.replace('W', 'A').replace('Y', 'C'))
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    def _make_read_pair(self, read_length, rc_read=None, rc_qual=None):
+        """The fwd read and rev read (with their qualities) of self.amplicon. rc_read and rc_qual can be given
+        to use a modified reverse complement of the rev read."""
+        if rc_read is None:
+            rc_read = self.amplicon[-read_length:]
+            rc_qual = 'I' * read_length
+        return self.amplicon[:read_length], 'I' * read_length, self.native_qc._rev_comp(rc_read), rc_qual[::-1]
+
+    def _make_contig(self, fwd_seq, fwd_qual, rev_seq, rev_qual):
+        """Assemble a single read pair"""
+        return self.native_qc._make_contigs([(fwd_seq, fwd_qual, rev_seq, rev_qual)])[0]
+
+    def test_make_contig(self):
+        print('\n\nTesting: native_qc_make_contig\n\n')
+        read_length = 180
+        overlap_length = 2 * read_length - len(self.amplicon)
+        # A perfect overlap
+        perfect_read_pair = self._make_read_pair(read_length)
+        self.assertEqual(self._make_contig(*perfect_read_pair), (self.amplicon, overlap_length))
+
+        # A low quality mismatch in the overlap is resolved to the base of the other read
+        fwd_seq, fwd_qual, rev_seq, rev_qual = self._make_read_pair(read_length)
+        mismatch_index = 150
+        wrong_base = 'A' if fwd_seq[mismatch_index] != 'A' else 'C'
+        mismatch_read_pair = (
+            fwd_seq[:mismatch_index] + wrong_base + fwd_seq[mismatch_index + 1:],
+            fwd_qual[:mismatch_index] + '#' + fwd_qual[mismatch_index + 1:], rev_seq, rev_qual)
+        self.assertEqual(self._make_contig(*mismatch_read_pair), (self.amplicon, overlap_length))
+        # A mismatch between bases of similar quality is resolved to an N
+        mismatch_read_pair = (
+            fwd_seq[:mismatch_index] + wrong_base + fwd_seq[mismatch_index + 1:], fwd_qual, rev_seq, rev_qual)
+        contig, _ = self._make_contig(*mismatch_read_pair)
+        self.assertEqual(contig, self.amplicon[:mismatch_index] + 'N' + self.amplicon[mismatch_index + 1:])
+
+        # A low quality insertion in the overlap of the rev read is aligned as a gap and left out of the contig
+        rc_read = self.amplicon[-read_length:]
+        insertion_index = 60
+        rc_read = rc_read[:insertion_index] + 'T' + rc_read[insertion_index:]
+        rc_qual = 'I' * insertion_index + '#' + 'I' * (read_length - insertion_index)
+        insertion_read_pair = self._make_read_pair(read_length, rc_read=rc_read, rc_qual=rc_qual)
+        self.assertEqual(self._make_contig(*insertion_read_pair), (self.amplicon, overlap_length + 1))
+
+        # Reads that do not overlap are concatenated with an overlap of 0
+        fwd_seq, fwd_qual, rev_seq, rev_qual = self._make_read_pair(100)
+        self.assertEqual(
+            self._make_contig(fwd_seq, fwd_qual, rev_seq, rev_qual),
+            (fwd_seq + self.native_qc._rev_comp(rev_seq), 0))
+
+        # Assembling the read pairs as a batch gives the same contigs
+        read_pair_list = [perfect_read_pair, mismatch_read_pair, insertion_read_pair]
+        self.assertEqual(
+            self.native_qc._make_contigs(read_pair_list),
+            [self._make_contig(*read_pair) for read_pair in read_pair_list])
+
+    def test_pcr(self):
+        print('\n\nTesting: native_qc_pcr\n\n')
+        fwd_primer_length = len(self.native_qc.pcr_fwd_primer)
+        self.assertEqual(self.native_qc._pcr_trim(self.amplicon), (self.insert, False))
+        # Up to 2 mismatches are allowed in a primer
+        two_mismatch_amplicon = 'TT' + self.amplicon[2:]
+        self.assertEqual(self.native_qc._pcr_trim(two_mismatch_amplicon), (self.insert, False))
+        three_mismatch_amplicon = 'TTT' + self.amplicon[3:]
+        self.assertEqual(self.native_qc._pcr_trim(three_mismatch_amplicon), (None, False))
+        # A primer that matches equally well in two places is discarded
+        two_match_amplicon = 'T' + self.amplicon[1:fwd_primer_length] + 'GT' + self.amplicon[2:]
+        self.assertEqual(self.native_qc._pcr_trim(two_match_amplicon), (None, True))
+
+        # Sequences in which the primers are not found are tried again as their reverse complement
+        self.native_qc.rep_name_to_seq_dict = {
+            'seq_1': self.amplicon, 'seq_2': self.native_qc._rev_comp(self.amplicon),
+            'seq_3': three_mismatch_amplicon}
+        self.native_qc.rep_name_to_member_names_dict = {
+            rep_name: [rep_name] for rep_name in self.native_qc.rep_name_to_seq_dict}
+        self.native_qc.execute_pcr(do_reverse_pcr_as_well=True)
+        self.assertEqual(self.native_qc.rep_name_to_seq_dict, {'seq_1': self.insert, 'seq_2': self.insert})
+        self.native_qc.execute_unique_seqs()
+        self.assertEqual(self.native_qc.rep_name_to_member_names_dict, {'seq_1': ['seq_1', 'seq_2']})
+
+    def test_split_abund(self):
+        print('\n\nTesting: native_qc_split_abund\n\n')
+        self.native_qc.rep_name_to_seq_dict = {'seq_1': 'AAAA', 'seq_2': 'CCCC', 'seq_3': 'GGGG'}
+        self.native_qc.rep_name_to_member_names_dict = {
+            'seq_1': ['seq_1', 'seq_4', 'seq_5'], 'seq_2': ['seq_2', 'seq_6'], 'seq_3': ['seq_3']}
+        # Only the sequences with an abundance greater than the cutoff of 2 are kept
+        self.native_qc.execute_split_abund()
+        self.assertEqual(self.native_qc.rep_name_to_seq_dict, {'seq_1': 'AAAA'})
+        with open(self.native_qc.name_file_path, 'r') as f:
+            self.assertEqual(f.read().splitlines(), ['seq_1\tseq_1,seq_4,seq_5'])
+
+        # If there are no abundant sequences then the sequences are left unchanged
+        self.native_qc.rep_name_to_seq_dict = {'seq_2': 'CCCC', 'seq_3': 'GGGG'}
+        self.native_qc.rep_name_to_member_names_dict = {'seq_2': ['seq_2', 'seq_6'], 'seq_3': ['seq_3']}
+        self.native_qc.execute_split_abund()
+        self.assertEqual(self.native_qc.rep_name_to_seq_dict, {'seq_2': 'CCCC', 'seq_3': 'GGGG'})
+
+
+class DataAnalysisKDETesting(TransactionTestCase):
+    """Regression test of the binned KDE of the MultiModalDetectionWorker against the exact
+    scipy.stats.gaussian_kde. The reference modes, extrema and VCC splits of a few representative distributions
+    are in data/kde_regression (see make_kde_regression_data.py)."""
+
+    def test_binned_kde_split_points(self):
+        print('\n\nTesting: binned_kde_split_points\n\n')
+        import json
+        import pandas as pd
+        from data_analysis import SPDataAnalysis
+        kde_regression_data_path = os.path.join(
+            os.path.abspath(os.path.dirname(__file__)), 'data', 'kde_regression', 'kde_regression_data.json')
+        with open(kde_regression_data_path, 'r') as f:
+            case_list = json.load(f)
+        for case in case_list:
+            rel_abund_df = pd.DataFrame({1: case['values']}, index=list(range(1, len(case['values']) + 1)))
+            worker = SPDataAnalysis.MultiModalDetectionWorker(rel_abund_df)
+            c, modes, pdf, x_grid = worker._find_modes_of_abundances(1)
+            self.assertEqual(modes, len(case['mode_indices']), case['name'])
+            # Allow for the linear binning moving an extremum to a neighbouring grid point
+            for index, reference_index in zip(c, case['mode_indices']):
+                self.assertLessEqual(abs(index - reference_index), 1, case['name'])
+            extrema_indices = worker._get_extrema_indices(pdf)
+            self.assertEqual(len(extrema_indices), len(case['extrema_indices']), case['name'])
+            for index, reference_index in zip(extrema_indices, case['extrema_indices']):
+                self.assertLessEqual(abs(index - reference_index), 1, case['name'])
+            split = worker.get_split_vcc_uid_lists()
+            if case['split'] is None:
+                self.assertIsNone(split, case['name'])
+            else:
+                self.assertEqual([list(split[0]), list(split[1])], case['split'], case['name'])
+
+
+class AnalysisCheckpointTesting(TransactionTestCase):
+    """Round trip of the checkpoints of an SPDataAnalysis: the checkpoints are written after each stage, the
+    analysis is interrupted and then resumed from the last checkpoint. The stages are replaced with stand-ins
+    that record their work on the VirtualObjectManager so that the resumed analysis can be compared to an
+    analysis that was not interrupted."""
+    fixtures = ['three_dataset_one_analysis_db.json']
+
+    def setUp(self):
+        import tempfile
+        from types import SimpleNamespace
+        self.temp_dir = tempfile.mkdtemp()
+        self.workflow_manager = SimpleNamespace(
+            symportal_root_directory=self.temp_dir, within_clade_cutoff=0.03,
+            args=SimpleNamespace(num_proc=1, multiprocess=False))
+        self.checkpoint_directory = os.path.join(self.temp_dir, 'analysis_checkpoints', '1')
+        # stage: number of times that it has been run
+        self.stage_run_count_dict = {}
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    def _make_sp_data_analysis(self, resume_analysis=False, interrupt_at_stage=None):
+        import data_analysis
+        sp_data_analysis = data_analysis.SPDataAnalysis(
+            workflow_manager_parent=self.workflow_manager, data_analysis_obj=DataAnalysis.objects.get(id=1),
+            force_basal_lineage_separation=False, resume_analysis=resume_analysis)
+
+        def make_stage(stage):
+            def run_stage():
+                if stage == interrupt_at_stage:
+                    raise RuntimeError(f'Interrupted at {stage}')
+                self.stage_run_count_dict[stage] = self.stage_run_count_dict.get(stage, 0) + 1
+                vom = sp_data_analysis.virtual_object_manager
+                if not hasattr(vom, 'completed_stage_list'):
+                    vom.completed_stage_list = []
+                vom.completed_stage_list.append((stage, len(vom.vcc_manager.vcc_dict)))
+            return run_stage
+
+        sp_data_analysis._profile_discovery = make_stage('profile_discovery')
+        sp_data_analysis._profile_assignment_and_update_vats = make_stage('profile_assignment')
+        sp_data_analysis._name_divs = make_stage('div_naming')
+        sp_data_analysis._associate_species_designations_and_clean_up = make_stage('species_association')
+        sp_data_analysis._make_analysis_type_objects_from_vats = make_stage('analysis_type_creation')
+        return sp_data_analysis
+
+    def test_checkpoint_round_trip(self):
+        print('\n\nTesting: analysis_checkpoint_round_trip\n\n')
+        from data_analysis import AnalysisCheckpoint
+        uninterrupted_analysis = self._make_sp_data_analysis()
+        uninterrupted_analysis.analyse_data()
+        uninterrupted_completed_stage_list = uninterrupted_analysis.virtual_object_manager.completed_stage_list
+        self.assertEqual([stage for stage, _ in uninterrupted_completed_stage_list], AnalysisCheckpoint.stages)
+        # The checkpoints are deleted once the analysis has completed
+        self.assertFalse(os.path.exists(self.checkpoint_directory))
+
+        self.stage_run_count_dict = {}
+        interrupted_analysis = self._make_sp_data_analysis(interrupt_at_stage='div_naming')
+        with self.assertRaises(RuntimeError):
+            interrupted_analysis.analyse_data()
+        self.assertEqual(
+            sorted(os.listdir(self.checkpoint_directory)), ['profile_assignment.p.gz', 'profile_discovery.p.gz'])
+
+        resumed_analysis = self._make_sp_data_analysis(resume_analysis=True)
+        self.assertEqual(resumed_analysis.last_completed_stage, 'profile_assignment')
+        resumed_analysis.analyse_data()
+        # The completed stages were not run again and the result is the same as that of the uninterrupted analysis
+        self.assertEqual(self.stage_run_count_dict, {stage: 1 for stage in AnalysisCheckpoint.stages})
+        self.assertEqual(resumed_analysis.virtual_object_manager.completed_stage_list, uninterrupted_completed_stage_list)
+        self.assertEqual(
+            sorted(resumed_analysis.virtual_object_manager.vcc_manager.vcc_dict),
+            sorted(uninterrupted_analysis.virtual_object_manager.vcc_manager.vcc_dict))
+        self.assertFalse(os.path.exists(self.checkpoint_directory))
+
+
+class IncrementalAnalysisSeedingTesting(TransactionTestCase):
+    """Seeding of the VirtualAnalysisTypes of an incremental analysis from the AnalysisTypes of a previous
+    DataAnalysis. The analysis of the fixture is used as both the previous and the new analysis so that each of its
+    AnalysisTypes is seeded. Only the seeded types that gain CladeCollections should be reassessed for artefacts."""
+    fixtures = ['three_dataset_one_analysis_db.json']
+
+    def setUp(self):
+        import tempfile
+        from types import SimpleNamespace
+        self.temp_dir = tempfile.mkdtemp()
+        self.workflow_manager = SimpleNamespace(
+            symportal_root_directory=self.temp_dir, within_clade_cutoff=0.03,
+            args=SimpleNamespace(num_proc=1, multiprocess=False))
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    def test_unchanged_and_changed_seeded_types(self):
+        print('\n\nTesting: unchanged_and_changed_seeded_types\n\n')
+        from types import SimpleNamespace
+        from data_analysis import SPDataAnalysis, AnalysisTypeCreator
+        from dbApp.models import AnalysisType
+        sp_data_analysis = SPDataAnalysis(
+            workflow_manager_parent=self.workflow_manager, data_analysis_obj=DataAnalysis.objects.get(id=1),
+            force_basal_lineage_separation=False, seed_data_analysis_obj=DataAnalysis.objects.get(id=1))
+        sp_data_analysis._seed_vats_from_previous_analysis()
+        vcc_dict = sp_data_analysis.virtual_object_manager.vcc_manager.vcc_dict
+        seed_analysis_types = list(AnalysisType.objects.filter(data_analysis_from=1))
+        # Every AnalysisType is seeded and, as all of their CladeCollections are seeded, none go through discovery
+        self.assertEqual(len(sp_data_analysis.seeded_footprint_to_vat_dict), len(seed_analysis_types))
+        self.assertEqual(
+            sp_data_analysis.unchanged_seeded_vat_uid_set,
+            {vat.id for vat in sp_data_analysis.seeded_footprint_to_vat_dict.values()})
+        self.assertEqual(sp_data_analysis.seeded_vcc_uid_set, set(vcc_dict))
+
+        def get_seeded_vat_and_initial_type(at_uid, extra_cc_uid_list):
+            at = AnalysisType.objects.get(id=at_uid)
+            seeded_vat = sp_data_analysis.seeded_footprint_to_vat_dict[
+                frozenset(int(rs_uid) for rs_uid in at.ordered_footprint_list.split(','))]
+            initial_type = SimpleNamespace(
+                profile=[SimpleNamespace(id=rs_uid) for rs_uid in seeded_vat.ref_seq_uids_set],
+                clade_collection_list=[vcc_dict[int(cc_uid)] for cc_uid in at.list_of_clade_collections.split(',')] +
+                [vcc_dict[cc_uid] for cc_uid in extra_cc_uid_list])
+            return seeded_vat, initial_type
+
+        # An InitialType with the profile of a seeded type but no new CladeCollections leaves the type unchanged
+        unchanged_vat, unchanged_initial_type = get_seeded_vat_and_initial_type(at_uid=4, extra_cc_uid_list=[])
+        # An InitialType that brings a CladeCollection that is not yet in the seeded type changes the type.
+        # CladeCollection 11 (of AnalysisType 1, 15-474-228-227) also holds the profile of AnalysisType 2 (15-474).
+        changed_vat, changed_initial_type = get_seeded_vat_and_initial_type(at_uid=2, extra_cc_uid_list=[11])
+        unchanged_cc_uids = {vcc.id for vcc in unchanged_vat.clade_collection_obj_set_profile_discovery}
+        changed_cc_uids = {vcc.id for vcc in changed_vat.clade_collection_obj_set_profile_discovery}
+
+        analysis_type_creator = AnalysisTypeCreator(parent_sp_data_analysis=sp_data_analysis)
+        num_vats = len(sp_data_analysis.virtual_object_manager.vat_manager.vat_dict)
+        analysis_type_creator._create_new_virtual_analysis_type_from_initial_type(unchanged_initial_type)
+        analysis_type_creator._create_new_virtual_analysis_type_from_initial_type(changed_initial_type)
+
+        # The InitialTypes are added to the seeded types rather than being made into new types
+        self.assertEqual(len(sp_data_analysis.virtual_object_manager.vat_manager.vat_dict), num_vats)
+        self.assertIn(unchanged_vat.id, sp_data_analysis.unchanged_seeded_vat_uid_set)
+        self.assertEqual(
+            {vcc.id for vcc in unchanged_vat.clade_collection_obj_set_profile_discovery}, unchanged_cc_uids)
+        self.assertNotIn(changed_vat.id, sp_data_analysis.unchanged_seeded_vat_uid_set)
+        self.assertEqual(
+            {vcc.id for vcc in changed_vat.clade_collection_obj_set_profile_discovery}, changed_cc_uids | {11})
+        self.assertEqual(
+            len(sp_data_analysis.unchanged_seeded_vat_uid_set), len(seed_analysis_types) - 1)
+
+
+class SeqStackedBarPlotterSampleOrderTesting(TransactionTestCase):
+    """The sample order of the sequence stacked bar plot is generated by the SeqStackedBarPlotter
+    (when it is not given one) from the count table. It should be the same as that of the per sample loop
+    that the plotter used before the ordering was vectorized (see ThreadSafeGeneral.order_samples_by_most_abundant_seq):
+    samples grouped by their most abundant sequence, ignoring clade, with ties kept in the order of first appearance."""
+
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    @staticmethod
+    def _get_reference_sample_order(seq_abund_df):
+        from collections import defaultdict
+        max_seq_ddict = defaultdict(int)
+        seq_to_samp_ddict = defaultdict(list)
+        no_maj_seq = []
+        for sample_id_to_sort in seq_abund_df.index.values.tolist():
+            smp_series = seq_abund_df.loc[sample_id_to_sort].astype('float')
+            rel_abund_of_max_abund_seq_name = smp_series.max()
+            if not rel_abund_of_max_abund_seq_name > 0:
+                no_maj_seq.append(sample_id_to_sort)
+            else:
+                max_abund_seq_name = smp_series.idxmax()
+                seq_to_samp_ddict[max_abund_seq_name].append((sample_id_to_sort, rel_abund_of_max_abund_seq_name))
+                max_seq_ddict[max_abund_seq_name] += 1
+        ordered_sample_list = []
+        for seq_name in [x[0] for x in sorted(max_seq_ddict.items(), key=lambda x: x[1], reverse=True)]:
+            ordered_sample_list.extend(
+                [x[0] for x in sorted(seq_to_samp_ddict[seq_name], key=lambda x: x[1], reverse=True)])
+        ordered_sample_list.extend(no_maj_seq)
+        return ordered_sample_list
+
+    def test_de_novo_sample_order(self):
+        print('\n\nTesting: de_novo_sample_order\n\n')
+        import numpy as np
+        import pandas as pd
+        from plotting import SeqStackedBarPlotter
+        rng = np.random.default_rng(1234)
+        # Sequences of several clades so that a clade grouped order would differ
+        seq_names = ['D1', 'C3', 'A1', '12345_C', 'C15', '678_D', 'B1']
+        for case_index in range(5):
+            num_samples = 120
+            # Few distinct abundances so that there are plenty of ties
+            abund_array = rng.choice([0, 0, 0.1, 0.2, 0.25, 0.5], size=(num_samples, len(seq_names)))
+            # Samples with no sequences
+            abund_array[rng.choice(num_samples, size=5, replace=False)] = 0
+            sample_uids = rng.permutation(np.arange(1, num_samples + 1) * 7).tolist()
+            seq_abund_df = pd.DataFrame(abund_array, index=sample_uids, columns=seq_names)
+            count_table_df = seq_abund_df.copy()
+            count_table_df.insert(0, 'sample_name', [f'sample_{uid}' for uid in sample_uids])
+            count_table_df.insert(1, 'raw_contigs', 1000)
+            count_table_df.loc['seq_accession'] = ['', ''] + [''] * len(seq_names)
+            count_table_df.loc['meta_info'] = ['', ''] + [''] * len(seq_names)
+            count_table_df.index.name = 'sample_uid'
+            count_table_path = os.path.join(self.temp_dir, f'count_table_{case_index}.txt')
+            count_table_df.to_csv(count_table_path, sep='\t', lineterminator='\n')
+
+            plotter = SeqStackedBarPlotter(
+                seq_relative_abund_count_table_path_post_med=count_table_path, seq_relative_abund_df_pre_med=None,
+                output_directory=self.temp_dir, no_pre_med_seqs=True, ordered_seq_list=seq_names)
+            reference_sample_order = self._get_reference_sample_order(seq_abund_df)
+            self.assertEqual(plotter.ordered_sample_uid_list, reference_sample_order)
+            # The samples are plotted in this order
+            self.assertEqual(plotter.output_count_table_as_df.index.tolist(), reference_sample_order)
+
+
+class FigureExportTesting(TransactionTestCase):
+    """Each of the figure formats that can be passed to --figure_formats is written out by the FigureExporter"""
+
+    def setUp(self):
+        import tempfile
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    def test_export_all_figure_formats(self):
+        print('\n\nTesting: export_all_figure_formats\n\n')
+        import matplotlib.pyplot as plt
+        from PIL import Image
+        from figure_export import FigureExporter
+        figure_formats = FigureExporter.raster_formats + FigureExporter.vector_formats
+        figure_exporter = FigureExporter(formats=figure_formats, dpi=50)
+        f, ax = plt.subplots(1, 1, figsize=(2, 1))
+        ax.bar([0, 1], [1, 2])
+        output_path_list = figure_exporter.export_figure(
+            figure=f, fig_output_path_base=os.path.join(self.temp_dir, 'test_figure'))
+        plt.close(f)
+        self.assertEqual(
+            output_path_list, [os.path.join(self.temp_dir, f'test_figure.{fmt}') for fmt in figure_formats])
+        for output_path, figure_format in zip(output_path_list, figure_formats):
+            self.assertGreater(os.path.getsize(output_path), 0, figure_format)
+            if figure_format in FigureExporter.raster_formats:
+                # The raster outputs are written at the output DPI
+                with Image.open(output_path) as image:
+                    self.assertEqual(image.size, (100, 50), figure_format)
+
+
+class ReferenceSequenceHashTesting(TransactionTestCase):
+    """ReferenceSequences with a duplicate sequence that were left without a sequence_hash by the migration that
+    added it (see dbApp/migrations/0002) can still be saved."""
+
+    def test_save_duplicate_without_hash(self):
+        print('\n\nTesting: save_duplicate_without_hash\n\n')
+        from django.db import IntegrityError, transaction
+        from dbApp.models import ReferenceSequence
+        sequence = 'ACGT' * 50
+        first, duplicate = ReferenceSequence.objects.bulk_create([
+            ReferenceSequence(
+                clade='C', sequence=sequence, sequence_hash=ReferenceSequence.make_sequence_hash(sequence)),
+            ReferenceSequence(clade='C', sequence=sequence, sequence_hash=None)])
+        duplicate = ReferenceSequence.objects.get(id=duplicate.id)
+        duplicate.name = 'renamed_duplicate'
+        duplicate.has_name = True
+        duplicate.save()
+        duplicate = ReferenceSequence.objects.get(id=duplicate.id)
+        self.assertEqual(duplicate.name, 'renamed_duplicate')
+        self.assertIsNone(duplicate.sequence_hash)
+        # The first of the duplicates keeps its hash
+        first = ReferenceSequence.objects.get(id=first.id)
+        first.save()
+        self.assertEqual(
+            ReferenceSequence.objects.get(id=first.id).sequence_hash, ReferenceSequence.make_sequence_hash(sequence))
+        # A duplicate whose sequence is changed to a new sequence is given its hash
+        new_sequence = 'TTGA' * 50
+        duplicate.sequence = new_sequence
+        duplicate.save()
+        self.assertEqual(
+            ReferenceSequence.objects.get(id=duplicate.id).sequence_hash,
+            ReferenceSequence.make_sequence_hash(new_sequence))
+        # New duplicates are still not allowed
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ReferenceSequence(clade='C', sequence=sequence).save()
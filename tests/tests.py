@@ -4,7 +4,7 @@ import main
 import django_general
 import shutil
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "settings")
-from dbApp.models import DataAnalysis, DataSet
+from dbApp.models import DataAnalysis, DataSet, DataSetSample
 import pandas as pd
 
 
@@ -18,11 +18,17 @@ class SymPortalTester:
         self.num_proc=6
         self.name='testing'
         self.assertion_matching_dir = os.path.join(self.test_data_dir_path, 'assertion_testing')
+        # The DataSet loaded with the mothur QC that the native QC is compared to
+        self.mothur_qc_data_set_uid = None
+        # The largest relative difference allowed between the post-QC abundances of a sample of the native QC
+        # and those of the mothur QC
+        self.native_qc_tolerance = 0.01
 
     def execute_integrated_tests(self):
         self.cleanup_after_previous_tests()
         self._test_data_loading_work_flow()
         self._test_data_analysis_work_flow()
+        self._test_data_loading_work_flow_native_qc()
         self.cleanup_after_previous_tests()
 
     def _test_data_loading_work_flow(self):
@@ -30,11 +36,10 @@ class SymPortalTester:
                             str(self.num_proc), '--data_sheet', self.data_sheet_file_path, '--debug']
         self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
         self.work_flow_manager.start_work_flow()
-        # Let's see if we can read in some of the outputs and work with them as assertions
-        foo = 'ar'
-        # here we should develop some real tests
-        # Check the md5sum of the output post_med_seq abund only relative and absolute files
-        
+        self.mothur_qc_data_set_uid = self.work_flow_manager.data_set_object.id
+        self._check_data_loading_outputs()
+
+    def _check_data_loading_outputs(self):
         # Post-MED objects to check.
         for path in self.work_flow_manager.data_loading_object.output_path_list:
             if 'seqs.absolute.abund_only' in path:
@@ -110,6 +115,33 @@ class SymPortalTester:
         self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
         self.work_flow_manager.start_work_flow()
 
+    def _test_data_loading_work_flow_native_qc(self):
+        custom_args_list = ['--load', self.test_data_dir_path, '--name', self.name, '--num_proc',
+                            str(self.num_proc), '--data_sheet', self.data_sheet_file_path, '--native_qc', '--debug']
+        self.work_flow_manager = main.SymPortalWorkFlowManager(custom_args_list)
+        self.work_flow_manager.start_work_flow()
+        self._check_data_loading_outputs()
+        self._compare_post_qc_abundances_to_mothur_qc(native_qc_data_set_uid=self.work_flow_manager.data_set_object.id)
+
+    def _compare_post_qc_abundances_to_mothur_qc(self, native_qc_data_set_uid):
+        """The native QC should give the same post-QC abundances (absolute and unique) as the mothur QC for each
+        of the samples, give or take native_qc_tolerance."""
+        mothur_qc_dss_dict = {
+            dss.name: dss for dss in DataSetSample.objects.filter(data_submission_from=self.mothur_qc_data_set_uid)}
+        native_qc_dss_dict = {
+            dss.name: dss for dss in DataSetSample.objects.filter(data_submission_from=native_qc_data_set_uid)}
+        if set(mothur_qc_dss_dict) != set(native_qc_dss_dict):
+            raise AssertionError('The native QC and the mothur QC loadings do not have the same samples')
+        for sample_name, mothur_qc_dss in mothur_qc_dss_dict.items():
+            native_qc_dss = native_qc_dss_dict[sample_name]
+            for abundance_field in ['post_qc_absolute_num_seqs', 'post_qc_unique_num_seqs']:
+                mothur_qc_abundance = getattr(mothur_qc_dss, abundance_field)
+                native_qc_abundance = getattr(native_qc_dss, abundance_field)
+                if abs(native_qc_abundance - mothur_qc_abundance) > self.native_qc_tolerance * mothur_qc_abundance:
+                    raise AssertionError(
+                        f'{abundance_field} of {sample_name} is {native_qc_abundance} with the native QC '
+                        f'but {mothur_qc_abundance} with the mothur QC')
+
     def _test_data_analysis_work_flow(self):
         custom_args_list = ['--analyse', str(self.work_flow_manager.data_set_object.id), '--name', self.name,
                             '--num_proc', str(self.num_proc)]
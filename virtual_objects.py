@@ -28,6 +28,25 @@ class VirtualObjectManager():
         self.vat_manager = VirtualAnalysisTypeManager(obj_manager=self)
         self.vdss_manager = VirtualDataSetSampleManager(parent_virtual_object_manager=self)
 
+    def __setstate__(self, state):
+        """VirtualObjectManagers are pickled to make the analysis checkpoints (see data_analysis.AnalysisCheckpoint).
+        VirtualCladeCollections and VirtualAnalysisTypes are pickled with the uids of the
+        VirtualAnalysisTypes and VirtualCladeCollections that they reference, rather than the objects themselves,
+        so that pickle doesn't recurse through the whole object graph. Here the references are restored.
+        References to VirtualAnalysisTypes that have since been deleted are dropped."""
+        self.__dict__.update(state)
+        vcc_dict = self.vcc_manager.vcc_dict
+        vat_dict = self.vat_manager.vat_dict
+        for vcc in vcc_dict.values():
+            vcc.analysis_type_obj_to_representative_rel_abund_in_cc_dict = {
+                vat_dict[vat_uid]: rel_abund for vat_uid, rel_abund in
+                vcc.analysis_type_obj_to_representative_rel_abund_in_cc_dict if vat_uid in vat_dict}
+        for vat in vat_dict.values():
+            vat.clade_collection_obj_set_profile_discovery = set(
+                vcc_dict[vcc_uid] for vcc_uid in vat.clade_collection_obj_set_profile_discovery)
+            vat.clade_collection_obj_set_profile_assignment = set(
+                vcc_dict[vcc_uid] for vcc_uid in vat.clade_collection_obj_set_profile_assignment)
+
     def _chunk_query_dss_from_ds_uids(self):
         data_set_samples = []
         for uid_list in general.chunks(self.list_of_data_set_uids):
@@ -206,6 +225,14 @@ class VirtualCladeCollection:
         except Exception:
             return f'VirtualCladeCollection uid: {self.id}'
 
+    def __getstate__(self):
+        # The VirtualAnalysisTypes are replaced by their uids. See VirtualObjectManager.__setstate__
+        state = self.__dict__.copy()
+        state['analysis_type_obj_to_representative_rel_abund_in_cc_dict'] = [
+            (vat.id, rel_abund) for vat, rel_abund in
+            self.analysis_type_obj_to_representative_rel_abund_in_cc_dict.items()]
+        return state
+
 
 class VirutalAnalysisTypeInit:
     """Class for instantiasing VirtualAnalysisTypes
@@ -648,6 +675,15 @@ class VirtualAnalysisTypeManager():
             else:
                 self.species = None
 
+        def __getstate__(self):
+            # The VirtualCladeCollections are replaced by their uids. See VirtualObjectManager.__setstate__
+            state = self.__dict__.copy()
+            state['clade_collection_obj_set_profile_discovery'] = [
+                vcc.id for vcc in self.clade_collection_obj_set_profile_discovery]
+            state['clade_collection_obj_set_profile_assignment'] = [
+                vcc.id for vcc in self.clade_collection_obj_set_profile_assignment]
+            return state
+
         def generate_name(self, at_df, use_rs_ids_rather_than_names=False):
             """
             If we are here, and use_rs_ids_rather_than_names is False